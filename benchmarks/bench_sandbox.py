@@ -0,0 +1,161 @@
+#! /usr/bin/env python3
+#=========================================================================
+# bench_sandbox.py
+#=========================================================================
+# Benchmark for the sandbox modes of the build directory stage
+#
+# Builds a parameter sweep (500 points by default) over a step whose
+# template bundles a tree of scripts, generates a Makefile, and times
+# "make" for the build directories of all points with each sandbox mode.
+# Also reports the disk space used by the build directories, counting
+# each inode once and leaving out inodes shared with the template.
+#
+#     % python benchmarks/bench_sandbox.py
+#     % python benchmarks/bench_sandbox.py --points 100 --files 1000
+#
+#  -h --help        Display this message
+#  --points         Number of sweep points
+#  --files          Number of files in the step template
+#  --size-kb        Size of each file in the step template (KB)
+#  --jobs           Number of make jobs
+#  --modes          Comma-separated list of sandbox modes
+#
+# Date   : October 18, 2026
+#
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname(
+                      os.path.abspath( __file__ ) ) ) )
+
+from mflowgen.backends   import MakeBackend
+from mflowgen.components import Graph, Step
+from mflowgen.core       import BuildOrchestrator
+from mflowgen.utils      import write_yaml
+
+#-------------------------------------------------------------------------
+# Sweep
+#-------------------------------------------------------------------------
+
+def make_template( d, n_files, size_kb ):
+
+  write_yaml( data = { 'name'       : 'sweep',
+                       'outputs'    : [ 'result.txt' ],
+                       'commands'   : [ 'echo {p} > outputs/result.txt' ],
+                       'parameters' : { 'p': 0 } },
+              path = d + '/configure.yml' )
+
+  # Spread the files over a few subdirectories like a bundled flow tree
+
+  data = os.urandom( size_kb * 1024 )
+
+  for i in range( n_files ):
+    sub = d + '/scripts/{:02d}'.format( i % 16 )
+    os.makedirs( sub, exist_ok=True )
+    with open( sub + '/script-{}.tcl'.format( i ), 'wb' ) as fd:
+      fd.write( data )
+
+# make_graph
+#
+# Steps remember the path to their template relative to the working
+# directory, so the graph is created from within the build directory
+#
+
+def make_graph( template_dir, n_points, mode ):
+
+  g        = Graph()
+  template = Step( template_dir )
+
+  for i in range( n_points ):
+    step = template.clone()
+    step.set_name( 'sweep-{}'.format( i ) )
+    step.set_param( 'p', i )
+    step.set_sandbox( mode )
+    g.add_step( step )
+
+  return g
+
+#-------------------------------------------------------------------------
+# Disk usage
+#-------------------------------------------------------------------------
+
+def inodes( path ):
+  result = {}
+  for root, dirs, files in os.walk( path ):
+    for name in dirs + files:
+      st = os.lstat( os.path.join( root, name ) )
+      result[ ( st.st_dev, st.st_ino ) ] = st.st_blocks * 512
+  return result
+
+def disk_usage( build_dirs, template_dir ):
+  shared = inodes( template_dir )
+  used   = {}
+  for d in build_dirs:
+    used.update( inodes( d ) )
+  return sum( v for k, v in used.items() if k not in shared )
+
+#-------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------
+
+def main():
+
+  p = argparse.ArgumentParser()
+  p.add_argument( '--points',  default=500, type=int                   )
+  p.add_argument( '--files',   default=200, type=int                   )
+  p.add_argument( '--size-kb', default=16,  type=int                   )
+  p.add_argument( '--jobs',    default=8,   type=int                   )
+  p.add_argument( '--modes',   default='copy,hardlink,overlay-symlink' )
+  opts = p.parse_args()
+
+  os.environ[ 'MFLOWGEN_HOME' ] = os.path.dirname( os.path.dirname(
+                                    os.path.abspath( __file__ ) ) )
+
+  template_str = '{mode: >16} -- {points} points -- {t: >8.2f} s' \
+                 ' -- {mb: >9.1f} MB'
+
+  print( 'Template: {} files x {} KB = {:.1f} MB'.format( opts.files,
+           opts.size_kb, opts.files * opts.size_kb / 1024 ) )
+
+  cwd = os.getcwd()
+
+  with tempfile.TemporaryDirectory() as d:
+
+    template_dir = d + '/template'
+    os.makedirs( template_dir )
+    make_template( template_dir, opts.files, opts.size_kb )
+
+    for mode in opts.modes.split( ',' ):
+
+      build_root = d + '/build-' + mode
+      os.makedirs( build_root )
+      os.chdir( build_root )
+
+      try:
+        g = make_graph( template_dir, opts.points, mode )
+        BuildOrchestrator( g, MakeBackend ).build()
+
+        build_dirs = sorted( x for x in os.listdir( '.mflowgen' )
+                               if x[0].isdigit() )
+        targets    = [ x + '/.stamp' for x in build_dirs ]
+
+        start = time.perf_counter()
+        subprocess.check_call( [ 'make', '-j', str( opts.jobs ) ]
+                               + targets, stdout = subprocess.DEVNULL )
+        t = time.perf_counter() - start
+
+        mb = disk_usage( build_dirs, template_dir ) / 1024 / 1024
+
+      finally:
+        os.chdir( cwd )
+
+      print( template_str.format( mode = mode, points = opts.points,
+                                  t = t, mb = mb ) )
+
+if __name__ == '__main__':
+  main()
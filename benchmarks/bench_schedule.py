@@ -0,0 +1,174 @@
+#! /usr/bin/env python3
+#=========================================================================
+# bench_schedule.py
+#=========================================================================
+# Benchmark for the longest-path-first scheduling of "mflowgen build"
+#
+# Builds a random layered graph of steps with very different runtimes
+# (most steps are short, a few are long), where each step just sleeps for
+# its runtime, and times "mflowgen build -j N" for the same rules with and
+# without the priorities from BuildOrchestrator.set_priorities. The
+# runtimes are passed as "expected_runtime" hints. Also reports the two
+# lower bounds on the makespan (the critical path and the total work
+# divided by the number of jobs). Each step also spends a fraction of a
+# second of CPU time in the mflowgen scripts around its commands, so use
+# a larger --scale on machines with few cores.
+#
+#     % python benchmarks/bench_schedule.py
+#     % python benchmarks/bench_schedule.py --steps 60 --jobs 8
+#
+#  -h --help        Display this message
+#  --steps          Number of steps
+#  --layers         Number of layers of steps
+#  --jobs           Number of jobs
+#  --scale          Seconds per unit of runtime
+#  --seed           Random seed for the graph
+#
+# Date   : October 18, 2026
+#
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname(
+                      os.path.abspath( __file__ ) ) ) )
+
+from mflowgen.backends   import LocalBackend
+from mflowgen.components import Graph, Step
+from mflowgen.core       import BuildOrchestrator
+from mflowgen.core       import Executor
+from mflowgen.utils      import write_yaml
+
+#-------------------------------------------------------------------------
+# Graph
+#-------------------------------------------------------------------------
+
+def make_template( d ):
+  write_yaml( data = { 'name'       : 'work',
+                       'outputs'    : [ 'out' ],
+                       'commands'   : [ 'sleep $t && touch outputs/out' ],
+                       'parameters' : { 't': 0 } },
+              path = d + '/configure.yml' )
+
+# make_graph
+#
+# Steps are spread over layers and depend on one or two steps of the
+# layer before. Runtimes are in units: 70% of the steps take 1, 20% take
+# 5, and 10% take 20.
+#
+
+def make_graph( template_dir, n_steps, n_layers, scale, seed ):
+
+  rng      = random.Random( seed )
+  g        = Graph()
+  template = Step( template_dir )
+  layers   = [ [] for _ in range( n_layers ) ]
+  runtimes = {}
+
+  for i in range( n_steps ):
+
+    layer = i % n_layers
+    units = rng.choices( [ 1, 5, 20 ], weights = [ 70, 20, 10 ] )[0]
+    name  = 'work-{:03d}'.format( rng.randrange( 1000 ) * 1000 + i )
+
+    step = template.clone()
+    step.set_name( name )
+    step.set_param( 't', units * scale )
+    step.set_expected_runtime( units * scale )
+
+    ups = rng.sample( layers[ layer - 1 ],
+                      min( 2, len( layers[ layer - 1 ] ) ) ) \
+            if layer else []
+
+    step.extend_inputs( [ 'in-' + up.get_name() for up in ups ] )
+    g.add_step( step )
+
+    for up in ups:
+      g.connect( up.o( 'out' ), step.i( 'in-' + up.get_name() ) )
+
+    layers[ layer ].append( step )
+    runtimes[ name ] = units * scale
+
+  return g, runtimes
+
+#-------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------
+
+def run( build_file, jobs ):
+  for d in os.listdir( '.' ):
+    if d[0].isdigit():
+      shutil.rmtree( d )
+  start = time.perf_counter()
+  with open( os.devnull, 'w' ) as devnull:
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+      ok = Executor( build_file, jobs = jobs ).build()
+    finally:
+      sys.stdout = stdout
+  assert ok, 'Build failed'
+  return time.perf_counter() - start
+
+def main():
+
+  p = argparse.ArgumentParser()
+  p.add_argument( '--steps',  default=24,   type=int   )
+  p.add_argument( '--layers', default=4,    type=int   )
+  p.add_argument( '--jobs',   default=4,    type=int   )
+  p.add_argument( '--scale',  default=0.5,  type=float )
+  p.add_argument( '--seed',   default=1,    type=int   )
+  opts = p.parse_args()
+
+  os.environ[ 'MFLOWGEN_HOME' ] = os.path.dirname( os.path.dirname(
+                                    os.path.abspath( __file__ ) ) )
+
+  cwd = os.getcwd()
+
+  with tempfile.TemporaryDirectory() as d:
+
+    template_dir = d + '/template'
+    os.makedirs( template_dir )
+    make_template( template_dir )
+
+    os.makedirs( d + '/build' )
+    os.chdir( d + '/build' )
+
+    try:
+      g, runtimes = make_graph( template_dir, opts.steps, opts.layers,
+                                opts.scale, opts.seed )
+      cp = g.critical_path( runtimes )[ 'length' ]
+      BuildOrchestrator( g, LocalBackend ).build()
+
+      # Same rules without priorities
+
+      with open( LocalBackend.build_file ) as fd:
+        data = json.load( fd )
+      for rule in data[ 'rules' ]:
+        rule[ 'priority' ] = 0
+      with open( 'build.fifo.json', 'w' ) as fd:
+        json.dump( data, fd )
+
+      t_fifo     = run( 'build.fifo.json', opts.jobs )
+      t_priority = run( LocalBackend.build_file, opts.jobs )
+
+    finally:
+      os.chdir( cwd )
+
+  work = sum( runtimes.values() )
+
+  print( '{} steps, {} layers, -j {}'.format( opts.steps, opts.layers,
+                                              opts.jobs ) )
+  print( '  Critical path   : {:8.2f} s'.format( cp ) )
+  print( '  Work / jobs     : {:8.2f} s'.format( work / opts.jobs ) )
+  print( '  Without priority: {:8.2f} s'.format( t_fifo ) )
+  print( '  With priority   : {:8.2f} s ({:+.0f}%)'.format( t_priority,
+           100 * ( t_priority - t_fifo ) / t_fifo ) )
+
+if __name__ == '__main__':
+  main()
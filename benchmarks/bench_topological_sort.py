@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+#=========================================================================
+# bench_topological_sort.py
+#=========================================================================
+# Benchmark for Graph.topological_sort on synthetic graphs
+#
+# Builds layered random DAGs (fixed seed) where every step has a single
+# output and up to four inputs connected to earlier steps, then times a
+# full sort and a sort over a seed subgraph (every other step). The
+# previous list-membership algorithm is kept here for comparison on the
+# smaller graphs.
+#
+#     % python benchmarks/bench_topological_sort.py
+#     % python benchmarks/bench_topological_sort.py --sizes 100,1000 --legacy-max 1000
+#
+#  -h --help        Display this message
+#  --sizes          Comma-separated list of graph sizes (number of steps)
+#  --legacy-max     Largest graph size to also time the legacy sort on
+#
+# Date   : October 18, 2026
+#
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname(
+                      os.path.abspath( __file__ ) ) ) )
+
+from mflowgen.components import Graph, Step
+from mflowgen.utils      import write_yaml
+
+#-------------------------------------------------------------------------
+# Synthetic graphs
+#-------------------------------------------------------------------------
+
+def make_template_step( d ):
+  write_yaml( data = { 'name'    : 'synthetic',
+                       'inputs'  : [ 'in0', 'in1', 'in2', 'in3' ],
+                       'outputs' : [ 'out' ],
+                       'commands': [ 'true' ] },
+              path = d + '/configure.yml' )
+  return Step( d )
+
+def make_graph( template, n_steps, seed=0 ):
+
+  rng   = random.Random( seed )
+  g     = Graph()
+  steps = []
+
+  for i in range( n_steps ):
+    step = template.clone()
+    step.set_name( 'step-{}'.format( i ) )
+    g.add_step( step )
+    if steps:
+      # Connect to a few earlier steps, biased towards recent steps so
+      # the graph has some depth
+      window = steps[ -64: ]
+      for k in range( rng.randint( 1, 4 ) ):
+        src = rng.choice( window )
+        g.connect( src.o( 'out' ), step.i( 'in{}'.format( k ) ) )
+    steps.append( step )
+
+  return g
+
+#-------------------------------------------------------------------------
+# Legacy algorithm (for comparison)
+#-------------------------------------------------------------------------
+
+def legacy_topological_sort( g ):
+
+  order = []
+  edges = { k: list( v ) for k, v in g._edges_i.items() }
+  steps = set( g.all_steps() )
+
+  while( steps ):
+    steps_with_deps    = set( edges.keys() )
+    steps_without_deps = steps.difference( steps_with_deps )
+    order.extend( sorted( steps_without_deps ) )
+    steps = steps_with_deps
+    keys_to_delete = []
+    for step_name, elist in edges.items():
+      idx_to_delete = []
+      for i, e in enumerate( elist ):
+        if e.get_src()[0] in order:
+          idx_to_delete.append( i )
+      for i in reversed( idx_to_delete ):
+        del( elist[i] )
+      if elist == []:
+        keys_to_delete.append( step_name )
+    for k in keys_to_delete:
+      del( edges[k] )
+
+  return order
+
+#-------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------
+
+def timeit( f ):
+  start  = time.perf_counter()
+  result = f()
+  return result, time.perf_counter() - start
+
+def main():
+
+  p = argparse.ArgumentParser()
+  p.add_argument( '--sizes',      default='100,1000,10000,50000' )
+  p.add_argument( '--legacy-max', default=1000, type=int         )
+  opts = p.parse_args()
+
+  sizes = [ int( x ) for x in opts.sizes.split( ',' ) ]
+
+  template_str = '{n: >7} steps -- {full: >9.4f} s full' \
+                 ' -- {seed: >9.4f} s seeded -- legacy {legacy}'
+
+  with tempfile.TemporaryDirectory() as d:
+
+    template = make_template_step( d )
+
+    for n in sizes:
+
+      g = make_graph( template, n )
+
+      seed_steps = set( list( g.all_steps() )[ ::2 ] )
+
+      order, t_full = timeit( lambda: g.topological_sort() )
+      _,     t_seed = timeit( lambda: g.topological_sort( seed_steps ) )
+
+      if n <= opts.legacy_max:
+        legacy_order, t_legacy = timeit( lambda: legacy_topological_sort( g ) )
+        assert legacy_order == order, 'Sort order changed'
+        legacy = '{:.4f} s'.format( t_legacy )
+      else:
+        legacy = '(skipped)'
+
+      print( template_str.format( n = n, full = t_full, seed = t_seed,
+                                  legacy = legacy ) )
+
+
+if __name__ == '__main__':
+  main()
+
@@ -11,7 +11,7 @@ import os
 import re
 import stat
 
-from mflowgen.utils import read_yaml
+from mflowgen.utils import read_yaml, write_if_changed
 
 #-------------------------------------------------------------------------
 # template_pytest_file
@@ -186,15 +186,21 @@ def improve_assert_messages( entry ):
 #         assert math.pi > 3.00                    #         statements
 #
 
-def dump_assertion_check_scripts( step_name, dir_name ):
+def dump_assertion_check_scripts( step_name, dir_name, data=None ):
 
-  yaml_path = dir_name + '/configure.yml'
-  data      = read_yaml( yaml_path )
+  # Read the step configuration from the dumped YAML unless the caller
+  # already has the data
+
+  if data is None:
+    yaml_path = dir_name + '/configure.yml'
+    data      = read_yaml( yaml_path )
 
   # Look at both preconditions and postconditions
 
   assertion_types = [ 'preconditions', 'postconditions' ]
 
+  fpaths = [] # generated scripts
+
   for t in assertion_types:
 
     # If no pre/post conditions are defined, continue
@@ -271,16 +277,19 @@ def dump_assertion_check_scripts( step_name, dir_name ):
 
     fpath = dir_name + '/mflowgen-check-'+t+'.py'
 
-    with open( fpath, 'w' ) as fd:
-      fd.write( template_pytest_file.format(
-                  step       = step_name,
-                  tests      = tests_str,
-                  check_type = t,
-                  gen        = os.path.abspath( __file__ ).rstrip('c'),
-                  pyfiles    = ', '.join( pyfiles ) ) )
+    write_if_changed( fpath, template_pytest_file.format(
+      step       = step_name,
+      tests      = tests_str,
+      check_type = t,
+      gen        = os.path.abspath( __file__ ).rstrip('c'),
+      pyfiles    = ', '.join( pyfiles ) ) )
 
     # Make it executable
 
     os.chmod( fpath, os.stat( fpath ).st_mode | stat.S_IEXEC )
 
+    fpaths.append( fpath )
+
+  return fpaths
+
 
@@ -1,3 +1,4 @@
 from mflowgen.backends.make_backend  import MakeBackend
 from mflowgen.backends.ninja_backend import NinjaBackend
 
+from mflowgen.backends.local_backend import LocalBackend
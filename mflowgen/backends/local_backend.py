@@ -0,0 +1,442 @@
+#=========================================================================
+# local_backend.py
+#=========================================================================
+# Backend that saves the rules from a BuildOrchestrator so that they can
+# be executed directly from Python with "mflowgen build"
+#
+# The rules, stamps, and handling of pre-built steps are the same as in
+# the Makefile, so a build directory can switch freely between the make
+# backend and the local backend.
+#
+# Date   : October 18, 2026
+#
+
+from mflowgen.backends.local_syntax import Writer as LocalWriter
+from mflowgen.backends.local_syntax import local_cpdir, local_symlink
+from mflowgen.backends.local_syntax import local_execute
+from mflowgen.backends.local_syntax import local_alias, local_command
+from mflowgen.backends.local_syntax import local_diff, local_runtimes
+from mflowgen.backends.local_syntax import local_list, local_graph
+from mflowgen.backends.local_syntax import local_status, local_info
+from mflowgen.backends.local_syntax import local_digest
+from mflowgen.utils.helpers         import stamp, is_output_stamp
+from mflowgen.utils.helpers         import write_if_changed
+
+class LocalBackend:
+
+  # Name of the build file that "mflowgen build" reads
+
+  build_file = 'build.local.json'
+
+  def __init__( s ):
+    s.w = LocalWriter()
+    # Track debug targets for list command
+    s.debug_targets = {}
+
+  # save
+
+  def save( s, order, build_dirs, step_dirs, resources=None,
+                                              capacities=None ):
+    s.order      = order
+    s.build_dirs = build_dirs
+    s.step_dirs  = step_dirs
+    s.resources  = resources  or {}
+    s.capacities = capacities or {}
+
+  # gen_header
+
+  def gen_header( s ):
+    pass
+
+  # gen_prologue
+
+  def gen_prologue( s ):
+
+    # Default target -- build everything
+
+    s.w.set_default( s.order )
+
+    # Capacities of the resources that steps hold while they execute
+
+    s.w.set_capacities( s.capacities )
+
+  # gen_step_header
+
+  def gen_step_header( s, step_name ):
+    pass
+
+  # gen_step_directory_pre
+  #
+  # This runs at the very start of generating rules for the step directory
+
+  def gen_step_directory_pre( s ):
+    pass
+
+  # gen_step_directory
+  #
+  # Expected semantics
+  #
+  # - Remove the {dst}
+  # - Copy the {src} to the {dst}
+  # - Parameterize using the saved YAML in the metadata directory
+  # - This rule depends on {deps}
+  # - {sandbox} True (copies src dir), False (symlinks src contents), or
+  #   'hardlink' / 'overlay-symlink' (see mflowgen-sandbox)
+  #
+  # Expected return
+  #
+  # - Return a list that can pass to another backend call as extra_deps
+  #
+
+  def gen_step_directory( s, dst, src, deps, extra_deps, sandbox ):
+
+    # Early cutoff -- Only the digest stamps of the upstream outputs
+    # trigger a rebuild. The other upstream stamps only order this rule
+    # after the upstream steps (see MakeBackend).
+
+    content_deps = [ d for d in extra_deps if is_output_stamp( d ) ]
+    order_deps   = [ d for d in extra_deps if not is_output_stamp( d ) ]
+
+    all_deps = deps + content_deps
+
+    # Rules
+    #
+    # The rule is ignored for pre-built steps (see MakeBackend)
+
+    target = local_cpdir(
+      w          = s.w,
+      dst        = dst,
+      src        = src,
+      deps       = all_deps,
+      sandbox    = sandbox,
+      prebuilt   = dst,
+      order_deps = order_deps,
+    )
+
+    return [ target ]
+
+  # gen_step_collect_inputs_pre
+  #
+  # This runs at the very start of generating rules for collecting inputs
+
+  def gen_step_collect_inputs_pre( s ):
+    pass
+
+  # gen_step_collect_inputs
+  #
+  # Expected semantics
+  #
+  # - Symlink the {src} to the {dst}
+  # - This rule depends on {deps}
+  #
+  # Expected return
+  #
+  # - Return a list that can pass to another backend call as extra_deps
+  #
+
+  def gen_step_collect_inputs( s, dst, src, deps, extra_deps ):
+
+    all_deps = deps + extra_deps
+
+    # Rules
+    #
+    # The rule is ignored for pre-built steps (see MakeBackend)
+
+    target = local_symlink(
+      w              = s.w,
+      dst            = dst,
+      src            = src,
+      deps           = all_deps,
+      src_is_symlink = True,
+      prebuilt       = dst.split('/')[0], # Assumes dst is relative
+    )
+
+    return [ target ]
+
+  # gen_step_execute_pre
+  #
+  # This runs at the very start of generating rules for execute
+
+  def gen_step_execute_pre( s ):
+    pass
+
+  # gen_step_execute
+  #
+  # Expected semantics
+  #
+  # - Run the {command}
+  # - Generate the {outputs}
+  # - This rule depends on {deps}
+  # - Hold the {resources} while running
+  # - Start before ready rules with a lower {priority}
+  #
+  # Expected return
+  #
+  # - Return a list that can pass to another backend call as extra_deps
+  #
+
+  def gen_step_execute( s, outputs, command, deps, extra_deps,
+                        phony=False, resources=None, priority=0 ):
+
+    all_deps = deps + extra_deps
+
+    # Extract the build directory from the command
+
+    tokens    = command.split()
+    cd_idx    = tokens.index( 'cd' )
+    build_dir = tokens[ cd_idx + 1 ]
+
+    # Stamp all outputs from execute
+
+    outputs = [ stamp( o, '.execstamp.' ) for o in outputs ]
+
+    # Update timestamps for pre-existing outputs so timestamp-based
+    # dependency checking works
+
+    command = 'mkdir -p ' + build_dir + '/outputs && ' + \
+              command + ' && touch -c ' + build_dir + '/outputs/*'
+
+    # Stamp the build directory
+
+    outputs.insert( 0, build_dir + '/.execstamp' )
+
+    # Rules
+    #
+    # The rules are ignored for pre-built steps (see MakeBackend)
+
+    targets = local_execute(
+      w            = s.w,
+      outputs      = outputs,
+      command      = command,
+      deps         = all_deps,
+      touch_target = not phony,
+      prebuilt     = build_dir,
+      resources    = resources,
+      priority     = priority,
+    )
+
+    return targets
+
+  # gen_step_collect_outputs_pre
+  #
+  # This runs at the very start of generating rules for collecting outputs
+
+  def gen_step_collect_outputs_pre( s ):
+    pass
+
+  # gen_step_collect_outputs_tagged
+  #
+  # Expected semantics
+  #
+  # - Symlink the {src} to the {dst}
+  # - This rule depends on {deps}
+  #
+  # Expected return
+  #
+  # - Return a list that can pass to another backend call as extra_deps
+  #
+
+  def gen_step_collect_outputs_tagged( s, dst, src, deps, extra_deps ):
+
+    all_deps = deps + extra_deps
+
+    # Rules
+    #
+    # The stamp is only touched when the output changes (early cutoff)
+
+    target = local_digest(
+      w    = s.w,
+      f    = dst,
+      deps = all_deps, # the only dep here comes through all_deps
+      src  = src,
+    )
+
+    return [ target ]
+
+  # gen_step_collect_outputs_untagged
+  #
+  # Expected semantics
+  #
+  # - Do whatever is necessary to the untagged output {f}
+  # - This rule depends on {deps}
+  #
+  # Expected return
+  #
+  # - Return a list that can pass to another backend call as extra_deps
+  #
+
+  def gen_step_collect_outputs_untagged( s, f, deps, extra_deps ):
+
+    all_deps = deps + extra_deps
+
+    # Only depend on the stamped 'f' (see MakeBackend). The stamp is only
+    # touched when the output changes (early cutoff).
+
+    target = local_digest(
+      w    = s.w,
+      f    = f,
+      deps = all_deps,
+    )
+
+    return [ target ]
+
+  # gen_step_post_conditions_pre
+  #
+  # This runs at the very start of generating rules for post-conditions
+
+  def gen_step_post_conditions_pre( s ):
+    pass
+
+  # gen_step_post_conditions
+  #
+  # Expected semantics
+  #
+  # - Run the {command}
+  # - This rule depends on {deps}
+  #
+  # Expected return
+  #
+  # - Return a list that can pass to another backend call as extra_deps
+  #
+
+  def gen_step_post_conditions( s, command, deps, extra_deps ):
+
+    all_deps = deps + extra_deps
+
+    # Extract the build directory from the command
+
+    tokens    = command.split()
+    cd_idx    = tokens.index( 'cd' )
+    build_dir = tokens[ cd_idx + 1 ]
+
+    # Stamp the build directory
+
+    outputs = [ build_dir + '/.postconditions.stamp' ]
+
+    # Rules
+
+    targets = local_execute(
+      w            = s.w,
+      outputs      = outputs,
+      command      = command,
+      deps         = all_deps,
+      touch_target = True,
+    )
+
+    return targets
+
+  # gen_step_alias_pre
+  #
+  # This runs at the very start of generating rules for aliases
+
+  def gen_step_alias_pre( s ):
+    pass
+
+  # gen_step_alias
+  #
+  # Expected semantics
+  #
+  # - Create an alias called {alias} for this step
+  # - This rule depends on {deps}
+  #
+  # Expected return
+  #
+  # - Return a list that can pass to another backend call as extra_deps
+  #
+
+  def gen_step_alias( s, alias, deps, extra_deps ):
+
+    all_deps = deps + extra_deps
+
+    # Rules
+    #
+    # Aliases are phony, so return what they depend on rather than the
+    # alias itself (same as MakeBackend)
+
+    return local_alias(
+      w     = s.w,
+      alias = alias,
+      deps  = all_deps,
+    )
+
+  # gen_step_debug_pre
+  #
+  # This runs at the very start of generating rules for debug commands
+
+  def gen_step_debug_pre( s ):
+    pass
+
+  # gen_step_debug
+  #
+  # Expected semantics
+  #
+  # - Run the {command}
+  # - Generate the {target}
+  # - Use {build_id} to guarantee uniqueness
+  #
+  # Expected return
+  #
+  # - None
+  #
+
+  def gen_step_debug( s, target, command, build_id ):
+
+    # Rules
+
+    local_command( s.w, target, command )
+
+    # Track debug targets for list command
+
+    s.debug_targets.update( { build_id : target } )
+
+  # gen_epilogue
+  #
+  # Miscellaneous targets for quality of life, etc.
+  #
+
+  def gen_epilogue( s ):
+
+    # Clean target
+
+    command = \
+      '@find . -maxdepth 1 ! -name ' + s.build_file + \
+      r' ! -name .mflowgen ! -name .mflowgen.stash.yml' \
+      r' ! -name \. ! -name \.\. -exec rm -rf {} +'
+
+    local_command( s.w, 'clean-all', command )
+
+    # Clean subtargets (e.g., clean-0, clean-1)
+
+    for step_name, d in sorted( s.build_dirs.items(),
+                                  key=lambda x: x[1] ):
+      idx     = d.split('-')[0]
+      name_n  = 'clean-' + idx
+      name_s  = 'clean-' + step_name
+      local_command( s.w, name_n, 'rm -rf ./' + d )
+      # Named clean subtargets (e.g., clean-foo, clean-bar)
+      local_alias( s.w, alias=name_s, deps=[name_n] )
+
+    # Diff target
+
+    for step_name in s.order:
+      src     = s.step_dirs[ step_name ]
+      dst     = s.build_dirs[ step_name ]
+      idx     = dst.split('-')[0].lstrip('./')
+      name    = 'diff-' + idx
+      local_diff( s.w, name=name, src=src, dst=dst )
+
+    # Info target
+
+    for step_name in s.order:
+      local_info( s.w, build_dir=s.build_dirs[ step_name ] )
+
+    # Runtime, list, graph, and status targets
+
+    local_runtimes( s.w )
+    local_list( s.w, s.build_dirs, s.debug_targets )
+    local_graph( s.w )
+    local_status( s.w, s.build_dirs.values() )
+
+    # Write the build file (only if it changed)
+
+    write_if_changed( s.build_file, s.w.dumps() )
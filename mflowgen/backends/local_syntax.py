@@ -0,0 +1,485 @@
+#=========================================================================
+# local_syntax.py
+#=========================================================================
+# Helper functions to generate the rules for the local backend
+#
+# The local backend does not generate a build file for an external build
+# tool. Instead, the rules are saved as JSON and executed directly from
+# Python with "mflowgen build" (see mflowgen/core/executor.py).
+#
+# Each rule makes a single target and looks like this:
+#
+#     {
+#       'target'    : '3-rtl/.execstamp',
+#       'deps'      : [ '3-rtl/.stamp', ... ],
+#       'order_deps': [],
+#       'phony'     : False,
+#       'prebuilt'  : '3-rtl',
+#       'actions'   : [ [ 'shell', 'mkdir -p 3-rtl/outputs && ...' ],
+#                       [ 'touch', '3-rtl/.execstamp' ] ],
+#       'resources' : { 'cores': 8 },
+#       'priority'  : 3600,
+#     }
+#
+# Order-only dependencies are made first but do not trigger a rebuild
+# (same as make). The actions are run in order:
+#
+# - [ 'shell', command ]                    -- Run with bash (quiet if the
+#                                              command starts with "@",
+#                                              also run for dry runs if it
+#                                              starts with "+")
+# - [ 'touch', path ]                       -- Touch a file
+# - [ 'symlink', dst_dir, dst, src, stamp ] -- Same as the "symlink"
+#                                              Makefile recipe
+#
+# The rule is ignored if the "prebuilt" build directory has a ".prebuilt"
+# file, which matches the Makefile toggle for pre-built steps. A rule is
+# only started when the running rules leave enough of its resources (up to
+# the capacities that are saved next to the rules). Among the rules that
+# are ready, the rules with the highest priority start first.
+#
+# Date   : October 18, 2026
+#
+
+import json
+import os
+import shlex
+
+from mflowgen.utils         import get_top_dir
+from mflowgen.utils.helpers import stamp
+
+#-------------------------------------------------------------------------
+# Writer class
+#-------------------------------------------------------------------------
+
+class Writer:
+
+  def __init__( s ):
+    s.rules      = []
+    s.targets    = set()
+    s.default    = []
+    s.capacities = {}
+
+  def rule( s, target, deps=None, actions=None, phony=False,
+                 prebuilt=None, resources=None, order_deps=None,
+                 priority=0 ):
+    assert target not in s.targets, \
+      'Multiple rules for target "{}"'.format( target )
+    s.targets.add( target )
+    s.rules.append( {
+      'target'    : target,
+      'deps'      : list( deps ) if deps else [],
+      'order_deps': list( order_deps ) if order_deps else [],
+      'phony'     : phony,
+      'prebuilt'  : prebuilt,
+      'actions'   : actions if actions else [],
+      'resources' : resources if resources else {},
+      'priority'  : priority,
+    } )
+    return target
+
+  def set_default( s, targets ):
+    s.default = list( targets )
+
+  def set_capacities( s, capacities ):
+    s.capacities = dict( capacities )
+
+  def dumps( s ):
+    data = { 'default'    : s.default,
+             'capacities' : s.capacities,
+             'rules'      : s.rules }
+    return json.dumps( data, indent=1 ) + '\n'
+
+#-------------------------------------------------------------------------
+# Helper functions
+#-------------------------------------------------------------------------
+
+# local_cpdir
+#
+# Copies a directory and handles stamping
+#
+# - w          : instance of Writer
+# - dst        : path to copied directory
+# - src        : path to source directory
+# - deps       : list, additional dependencies
+# - sandbox    : True or 'copy' (copies src dir), 'hardlink' or
+#                'overlay-symlink' (see mflowgen-sandbox), False (symlinks
+#                src contents)
+# - prebuilt   : build directory that can disable this rule
+# - order_deps : list, order-only dependencies
+#
+
+def local_cpdir( w, dst, src, deps=None, sandbox=True, prebuilt=None,
+                                                      order_deps=None ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+    deps = [ d for d in deps if ':' not in d ] # ignore colon files
+
+  if order_deps:
+    assert type( order_deps ) == list, \
+      'Expecting order_deps to be of type list'
+    order_deps = [ d for d in order_deps if ':' not in d ]
+
+  target = dst + '/.stamp'
+
+  if sandbox in [ 'hardlink', 'overlay-symlink' ]:
+    commands = [
+      'rm -rf ./' + dst,
+      get_top_dir() + '/mflowgen/scripts/mflowgen-sandbox -m ' + sandbox +
+        ' ' + src + ' ' + dst,
+      'rm -f ' + dst + '/configure.yml && ' +
+        'cp .mflowgen/' + dst + '/configure.yml ' + dst,
+    ]
+  elif sandbox:
+    commands = [
+      'rm -rf ./' + dst,
+      'cp -aL ' + src + ' ' + dst + ' || true',
+      'chmod -R +w ' + dst,
+      'cp .mflowgen/' + dst + '/configure.yml ' + dst,
+    ]
+  else:
+    commands = [
+      'rm -rf ./' + dst,
+      'mkdir -p ' + dst,
+      'cd ' + dst + ' && ln -sf ../' + src + '/* . && cd ..',
+      'rm ' + dst + '/configure.yml && ' +
+        'cp .mflowgen/' + dst + '/configure.yml ' + dst,
+    ]
+
+  actions = [ [ 'shell', c ] for c in commands ] + [ [ 'touch', target ] ]
+
+  return w.rule( target, deps, actions, prebuilt=prebuilt,
+                                       order_deps=order_deps )
+
+# local_symlink
+#
+# Symlinks src to dst while handling stamping
+#
+# - w              : instance of Writer
+# - dst            : path to linked file/directory
+# - src            : path to source file/directory
+# - deps           : additional dependencies
+# - src_is_symlink : boolean, flag if source is a symlink (and has stamp)
+# - ignore_src_dep : boolean, does not include src in deps if True
+# - prebuilt       : build directory that can disable this rule
+#
+
+def local_symlink( w, dst, src, deps=None, src_is_symlink=False,
+                      ignore_src_dep=False, prebuilt=None ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+
+  deps = list( deps ) if deps else []
+
+  # Stamp files
+
+  dst_dir   = os.path.dirname( dst )
+  dst_base  = os.path.basename( dst )
+  dst_stamp = stamp( dst )
+
+  # Relative paths for symlinking after changing directories
+
+  src_relative       = os.path.relpath( src, dst_dir )
+  dst_stamp_relative = os.path.basename( dst_stamp )
+
+  # Depend on the digest stamp of src if src is also a symlink (i.e.,
+  # the output of another step, see mflowgen-digest)
+
+  if not ignore_src_dep:
+    deps.append( stamp( src, '.digest.' ) if src_is_symlink else src )
+
+  actions = [ [ 'symlink', dst_dir, dst_base, src_relative,
+                           dst_stamp_relative ] ]
+
+  return w.rule( dst_stamp, deps, actions, prebuilt=prebuilt )
+
+# local_execute
+#
+# Runs the execute rule
+#
+# - w            : instance of Writer
+# - outputs      : outputs of the execute rule
+# - command      : string, command for the rule
+# - deps         : additional dependencies
+# - touch_target : should we touch the target?
+# - phony        : is the first output a phony target?
+# - prebuilt     : build directory that can disable this rule
+# - resources    : dict, amount of each resource the command holds
+# - priority     : rules with a higher priority start first
+#
+
+def local_execute( w, outputs, command, deps=None, touch_target=True,
+                      phony=False, prebuilt=None, resources=None,
+                      priority=0 ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+
+  actions = [ [ 'shell', command ] ]
+
+  if touch_target:
+    actions.append( [ 'touch', outputs[0] ] )
+
+  w.rule( outputs[0], deps, actions, phony=phony, prebuilt=prebuilt,
+                                     resources=resources, priority=priority )
+
+  # Make all other outputs just depend on the first output
+
+  for output in outputs[1:]:
+    w.rule( output, [ outputs[0] ], [ [ 'touch', output ] ],
+            prebuilt=prebuilt )
+
+  return outputs
+
+# local_stamp
+#
+# Stamps the given file with a '.stamp.' prefix
+#
+# - w        : instance of Writer
+# - f        : file to stamp
+# - deps     : additional dependencies
+# - f_is_dep : should the file to be stamped also be a dependency?
+#
+
+def local_stamp( w, f, deps=None, f_is_dep=True ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+
+  deps = list( deps ) if deps else []
+
+  if f_is_dep:
+    deps.insert( 0, f )
+
+  f_stamp = stamp( f )
+
+  return w.rule( f_stamp, deps, [ [ 'touch', f_stamp ] ] )
+
+# local_digest
+#
+# Stamps a step output with a '.stamp.' prefix and returns its digest
+# stamp, which is only touched when the contents of the output change
+# (same as make_digest)
+#
+# - w    : instance of Writer
+# - f    : output to stamp
+# - deps : additional dependencies
+# - src  : if given, first symlink the output to this path
+#
+
+def local_digest( w, f, deps=None, src=None ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+
+  f_stamp  = stamp( f )
+  f_digest = stamp( f, '.digest.' )
+
+  command = get_top_dir() + '/mflowgen/scripts/mflowgen-digest' \
+            ' -o ' + f + ' -s ' + f_stamp + ' -d ' + f_digest
+
+  if src:
+    f_dir = os.path.dirname( f )
+    link  = 'mkdir -p {d} && cd {d} && ln -sf {src} {dst}'.format(
+              d   = f_dir,
+              src = os.path.relpath( src, f_dir ),
+              dst = os.path.basename( f ) )
+    command += ' -c ' + shlex.quote( link )
+
+  w.rule( f_stamp, deps, [ [ 'shell', command ] ] )
+
+  return w.rule( f_digest, [ f_stamp ] )
+
+# local_alias
+#
+# Create an alias for the given dependencies
+#
+# - w     : instance of Writer
+# - alias : alias name
+# - deps  : dependencies
+#
+
+def local_alias( w, alias, deps ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+
+  w.rule( alias, deps, phony=True )
+
+  return list( deps ) if deps else []
+
+# local_command
+#
+# Phony target that runs a single command
+#
+# - w       : instance of Writer
+# - name    : target name
+# - command : string, command for the rule
+#
+
+def local_command( w, name, command ):
+  return w.rule( name, actions=[ [ 'shell', command ] ], phony=True )
+
+# local_diff
+#
+# Write out rules for diffs
+#
+# - w : instance of Writer
+#
+
+def local_diff( w, name, src, dst ):
+
+  exclude_files = [
+    'configure.yml',
+    '.time_end',
+    '.time_start',
+    'mflowgen-run*',
+    'mflowgen-debug',
+    '.stamp',
+    'inputs',
+    'outputs',
+  ]
+
+  command = ' '.join( [
+    # Newline
+    '@echo &&',
+    # Diff the src and dst
+    'diff -r -u --minimal',
+    # Exclude build-system specific files
+    '--exclude={' + ','.join( exclude_files ) + '}',
+    src,
+    dst,
+    '|',
+    # Try to portably colorize the outputs with grep
+    "grep --color=always -e '^-.*' -e '$' -e 'Only in " + src + ".*'",
+    '|',
+    "GREP_COLOR='01;32' grep --color=always -e '^+.*' -e '$' -e 'Only in " + dst + ".*'",
+    # Newline
+    '&& echo',
+    # Ignore any issues
+    '|| true',
+  ] )
+
+  local_command( w, name, command )
+
+# local_runtimes
+#
+# Write out rules for calculating runtimes from timestamps
+#
+# - w : instance of Writer
+#
+
+def local_runtimes( w ):
+
+  command = '@' + get_top_dir() + '/mflowgen/scripts/mflowgen-runtimes'
+
+  local_command( w, 'runtimes', command )
+
+# local_list
+#
+# Write out rule to list all steps
+#
+# - w             : instance of Writer
+# - build_dirs    : list of build directories
+# - debug_targets : dict of debug targets with key (id) and value (target)
+#
+
+def local_list( w, build_dirs, debug_targets ):
+
+  # Split the build ID and step name from the build_dir (e.g.,
+  # "4-synopsys-dc-synthesis" turns into ( '4', 'synopsys-dc-synthesis' ))
+
+  steps = []
+
+  for _ in sorted( build_dirs.values(), \
+                     key = lambda x: int(x.split('-')[0]) ):
+    tokens = _.split('-')
+    steps.append( ( tokens[0], '-'.join(tokens[1:]) ) )
+
+  steps_str = \
+    [ '"{: >3} : {}"'.format(x,y) for x, y in ( steps ) ]
+
+  generic = [
+    '"list      -- List all steps"',
+    '"status    -- Print build status for each step"',
+    '"runtimes  -- Print runtimes for each step"',
+    '"graph     -- Generate a PDF of the step dependency graph"',
+    '"clean-all -- Remove all build directories"',
+    '"clean-N   -- Clean target N"',
+    '"info-N    -- Print configured info for step N"',
+    '"diff-N    -- Diff target N"',
+  ]
+
+  debug_str = \
+    [ '"debug-{: <2} : {}"'.format(i,tup) \
+      for i, tup in sorted( debug_targets.items(), key=lambda x:int(x[0]) ) ]
+
+  commands = [
+    r'echo',
+    r'echo Generic Targets: && echo && ' + \
+      r'printf " - %s\\n" ' + ' '.join( generic ),
+    r'echo',
+    r'echo Targets: && echo && ' + \
+      r'printf " - %s\\n" ' + ' '.join( steps_str ),
+    r'echo',
+    r'echo Debug Targets: && echo && ' + \
+      r'printf " - %s\\n" ' + ' '.join( debug_str ),
+    r'echo',
+  ]
+
+  local_command( w, 'list', '@' + ' && '.join( commands ) )
+
+# local_graph
+#
+# Write out rule to generate a PDF of the user-defined graph
+#
+# - w : instance of Writer
+#
+
+def local_graph( w ):
+
+  command = 'dot -Tpdf .mflowgen/graph.dot > graph.pdf'
+
+  local_command( w, 'graph', command )
+
+# local_status
+#
+# Write out rules for printing build status
+#
+# - w     : instance of Writer
+# - steps : list of step names to print status for
+#
+
+def local_status( w, steps ):
+
+  steps_comma_separated = ','.join( steps )
+
+  command = '@' + get_top_dir() + '/mflowgen/scripts/mflowgen-status' \
+            ' --backend local -s ' + steps_comma_separated
+
+  local_command( w, 'status', command )
+
+# local_info
+#
+# Write out rules for printing step info
+#
+# - w         : instance of Writer
+# - build_dir : build_dir for this info target
+#
+
+def local_info( w, build_dir ):
+
+  build_id      = build_dir.split('-')[0]              # <- first number
+  step_name     = '-'.join( build_dir.split('-')[1:])  # <- remainder
+  target        = 'info-' + build_id
+
+  command = '@' + get_top_dir() + '/mflowgen/scripts/mflowgen-letters' \
+      + ' -c -t ' + step_name
+
+  command = command + ' && ' + get_top_dir() \
+      + '/mflowgen/scripts/mflowgen-info'    \
+      + ' -y .mflowgen/' + build_dir + '/configure.yml'
+
+  local_command( w, target, command )
@@ -8,34 +8,39 @@
 #
 
 import datetime as dt
+import io
 import os
 
 from mflowgen.backends.makefile_syntax import Writer as MakeWriter
 from mflowgen.backends.makefile_syntax import make_cpdir, make_symlink
-from mflowgen.backends.makefile_syntax import make_execute, make_stamp, make_alias
+from mflowgen.backends.makefile_syntax import make_execute, make_alias
+from mflowgen.backends.makefile_syntax import make_resources, make_digest
 from mflowgen.backends.makefile_syntax import make_common_rules, make_clean
 from mflowgen.backends.makefile_syntax import make_diff
 from mflowgen.backends.makefile_syntax import make_runtimes, make_list
 from mflowgen.backends.makefile_syntax import make_graph, make_status, make_info
-from mflowgen.utils.helpers            import stamp
+from mflowgen.utils.helpers            import stamp, is_output_stamp
+from mflowgen.utils.helpers            import write_if_changed
 
 class MakeBackend:
 
   def __init__( s ):
-    s.fd = open( 'Makefile', 'w' )
+    # Render into memory and only write the build file at the end (see
+    # gen_epilogue) if it changed
+    s.fd = io.StringIO()
     s.w = MakeWriter( s.fd )
     # Track debug targets for list command
     s.debug_targets = {}
 
-  def __del__( s ):
-    s.fd.close()
-
   # save
 
-  def save( s, order, build_dirs, step_dirs ):
+  def save( s, order, build_dirs, step_dirs, resources=None,
+                                              capacities=None ):
     s.order      = order
     s.build_dirs = build_dirs
     s.step_dirs  = step_dirs
+    s.resources  = resources  or {}
+    s.capacities = capacities or {}
 
   # gen_header
 
@@ -91,7 +96,8 @@ class MakeBackend:
   # - Copy the {src} to the {dst}
   # - Parameterize using the saved YAML in the metadata directory
   # - This rule depends on {deps}
-  # - {sandbox} True (copies src dir), False (symlinks src contents)
+  # - {sandbox} True (copies src dir), False (symlinks src contents), or
+  #   'hardlink' / 'overlay-symlink' (see mflowgen-sandbox)
   #
   # Expected return
   #
@@ -118,16 +124,33 @@ class MakeBackend:
     s.w.newline()
     #.....................................................................
 
-    all_deps = deps + extra_deps
+    # Early cutoff -- The extra deps come from the upstream step aliases.
+    # Only the digest stamps of the upstream outputs trigger a rebuild,
+    # since they are only touched when an output actually changes (see
+    # make_digest). The other upstream stamps are touched every time the
+    # upstream step reruns, so they only order this rule after it.
+
+    content_deps = []
+    order_deps   = []
+
+    for d in extra_deps:
+      upstream = d.split()
+      content  = [ _ for _ in upstream if is_output_stamp( _ ) ]
+      others   = [ _ for _ in upstream if not is_output_stamp( _ ) ]
+      if content : content_deps.append( ' '.join( content ) )
+      if others  : order_deps.append( ' '.join( others ) )
+
+    all_deps = deps + content_deps
 
     # Rules
 
     target = make_cpdir(
-      w       = s.w,
-      dst     = dst,
-      src     = src,
-      deps    = all_deps,
-      sandbox = sandbox,
+      w          = s.w,
+      dst        = dst,
+      src        = src,
+      deps       = all_deps,
+      sandbox    = sandbox,
+      order_deps = order_deps,
     )
 
     #.....................................................................
@@ -224,6 +247,9 @@ class MakeBackend:
   # - Run the {command}
   # - Generate the {outputs}
   # - This rule depends on {deps}
+  # - Hold the {resources} while running
+  # - Start before ready rules with a lower {priority} (make has no way
+  #   to prioritize rules, so this is not used)
   #
   # Expected return
   #
@@ -231,7 +257,7 @@ class MakeBackend:
   #
 
   def gen_step_execute( s, outputs, command, deps, extra_deps,
-                                                     phony=False ):
+                        phony=False, resources=None, priority=0 ):
 
     all_deps = deps + extra_deps
 
@@ -269,6 +295,12 @@ class MakeBackend:
 
     outputs = [ stamp( o, '.execstamp.' ) for o in outputs ]
 
+    # Make has no pools, so wait for the resources in a wrapper that
+    # shares them between all make jobs
+
+    if resources:
+      command = make_resources( command, resources, s.capacities )
+
     # Update timestamps for pre-existing outputs so timestamp-based
     # dependency checking works
 
@@ -327,13 +359,14 @@ class MakeBackend:
     all_deps = deps + extra_deps
 
     # Rules
+    #
+    # The stamp is only touched when the output changes (early cutoff)
 
-    target = make_symlink(
+    target = make_digest(
       w    = s.w,
-      dst  = dst,
+      f    = dst,
+      deps = all_deps, # the only dep here comes through all_deps
       src  = src,
-      deps = all_deps,
-      ignore_src_dep = True, # the only dep here comes through all_deps
     )
 
     return [ target ]
@@ -357,15 +390,16 @@ class MakeBackend:
     # Note: Because the execute outputs are all stamped with
     # '.execstamp.', we should not depend on the file 'f' here. We should
     # only depend on the stamped 'f', which we expect to come through in
-    # the list of extra_deps. So we set 'f_is_dep' to False.
+    # the list of extra_deps.
 
     # Rules
+    #
+    # The stamp is only touched when the output changes (early cutoff)
 
-    target = make_stamp(
-      w        = s.w,
-      f        = f,
-      deps     = all_deps,
-      f_is_dep = False,
+    target = make_digest(
+      w    = s.w,
+      f    = f,
+      deps = all_deps,
     )
 
     return [ target ]
@@ -582,4 +616,8 @@ class MakeBackend:
 
     make_status( s.w, s.build_dirs.values() )
 
+    # Write the build file (only if it changed)
+
+    write_if_changed( 'Makefile', s.fd.getvalue() )
+
 
@@ -8,6 +8,7 @@
 #
 
 import os
+import shlex
 import textwrap
 
 from mflowgen.utils         import get_top_dir
@@ -43,30 +44,47 @@ class Writer:
 # Helper functions
 #-------------------------------------------------------------------------
 
+# sandbox_rules
+#
+# Rule that creates the build directory for each sandbox mode
+#
+
+sandbox_rules = {
+  True              : 'cpdir-and-parameterize',
+  'copy'            : 'cpdir-and-parameterize',
+  'hardlink'        : 'hardlink-and-parameterize',
+  'overlay-symlink' : 'overlay-and-parameterize',
+  False             : 'mkdir-and-symlink',
+}
+
 # make_cpdir
 #
 # Copies a directory and handles stamping
 #
-# - w       : instance of Writer
-# - dst     : path to copied directory
-# - src     : path to source directory
-# - deps    : list, additional dependencies
-# - sandbox : bool, True (copies src dir), False (symlinks src contents)
+# - w          : instance of Writer
+# - dst        : path to copied directory
+# - src        : path to source directory
+# - deps       : list, additional dependencies
+# - sandbox    : True or 'copy' (copies src dir), 'hardlink' or
+#                'overlay-symlink' (see mflowgen-sandbox), False (symlinks
+#                src contents)
+# - order_deps : list, order-only dependencies
 #
 
-def make_cpdir( w, dst, src, deps=None, sandbox=True ):
+def make_cpdir( w, dst, src, deps=None, sandbox=True, order_deps=None ):
 
   if deps:
     assert type( deps ) == list, 'Expecting deps to be of type list'
 
+  if order_deps:
+    assert type( order_deps ) == list, \
+      'Expecting order_deps to be of type list'
+
   # $1 -- dst
   # $2 -- src
   # $3 -- stamp
 
-  if sandbox:
-    rule = 'cpdir-and-parameterize'
-  else:
-    rule = 'mkdir-and-symlink'
+  rule = sandbox_rules[ sandbox ]
 
   target = dst + '/.stamp'
 
@@ -84,6 +102,17 @@ def make_cpdir( w, dst, src, deps=None, sandbox=True ):
   for dep in deps:
     w.write( template_str.format( target=target, dep=dep ) )
 
+  # Order-only dependencies must be built first but do not trigger a
+  # rebuild when they change
+
+  if order_deps:
+    order_deps = [ d for d in order_deps if ':' not in d ]
+
+  template_str = '{target}: | {dep}\n'
+
+  for dep in ( order_deps or [] ):
+    w.write( template_str.format( target=target, dep=dep ) )
+
   # Generate the build rule
 
   template_str  = '{target}:\n'
@@ -138,10 +167,11 @@ def make_symlink( w, dst, src, deps=None, src_is_symlink=False,
   dst_relative = dst_base
   dst_stamp_relative = os.path.basename( dst_stamp )
 
-  # Depend on src stamp if src is also a symlink
+  # Depend on the digest stamp of src if src is also a symlink (i.e.,
+  # the output of another step, see mflowgen-digest)
 
   if src_is_symlink:
-    src_stamp = stamp( src )
+    src_stamp = stamp( src, '.digest.' )
     inputs    = src_stamp
   else:
     inputs    = src
@@ -233,6 +263,24 @@ def make_execute( w, outputs, rule, command, deps=None,
 
   return outputs
 
+# make_resources
+#
+# Wraps a command so that it only runs once the resources it needs are
+# free (see mflowgen-resources)
+#
+# - command    : string, command to wrap
+# - resources  : dict, amount of each resource that the command holds
+# - capacities : dict, capacity of each resource
+#
+
+def make_resources( command, resources, capacities ):
+
+  requests = [ '-r {}={}/{}'.format( r, n, capacities[ r ] ) \
+                 for r, n in sorted( resources.items() ) ]
+
+  return ' '.join( [ get_top_dir() + '/mflowgen/scripts/mflowgen-resources' ]
+                   + requests + [ '-c', shlex.quote( command ) ] )
+
 # make_stamp
 #
 # Stamps the given file with a '.stamp.' prefix
@@ -275,6 +323,59 @@ def make_stamp( w, f, deps=None, f_is_dep=True ):
 
   return f_stamp
 
+# make_digest
+#
+# Stamps a step output with a '.stamp.' prefix and returns its digest
+# stamp (with a '.digest.' prefix), which is only touched when the
+# contents of the output change (see mflowgen-digest). The digest stamp
+# has a rule without a recipe, so make checks its timestamp again after
+# the stamp is made and skips the steps after it if the output did not
+# change. Dry runs (i.e., "make -n") cannot see this, so they list the
+# steps after it as if they would rerun whenever the digest stamp is older
+# than the stamp (i.e., the step reran but the output did not change). Use
+# "mflowgen status" for the status of each step instead.
+#
+# - w    : instance of Writer
+# - f    : output to stamp
+# - deps : additional dependencies
+# - src  : if given, first symlink the output to this path
+#
+
+def make_digest( w, f, deps=None, src=None ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+
+  f_stamp  = stamp( f )
+  f_digest = stamp( f, '.digest.' )
+
+  command = get_top_dir() + '/mflowgen/scripts/mflowgen-digest' \
+            ' -o ' + f + ' -s ' + f_stamp + ' -d ' + f_digest
+
+  if src:
+    f_dir = os.path.dirname( f )
+    link  = 'mkdir -p {d} && cd {d} && ln -sf {src} {dst}'.format(
+              d   = f_dir,
+              src = os.path.relpath( src, f_dir ),
+              dst = os.path.basename( f ) )
+    command += ' -c ' + shlex.quote( link )
+
+  template_str  = '{target}: {deps}\n'
+  template_str += '	{command}\n'
+  template_str += '{digest}: {target} ;\n'
+
+  w.write(
+    template_str.format(
+      target  = f_stamp,
+      deps    = ' '.join( deps ) if deps else '',
+      command = command,
+      digest  = f_digest,
+    )
+  )
+  w.newline()
+
+  return f_digest
+
 # make_alias
 #
 # Create an alias for the given dependencies
@@ -315,6 +416,9 @@ def make_alias( w, alias, deps ):
 
 def make_common_rules( w ):
 
+  w.write( 'MFLOWGEN_SANDBOX = ' + get_top_dir() +
+           '/mflowgen/scripts/mflowgen-sandbox\n' )
+
   w.write(
 '''
 SHELL=/usr/bin/env bash -euo pipefail
@@ -354,6 +458,28 @@ define mkdir-and-symlink
 	touch $3
 endef
 
+# $1 -- $dst
+# $2 -- $src
+# $3 -- $stamp
+
+define hardlink-and-parameterize
+	rm -rf ./$1
+	$(MFLOWGEN_SANDBOX) -m hardlink $2 $1
+	rm -f $1/configure.yml && cp .mflowgen/$1/configure.yml $1
+	touch $3
+endef
+
+# $1 -- $dst
+# $2 -- $src
+# $3 -- $stamp
+
+define overlay-and-parameterize
+	rm -rf ./$1
+	$(MFLOWGEN_SANDBOX) -m overlay-symlink $2 $1
+	rm -f $1/configure.yml && cp .mflowgen/$1/configure.yml $1
+	touch $3
+endef
+
 # $1 -- $dst_dir
 # $2 -- $dst
 # $3 -- $src
@@ -8,33 +8,43 @@
 #
 
 import datetime as dt
+import io
 import os
 
 from mflowgen.backends.ninja_syntax       import Writer as NinjaWriter
 from mflowgen.backends.ninja_syntax_extra import ninja_cpdir, ninja_symlink
-from mflowgen.backends.ninja_syntax_extra import ninja_execute, ninja_stamp, ninja_alias
+from mflowgen.backends.ninja_syntax_extra import ninja_execute, ninja_alias
 from mflowgen.backends.ninja_syntax_extra import ninja_common_rules, ninja_clean
 from mflowgen.backends.ninja_syntax_extra import ninja_diff
 from mflowgen.backends.ninja_syntax_extra import ninja_runtimes, ninja_list
 from mflowgen.backends.ninja_syntax_extra import ninja_graph, ninja_status, ninja_info
+from mflowgen.backends.ninja_syntax_extra import ninja_pools, ninja_digest
+from mflowgen.utils.helpers               import is_output_stamp
+from mflowgen.utils.helpers               import write_if_changed
 
 class NinjaBackend:
 
   def __init__( s ):
-    s.fd = open( 'build.ninja', 'w' )
+    # Render into memory and only write the build file at the end (see
+    # gen_epilogue) if it changed
+    s.fd = io.StringIO()
     s.w = NinjaWriter( s.fd )
     # Track debug targets for list command
     s.debug_targets = {}
-
-  def __del__( s ):
-    s.fd.close()
+    # Track the dependencies of each step alias (see gen_step_directory)
+    s.alias_deps = {}
+    # Rules of each step as [ priority, index, rules ] (see gen_epilogue)
+    s.step_rules = []
 
   # save
 
-  def save( s, order, build_dirs, step_dirs ):
+  def save( s, order, build_dirs, step_dirs, resources=None,
+                                              capacities=None ):
     s.order      = order
     s.build_dirs = build_dirs
     s.step_dirs  = step_dirs
+    s.resources  = resources  or {}
+    s.capacities = capacities or {}
 
   # gen_header
 
@@ -54,11 +64,18 @@ class NinjaBackend:
 
   def gen_prologue( s ):
     ninja_common_rules( s.w )
+    # Pools for the resources that steps hold while they execute
+    s.pools = ninja_pools( s.w, s.resources, s.capacities )
 
   # gen_step_header
 
   def gen_step_header( s, step_name ):
 
+    # Render the rules of each step separately
+
+    s.step_rules.append( [ 0, len( s.step_rules ), io.StringIO() ] )
+    s.w.output = s.step_rules[-1][2]
+
     s.w.comment( '-'*72 )
     s.w.comment( step_name )
     s.w.comment( '-'*72 )
@@ -81,7 +98,8 @@ class NinjaBackend:
   # - Copy the {src} to the {dst}
   # - Parameterize using the saved YAML in the metadata directory
   # - This rule depends on {deps}
-  # - {sandbox} True (copies src dir), False (symlinks src contents)
+  # - {sandbox} True (copies src dir), False (symlinks src contents), or
+  #   'hardlink' / 'overlay-symlink' (see mflowgen-sandbox)
   #
   # Expected return
   #
@@ -90,16 +108,30 @@ class NinjaBackend:
 
   def gen_step_directory( s, dst, src, deps, extra_deps, sandbox ):
 
-    all_deps = deps + extra_deps
+    # Early cutoff -- The extra deps are the upstream step aliases. Only
+    # the digest stamps of the upstream outputs trigger a rebuild, since
+    # they are only touched when an output actually changes (see
+    # ninja_digest). The aliases themselves only order this rule after the
+    # upstream steps.
+
+    content_deps = set()
+
+    for alias in extra_deps:
+      for d in s.alias_deps.get( alias, [] ):
+        if is_output_stamp( d ):
+          content_deps.add( d )
+
+    all_deps = deps + sorted( content_deps )
 
     # Rules
 
     target = ninja_cpdir(
-      w       = s.w,
-      dst     = dst,
-      src     = src,
-      deps    = all_deps,
-      sandbox = sandbox,
+      w          = s.w,
+      dst        = dst,
+      src        = src,
+      deps       = all_deps,
+      sandbox    = sandbox,
+      order_deps = extra_deps,
     )
     s.w.newline()
 
@@ -159,6 +191,8 @@ class NinjaBackend:
   # - Run the {command}
   # - Generate the {outputs}
   # - This rule depends on {deps}
+  # - Hold the {resources} while running
+  # - Start before ready rules with a lower {priority}
   #
   # Expected return
   #
@@ -166,10 +200,12 @@ class NinjaBackend:
   #
 
   def gen_step_execute( s, outputs, command, deps, extra_deps,
-                                                     phony=False ):
+                        phony=False, resources=None, priority=0 ):
 
     all_deps = deps + extra_deps
 
+    s.step_rules[-1][0] = priority
+
     # Extract the build directory from the command so we can create a
     # unique rule name
 
@@ -191,6 +227,14 @@ class NinjaBackend:
 
     command = command + ' && touch ' + build_dir + '/.execstamp'
 
+    # A job can only be in one pool, so use the most limiting pool if the
+    # step holds several resources
+
+    pool = ''
+
+    if resources:
+      pool = min( resources, key = lambda r: ( s.pools[r], r ) )
+
     # Rules
 
     targets = ninja_execute(
@@ -200,6 +244,7 @@ class NinjaBackend:
       command     = command,
       description = description,
       deps        = all_deps,
+      pool        = pool,
     )
 
     return targets
@@ -230,12 +275,14 @@ class NinjaBackend:
     all_deps = deps + extra_deps
 
     # Rules
+    #
+    # The stamp is only touched when the output changes (early cutoff)
 
-    target = ninja_symlink(
+    target = ninja_digest(
       w    = s.w,
-      dst  = dst,
-      src  = src,
+      f    = dst,
       deps = all_deps,
+      src  = src,
     )
 
     return [ target ]
@@ -257,8 +304,10 @@ class NinjaBackend:
     all_deps = deps + extra_deps
 
     # Rules
+    #
+    # The stamp is only touched when the output changes (early cutoff)
 
-    target = ninja_stamp(
+    target = ninja_digest(
       w    = s.w,
       f    = f,
       deps = all_deps,
@@ -356,6 +405,8 @@ class NinjaBackend:
       deps  = all_deps,
     )
 
+    s.alias_deps[ target ] = all_deps
+
     return [ target ]
 
   # gen_step_debug_pre
@@ -406,6 +457,19 @@ class NinjaBackend:
 
   def gen_epilogue( s ):
 
+    # Steps in order of priority
+    #
+    # Ninja starts the ready edges that come first in the build file first
+    # (newer versions of ninja only after those on the critical path from
+    # their own log), so the steps with the longest path to the end of the
+    # build go first. Ninja does not need the steps in dependency order.
+
+    s.w.output = s.fd
+
+    for _, _, rules in sorted( s.step_rules,
+                               key = lambda x: ( -x[0], x[1] ) ):
+      s.fd.write( rules.getvalue() )
+
     s.w.comment( '-'*72 )
     s.w.comment( 'Misc' )
     s.w.comment( '-'*72 )
@@ -491,5 +555,9 @@ class NinjaBackend:
 
     ninja_status( s.w, s.build_dirs.values() )
 
+    # Write the build file (only if it changed)
+
+    write_if_changed( 'build.ninja', s.fd.getvalue() )
+
 
 
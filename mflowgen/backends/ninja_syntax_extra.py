@@ -15,37 +15,55 @@ from mflowgen.utils.helpers import stamp
 # Extra ninja helper functions
 #-------------------------------------------------------------------------
 
+# sandbox_rules
+#
+# Rule that creates the build directory for each sandbox mode
+#
+
+sandbox_rules = {
+  True              : 'cpdir-and-parameterize',
+  'copy'            : 'cpdir-and-parameterize',
+  'hardlink'        : 'hardlink-and-parameterize',
+  'overlay-symlink' : 'overlay-and-parameterize',
+  False             : 'mkdir-and-symlink',
+}
+
 # ninja_cpdir
 #
 # Copies a directory and handles stamping
 #
-# - w       : instance of ninja_syntax Writer
-# - dst     : path to copied directory
-# - src     : path to source directory
-# - deps    : list, additional dependencies for ninja build
-# - sandbox : bool, True (copies src dir), False (symlinks src contents)
+# - w          : instance of ninja_syntax Writer
+# - dst        : path to copied directory
+# - src        : path to source directory
+# - deps       : list, additional dependencies for ninja build
+# - sandbox    : True or 'copy' (copies src dir), 'hardlink' or
+#                'overlay-symlink' (see mflowgen-sandbox), False (symlinks
+#                src contents)
+# - order_deps : list, order-only dependencies for ninja build
 #
 
-def ninja_cpdir( w, dst, src, deps=None, sandbox=True ):
+def ninja_cpdir( w, dst, src, deps=None, sandbox=True, order_deps=None ):
 
   if deps:
     assert type( deps ) == list, 'Expecting deps to be of type list'
 
-  if sandbox:
-    rule = 'cpdir-and-parameterize'
-  else:
-    rule = 'mkdir-and-symlink'
+  if order_deps:
+    assert type( order_deps ) == list, \
+      'Expecting order_deps to be of type list'
+
+  rule = sandbox_rules[ sandbox ]
 
   target = dst + '/.stamp'
 
   w.build(
-    outputs   = target,
-    #implicit  = [ src ] + deps,
-    implicit  = deps,
-    rule      = rule,
-    variables = { 'dst'   : dst,
-                  'src'   : src,
-                  'stamp' : target },
+    outputs    = target,
+    #implicit   = [ src ] + deps,
+    implicit   = deps,
+    order_only = order_deps,
+    rule       = rule,
+    variables  = { 'dst'   : dst,
+                   'src'   : src,
+                   'stamp' : target },
   )
 
   return target
@@ -78,10 +96,11 @@ def ninja_symlink( w, dst, src, deps=None, src_is_symlink=False ):
   dst_relative = dst_base
   dst_stamp_relative = os.path.basename( dst_stamp )
 
-  # Depend on src stamp if src is also a symlink
+  # Depend on the digest stamp of src if src is also a symlink (i.e.,
+  # the output of another step, see mflowgen-digest)
 
   if src_is_symlink:
-    src_stamp = stamp( src )
+    src_stamp = stamp( src, '.digest.' )
     inputs    = src_stamp
   else:
     inputs    = src
@@ -145,6 +164,36 @@ def ninja_execute( w, outputs, rule, command, description='', deps=None, pool=''
 
   return outputs
 
+# ninja_pools
+#
+# Write out a pool for each resource that steps hold while they execute.
+# A pool counts jobs rather than amounts, so the depth assumes that every
+# job in the pool holds the largest amount that any step needs.
+#
+# - w          : instance of ninja_syntax Writer
+# - resources  : dict, amount of each resource that each step holds
+# - capacities : dict, capacity of each resource
+#
+# Returns a dict with the depth of each pool
+#
+
+def ninja_pools( w, resources, capacities ):
+
+  largest = {}
+
+  for needs in resources.values():
+    for r, n in needs.items():
+      largest[ r ] = max( largest.get( r, 0 ), n )
+
+  depths = {}
+
+  for r, n in sorted( largest.items() ):
+    depths[ r ] = max( capacities[ r ] // n, 1 )
+    w.pool( r, depths[ r ] )
+    w.newline()
+
+  return depths
+
 # ninja_stamp
 #
 # Stamps the given file with a '.stamp.' prefix
@@ -172,6 +221,54 @@ def ninja_stamp( w, f, deps=None ):
 
   return f_stamp
 
+# ninja_digest
+#
+# Stamps a step output with a '.stamp.' prefix and returns its digest
+# stamp, which is only touched when the contents of the output change (see
+# mflowgen-digest). The rules use "restat" so that ninja skips the
+# downstream rules if the digest stamp did not change.
+#
+# - w    : instance of ninja_syntax Writer
+# - f    : output to stamp
+# - deps : additional dependencies for ninja build
+# - src  : if given, first symlink the output to this path
+#
+
+def ninja_digest( w, f, deps=None, src=None ):
+
+  if deps:
+    assert type( deps ) == list, 'Expecting deps to be of type list'
+
+  f_stamp  = stamp( f )
+  f_digest = stamp( f, '.digest.' )
+
+  if src:
+    f_dir = os.path.dirname( f )
+    w.build(
+      outputs   = [ f_stamp, f_digest ],
+      implicit  = deps,
+      rule      = 'digest-symlink',
+      variables = { 'output'  : f,
+                    'dst_dir' : f_dir,
+                    'dst'     : os.path.basename( f ),
+                    'src'     : os.path.relpath( src, f_dir ),
+                    'stamp'   : f_stamp,
+                    'digest'  : f_digest },
+    )
+  else:
+    w.build(
+      outputs   = [ f_stamp, f_digest ],
+      implicit  = [ f ] + deps,
+      rule      = 'digest',
+      variables = { 'output' : f,
+                    'stamp'  : f_stamp,
+                    'digest' : f_digest },
+    )
+
+  w.newline()
+
+  return f_digest
+
 # ninja_alias
 #
 # Create an alias for the given dependencies
@@ -248,6 +345,25 @@ def ninja_common_rules( w ):
   )
   w.newline()
 
+  # hardlink-and-parameterize, overlay-and-parameterize
+  #
+  # Creates the build directory without copying the source directory (see
+  # mflowgen-sandbox)
+
+  for rule, mode in [ ( 'hardlink-and-parameterize', 'hardlink'        ),
+                      ( 'overlay-and-parameterize',  'overlay-symlink' ) ]:
+    w.rule(
+      name        = rule,
+      description = rule + ': Sandboxing $src to $dst',
+      command     = 'rm -rf ./$dst && ' +
+                    get_top_dir() + '/mflowgen/scripts/mflowgen-sandbox' +
+                    ' -m ' + mode + ' $src $dst && ' +
+                    'rm -f $dst/configure.yml && ' +
+                    'cp .mflowgen/$dst/configure.yml $dst && ' +
+                    'touch $stamp',
+    )
+    w.newline()
+
   # symlink
 
   w.rule(
@@ -266,6 +382,31 @@ def ninja_common_rules( w ):
   )
   w.newline()
 
+  # digest
+  #
+  # Stamps only when the output changes (see ninja_digest)
+
+  digest = get_top_dir() + '/mflowgen/scripts/mflowgen-digest'
+
+  w.rule(
+    name        = 'digest',
+    description = 'digest: Stamping at $stamp',
+    command     = digest + ' -o $output -s $stamp -d $digest',
+    restat      = True,
+  )
+  w.newline()
+
+  # digest-symlink
+
+  w.rule(
+    name        = 'digest-symlink',
+    description = 'digest-symlink: Symlinking $src to $dst',
+    command     = digest + ' -o $output -s $stamp -d $digest' +
+                  " -c 'cd $dst_dir && ln -sf $src $dst'",
+    restat      = True,
+  )
+  w.newline()
+
 # ninja_clean
 #
 # Write out ninja rules for cleaning
@@ -0,0 +1,2 @@
+from mflowgen.cache.build_cache   import BuildCache
+from mflowgen.cache.cache_handler import CacheHandler
@@ -0,0 +1,463 @@
+#=========================================================================
+# build_cache.py
+#=========================================================================
+# Local cache of step results
+#
+# Nightly flows and parameter sweeps rebuild the same steps over and over
+# (e.g., synthesis with the same parameters). The build cache saves the
+# results of each step that runs and restores them when a step with the
+# same fingerprint runs again, instead of running the tools.
+#
+# The cache is keyed by the fingerprint of the step including the digests
+# of its inputs (see BuildOrchestrator.dump_fingerprint), so a step only
+# gets a hit when its template, its expanded parameters and commands, and
+# all of its inputs are the same. The digests of the inputs are those
+# recorded by mflowgen-digest when the upstream steps stamped their
+# outputs. Steps with inputs that were never stamped this way (e.g.,
+# pre-built steps) are not cached.
+#
+# Each entry keeps the same files that "mflowgen stash push" keeps (i.e.,
+# the outputs, logs, reports, and the run log) so that post-conditions
+# still have something to check:
+#
+#     <cache>/entries/3e/3e5ab4.../meta.yml
+#     <cache>/entries/3e/3e5ab4.../data/outputs/design.v
+#     <cache>/entries/3e/3e5ab4.../data/logs/dc.log
+#     <cache>/stats.yml
+#
+# Results are copied into the cache (following symlinks) and made
+# read-only. They are restored into the build directory with hardlinks,
+# or with copies when the cache is on another file system or belongs to
+# another user. Restored files are read-only too, so they are replaced
+# with private copies before the step runs again (see detach).
+#
+# The least recently used entries are evicted when the cache grows past
+# its size quota.
+#
+# The cache is off unless a cache directory is given with the
+# MFLOWGEN_CACHE environment variable. The quota is set with
+# MFLOWGEN_CACHE_SIZE (e.g., "500G", default "50G").
+#
+# Date   : October 18, 2026
+#
+
+import fcntl
+import os
+import re
+import shutil
+import stat
+
+from datetime       import datetime
+
+from mflowgen.utils import read_yaml, write_yaml_if_changed
+from mflowgen.utils import read_fingerprint
+
+#-------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------
+
+# parse_size
+#
+# Converts sizes like "500M" or "50G" into bytes
+#
+
+def parse_size( size ):
+  m = re.match( r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$', str( size ),
+                re.IGNORECASE )
+  assert m, 'BuildCache -- Bad size "{}" (e.g., "500M", "50G")'.format(
+            size )
+  scale = 1024 ** ' kmgt'.index( m.group(2).lower() or ' ' )
+  return int( float( m.group(1) ) * scale )
+
+# format_size
+#
+# Converts bytes into a human-readable size
+#
+
+def format_size( n ):
+  for unit in [ 'B', 'K', 'M', 'G' ]:
+    if n < 1024:
+      return '{:.1f}{}'.format( n, unit ) if unit != 'B' else \
+             '{}B'.format( n )
+    n = n / 1024
+  return '{:.1f}T'.format( n )
+
+#-------------------------------------------------------------------------
+# BuildCache
+#-------------------------------------------------------------------------
+
+class BuildCache:
+
+  # Files and directories in the build directory that are cached
+
+  items = [ 'outputs', 'logs', 'reports', 'mflowgen-run.log' ]
+
+  # File in the build directory that records a cache hit
+
+  hit_log = 'mflowgen-cache.log'
+
+  def __init__( s, path=None, max_size=None, metadata_dir='.mflowgen' ):
+
+    s.path = path or os.environ.get( 'MFLOWGEN_CACHE', '' )
+
+    if s.path:
+      s.path = os.path.abspath( os.path.expanduser( s.path ) )
+
+    s.max_size = parse_size( max_size or
+                   os.environ.get( 'MFLOWGEN_CACHE_SIZE', '50G' ) )
+
+    s.metadata_dir = metadata_dir
+
+  def enabled( s ):
+    return bool( s.path )
+
+  #-----------------------------------------------------------------------
+  # Keys
+  #-----------------------------------------------------------------------
+
+  # key
+  #
+  # Returns the fingerprint of the step in the build directory including
+  # the digests of its inputs, or None if the step cannot be cached
+  #
+
+  def key( s, build_dir ):
+    return read_fingerprint( build_dir, s.metadata_dir )
+
+  def entry_path( s, key ):
+    return s.path + '/entries/' + key[:2] + '/' + key
+
+  #-----------------------------------------------------------------------
+  # Locking and statistics
+  #-----------------------------------------------------------------------
+
+  # lock
+  #
+  # Builds share the cache, so updates to the statistics and evictions
+  # hold an exclusive lock on the cache directory
+  #
+
+  def lock( s ):
+    os.makedirs( s.path, exist_ok=True )
+    fd = os.open( s.path, os.O_RDONLY )
+    fcntl.flock( fd, fcntl.LOCK_EX )
+    return fd
+
+  def unlock( s, fd ):
+    os.close( fd )
+
+  def read_stats( s ):
+    try:
+      return read_yaml( s.path + '/stats.yml' ) or {}
+    except Exception:
+      return {}
+
+  def count( s, name, n=1 ):
+    fd = s.lock()
+    try:
+      data = s.read_stats()
+      data[ name ] = data.get( name, 0 ) + n
+      write_yaml_if_changed( data, s.path + '/stats.yml' )
+    finally:
+      s.unlock( fd )
+
+  #-----------------------------------------------------------------------
+  # Entries
+  #-----------------------------------------------------------------------
+
+  # entries
+  #
+  # Returns the metadata of all entries, least recently used first
+  #
+
+  def entries( s ):
+
+    entries     = []
+    entries_dir = s.path + '/entries'
+
+    if not os.path.isdir( entries_dir ):
+      return entries
+
+    for prefix in os.listdir( entries_dir ):
+      prefix_dir = entries_dir + '/' + prefix
+      for key in os.listdir( prefix_dir ):
+        meta_path = prefix_dir + '/' + key + '/meta.yml'
+        try:
+          meta = read_yaml( meta_path )
+          meta[ 'used' ] = os.stat( meta_path ).st_mtime
+        except Exception:
+          meta = { 'key': key, 'size': 0, 'used': 0, 'files': {} }
+        entries.append( meta )
+
+    return sorted( entries, key=lambda x: x[ 'used' ] )
+
+  def remove_entry( s, key ):
+    shutil.rmtree( s.entry_path( key ), ignore_errors=True )
+
+  # verify
+  #
+  # Cached files are read-only, so an entry with a file that is writable
+  # or that changed size was modified after it was saved
+  #
+
+  def verify( s, key, meta ):
+    data_dir = s.entry_path( key ) + '/data'
+    for rel, size in meta[ 'files' ].items():
+      try:
+        st = os.stat( data_dir + '/' + rel )
+      except OSError:
+        return False
+      if st.st_size != size or st.st_mode & 0o222:
+        return False
+    return True
+
+  #-----------------------------------------------------------------------
+  # restore
+  #-----------------------------------------------------------------------
+  # Restores the results of the step in the build directory from the
+  # cache. Returns True on a hit.
+  #
+  # On a miss, any restored (read-only) files left in the build directory
+  # are replaced with private copies so the step can overwrite them.
+  #
+
+  def restore( s, build_dir ):
+
+    if not s.enabled():
+      return False
+
+    key = s.key( build_dir )
+
+    if key:
+      try:
+        meta = read_yaml( s.entry_path( key ) + '/meta.yml' )
+        hit  = s.verify( key, meta )
+        if not hit:
+          s.remove_entry( key )
+      except Exception:
+        hit = False
+    else:
+      hit = False
+
+    if not hit:
+      s.detach( build_dir )
+      try:
+        os.remove( build_dir + '/' + s.hit_log )
+      except OSError:
+        pass
+      s.count( 'misses' )
+      return False
+
+    # Replace the cached files and directories in the build directory
+
+    for item in s.items:
+      s.remove( build_dir + '/' + item )
+
+    os.makedirs( build_dir + '/outputs', exist_ok=True )
+
+    data_dir = s.entry_path( key ) + '/data'
+
+    for rel in meta[ 'files' ]:
+      src = data_dir + '/' + rel
+      dst = build_dir + '/' + rel
+      os.makedirs( os.path.dirname( dst ), exist_ok=True )
+      s.link( src, dst )
+
+    # Record the hit and mark the entry as recently used
+
+    with open( build_dir + '/' + s.hit_log, 'w' ) as fd:
+      fd.write( 'Restored from the build cache on {}\n'.format(
+                  datetime.now().strftime( '%Y-%m%d-%H%M-%S' ) ) )
+      fd.write( 'Cache : {}\n'.format( s.path ) )
+      fd.write( 'Key   : {}\n'.format( key ) )
+      fd.write( 'From  : {} ({})\n'.format( meta.get( 'build_dir' ),
+                                            meta.get( 'created' ) ) )
+
+    os.utime( s.entry_path( key ) + '/meta.yml', None )
+
+    s.count( 'hits' )
+
+    return True
+
+  # link
+  #
+  # Hardlinks a cached file into the build directory. Falls back to a copy
+  # across file systems and for cached files owned by another user (whose
+  # timestamps could not be updated by the build).
+  #
+
+  def link( s, src, dst ):
+    if os.stat( src ).st_uid == os.getuid():
+      try:
+        os.link( src, dst )
+        return
+      except OSError:
+        pass
+    shutil.copy2( src, dst )
+
+  # remove
+  #
+  # Removes a file or directory (the files may be read-only)
+  #
+
+  def remove( s, path ):
+    if os.path.isdir( path ) and not os.path.islink( path ):
+      shutil.rmtree( path )
+    elif os.path.lexists( path ):
+      os.remove( path )
+
+  # detach
+  #
+  # Replaces read-only and hardlinked files in the cached parts of the
+  # build directory with private writable copies
+  #
+
+  def detach( s, build_dir ):
+    for rel, path in s.walk( build_dir, followlinks=False ):
+      st = os.lstat( path )
+      if not stat.S_ISREG( st.st_mode ):
+        continue
+      if st.st_nlink > 1 or not st.st_mode & stat.S_IWUSR:
+        tmp = path + '.mflowgen-cache-tmp'
+        shutil.copy2( path, tmp )
+        os.chmod( tmp, st.st_mode | stat.S_IWUSR )
+        os.replace( tmp, path )
+
+  # walk
+  #
+  # Returns ( relative path, path ) for the files in the cached parts of
+  # the build directory
+  #
+
+  def walk( s, build_dir, followlinks=True ):
+    files = []
+    for item in s.items:
+      path = build_dir + '/' + item
+      if os.path.isfile( path ):
+        files.append( ( item, path ) )
+      elif os.path.isdir( path ):
+        for root, dirs, names in os.walk( path, followlinks=followlinks ):
+          dirs.sort()
+          for name in sorted( names ):
+            full = os.path.join( root, name )
+            if os.path.isfile( full ): # skips dangling symlinks
+              files.append( ( os.path.relpath( full, build_dir ), full ) )
+    return files
+
+  #-----------------------------------------------------------------------
+  # save
+  #-----------------------------------------------------------------------
+  # Saves the results of the step in the build directory to the cache
+  # after it ran. Returns True if a new entry was saved.
+  #
+
+  def save( s, build_dir ):
+
+    if not s.enabled():
+      return False
+
+    key = s.key( build_dir )
+
+    if not key:
+      return False
+
+    entry = s.entry_path( key )
+
+    if os.path.exists( entry ):
+      os.utime( entry + '/meta.yml', None )
+      return False
+
+    files = s.walk( build_dir )
+    size  = sum( os.stat( path ).st_size for rel, path in files )
+
+    if size > s.max_size:
+      return False
+
+    # Copy into a temporary directory and move it into place, so that
+    # concurrent builds never see a partial entry
+
+    tmp = s.path + '/tmp/{}.{}'.format( key, os.getpid() )
+
+    s.remove( tmp )
+
+    try:
+      for rel, path in files:
+        dst = tmp + '/data/' + rel
+        os.makedirs( os.path.dirname( dst ), exist_ok=True )
+        shutil.copy2( path, dst )
+        os.chmod( dst, os.stat( dst ).st_mode & ~0o222 )
+      meta = {
+        'key'       : key,
+        'build_dir' : build_dir,
+        'created'   : datetime.now().strftime( '%Y-%m%d-%H%M-%S' ),
+        'size'      : size,
+        'files'     : { rel: os.stat( path ).st_size
+                          for rel, path in files },
+      }
+      write_yaml_if_changed( meta, tmp + '/meta.yml' )
+      os.makedirs( os.path.dirname( entry ), exist_ok=True )
+      os.rename( tmp, entry )
+    except OSError:
+      s.remove( tmp ) # e.g., another build saved the same entry first
+      return False
+
+    s.count( 'saves' )
+    s.prune()
+
+    return True
+
+  #-----------------------------------------------------------------------
+  # prune
+  #-----------------------------------------------------------------------
+  # Evicts the least recently used entries until the cache fits in the
+  # quota. Returns the number of entries and bytes that were evicted.
+  #
+
+  def prune( s, max_size=None ):
+
+    if max_size is None:
+      max_size = s.max_size
+
+    fd = s.lock()
+
+    try:
+      entries = s.entries()
+      total   = sum( e[ 'size' ] for e in entries )
+      evicted = 0
+      freed   = 0
+      for e in entries:
+        if total <= max_size:
+          break
+        s.remove_entry( e[ 'key' ] )
+        total   -= e[ 'size' ]
+        freed   += e[ 'size' ]
+        evicted += 1
+      if evicted:
+        data = s.read_stats()
+        data[ 'evictions' ] = data.get( 'evictions', 0 ) + evicted
+        write_yaml_if_changed( data, s.path + '/stats.yml' )
+    finally:
+      s.unlock( fd )
+
+    return evicted, freed
+
+  #-----------------------------------------------------------------------
+  # stats
+  #-----------------------------------------------------------------------
+  # Returns the statistics of the cache
+  #
+
+  def stats( s ):
+    entries = s.entries()
+    data    = {
+      'path'      : s.path,
+      'entries'   : len( entries ),
+      'size'      : sum( e[ 'size' ] for e in entries ),
+      'max_size'  : s.max_size,
+      'hits'      : 0,
+      'misses'    : 0,
+      'saves'     : 0,
+      'evictions' : 0,
+    }
+    data.update( s.read_stats() )
+    return data
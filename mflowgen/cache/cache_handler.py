@@ -0,0 +1,142 @@
+#=========================================================================
+# cache_handler.py
+#=========================================================================
+# Handler for build-cache-related commands
+#
+# Date   : October 18, 2026
+#
+
+import sys
+
+from mflowgen.cache.build_cache import BuildCache, format_size
+from mflowgen.utils             import bold
+
+class CacheHandler:
+
+  def __init__( s ):
+
+    # Valid commands
+
+    s.commands = [
+      'stats',
+      'prune',
+      'help',
+    ]
+
+  #-----------------------------------------------------------------------
+  # launch
+  #-----------------------------------------------------------------------
+  # Dispatch function for commands
+  #
+
+  def launch( s, args, help_, path, size ):
+
+    if help_ and not args:
+      s.launch_help()
+      return
+
+    try:
+      command = args[0]
+      assert command in s.commands # valid commands only
+    except Exception as e:
+      print( 'cache: Unrecognized commands (see "mflowgen cache help")' )
+      sys.exit( 1 )
+
+    if command == 'help':
+      s.launch_help()
+      return
+
+    try:
+      s.cache = BuildCache( path = path, max_size = size )
+    except AssertionError as e:
+      print( bold( 'Error:' ), e )
+      sys.exit( 1 )
+
+    if not help_ and not s.cache.enabled():
+      print()
+      print( bold( 'Error:' ), 'No build cache (set MFLOWGEN_CACHE or'
+                               ' use --path)' )
+      print()
+      sys.exit( 1 )
+
+    if   command == 'stats' : s.launch_stats( help_ )
+    elif command == 'prune' : s.launch_prune( help_ )
+
+  #-----------------------------------------------------------------------
+  # launch_stats
+  #-----------------------------------------------------------------------
+
+  def launch_stats( s, help_ ):
+
+    # Help message
+
+    def print_help():
+      print()
+      print( bold( 'Usage:' ), 'mflowgen cache stats [--path <dir>]'   )
+      print()
+      print( 'Shows the size of the build cache and how often steps'   )
+      print( 'were restored from it.'                                  )
+      print()
+
+    if help_:
+      print_help()
+      return
+
+    data    = s.cache.stats()
+    lookups = data[ 'hits' ] + data[ 'misses' ]
+
+    print()
+    print( bold( 'Build Cache:' ), data[ 'path' ] )
+    print()
+    print( '  Entries   :', data[ 'entries' ] )
+    print( '  Size      : {} of {}'.format( format_size( data[ 'size' ] ),
+                                      format_size( data[ 'max_size' ] ) ) )
+    print( '  Hits      : {} of {} ({:.0f}%)'.format( data[ 'hits' ],
+             lookups, 100.0 * data[ 'hits' ] / lookups if lookups else 0 ) )
+    print( '  Saves     :', data[ 'saves' ] )
+    print( '  Evictions :', data[ 'evictions' ] )
+    print()
+
+  #-----------------------------------------------------------------------
+  # launch_prune
+  #-----------------------------------------------------------------------
+
+  def launch_prune( s, help_ ):
+
+    # Help message
+
+    def print_help():
+      print()
+      print( bold( 'Usage:' ), 'mflowgen cache prune [--path <dir>]'
+                               ' [--size <size>]'                       )
+      print()
+      print( bold( 'Example:' ), 'mflowgen cache prune --size 10G'      )
+      print()
+      print( 'Evicts the least recently used entries until the build'   )
+      print( 'cache fits in the given size (default: the quota from'    )
+      print( 'MFLOWGEN_CACHE_SIZE). Use "--size 0" to empty the cache.' )
+      print()
+
+    if help_:
+      print_help()
+      return
+
+    evicted, freed = s.cache.prune()
+
+    print( 'Evicted {} entries ({})'.format( evicted,
+                                             format_size( freed ) ) )
+
+  #-----------------------------------------------------------------------
+  # launch_help
+  #-----------------------------------------------------------------------
+
+  def launch_help( s ):
+    print()
+    print( bold( 'Cache Commands' ) )
+    print()
+    print( bold( ' - stats :' ), 'Show the size and hit rate of the build cache' )
+    print( bold( ' - prune :' ), 'Evict the least recently used entries'          )
+    print()
+    print( 'The build cache is in the directory given by MFLOWGEN_CACHE' )
+    print( '(or --path). Run any command with -h to see more details'   )
+    print()
@@ -0,0 +1,46 @@
+import os
+
+from mflowgen.cache import BuildCache
+from mflowgen.utils import write_yaml
+
+def make_build( tmp_path, digest='abc' ):
+  os.makedirs( '.mflowgen/0-a' )
+  os.makedirs( '.mflowgen/1-b' )
+  os.makedirs( '1-b/outputs' )
+  write_yaml( { 'x.v': { 'digest': digest } }, '.mflowgen/0-a/digests.yml' )
+  write_yaml( { 'step': '123', 'sources': { 'x.v': [ '0-a', 'x.v' ] } },
+              '.mflowgen/1-b/fingerprint.yml' )
+  with open( '1-b/outputs/y.v', 'w' ) as fd:
+    fd.write( 'module y;\n' )
+
+def test_build_cache( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  make_build( tmp_path )
+  cache = BuildCache( path = str( tmp_path / 'cache' ) )
+  assert not cache.restore( '1-b' )
+  assert cache.save( '1-b' )
+  assert not cache.save( '1-b' )
+  # Hit
+  os.remove( '1-b/outputs/y.v' )
+  assert cache.restore( '1-b' )
+  assert open( '1-b/outputs/y.v' ).read() == 'module y;\n'
+  assert os.stat( '1-b/outputs/y.v' ).st_nlink == 2
+  # Miss when an input changes, and restored files become private copies
+  write_yaml( { 'x.v': { 'digest': 'def' } }, '.mflowgen/0-a/digests.yml' )
+  assert not cache.restore( '1-b' )
+  assert os.stat( '1-b/outputs/y.v' ).st_nlink == 1
+  assert os.access( '1-b/outputs/y.v', os.W_OK )
+  stats = cache.stats()
+  assert ( stats[ 'entries' ], stats[ 'hits' ], stats[ 'misses' ] ) == \
+         ( 1, 1, 2 )
+  assert cache.prune( 0 ) == ( 1, len( 'module y;\n' ) )
+  assert cache.stats()[ 'entries' ] == 0
+
+def test_build_cache_disabled( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  monkeypatch.delenv( 'MFLOWGEN_CACHE', raising=False )
+  make_build( tmp_path )
+  cache = BuildCache()
+  assert not cache.enabled()
+  assert not cache.save( '1-b' )
+  assert not cache.restore( '1-b' )
@@ -10,7 +10,8 @@
 #     --demo            --  Generate a demo design
 #     --design   string --  Path to design directory with build graph
 #     --update          --  Re-read the graph and update the build
-#     --backend  string --  Backend build system: make, ninja
+#     --backend  string --  Backend build system: make, ninja, local
+#     --verbose         --  Report the time spent in each phase
 #
 # mflowgen stash (Stash-related options)
 #
@@ -20,11 +21,51 @@
 #     --hash     string --  Hash for stash pull, stash pop, stash drop
 #     --all
 #     --verbose
+#     --name     string --  Step name filter for stash list
+#     --author   string --  Author filter for stash list
+#     --since    string --  Date filter for stash list (e.g., 2020-03-15)
+#     --until    string --  Date filter for stash list
+#     --page     int    --  Page for stash list
+#     --limit    int    --  Steps per page for stash list (default: 10)
+#  -j --jobs     int    --  Parallel file transfers for stash push, pull
+#     --link            --  Pull as read-only links into the stash
+#     --materialize     --  Pull (or turn a pulled step) into private copies
+#     --compress string --  Compress stash pushes (gzip, lzma, zstd, auto)
+#     --outputs-only    --  Pull only the outputs of a stashed step
+#     --keep-last int   --  Pushes to keep per step for stash gc
+#     --max-age  int    --  Days since the last push or pull for stash gc
+#     --size     string --  Size quota for stash gc (e.g., 500G)
+#  -n --dry-run         --  List what stash gc would drop
+#
+# mflowgen cache (Build-cache-related options)
+#
+#  -p --path     string --  Path to the build cache (default: MFLOWGEN_CACHE)
+#     --size     string --  Size quota for cache prune (e.g., 10G)
+#
+# mflowgen trace (Trace of the latest build)
+#
+#  -p --path     string --  Path for the trace (default: trace.json)
+#  -j --jobs     int    --  Number of jobs the build ran with
+#     --all             --  Trace every run in the state journal
+#
+# mflowgen runtimes (Runtime estimates from earlier runs)
+#
+#     --critical-path   --  Critical path and slack of each step
+#     --eta             --  Remaining time of the build in progress
+#
+# mflowgen resume (Restart a step from its last checkpoint)
+#
+#  -n --dry-run         --  Show the regenerated mflowgen-run only
 #
 # mflowgen mock (Mock-related options)
 #
 #  -p --path     string --  Path to step directory
 #
+# mflowgen build (Options for builds with the local backend)
+#
+#  -j --jobs     int    --  Number of rules to run at the same time
+#  -n --dry-run         --  Print the commands without running them
+#
 
 #
 # Author : Christopher Torng
@@ -37,9 +78,12 @@ import sys
 
 from mflowgen           import __version__
 from mflowgen.demo      import DemoHandler
-from mflowgen.core      import RunHandler
+from mflowgen.core      import RunHandler, BuildHandler
 from mflowgen.stash     import StashHandler
 from mflowgen.mock      import MockHandler
+from mflowgen.cache     import CacheHandler
+from mflowgen.state     import TraceHandler, RuntimesHandler
+from mflowgen.state     import ResumeHandler
 
 # Path hack for now to find steps and adks
 
@@ -69,7 +113,7 @@ def parse_cmdline():
   p.add_argument(       "--design"                                )
   p.add_argument(       "--update",  action="store_true"          )
   p.add_argument(       "--backend", default="make",
-                                     choices=("make", "ninja")    )
+                                     choices=("make", "ninja", "local") )
 
   # Stash-related arguments
   p.add_argument(       "args", type=str, nargs='*' ) # positional
@@ -79,7 +123,37 @@ def parse_cmdline():
   p.add_argument(       "--hash"                                  )
   p.add_argument(       "--all",     action="store_true"          )
   p.add_argument(       "--verbose", action="store_true"          )
-  opts = p.parse_args()
+  p.add_argument(       "--name"                                  )
+  p.add_argument(       "--author"                                )
+  p.add_argument(       "--since"                                 )
+  p.add_argument(       "--until"                                 )
+  p.add_argument(       "--page",    type=int                     )
+  p.add_argument(       "--limit",   type=int                     )
+  p.add_argument(       "--link",    action="store_true"          )
+  p.add_argument(       "--materialize", action="store_true"      )
+  p.add_argument(       "--compress", nargs='?', const='auto'     )
+  p.add_argument(       "--outputs-only", action="store_true"     )
+  p.add_argument(       "--keep-last", type=int                   )
+  p.add_argument(       "--max-age", type=int                     )
+
+  # Cache-related arguments
+  p.add_argument(       "--size"                                  )
+
+  # Runtime-related arguments
+  p.add_argument(       "--critical-path", action="store_true"    )
+  p.add_argument(       "--eta",     action="store_true"          )
+
+  # Build-related arguments
+  p.add_argument( "-j", "--jobs",    type=int, nargs='?',
+                                     const=os.cpu_count()         )
+  p.add_argument( "-n", "--dry-run", action="store_true"          )
+
+  # Positional args may also come after the options (e.g., build targets
+  # in "mflowgen build -j 4 list")
+  opts, extra = p.parse_known_args()
+  unknown = [ x for x in extra if x.startswith( '-' ) ]
+  if unknown: p.error( 'unrecognized arguments: ' + ' '.join( unknown ) )
+  opts.args += extra
   if opts.help and not opts.args: p.error() # print help only if not stash
   return opts
 
@@ -109,14 +183,29 @@ def main():
   if opts.args and opts.args[0] == 'stash':
     shandler = StashHandler()
     shandler.launch(
-      args    = opts.args[1:],
-      help_   = opts.help,
-      path    = opts.path,
-      step    = opts.step,
-      msg     = opts.msg,
-      hash_   = opts.hash,
-      all_    = opts.all,
-      verbose = opts.verbose,
+      args         = opts.args[1:],
+      help_        = opts.help,
+      path         = opts.path,
+      step         = opts.step,
+      msg          = opts.msg,
+      hash_        = opts.hash,
+      all_         = opts.all,
+      verbose      = opts.verbose,
+      name         = opts.name,
+      author       = opts.author,
+      since        = opts.since,
+      until        = opts.until,
+      page         = opts.page,
+      limit        = opts.limit,
+      jobs         = opts.jobs,
+      link         = opts.link,
+      materialize  = opts.materialize,
+      compress     = opts.compress,
+      outputs_only = opts.outputs_only,
+      keep_last    = opts.keep_last,
+      max_age      = opts.max_age,
+      size         = opts.size,
+      dry_run      = opts.dry_run,
     )
     return
 
@@ -131,6 +220,66 @@ def main():
     )
     return
 
+  # Dispatch to CacheHandler
+
+  if opts.args and opts.args[0] == 'cache':
+    chandler = CacheHandler()
+    chandler.launch(
+      args  = opts.args[1:],
+      help_ = opts.help,
+      path  = opts.path,
+      size  = opts.size,
+    )
+    return
+
+  # Dispatch to TraceHandler
+
+  if opts.args and opts.args[0] == 'trace':
+    thandler = TraceHandler()
+    thandler.launch(
+      args  = opts.args[1:],
+      help_ = opts.help,
+      path  = opts.path,
+      jobs  = opts.jobs,
+      all_  = opts.all,
+    )
+    return
+
+  # Dispatch to RuntimesHandler
+
+  if opts.args and opts.args[0] == 'runtimes':
+    rthandler = RuntimesHandler()
+    rthandler.launch(
+      args          = opts.args[1:],
+      help_         = opts.help,
+      critical_path = opts.critical_path,
+      eta           = opts.eta,
+    )
+    return
+
+  # Dispatch to ResumeHandler
+
+  if opts.args and opts.args[0] == 'resume':
+    rshandler = ResumeHandler()
+    rshandler.launch(
+      args    = opts.args[1:],
+      help_   = opts.help,
+      dry_run = opts.dry_run,
+    )
+    return
+
+  # Dispatch to BuildHandler
+
+  if opts.args and opts.args[0] == 'build':
+    bhandler = BuildHandler()
+    bhandler.launch(
+      args    = opts.args[1:],
+      help_   = opts.help,
+      jobs    = opts.jobs,
+      dry_run = opts.dry_run,
+    )
+    return
+
   # Dispatch to RunHandler
 
   legacy = \
@@ -143,6 +292,7 @@ def main():
       design  = opts.design,
       update  = opts.update,
       backend = opts.backend,
+      verbose = opts.verbose,
     )
     return
 
@@ -150,6 +300,8 @@ def main():
 
   ArgumentParserWithCustomError().error(
     'Command can be "mflowgen run" or "mflowgen stash" or "mflowgen mock"'
+    ' or "mflowgen build" or "mflowgen cache" or "mflowgen trace"'
+    ' or "mflowgen runtimes" or "mflowgen resume"'
   )
 
 
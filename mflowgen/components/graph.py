@@ -5,11 +5,13 @@
 # Date   : June 2, 2019
 #
 
+import itertools
 import os
 
 from mflowgen.components.step import Step
 from mflowgen.components.edge import Edge
-from mflowgen.utils           import get_top_dir
+from mflowgen.utils           import get_top_dir, write_if_changed
+from mflowgen.utils           import critical_path
 
 class Graph:
   """Graph of nodes and edges (i.e., :py:mod:`Step` and :py:mod:`Edge`)."""
@@ -20,6 +22,23 @@ class Graph:
     s._edges_o = {}
     s._steps   = {}
 
+    # Step-level adjacency index that is kept up to date with the edge
+    # lists above. Each maps a step name to a dict of neighboring step
+    # names and the number of edges between the two steps (i.e., several
+    # files can connect the same pair of steps).
+    #
+    #     s._preds[ 'bar' ] = { 'foo': 2 }   # two edges from foo to bar
+    #     s._succs[ 'foo' ] = { 'bar': 2 }
+    #
+
+    s._preds = {}
+    s._succs = {}
+
+    # Capacity of each resource that steps can hold while they execute
+    # (see Step.get_resources)
+
+    s._resource_capacities = {}
+
     # System paths to search for ADKs (i.e., analogous to python sys.path)
     #
     # The contents of the environment variable "MFLOWGEN_PATH" are
@@ -193,6 +212,24 @@ class Graph:
     s._edges_i[ dst_step_name ].append( e )
     s._edges_o[ src_step_name ].append( e )
 
+    s._index_add_edge( src_step_name, dst_step_name )
+
+  # Adjacency index helpers
+
+  def _index_add_edge( s, src_step_name, dst_step_name ):
+    preds = s._preds.setdefault( dst_step_name, {} )
+    succs = s._succs.setdefault( src_step_name, {} )
+    preds[ src_step_name ] = preds.get( src_step_name, 0 ) + 1
+    succs[ dst_step_name ] = succs.get( dst_step_name, 0 ) + 1
+
+  def _index_remove_edge( s, src_step_name, dst_step_name ):
+    preds = s._preds[ dst_step_name ]
+    succs = s._succs[ src_step_name ]
+    preds[ src_step_name ] -= 1
+    succs[ dst_step_name ] -= 1
+    if not preds[ src_step_name ] : del( preds[ src_step_name ] )
+    if not succs[ dst_step_name ] : del( succs[ dst_step_name ] )
+
   def connect_by_name( s, src, dst ):
 
     # Get the step (in case the user provided step names instead)
@@ -222,9 +259,10 @@ class Graph:
 
     overlap = set( src_outputs ).intersection( set( dst_inputs ) )
 
-    # For all overlaps, connect src to dst
+    # For all overlaps, connect src to dst (in sorted order so that the
+    # generated build files do not depend on set iteration order)
 
-    for name in overlap:
+    for name in sorted( overlap ):
       l_handle = src_step.o( name )
       r_handle = dst_step.i( name )
       s.connect( l_handle, r_handle )
@@ -250,6 +288,37 @@ class Graph:
     for step_name in s.all_steps():
       s.get_step( step_name ).expand_params()
 
+  #-----------------------------------------------------------------------
+  # Resources
+  #-----------------------------------------------------------------------
+
+  def set_resource_capacity( s, resource, capacity ):
+    """Sets how much of a resource the running steps can hold in total.
+
+    Steps list the resources that they hold while executing in the
+    "resources" section of their configure.yml (see
+    :py:meth:`Step.get_resources`). The build system only starts a step if
+    the steps that are already running leave enough of each resource, so
+    the number of parallel jobs can be set high without oversubscribing
+    cores or licenses. Resources without a capacity are not limited.
+
+    For example: ::
+
+        g.set_resource_capacity( 'cores',           32 )
+        g.set_resource_capacity( 'license.innovus',  2 )
+
+    Args:
+      resource: A string representing the name of the resource
+      capacity: An integer amount of the resource
+    """
+    assert int( capacity ) > 0, \
+      'set_resource_capacity -- Capacity of "{}" must be positive: ' \
+      '{}'.format( resource, capacity )
+    s._resource_capacities[ resource ] = int( capacity )
+
+  def get_resource_capacities( s ):
+    return s._resource_capacities
+
   #-----------------------------------------------------------------------
   # Metadata
   #-----------------------------------------------------------------------
@@ -343,6 +412,42 @@ class Graph:
       'bar-p-3').
     """
 
+    return s.param_sweep( step, { param_name : param_space } )
+
+  # param_sweep
+
+  def param_sweep( s, step, params, mode='product' ):
+    """Spins out new copies of the step across a multi-dimensional
+    parameter space.
+
+    This is the multi-parameter version of :py:meth:`Graph.param_space`.
+    The set of points is computed first (i.e., the cartesian product of
+    all parameter value lists, or the values zipped together), and then
+    the step and all of its downstream steps are replicated once per
+    point in a single pass over the graph.
+
+    For example, this call:
+
+    .. code-block:: python
+
+        g.param_sweep( 'bar', { 'p': [ 1, 2 ], 'q': [ 'a', 'b' ] } )
+
+    creates the steps 'bar-p-1-q-a', 'bar-p-1-q-b', 'bar-p-2-q-a', and
+    'bar-p-2-q-b' (and likewise for each downstream step), which are the
+    same names that nested calls to :py:meth:`Graph.param_space` would
+    generate.
+
+    Args:
+      step   : A string for the step name targeted for expansion
+      params : A dict of parameter names (strings) and lists of values
+      mode   : Either 'product' to sweep the cartesian product of all
+               value lists, or 'zip' to sweep the value lists in lockstep
+               (all lists must then have the same length)
+
+    Returns:
+      A list of (parameterized) steps, one for each point in the sweep.
+    """
+
     # Get the step name (in case the user provided a step object instead)
 
     if type( step ) != str:
@@ -352,63 +457,47 @@ class Graph:
       step      = s.get_step( step_name )
 
     assert step_name in s.all_steps(), \
-      'param_space -- ' \
+      'param_sweep -- ' \
       'Step "{}" not found in graph'.format( step_name )
 
-    # Remove the step and its incoming edges from the graph
-
-    del( s._steps[ step_name ] )
+    assert type( params ) == dict, \
+      'param_sweep -- ' \
+      'Expecting a dict of parameter names and lists of values'
 
-    elist_i = s._param_space_helper_remove_incoming_edges( step_name )
-
-    # Now spin out new copies of the step across the parameter space
-    #
-    # Start from this:
-    #
-    #     +-----+    +-----------+    +-----------+
-    #     | foo | -> |    bar    | -> |    baz    |
-    #     |     |    |           |    |           |
-    #     +-----+    +-----------+    +-----------+
-    #
-    # End like this:
-    #
-    #                 +-----------+
-    #             +-> |  bar-p-1  |
-    #             |   | ( p = 1 ) |        +-----------+
-    #             |   +-----------+     -- |    baz    |
-    #     +-----+ |   +-----------+        |           |
-    #     | foo | --> |  bar-p-2  |        +-----------+
-    #     |     | |   | ( p = 2 ) |
-    #     +-----+ |   +-----------+
-    #             |   +-----------+
-    #             +-> |  bar-p-3  |
-    #                 | ( p = 3 ) |
-    #                 +-----------+
+    # Compute the points in the parameter space
     #
+    # Each point is a list of ( param_name, value ) pairs in the order the
+    # parameters were given.
+
+    names  = list( params.keys() )
+    values = [ list( params[ name ] ) for name in names ]
+
+    for name in names:
+      if name not in step.params():
+        raise KeyError( 'param_sweep -- ' \
+          'No parameter "%s" in step "%s" (available parameters: %s)' % \
+            ( name, step_name, step.params().keys() ) )
+
+    if mode == 'product':
+      points = list( itertools.product( *values ) )
+    elif mode == 'zip':
+      assert len( { len( v ) for v in values } ) <= 1, \
+        'param_sweep -- ' \
+        'All value lists must have the same length in "zip" mode'
+      points = list( zip( *values ) )
+    else:
+      assert False, \
+        'param_sweep -- Unrecognized mode "{}"'.format( mode )
 
-    new_steps = []
-
-    for p in param_space:
-      p_step = step.clone()
-      p_step.set_param( param_name, p )
-      p_step.set_name( step_name + '-' + param_name + '-' + str(p) )
-      s.add_step( p_step )
-      for e in elist_i:
-        src_step_name, src_f = e.get_src()
-        dst_step_name, dst_f = e.get_dst()
-        src_step = s.get_step( src_step_name )
-        s.connect( src_step.o( src_f ), p_step.i( dst_f ) )
-      new_steps.append( p_step )
-
-    # Build a dict to map (removed) base steps to their expanded steps
-
-    new_src_map = { step_name : new_steps }
+    points   = [ list( zip( names, point ) ) for point in points ]
+    suffixes = [ ''.join( '-' + name + '-' + str( v ) for name, v in point )
+                   for point in points ]
 
-    # Recurse on downstream nodes
+    # Find the step and everything downstream of it, which is the
+    # subgraph that gets replicated for each point
     #
-    # We traverse down the graph in _topological_ sort order to handle
-    # cases where downstream nodes depend on multiple previous nodes. For
-    # example:
+    # We replicate in _topological_ sort order to handle cases where
+    # downstream nodes depend on multiple previous nodes. For example:
     #
     #         +---+    +---+    +---+
     #         | A | -> | B | -> | C |
@@ -416,157 +505,124 @@ class Graph:
     #           |               ^
     #            \_____________/
     #
-    # On each node expansion, we are breaking the incoming edges of that
-    # node, removing the node from the graph, stamping out three
-    # parameterized versions of the node, and reconnecting the incoming
-    # edges.
+    # When we get to C, both A and B must have already been replicated so
+    # that the copies of C can connect to the matching copies of A and B.
     #
-    # The natural expansion order is A, B, C (i.e., topological sort
-    # order). If we use non-topological sort order, then the solution is
-    # less clean.
-    #
-
-    dep_steps = s._param_space_helper_get_dependent_steps( step_name )
-    dep_steps = s.topological_sort( seed_steps=dep_steps )
-
-    # For each dependent step, replicate and connect to the graph
 
-    visited = set()
+    subgraph = { step_name }
+    frontier = [ step_name ]
 
-    for dep_step in dep_steps:
-      s._param_space_helper( step_name   = dep_step,
-                             new_src_map = new_src_map,
-                             visited     = visited,
-                             param_name  = param_name,
-                             param_space = param_space )
+    while frontier:
+      for dst_step_name in s._param_space_helper_get_dependent_steps(
+                             frontier.pop() ):
+        if dst_step_name not in subgraph:
+          subgraph.add( dst_step_name )
+          frontier.append( dst_step_name )
 
-    return new_steps
+    subgraph_order = s.topological_sort( seed_steps=subgraph )
 
-  # _param_space_helper
-  #
-  # Take the dependent step (i.e., baz), replicate the step across the
-  # parameter space, and then connect to the frontier of new_srcs (i.e.,
-  # bar-p-1, bar-p-2, bar-p-3).
-  #
-  # Start from this:
-  #
-  #                 +-----------+
-  #             +-> |  bar-p-1  |
-  #             |   | ( p = 1 ) |        +-----------+
-  #             |   +-----------+     -- |    baz    |
-  #     +-----+ |   +-----------+        |           |
-  #     | foo | --> |  bar-p-2  |        +-----------+
-  #     |     | |   | ( p = 2 ) |
-  #     +-----+ |   +-----------+
-  #             |   +-----------+
-  #             +-> |  bar-p-3  |
-  #                 | ( p = 3 ) |
-  #                 +-----------+
-  #
-  # End like this:
-  #
-  #                 +-----------+    +-----------+
-  #             +-> |  bar-p-1  | -> |  baz-p-1  |
-  #             |   | ( p = 1 ) |    |           |
-  #             |   +-----------+    +-----------+
-  #     +-----+ |   +-----------+    +-----------+
-  #     | foo | --> |  bar-p-2  | -> |  baz-p-2  |
-  #     |     | |   | ( p = 2 ) |    |           |
-  #     +-----+ |   +-----------+    +-----------+
-  #             |   +-----------+    +-----------+
-  #             +-> |  bar-p-3  | -> |  baz-p-3  |
-  #                 | ( p = 3 ) |    |           |
-  #                 +-----------+    +-----------+
-  #
-
-  def _param_space_helper( s, step_name, new_src_map, visited,
-                                         param_name,  param_space ):
-
-    if step_name in visited:
-      return
-    else:
-      visited.add( step_name )
-
-    step = s.get_step( step_name )
+    # Remove the subgraph and its incoming edges from the graph
+    #
+    # Start from this:
+    #
+    #     +-----+    +-----------+    +-----------+
+    #     | foo | -> |    bar    | -> |    baz    |
+    #     |     |    |           |    |           |
+    #     +-----+    +-----------+    +-----------+
+    #
 
-    # Remove the step and its incoming edges from the graph
+    base_steps = {}
+    elists_i   = {}
 
-    del( s._steps[ step_name ] )
+    for x in subgraph_order:
+      base_steps[ x ] = s.get_step( x )
+      del( s._steps[ x ] )
+      elists_i[ x ] = s._param_space_helper_remove_incoming_edges( x )
 
-    elist_i = s._param_space_helper_remove_incoming_edges( step_name )
+    # Now spin out new copies of the subgraph for each point and connect
+    # each copy to the existing steps or to the copies of the same point
+    #
+    # End like this:
+    #
+    #                 +-----------+    +-----------+
+    #             +-> |  bar-p-1  | -> |  baz-p-1  |
+    #             |   | ( p = 1 ) |    |           |
+    #             |   +-----------+    +-----------+
+    #     +-----+ |   +-----------+    +-----------+
+    #     | foo | --> |  bar-p-2  | -> |  baz-p-2  |
+    #     |     | |   | ( p = 2 ) |    |           |
+    #     +-----+ |   +-----------+    +-----------+
+    #
 
-    # Now spin out new copies of the step + attach them to new srcs
+    new_steps = {}
 
-    new_steps = []
+    for x in subgraph_order:
 
-    for i, p in enumerate( param_space ):
-      p_step = step.clone()
-      p_step.set_name( step_name + '-' + param_name + '-' + str(p) )
-      # Propagate the new parameter value to downstream nodes
-      try:
-        p_step.set_param( param_name, p )
-      # If the parameter cannot be accessed, do nothing to the parameter
-      except KeyError:
-        pass
-      s.add_step( p_step )
-      for e in elist_i:
-        src_step_name, src_f = e.get_src()
-        dst_step_name, dst_f = e.get_dst()
-        if src_step_name in new_src_map.keys():
-          src_step = new_src_map[src_step_name][i]
-        else:
-          src_step = s.get_step( src_step_name )
-        s.connect( src_step.o( src_f ), p_step.i( dst_f ) )
-      new_steps.append( p_step )
+      new_steps[ x ] = []
 
-    # Build a dict to map (removed) base steps to their expanded steps
+      for i, point in enumerate( points ):
 
-    new_src_map.update( { step_name : new_steps } )
+        p_step = base_steps[ x ].clone()
+        p_step.set_name( x + suffixes[i] )
 
-    # Recurse on downstream nodes
+        for param_name, value in point:
+          # The swept step must have the parameter
+          if x == step_name:
+            p_step.set_param( param_name, value )
+          # Propagate the new parameter value to downstream nodes, but
+          # if the parameter cannot be accessed, do nothing to it
+          else:
+            try:
+              p_step.set_param( param_name, value )
+            except KeyError:
+              pass
 
-    dep_steps = s._param_space_helper_get_dependent_steps( step_name )
-    dep_steps = s.topological_sort( seed_steps=dep_steps )
+        s.add_step( p_step )
 
-    # For each dependent step, replicate and connect to the new steps
+        for e in elists_i[ x ]:
+          src_step_name, src_f = e.get_src()
+          dst_step_name, dst_f = e.get_dst()
+          if src_step_name in subgraph:
+            src_step = new_steps[ src_step_name ][i]
+          else:
+            src_step = s.get_step( src_step_name )
+          s.connect( src_step.o( src_f ), p_step.i( dst_f ) )
 
-    for dep_step in dep_steps:
-      s._param_space_helper( step_name   = dep_step,
-                             new_src_map = new_src_map,
-                             visited     = visited,
-                             param_name  = param_name,
-                             param_space = param_space )
+        new_steps[ x ].append( p_step )
 
-    return new_steps
+    return new_steps[ step_name ]
 
   def _param_space_helper_remove_incoming_edges( s, step_name ):
 
     try:
       elist_i = s._edges_i[ step_name ]
       del( s._edges_i[ step_name ] ) # Delete edges in incoming edge list
-      for e in elist_i: # Also delete these edges in outgoing edge lists
-        src_step_name, src_f = e.get_src()
-        src_elist_o = s._edges_o[src_step_name]
-        del( src_elist_o[ src_elist_o.index( e ) ] )
     except KeyError:
-      elist_i = []
+      return []
+
+    # Also delete these edges in outgoing edge lists
+    #
+    # Group the edges by src step so that each outgoing edge list is only
+    # filtered once (e.g., the ADK step fans out to every swept step).
+
+    removed = {}
+    for e in elist_i:
+      src_step_name, src_f = e.get_src()
+      removed.setdefault( src_step_name, set() ).add( id( e ) )
+      s._index_remove_edge( src_step_name, step_name )
+
+    for src_step_name, edge_ids in removed.items():
+      s._edges_o[ src_step_name ] = \
+        [ e for e in s._edges_o[ src_step_name ] if id( e ) not in edge_ids ]
 
     return elist_i
 
   def _param_space_helper_get_dependent_steps( s, step_name ):
 
-    dep_steps = set()
-
     try:
-      elist_o = s._edges_o[ step_name ]
+      return set( s._succs[ step_name ].keys() )
     except KeyError:
-      elist_o = []
-
-    for e in elist_o:
-      dst_step_name, dst_f = e.get_dst()
-      dep_steps.add( dst_step_name )
-
-    return dep_steps
+      return set()
 
   #-----------------------------------------------------------------------
   # Ninja helpers
@@ -684,85 +740,110 @@ ranksep=0.8;
 
     # Write out the graphviz dot graph file
 
-    with open( dot_f, 'w' ) as fd:
-      graph_cfg = {}
-      graph_cfg['title'] = dot_title
-      graph_cfg['nodes'] = '\n'.join( dot_nodes )
-      graph_cfg['edges'] = '\n'.join( dot_edges )
-      fd.write( graph_template.format( **graph_cfg ) )
+    graph_cfg = {}
+    graph_cfg['title'] = dot_title
+    graph_cfg['nodes'] = '\n'.join( dot_nodes )
+    graph_cfg['edges'] = '\n'.join( dot_edges )
+
+    write_if_changed( dot_f, graph_template.format( **graph_cfg ) )
 
   #-----------------------------------------------------------------------
   # Graph traversal order
   #-----------------------------------------------------------------------
 
   def topological_sort( s, seed_steps=False ):
+    """Returns a list of step names in topological order.
 
-    order = []
+    This is a Kahn-style sort driven by in-degree counters over the
+    step-level adjacency index, so it runs in time linear in the number
+    of steps and edges. Steps are released level by level and each level
+    is sorted by name, so the order is deterministic.
 
-    # Make a deep copy of the edges (destructive algorithm)
+    Args:
+      seed_steps: An optional set of step names. If given, only the
+        subgraph made of these steps is sorted (i.e., edges coming from
+        steps outside of the set are ignored).
 
-    edges_deep_copy = {}
-    for step_name, elist in s._edges_i.items():
-      edges_deep_copy[ step_name ] = list(elist)
-    edges = edges_deep_copy
+    Returns:
+      A list of step names in topological order.
+    """
 
     # Consider all steps in the graph, or if there are seed steps then
     # only consider that subgraph (with incoming dangling edges removed)
 
     if type( seed_steps ) != set:
-      steps = set( s.all_steps() )
+      steps    = s._steps
+      subgraph = False
     else:
-      steps = set( seed_steps )
+      steps    = seed_steps
+      subgraph = True
       # If there are no steps, just return an empty list
       if not steps:
         return []
-      # Delete any edges directed to nodes not in the subgraph
-      steps_with_edges_i = list( edges.keys() )
-      for k in steps_with_edges_i:
-        if k not in seed_steps:
-          del( edges[k] )
-      # Delete any incoming edges from src nodes not in the subgraph
-      keys_to_delete = []
-      for step_name, elist in edges.items():
-        idx_to_delete = []
-        for i, e in enumerate( elist ):
-          if e.get_src()[0] not in seed_steps:
-            idx_to_delete.append( i )
-        for i in reversed( idx_to_delete ):
-          del( elist[i] )
-        if elist == []:
-          keys_to_delete.append( step_name )
-      for k in keys_to_delete:
-        del( edges[k] )
+
+    # Count the incoming dependencies of each step
+
+    indegree = {}
+
+    for step_name in steps:
+      try:
+        preds = s._preds[ step_name ]
+      except KeyError:
+        indegree[ step_name ] = 0
+        continue
+      if subgraph:
+        indegree[ step_name ] = sum( 1 for p in preds if p in steps )
+      else:
+        indegree[ step_name ] = len( preds )
 
     # Topological sort
+    #
+    # Release all steps without dependencies at once and sort them for
+    # determinacy, then release the next level of steps whose last
+    # dependency was in this level.
 
-    while( steps ):
+    order = []
+    level = sorted( x for x, n in indegree.items() if n == 0 )
 
-      steps_with_deps    = set( edges.keys() )
-      steps_without_deps = steps.difference( steps_with_deps )
+    while( level ):
 
-      assert steps_without_deps, \
-        'topological_sort -- Could not find a valid sort for ' \
-        '{}'.format( steps )
+      order.extend( level )
 
-      order.extend( sorted( steps_without_deps ) ) # sort for determinacy
-      steps = steps_with_deps
+      next_level = []
+      for step_name in level:
+        for dst_step_name in s._succs.get( step_name, () ):
+          try:
+            indegree[ dst_step_name ] -= 1
+          except KeyError:
+            continue # not in the (sub)graph
+          if indegree[ dst_step_name ] == 0:
+            next_level.append( dst_step_name )
 
-      keys_to_delete = []
-      for step_name, elist in edges.items():
-        idx_to_delete = []
-        for i, e in enumerate( elist ):
-          if e.get_src()[0] in order:
-            idx_to_delete.append( i )
-        for i in reversed( idx_to_delete ):
-          del( elist[i] )
-        if elist == []:
-          keys_to_delete.append( step_name )
+      level = sorted( next_level )
 
-      for k in keys_to_delete:
-        del( edges[k] )
+    assert len( order ) == len( indegree ), \
+      'topological_sort -- Could not find a valid sort for ' \
+      '{}'.format( set( indegree.keys() ).difference( order ) )
 
     return order
 
+  def critical_path( s, weights ):
+    """Finds the longest path through the graph weighted by step runtimes.
+
+    Each step is assumed to start as soon as all of its upstream steps
+    have finished (i.e., with as many jobs as needed), so the length of
+    the critical path is the shortest time in which the graph can be
+    built. Steps with slack can be delayed by that much without delaying
+    the whole build.
+
+    Args:
+      weights: A dict mapping step names to their runtimes (e.g., in
+        seconds). Steps without a runtime count as zero.
+
+    Returns:
+      A dict with the "length" of the critical path, the "path" as a list
+      of step names from the first to the last, and the earliest "start"
+      and the "slack" of every step (dicts keyed by step name).
+    """
 
+    return critical_path( s.topological_sort(), s._preds, weights )
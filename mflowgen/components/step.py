@@ -6,10 +6,17 @@
 #
 
 import copy
+import hashlib
+import json
 import os
+import re
 import yaml
 
-from mflowgen.utils import get_top_dir, read_yaml, write_yaml
+from collections    import ChainMap
+
+from mflowgen.utils import get_top_dir, read_yaml, write_yaml_if_changed
+from mflowgen.utils import dir_digest, dir_signature, fingerprint_inputs
+from mflowgen.utils.helpers import YamlDumper
 
 class Step:
 
@@ -19,7 +26,8 @@ class Step:
     #
     # If this is a default step, then we use the top-level steps directory
 
-    s._config = {}
+    s._config = ChainMap()
+    s._lent   = set()
 
     if default:
       yaml_path = '/'.join([
@@ -84,6 +92,24 @@ class Step:
       if type( c ) == bool:
         data['commands'][i] = str(c).lower()
 
+    # Check the resource requirements
+    #
+    # - An unquoted parameter reference (e.g., "cores: {nthreads}") is
+    #   read by YAML as a dict with a single empty key, so convert it back
+    #   into a string
+    #
+
+    if 'resources' in data.keys():
+      if not data['resources']:
+        del( data['resources'] )
+
+    if 'resources' in data.keys():
+      assert type( data['resources'] ) == dict, \
+        'Step -- YAML "resources" must be a dict: {}'.format( yaml_path )
+      for k, v in data['resources'].items():
+        if type( v ) == dict and list( v.values() ) == [ None ]:
+          data['resources'][k] = '{' + str( list( v.keys() )[0] ) + '}'
+
     # Replace any output tag shorthands with the real files
     #
     # So this configuration YAML:
@@ -128,12 +154,98 @@ class Step:
   # Clone
   #-----------------------------------------------------------------------
 
+  # clone
+  #
+  # The configuration is copy-on-write. It is stored as a chain of layers
+  # (i.e., a ChainMap) where only the top layer belongs to this step and
+  # all other layers are shared with the step it was cloned from. A clone
+  # starts with an empty top layer on top of the shared layers, so cloning
+  # costs the same no matter how many commands or parameters a step has.
+  #
+  # Shared layers are never modified in place. Anything that modifies a
+  # value first copies that one value into the top layer with s._own(),
+  # and this step moves its own top layer into the shared layers before
+  # handing them to the clone.
+  #
+  # The exception are values in the top layer that were handed out to the
+  # caller (or handed in, see s._lend()), since the caller may keep
+  # modifying them in place. These stay in the top layer of this step and
+  # the clone gets its own deep copy of them instead.
+  #
+  # Long chains (e.g., clones of clones in nested sweeps) are flattened
+  # into a single shared layer, which only copies references.
+  #
+
+  _max_config_layers = 8
+
   def clone( s ):
+    top    = s._config.maps[0]
+    shared = s._config.maps[1:]
+    lent   = { k: v for k, v in top.items() if k in s._lent }
+    if len( lent ) < len( top ):
+      shared = [ { k: v for k, v in top.items() if k not in lent } ] + \
+               shared
+      s._config = ChainMap( lent, *shared )
     new_step = Step.__new__( Step )
-    new_step._config = copy.deepcopy( s._config )
+    if lent:
+      new_step._config = ChainMap( {}, copy.deepcopy( lent ), *shared )
+    else:
+      new_step._config = ChainMap( {}, *shared )
+    if len( new_step._config.maps ) > s._max_config_layers:
+      new_step._config = ChainMap( {}, dict( new_step._config ) )
+    new_step._lent     = set()
     new_step.step_dir  = s.step_dir
     return new_step
 
+  # _own
+  #
+  # Returns the value for the given key after making sure that it is
+  # stored in the top layer of the configuration (i.e., it belongs to this
+  # step and is safe to modify in place). With deep=False, only the
+  # container itself is copied and its values are still shared.
+  #
+
+  def _own( s, key, deep=True ):
+    local = s._config.maps[0]
+    if key not in local:
+      if deep:
+        local[ key ] = copy.deepcopy( s._config[ key ] )
+      else:
+        local[ key ] = copy.copy( s._config[ key ] )
+    return local[ key ]
+
+  # _lend
+  #
+  # Same as _own (shallow) for values that are handed out to the caller,
+  # who may keep modifying them in place. Clones never share these.
+  #
+
+  def _lend( s, key ):
+    s._lent.add( key )
+    return s._own( key, deep=False )
+
+  # _own_param
+  #
+  # Same as _lend but for a single parameter value. The parameters dict is
+  # only copied shallowly, and then the one value is copied if it is a
+  # container that is still shared with another layer (e.g., the "order"
+  # list).
+  #
+
+  def _own_param( s, param ):
+    step_params = s._lend( 'parameters' )
+    value       = step_params[ param ]
+    if type( value ) in ( list, dict, set ):
+      for m in s._config.maps[1:]:
+        try:
+          shared = m[ 'parameters' ][ param ] is value
+        except KeyError:
+          continue
+        if shared:
+          step_params[ param ] = copy.deepcopy( value )
+          break
+    return step_params[ param ]
+
   #-----------------------------------------------------------------------
   # API to help build graphs interactively
   #-----------------------------------------------------------------------
@@ -197,14 +309,14 @@ class Step:
       s._config['inputs']
     except KeyError:
       s._config['inputs'] = []
-    s._config['inputs'].extend( new_list )
+    s._own( 'inputs' ).extend( new_list )
 
   def extend_outputs( s, new_list ):
     try:
       s._config['outputs']
     except KeyError:
       s._config['outputs'] = []
-    s._config['outputs'].extend( new_list )
+    s._own( 'outputs' ).extend( new_list )
 
   # API to pre/post extend commands
 
@@ -213,14 +325,14 @@ class Step:
       s._config['commands']
     except KeyError:
       s._config['commands'] = []
-    s._config['commands'][:0] = new_list
+    s._own( 'commands' )[:0] = new_list
 
   def extend_commands( s, new_list ):
     try:
       s._config['commands']
     except KeyError:
       s._config['commands'] = []
-    s._config['commands'].extend( new_list )
+    s._own( 'commands' ).extend( new_list )
 
   # API to extend preconditions and postconditions
 
@@ -229,26 +341,31 @@ class Step:
       s._config['preconditions']
     except KeyError:
       s._config['preconditions'] = []
-    s._config['preconditions'].extend( new_list )
+    s._own( 'preconditions' ).extend( new_list )
 
   def extend_postconditions( s, new_list ):
     try:
       s._config['postconditions']
     except KeyError:
       s._config['postconditions'] = []
-    s._config['postconditions'].extend( new_list )
+    s._own( 'postconditions' ).extend( new_list )
 
   def set_preconditions( s, new_list ):
     s._config['preconditions'] = new_list
+    s._lent.add( 'preconditions' )
 
   def set_postconditions( s, new_list ):
     s._config['postconditions'] = new_list
+    s._lent.add( 'postconditions' )
+
+  # The returned lists may be modified in place by the caller, so they
+  # must belong to this step (like the getters of the inputs and commands)
 
   def get_preconditions( s ):
-    return s._config['preconditions']
+    return s._lend( 'preconditions' )
 
   def get_postconditions( s ):
-    return s._config['postconditions']
+    return s._lend( 'postconditions' )
 
   #-----------------------------------------------------------------------
   # Parameter system
@@ -268,7 +385,7 @@ class Step:
         'No parameter "%s" in step "%s"' % ( param, s.get_name() ) )
     try:
       step_params[param]
-      step_params[param] = value
+      s._own( 'parameters', deep=False )[param] = value
     except KeyError:
       raise KeyError( 'set_param -- ' \
         'No parameter "%s" in step "%s" (available parameters: %s)' % \
@@ -282,7 +399,9 @@ class Step:
       'get_param -- ' \
       'No parameter "%s" in step "%s" (options: %s)' % \
         ( param, s.get_name(), s._config['parameters'].keys() )
-    return s._config['parameters'][param]
+    # Parameter values may be modified in place by the caller (e.g.,
+    # appending to the "order" list), so they must belong to this step
+    return s._own_param( param )
 
   # update_params
   #
@@ -304,51 +423,78 @@ class Step:
         s._config['parameters']
       except KeyError:
         s._config['parameters'] = {}
-      s._config['parameters'].update( params )
+      s._own( 'parameters', deep=False ).update( params )
 
     # Only update parameters that were defined in the configuration YAML
 
     else:
       try:
-        for p in params.keys():
-          if p in s._config['parameters'].keys():
-            s._config['parameters'][p] = params[p]
+        step_params = s._config['parameters']
       except KeyError:
-        pass
+        return
+      updates = { p: v for p, v in params.items() if p in step_params }
+      if updates:
+        s._own( 'parameters', deep=False ).update( updates )
+
+  # params
+  #
+  # The returned dict may be modified in place by the caller, so it must
+  # belong to this step. Internally we use _params_view() when we only
+  # need to read the parameters.
+  #
 
   def params( s ):
     if 'parameters' not in s._config.keys():
       return {}
-    return s._config['parameters']
+    step_params = s._lend( 'parameters' )
+    for param in list( step_params ):
+      s._own_param( param )
+    return step_params
+
+  def _params_view( s ):
+    try:
+      return s._config['parameters']
+    except KeyError:
+      return {}
 
   # expand_params
   #
   # Populate all parameters in outputs and commands
+  #
+  # Expanded lists are only stored if expanding actually changed anything,
+  # so clones with unparameterized commands keep sharing them.
+  #
 
   def expand_params( s ):
 
+    params = s._params_view()
+
     # Expand outputs
 
     if 'outputs' in s._config.keys():
-      for idx, o in enumerate( s._config['outputs'] ):
+      outputs = list( s._config['outputs'] )
+      for idx, o in enumerate( outputs ):
         if type(o) == dict:
-          key   = o.keys()[0].format( **s.params() )
-          value = o.values()[0].format( **s.params() )
-          s._config['outputs'][idx] = { key : value }
+          key   = o.keys()[0].format( **params )
+          value = o.values()[0].format( **params )
+          outputs[idx] = { key : value }
         elif type(o) == str:
-          output = o.format( **s.params() )
-          s._config['outputs'][idx] = output
+          output = o.format( **params )
+          outputs[idx] = output
         else:
           assert False, \
             'expand_params -- ' \
             'Unrecognized type %s in output "%s"' % ( type(o), o )
+      if outputs != s._config['outputs']:
+        s._config['outputs'] = outputs
 
     # Expand commands
 
     if 'commands' in s._config.keys():
-      for idx, c in enumerate( s._config['commands'] ):
+      commands = list( s._config['commands'] )
+      for idx, c in enumerate( commands ):
         try:
-          s._config['commands'][idx] = c.format( **s.params() )
+          commands[idx] = c.format( **params )
         except KeyError as e:
           cause = e.args[0]
           raise KeyError( 'Error: Unrecognized parameter "' + cause + '"'
@@ -357,12 +503,25 @@ class Step:
         except AttributeError as e:
           print( '\nError: Perhaps a command was interpreted as a dict\n')
           raise
+      if commands != s._config['commands']:
+        s._config['commands'] = commands
+
+    # Expand resources
+
+    if 'resources' in s._config.keys():
+      resources = {
+        k: v.format( **params ) if type( v ) == str else v
+        for k, v in s._config['resources'].items()
+      }
+      if resources != s._config['resources']:
+        s._config['resources'] = resources
 
     # Expand debug
 
     if 'debug' in s._config.keys():
-      for idx, c in enumerate( s._config['debug'] ):
-        s._config['debug'][idx] = c.format( **s.params() )
+      debug = [ c.format( **params ) for c in s._config['debug'] ]
+      if debug != s._config['debug']:
+        s._config['debug'] = debug
 
   #-----------------------------------------------------------------------
   # Metadata
@@ -389,30 +548,35 @@ class Step:
     # Escape outputs
 
     if 'outputs' in s._config.keys():
-      for idx, o in enumerate( s._config['outputs'] ):
+      outputs = list( s._config['outputs'] )
+      for idx, o in enumerate( outputs ):
         if type(o) == dict:
           key   = o.keys()[0].replace( '$', '$$' )
           value = o.values()[0].replace( '$', '$$' )
-          s._config['outputs'][idx] = { key : value }
+          outputs[idx] = { key : value }
         elif type(o) == str:
           output = o.replace( '$', '$$' )
-          s._config['outputs'][idx] = output
+          outputs[idx] = output
         else:
           assert False, \
             'escape_dollars -- ' \
             'Unrecognized type %s in output "%s"' % ( type(o), o )
+      if outputs != s._config['outputs']:
+        s._config['outputs'] = outputs
 
     # Escape commands
 
     if 'commands' in s._config.keys():
-      for idx, c in enumerate( s._config['commands'] ):
-        s._config['commands'][idx] = c.replace( '$', '$$' )
+      commands = [ c.replace( '$', '$$' ) for c in s._config['commands'] ]
+      if commands != s._config['commands']:
+        s._config['commands'] = commands
 
     # Escape debug
 
     if 'debug' in s._config.keys():
-      for idx, c in enumerate( s._config['debug'] ):
-        s._config['debug'][idx] = c.replace( '$', '$$' )
+      debug = [ c.replace( '$', '$$' ) for c in s._config['debug'] ]
+      if debug != s._config['debug']:
+        s._config['debug'] = debug
 
   #-----------------------------------------------------------------------
   # Observability methods
@@ -423,7 +587,7 @@ class Step:
   def all_inputs( s ):
     if 'inputs' not in s._config.keys():
       return []
-    return s._config['inputs']
+    return s._lend( 'inputs' )
 
   # all_outputs -- normal version
   #
@@ -538,11 +702,11 @@ class Step:
     return s.step_dir
 
   def get_commands( s ):
-    return s._config['commands']
+    return s._lend( 'commands' )
 
   def get_debug_commands( s ):
     if 'debug' in s._config.keys():
-      return s._config['debug']
+      return s._lend( 'debug' )
     else:
       return []
 
@@ -571,24 +735,221 @@ class Step:
         tmp.update( { 'style' : '|' } )
       return dumper.represent_scalar( **tmp )
     yaml.add_representer( str, str_representer )
+    yaml.add_representer( str, str_representer, Dumper=YamlDumper )
+
+    # Dump the content (leaving the file untouched if nothing changed)
+    # and return the data that was dumped
 
-    # Dump the content
+    data = dict( s._config )
 
-    write_yaml(
-      data = s._config,
+    write_yaml_if_changed(
+      data = data,
       path = build_dir + '/configure.yml',
     )
 
+    return data
+
+  # Resources that this step holds while it executes (e.g., cores,
+  # memory, or tool licenses), as set in the "resources" section of the
+  # configure.yml:
+  #
+  #     resources:
+  #       cores   : {nthreads}
+  #       mem_gb  : 64
+  #       license : innovus
+  #
+  # Licenses can be a name, a list of names, or a dict of names and
+  # counts. Each license is returned as its own resource "license.<name>"
+  # so that the above turns into this (with nthreads = 8):
+  #
+  #     { 'cores': 8, 'mem_gb': 64, 'license.innovus': 1 }
+  #
+  # The build only limits resources that have a capacity in the graph
+  # (see Graph.set_resource_capacity).
+  #
+
+  def set_resources( s, resources ):
+    s._config['resources'] = dict( resources )
+
+  def get_resources( s ):
+
+    resources = {}
+
+    for k, v in s._config.get( 'resources', {} ).items():
+      if k in [ 'license', 'licenses' ]:
+        if type( v ) != dict:
+          v = { name: 1 for name in ( v if type( v ) == list else [ v ] ) }
+        for name, n in v.items():
+          resources[ 'license.' + str( name ) ] = int( n )
+      else:
+        try:
+          resources[ k ] = int( v )
+        except ( TypeError, ValueError ):
+          assert False, \
+            'Step -- Resource "{}" of step "{}" must be a number: ' \
+            '{}'.format( k, s.get_name(), v )
+
+    return resources
+
+  # The expected runtime is a hint for scheduling steps that have not run
+  # yet (see BuildOrchestrator.set_priorities). It is either a number of
+  # seconds or a string with hours, minutes, and seconds (e.g., "10h" or
+  # "1h 30m"). Returns the runtime in seconds, or None without a hint.
+  #
+
+  def set_expected_runtime( s, runtime ):
+    s._config['expected_runtime'] = runtime
+
+  def get_expected_runtime( s ):
+
+    runtime = s._config.get( 'expected_runtime' )
+
+    if runtime is None or type( runtime ) in [ int, float ]:
+      return runtime
+
+    units   = { 'h': 3600, 'm': 60, 's': 1, '': 1 }
+    pattern = r'\s*(\d+(?:\.\d*)?)\s*([hms]?)'
+    parts   = re.findall( pattern, str( runtime ) )
+
+    assert re.fullmatch( '(?:' + pattern + r')+\s*', str( runtime ) ), \
+      'Step -- Expected runtime of step "{}" must be a number of seconds' \
+      ' or like "1h 30m": {}'.format( s.get_name(), runtime )
+
+    return sum( float( n ) * units[ u ] for n, u in parts )
+
+  # runtime_key
+  #
+  # Returns a hash of the name and the parameters of the step, which is
+  # what its runtime mostly depends on. Runs are recorded in the state
+  # journal under this key, so the runtime of a step can be estimated
+  # from earlier runs with the same parameters even after its template or
+  # its inputs changed (unlike with the fingerprint).
+  #
+
+  def runtime_key( s ):
+    data = [ s.get_name(), dict( s.params() ) ]
+    data = json.dumps( data, sort_keys=True, default=str )
+    return hashlib.sha1( data.encode() ).hexdigest()
+
+  # fingerprint
+  #
+  # Returns a hash that changes whenever the step would produce something
+  # different. It covers:
+  #
+  # - The step template directory
+  # - The fully expanded configuration (params, commands, inputs, ...)
+  # - The digests of the upstream outputs that feed the inputs (if given)
+  #
+  # Only the sizes and timestamps of the files in the template directory
+  # are checked for steps that are not sandboxed (e.g., ADKs), which can
+  # be very large. Otherwise the contents are hashed, but only for files
+  # that are not in the manifest from an earlier call with the same size
+  # and timestamp (see dir_digest). The manifest is updated in place.
+  #
+  # Where the step sits in the graph (i.e., its build directory, edges,
+  # and template path) does not change what it produces, so this is left
+  # out along with the resources and the expected runtime, which only
+  # affect scheduling, and the profile and checkpoint settings, which only
+  # add reports and restart points. This lets the same step share a
+  # fingerprint across builds.
+  #
+  # - input_digests : dict { input name : digest of the upstream output }
+  # - manifest      : dict { relative path : [ size, mtime_ns, digest ] }
+  #
+
+  fingerprint_ignore = [ 'build_dir', 'build_id', 'edges_i', 'edges_o',
+                         'source', 'resources', 'profile',
+                         'expected_runtime', 'checkpoint' ]
+
+  def fingerprint( s, input_digests=None, manifest=None ):
+
+    if s.get_sandbox():
+      template = dir_digest( s.get_dir(), manifest )
+    else:
+      template = dir_signature( s.get_dir() )
+
+    config = { k: v for k, v in dict( s._config ).items()
+                 if k not in s.fingerprint_ignore }
+
+    h = hashlib.sha1()
+    h.update( template.encode() )
+    h.update( json.dumps( config, sort_keys=True, default=str ).encode() )
+
+    if input_digests is None:
+      return h.hexdigest()
+
+    return fingerprint_inputs( h.hexdigest(), input_digests )
+
   # The sandbox flag will copy the source step directory if true (default)
   # or symlink the source files into the build directory if false
+  #
+  # Steps with large templates can avoid the copy with these modes (see
+  # mflowgen-sandbox):
+  #
+  # - 'hardlink'        : Copy-on-write copies if the file system supports
+  #                       them, otherwise hardlinks
+  # - 'overlay-symlink' : Real directories with symlinks to the source
+  #                       files
+  #
+
+  sandbox_modes = [ True, False, 'copy', 'hardlink', 'overlay-symlink' ]
 
   def set_sandbox( s, val ):
+    assert val in s.sandbox_modes, \
+      'Step -- Sandbox of step "{}" must be one of {}: {}'.format(
+        s.get_name(), s.sandbox_modes, val )
     s._config['sandbox'] = val
 
   def get_sandbox( s ):
     try:
-      return s._config['sandbox']
+      val = s._config['sandbox']
     except KeyError:
       return True
+    assert val in s.sandbox_modes, \
+      'Step -- Sandbox of step "{}" must be one of {}: {}'.format(
+        s.get_name(), s.sandbox_modes, val )
+    return val
+
+  # The cache flag allows the results of this step to be saved to and
+  # restored from the build cache (default), if the cache is enabled (see
+  # mflowgen/cache/build_cache.py)
+
+  def set_cache( s, val ):
+    s._config['cache'] = val
+
+  def get_cache( s ):
+    try:
+      return s._config['cache']
+    except KeyError:
+      return True
+
+  # The profile flag records the runtime and resources of each command of
+  # this step in profile.json in its build directory (default off, see
+  # mflowgen/state/step_profile.py)
+
+  def set_profile( s, val ):
+    s._config['profile'] = val
+
+  def get_profile( s ):
+    try:
+      return s._config['profile']
+    except KeyError:
+      return False
+
+  # The checkpoint setting records which entries of the "order" parameter
+  # completed, so that "mflowgen resume" can restart the step from its
+  # last tool checkpoint instead of from scratch (default off, see
+  # mflowgen/state/step_checkpoint.py). It is either True, to save a tool
+  # checkpoint after every entry, or a list of the entries to save a tool
+  # checkpoint after.
+
+  def set_checkpoint( s, val ):
+    s._config['checkpoint'] = val
+
+  def get_checkpoint( s ):
+    try:
+      return s._config['checkpoint']
+    except KeyError:
+      return False
 
 
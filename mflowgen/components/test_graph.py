@@ -0,0 +1,134 @@
+import pytest
+
+from mflowgen.components import Graph, Step
+from mflowgen.utils      import write_yaml
+
+def make_step( tmp_path, name, inputs=None, outputs=None, params=None ):
+  d = tmp_path / name
+  d.mkdir()
+  data = { 'name' : name, 'commands' : [ 'true' ] }
+  if inputs  : data[ 'inputs'     ] = inputs
+  if outputs : data[ 'outputs'    ] = outputs
+  if params  : data[ 'parameters' ] = params
+  write_yaml( data = data, path = str( d / 'configure.yml' ) )
+  return Step( str( d ) )
+
+def make_chain( tmp_path ):
+  #     a -> b -> c
+  #     |         ^
+  #      \_______/
+  g = Graph()
+  a = make_step( tmp_path, 'a', outputs=[ 'x' ] )
+  b = make_step( tmp_path, 'b', inputs=[ 'x' ], outputs=[ 'y' ],
+                                params={ 'p': 0 } )
+  c = make_step( tmp_path, 'c', inputs=[ 'x', 'y' ] )
+  for step in [ c, b, a ]:
+    g.add_step( step )
+  g.connect_by_name( a, b )
+  g.connect_by_name( a, c )
+  g.connect_by_name( b, c )
+  return g
+
+def test_topological_sort_basic( tmp_path ):
+  g = make_chain( tmp_path )
+  assert g.topological_sort() == [ 'a', 'b', 'c' ]
+
+def test_topological_sort_levels_are_sorted( tmp_path ):
+  g = Graph()
+  src = make_step( tmp_path, 'src', outputs=[ 'x' ] )
+  g.add_step( src )
+  for name in [ 'z', 'm', 'b' ]:
+    g.add_step( make_step( tmp_path, name, inputs=[ 'x' ] ) )
+    g.connect_by_name( src, name )
+  g.add_step( make_step( tmp_path, 'lonely' ) )
+  assert g.topological_sort() == [ 'lonely', 'src', 'b', 'm', 'z' ]
+
+def test_topological_sort_seed_steps( tmp_path ):
+  g = make_chain( tmp_path )
+  assert g.topological_sort( seed_steps={ 'b', 'c' } ) == [ 'b', 'c' ]
+  assert g.topological_sort( seed_steps={ 'c' } ) == [ 'c' ]
+  assert g.topological_sort( seed_steps=set() ) == []
+
+def test_topological_sort_cycle( tmp_path ):
+  g = Graph()
+  a = make_step( tmp_path, 'a', inputs=[ 'y' ], outputs=[ 'x' ] )
+  b = make_step( tmp_path, 'b', inputs=[ 'x' ], outputs=[ 'y' ] )
+  g.add_step( a )
+  g.add_step( b )
+  g.connect_by_name( a, b )
+  g.connect_by_name( b, a )
+  with pytest.raises( AssertionError ):
+    g.topological_sort()
+
+def test_topological_sort_after_param_space( tmp_path ):
+  g = make_chain( tmp_path )
+  g.param_space( 'b', 'p', [ 1, 2 ] )
+  assert g.topological_sort() == \
+    [ 'a', 'b-p-1', 'b-p-2', 'c-p-1', 'c-p-2' ]
+  assert g._preds[ 'c-p-1' ] == { 'a': 1, 'b-p-1': 1 }
+  assert g._succs[ 'a' ] == \
+    { 'b-p-1': 1, 'b-p-2': 1, 'c-p-1': 1, 'c-p-2': 1 }
+
+def make_sweep_graph( tmp_path ):
+  #     a -> b -> c
+  g = Graph()
+  a = make_step( tmp_path, 'a', outputs=[ 'x' ] )
+  b = make_step( tmp_path, 'b', inputs=[ 'x' ], outputs=[ 'y' ],
+                                params={ 'p': 0, 'q': 0 } )
+  c = make_step( tmp_path, 'c', inputs=[ 'y' ], params={ 'q': 0 } )
+  for step in [ a, b, c ]:
+    g.add_step( step )
+  g.connect_by_name( a, b )
+  g.connect_by_name( b, c )
+  return g
+
+def graph_summary( g ):
+  steps = { x: g.get_step( x ).params() for x in g.all_steps() }
+  edges = sorted( ( e.get_src(), e.get_dst() )
+                    for elist in g._edges_i.values() for e in elist )
+  return steps, edges
+
+def test_param_sweep_product_matches_nested_param_space( tmp_path ):
+  ( tmp_path / '1' ).mkdir()
+  ( tmp_path / '2' ).mkdir()
+  g1 = make_sweep_graph( tmp_path / '1' )
+  g2 = make_sweep_graph( tmp_path / '2' )
+  for step in g1.param_space( 'b', 'p', [ 1, 2 ] ):
+    g1.param_space( step, 'q', [ 'x', 'y' ] )
+  new_steps = g2.param_sweep( 'b', { 'p': [ 1, 2 ], 'q': [ 'x', 'y' ] } )
+  assert [ x.get_name() for x in new_steps ] == \
+    [ 'b-p-1-q-x', 'b-p-1-q-y', 'b-p-2-q-x', 'b-p-2-q-y' ]
+  assert graph_summary( g1 ) == graph_summary( g2 )
+  assert g2.get_step( 'c-p-2-q-y' ).params() == { 'q': 'y' }
+
+def test_param_sweep_zip( tmp_path ):
+  g = make_sweep_graph( tmp_path )
+  g.param_sweep( 'b', { 'p': [ 1, 2 ], 'q': [ 'x', 'y' ] }, mode='zip' )
+  assert g.topological_sort() == \
+    [ 'a', 'b-p-1-q-x', 'b-p-2-q-y', 'c-p-1-q-x', 'c-p-2-q-y' ]
+  with pytest.raises( AssertionError ):
+    g.param_sweep( 'b-p-1-q-x', { 'p': [ 1, 2 ], 'q': [ 3 ] }, mode='zip' )
+
+def test_param_sweep_unknown_param( tmp_path ):
+  g = make_sweep_graph( tmp_path )
+  with pytest.raises( KeyError ):
+    g.param_sweep( 'b', { 'r': [ 1, 2 ] } )
+  assert g.topological_sort() == [ 'a', 'b', 'c' ] # graph is untouched
+
+
+def test_critical_path( tmp_path ):
+  g = make_chain( tmp_path )
+  result = g.critical_path( { 'a': 1, 'b': 5, 'c': 2 } )
+  assert result[ 'length' ] == 8
+  assert result[ 'path' ] == [ 'a', 'b', 'c' ]
+  assert result[ 'start' ] == { 'a': 0, 'b': 1, 'c': 6 }
+  # Steps without runtimes weigh nothing, so a -> c is now critical
+  result = g.critical_path( { 'a': 1, 'c': 2 } )
+  assert result[ 'length' ] == 3
+  assert result[ 'path' ] == [ 'a', 'c' ]
+  assert result[ 'slack' ] == { 'a': 0, 'b': 0, 'c': 0 }
+  result = g.critical_path( { 'a': 1, 'b': 1, 'c': 2 } )
+  assert result[ 'slack' ] == { 'a': 0, 'b': 0, 'c': 0 }
+  g.add_step( make_step( tmp_path, 'd' ) )
+  assert g.critical_path( { 'a': 1, 'b': 1, 'c': 2, 'd': 1 } )[ 'slack' ] \
+           [ 'd' ] == 3
@@ -0,0 +1,144 @@
+import pytest
+
+from mflowgen.components import Step
+from mflowgen.utils      import read_yaml, write_yaml
+
+def make_step( tmp_path ):
+  data = {
+    'name'       : 'foo',
+    'outputs'    : [ 'design-{p}.v' ],
+    'commands'   : [ 'echo {p}', 'echo {{literal}}' ],
+    'parameters' : { 'p': 0, 'order': [ 'a.tcl', 'b.tcl' ] },
+  }
+  write_yaml( data = data, path = str( tmp_path / 'configure.yml' ) )
+  return Step( str( tmp_path ) )
+
+def test_clone_set_param_is_private( tmp_path ):
+  base = make_step( tmp_path )
+  x    = base.clone()
+  y    = base.clone()
+  x.set_param( 'p', 1 )
+  assert x.get_param( 'p' ) == 1
+  assert y.get_param( 'p' ) == 0
+  assert base.get_param( 'p' ) == 0
+
+def test_clone_get_param_mutation_is_private( tmp_path ):
+  base  = make_step( tmp_path )
+  x     = base.clone()
+  order = x.get_param( 'order' )
+  order.append( 'c.tcl' )
+  assert x.get_param( 'order' ) == [ 'a.tcl', 'b.tcl', 'c.tcl' ]
+  assert base.clone().get_param( 'order' ) == [ 'a.tcl', 'b.tcl' ]
+  assert base.params()[ 'order' ] == [ 'a.tcl', 'b.tcl' ]
+
+def test_clone_getter_mutation_is_private( tmp_path ):
+  ( tmp_path / 'configure.yml' ).write_text(
+    'name: foo\n'
+    'inputs: [ a.txt ]\n'
+    'commands: [ echo a ]\n'
+    'preconditions: [ assert True ]\n'
+    'postconditions: [ assert True ]\n' )
+  base = Step( str( tmp_path ) )
+  x    = base.clone()
+  x.get_commands().append( 'echo leaked' )
+  x.all_inputs().append( 'z.txt' )
+  x.get_preconditions().append( 'assert False' )
+  x.get_postconditions().append( 'assert False' )
+  assert x.get_commands() == [ 'echo a', 'echo leaked' ]
+  assert x.all_inputs() == [ 'a.txt', 'z.txt' ]
+  for step in [ base, base.clone() ]:
+    assert step.get_commands() == [ 'echo a' ]
+    assert step.all_inputs() == [ 'a.txt' ]
+    assert step.get_preconditions() == [ 'assert True' ]
+    assert step.get_postconditions() == [ 'assert True' ]
+
+def test_clone_parent_getter_mutation_after_clone( tmp_path ):
+  base     = make_step( tmp_path )
+  commands = base.get_commands()
+  order    = base.get_param( 'order' )
+  x        = base.clone()
+  commands.append( 'echo leaked' )
+  order.append( 'leaked.tcl' )
+  assert base.get_commands() == [ 'echo {p}', 'echo {{literal}}',
+                                  'echo leaked' ]
+  assert x.get_commands() == [ 'echo {p}', 'echo {{literal}}' ]
+  assert x.get_param( 'order' ) == [ 'a.tcl', 'b.tcl' ]
+  assert base.clone().get_param( 'order' ) == \
+         [ 'a.tcl', 'b.tcl', 'leaked.tcl' ]
+
+def test_clone_parent_changes_after_clone( tmp_path ):
+  base = make_step( tmp_path )
+  base.set_name( 'bar' )
+  x    = base.clone()
+  base.extend_commands( [ 'echo done' ] )
+  base.set_param( 'p', 5 )
+  assert x.get_name() == 'bar'
+  assert x.get_commands() == [ 'echo {p}', 'echo {{literal}}' ]
+  assert x.get_param( 'p' ) == 0
+
+def test_clone_of_clone_chain( tmp_path ):
+  step = make_step( tmp_path )
+  for i in range( 20 ):
+    step = step.clone()
+    step.set_param( 'p', i )
+  assert step.get_param( 'p' ) == 19
+  assert len( step._config.maps ) <= Step._max_config_layers + 1
+
+def test_clone_expand_params_and_dump_yaml( tmp_path ):
+  base = make_step( tmp_path )
+  x    = base.clone()
+  x.set_param( 'p', 7 )
+  x.expand_params()
+  assert x.get_commands() == [ 'echo 7', 'echo {literal}' ]
+  assert x.all_outputs() == [ 'design-7.v' ]
+  assert base.get_commands() == [ 'echo {p}', 'echo {{literal}}' ]
+  ( tmp_path / 'build' ).mkdir()
+  x.dump_yaml( str( tmp_path / 'build' ) )
+  data = read_yaml( str( tmp_path / 'build' / 'configure.yml' ) )
+  assert data[ 'parameters' ] == { 'p': 7, 'order': [ 'a.tcl', 'b.tcl' ] }
+  assert data[ 'commands' ] == [ 'echo 7', 'echo {literal}' ]
+
+
+def test_resources( tmp_path ):
+  ( tmp_path / 'configure.yml' ).write_text(
+    'name: foo\n'
+    'parameters:\n'
+    '  nthreads: 8\n'
+    'resources:\n'
+    '  cores: {nthreads}\n'
+    '  mem_gb: 64\n'
+    '  license: [ innovus, calibre ]\n' )
+  step = Step( str( tmp_path ) )
+  x    = step.clone()
+  x.set_param( 'nthreads', 4 )
+  x.expand_params()
+  step.expand_params()
+  assert step.get_resources() == { 'cores': 8, 'mem_gb': 64,
+                                   'license.innovus': 1,
+                                   'license.calibre': 1 }
+  assert x.get_resources()[ 'cores' ] == 4
+
+def test_fingerprint( tmp_path ):
+  step     = make_step( tmp_path )
+  manifest = {}
+  base     = step.fingerprint( manifest = manifest )
+  assert 'configure.yml' in manifest
+  assert step.fingerprint( manifest = manifest ) == base
+  # Parameters
+  x = step.clone()
+  x.set_param( 'p', 1 )
+  assert x.fingerprint() != base
+  # Input digests
+  assert step.fingerprint( { 'a.v': 'abc' } ) != base
+  # Template files
+  ( tmp_path / 'run.tcl' ).write_text( 'puts hi\n' )
+  assert step.fingerprint( manifest = manifest ) != base
+  assert 'run.tcl' in manifest
+
+def test_sandbox_modes( tmp_path ):
+  step = make_step( tmp_path )
+  assert step.get_sandbox() == True
+  step.set_sandbox( 'hardlink' )
+  assert step.get_sandbox() == 'hardlink'
+  with pytest.raises( AssertionError ):
+    step.set_sandbox( 'hardlinks' )
@@ -1,3 +1,6 @@
 from mflowgen.core.build_orchestrator import BuildOrchestrator
+from mflowgen.core.build              import BuildHandler
+from mflowgen.core.executor           import Executor
+from mflowgen.core.graph_cache        import GraphCache
 from mflowgen.core.run                import RunHandler
 
@@ -0,0 +1,65 @@
+#=========================================================================
+# build_handler
+#=========================================================================
+# Handler for "mflowgen build", which runs a build generated with the
+# local backend (i.e., "mflowgen run --backend local")
+#
+# Date   : October 18, 2026
+#
+
+import os
+import sys
+
+from mflowgen.backends      import LocalBackend
+from mflowgen.core.executor import Executor
+from mflowgen.utils         import bold
+
+class BuildHandler:
+
+  def __init__( s ):
+    pass
+
+  #-----------------------------------------------------------------------
+  # launch
+  #-----------------------------------------------------------------------
+  # Dispatch function for commands
+
+  def launch( s, args, help_, jobs=None, dry_run=False ):
+
+    if help_:
+      s.launch_help()
+      return
+
+    build_file = LocalBackend.build_file
+
+    try:
+      assert os.path.exists( build_file )
+    except AssertionError:
+      print()
+      print( bold( 'Error:' ), 'No build file "{}" in the current'
+                               ' directory'.format( build_file ) )
+      print( 'Generate one with "mflowgen run --backend local" first' )
+      print()
+      sys.exit( 1 )
+
+    executor = Executor( build_file, jobs = jobs or 1, dry_run = dry_run )
+
+    if not executor.build( args ):
+      sys.exit( 1 )
+
+  #-----------------------------------------------------------------------
+  # launch_help
+  #-----------------------------------------------------------------------
+
+  def launch_help( s ):
+    print()
+    print( bold( 'Usage:' ), 'mflowgen build [-j N] [-n] [targets]'     )
+    print()
+    print( 'Builds the given targets (default: all steps) from the rules' )
+    print( 'generated by "mflowgen run --backend local". Targets are the' )
+    print( 'same as for the other backends (e.g., a step number or name,' )
+    print( '"list", "status", "clean-all").'                              )
+    print()
+    print( '  -j --jobs N  -- Run up to N rules at the same time'         )
+    print( '  -n --dry-run -- Print the commands without running them'    )
+    print()
@@ -7,12 +7,21 @@
 # Date   : June 11, 2019
 #
 
+import io
+import json
 import os
 import re
+import shlex
 import shutil
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 from mflowgen.assertions.assertion_helpers import dump_assertion_check_scripts
-from mflowgen.utils import get_top_dir, get_files_in_dir
+from mflowgen.utils import get_top_dir, get_files_in_dir, write_if_changed
+from mflowgen.utils import read_yaml, write_yaml_if_changed
+from mflowgen.utils import fingerprint_inputs, read_fingerprint
+from mflowgen.state import StateJournal, StepCheckpoint
 
 class BuildOrchestrator:
 
@@ -38,15 +47,40 @@ class BuildOrchestrator:
     s.build_ids  = {}
     s.step_dirs  = {}
 
+    # Resources that each step holds while it executes and the capacity
+    # of each resource (see set_resources)
+
+    s.resources  = {}
+    s.capacities = {}
+
+    # Scheduling priority of each step (see set_priorities)
+
+    s.priorities = {}
+
     # Hidden metadata directory that saves parameterized YAMLs and
     # commands for each step
+    #
+    # The directory is updated in place rather than wiped so that files
+    # whose contents did not change keep their timestamps. We keep track
+    # of the files generated for each build directory so that anything
+    # stale can be pruned afterwards (see prune_metadata).
+    #
+
+    s.metadata_dir   = '.mflowgen'
+    s.metadata_files = {}
 
-    s.metadata_dir = '.mflowgen'
+    if not os.path.exists( s.metadata_dir ):
+      os.mkdir( s.metadata_dir )
 
-    if os.path.exists( s.metadata_dir ):
-      shutil.rmtree( s.metadata_dir )
+    # Number of threads used to dump the metadata for each step (the work
+    # is mostly small-file I/O, which benefits from overlapping especially
+    # on network filesystems)
 
-    os.mkdir( s.metadata_dir )
+    s.metadata_jobs = 8
+
+    # Time spent in each phase of generating the build files (seconds)
+
+    s.timings = {}
 
     # Names for the generated run and debug scripts for each step
 
@@ -67,7 +101,7 @@ class BuildOrchestrator:
     if not os.path.exists( inner_dir ):
       os.mkdir( inner_dir )
     step = s.g.get_step( step_name )
-    step.dump_yaml( inner_dir )
+    return step.dump_yaml( inner_dir )
 
   #-----------------------------------------------------------------------
   # dump_commands
@@ -90,7 +124,7 @@ class BuildOrchestrator:
 
     gen = os.path.abspath( __file__ ).rstrip('c')
 
-    with open( inner_dir + '/' + s.mflowgen_run, 'w' ) as fd:
+    with io.StringIO() as fd:
 
       # Shebang
       #
@@ -108,6 +142,34 @@ class BuildOrchestrator:
       fd.write( '# Generator : ' + gen + '\n' )
       fd.write( '\n' )
 
+      # Journal
+      #
+      # - Rerun this script under mflowgen-journal, which records the run
+      #   in the state journal (.mflowgen/state.db)
+      # - The script runs from within the build directory, so the path to
+      #   mflowgen-journal must be absolute
+      # - The arguments are quoted, since the path and the names may have
+      #   spaces or other characters that bash would expand
+      #
+
+      journal = os.path.abspath( get_top_dir() ) + \
+                  '/mflowgen/scripts/mflowgen-journal'
+
+      step    = s.g.get_step( step_name )
+      profile = step.get_profile()
+
+      fd.write( '# Journal\n' )
+      fd.write( '\n' )
+      fd.write( 'if [[ "${MFLOWGEN_JOURNAL_PID:-}" != "$PPID" ]]; then\n' )
+      fd.write( '  exec {} -s {} -d {} -k {}{} -- "$0" "$@"\n'.format(
+                  shlex.quote( journal ),
+                  shlex.quote( step_name ),
+                  shlex.quote( build_dir ),
+                  shlex.quote( step.runtime_key() ),
+                  ' -p' if profile else '' ) )
+      fd.write( 'fi\n' )
+      fd.write( '\n' )
+
       # Pre
       #
       # - Starting timestamp
@@ -126,12 +188,73 @@ class BuildOrchestrator:
 
       pre = [
         'rm -f .time_end',                     # clear end timestamp
+        'rm -f mflowgen-cache.log',            # not a cache hit
         'date +%Y-%m%d-%H%M-%S > .time_start', # start timestamp
         'MFLOWGEN_STEP_HOME=$PWD',             # save build directory
       ]
 
       pre = pre + params_commands
 
+      # Profile
+      #
+      # - Mark the start of each command and the end of the last one with
+      #   the time and the counters of this shell, which include those of
+      #   the commands it waited for (see mflowgen/state/step_profile.py)
+      # - Entries that continue the previous one (i.e., after a trailing
+      #   backslash) are not marked
+      # - The commands are saved for mflowgen-journal, which labels the
+      #   profile with them
+      #
+
+      if profile:
+        pre.append(
+          'mflowgen_profile_mark() {'
+          ' local stat="" io="";'
+          ' [[ -r /proc/$$/stat ]] && read -r stat < /proc/$$/stat;'
+          ' [[ -r /proc/$$/io ]] && io=$(< /proc/$$/io);'
+          ' printf \'%s\\t%s\\t%s\\t%s\\n\' "$1"'
+          ' "${EPOCHREALTIME:-$(date +%s.%N)}" "${stat##*) }"'
+          ' "${io//$\'\\n\'/ }"'
+          ' >> "$MFLOWGEN_STEP_HOME/.mflowgen-profile"; }'
+        )
+        marked = []
+        for i, c in enumerate( commands ):
+          if i == 0 or not commands[i-1].rstrip().endswith( '\\' ):
+            marked.append( 'mflowgen_profile_mark {}'.format( i ) )
+          marked.append( c )
+        marked.append( 'mflowgen_profile_mark end' )
+        write_if_changed( inner_dir + '/commands.json',
+                          json.dumps( commands, indent=2 ) + '\n' )
+      else:
+        marked = commands
+
+      # Checkpoints
+      #
+      # - Start a new record of the completed entries of the "order"
+      #   parameter (see mflowgen/state/step_checkpoint.py), which
+      #   "mflowgen resume" replaces with the restart point
+      # - Tell the tool script after which entries to save a checkpoint
+      #
+
+      checkpoint = step.get_checkpoint()
+
+      if checkpoint:
+        order = params.get( 'order', [] )
+        if type( order ) is not list:
+          order = order.split( ',' )
+        after = order if checkpoint is True else checkpoint
+        assert order and type( after ) is list \
+                     and all( x in order for x in after ), \
+          'BuildOrchestrator -- Step "{}" can only save checkpoints after' \
+          ' entries of its "order" parameter: {}'.format( step_name,
+                                                          checkpoint )
+        pre += [
+          'export MFLOWGEN_CHECKPOINT=$MFLOWGEN_STEP_HOME/' +
+            StepCheckpoint.file_name,
+          'export MFLOWGEN_CHECKPOINT_AFTER=' + ','.join( after ),
+          StepCheckpoint.reset_command,
+        ]
+
       fd.write( '# Pre\n' )
       fd.write( '\n' )
       for c in pre:
@@ -143,7 +266,7 @@ class BuildOrchestrator:
 
       fd.write( '# Commands\n' )
       fd.write( '\n' )
-      for c in commands:
+      for c in marked:
         fd.write( c )
         fd.write( '\n' )
       fd.write( '\n' )
@@ -165,6 +288,10 @@ class BuildOrchestrator:
         fd.write( '\n' )
       fd.write( '\n' )
 
+      # Write the script only if it changed
+
+      write_if_changed( inner_dir + '/' + s.mflowgen_run, fd.getvalue() )
+
   #-----------------------------------------------------------------------
   # dump_debug_commands
   #-----------------------------------------------------------------------
@@ -186,7 +313,7 @@ class BuildOrchestrator:
 
     gen = os.path.abspath( __file__ ).rstrip('c')
 
-    with open( inner_dir + '/' + s.mflowgen_debug, 'w' ) as fd:
+    with io.StringIO() as fd:
 
       # Shebang
       #
@@ -232,6 +359,256 @@ class BuildOrchestrator:
         fd.write( '\n' )
       fd.write( '\n' )
 
+      # Write the script only if it changed
+
+      write_if_changed( inner_dir + '/' + s.mflowgen_debug, fd.getvalue() )
+
+  #-----------------------------------------------------------------------
+  # dump_step_metadata
+  #-----------------------------------------------------------------------
+  # Dumps all metadata for one step: the parameterized YAML, the command
+  # and debug command scripts, and the assertion check scripts. Everything
+  # is rendered from the in-memory step (i.e., nothing that was just
+  # written is read back), so steps can be dumped independently.
+  #
+  # Returns the names of the generated files and the time spent on each
+  # kind of file.
+  #
+
+  def dump_step_metadata( s, step_name, build_dir ):
+
+    step      = s.g.get_step( step_name )
+    inner_dir = s.metadata_dir + '/' + build_dir
+
+    files   = set()
+    timings = {}
+    start   = time.perf_counter()
+
+    def lap( name ):
+      nonlocal start
+      now = time.perf_counter()
+      timings[ name ] = now - start
+      start = now
+
+    # Parameterized YAML
+
+    data = s.dump_yamls( step_name, build_dir )
+    files.add( 'configure.yml' )
+    lap( 'yaml' )
+
+    # Commands
+
+    step_commands = step.get_commands()
+    if step_commands:
+      s.dump_commands( step_commands, step_name, build_dir )
+      files.add( s.mflowgen_run )
+      if step.get_profile():
+        files.add( 'commands.json' )
+    lap( 'commands' )
+
+    # Debug commands
+
+    debug_commands = step.get_debug_commands()
+    if debug_commands:
+      s.dump_debug_commands( debug_commands, step_name, build_dir )
+      files.add( s.mflowgen_debug )
+    lap( 'debug commands' )
+
+    # Assertion check scripts
+
+    fpaths = dump_assertion_check_scripts( step_name, inner_dir, data )
+    files.update( os.path.basename( f ) for f in fpaths )
+    lap( 'assertions' )
+
+    # Fingerprint
+
+    s.dump_fingerprint( step_name, build_dir )
+    files.update( [ 'fingerprint', 'fingerprint.yml' ] )
+    lap( 'fingerprint' )
+
+    return files, timings
+
+  #-----------------------------------------------------------------------
+  # prune_metadata
+  #-----------------------------------------------------------------------
+  # The metadata directory is updated in place, so we remove the metadata
+  # of steps that are no longer in the graph as well as any stale files
+  # left in the metadata of the remaining steps (e.g., an assertion check
+  # script for a step that no longer has assertions). Files directly in
+  # the metadata directory (e.g., the graphviz dot file) are left alone.
+  #
+
+  def prune_metadata( s ):
+
+    for d in os.listdir( s.metadata_dir ):
+
+      inner_dir = s.metadata_dir + '/' + d
+
+      if not os.path.isdir( inner_dir ):
+        continue
+
+      # Remove build directories that are no longer in the graph
+
+      if d not in s.metadata_files:
+        shutil.rmtree( inner_dir )
+        continue
+
+      # Remove stale files (but keep the digests of the step outputs, see
+      # mflowgen-digest, which must outlive the build directory)
+
+      for f in os.listdir( inner_dir ):
+        if f in s.metadata_files[ d ] or f == 'digests.yml':
+          continue
+        path = inner_dir + '/' + f
+        if os.path.isdir( path ) and not os.path.islink( path ):
+          shutil.rmtree( path )
+        else:
+          os.remove( path )
+
+  #-----------------------------------------------------------------------
+  # Fingerprints
+  #-----------------------------------------------------------------------
+  # Each step has a fingerprint that covers its template directory, its
+  # fully expanded configuration, and the digests of the upstream outputs
+  # that feed its inputs (see Step.fingerprint). The fingerprints are
+  # saved in the metadata directory of each step:
+  #
+  # - fingerprint.yml -- The fingerprint, the input digests it was
+  #                      computed from, the upstream outputs that feed
+  #                      each input, and the manifest of the template
+  #                      directory that makes recomputing it cheap
+  #
+  # - fingerprint     -- The fingerprint without the input digests
+  #
+  # The build directory of a step depends on the "fingerprint" file, which
+  # is only rewritten when it changes, so a step is out of date whenever
+  # its template or its configuration changes. The input digests are left
+  # out here because changes to the inputs are already tracked through
+  # the stamps of the upstream outputs (see mflowgen-digest).
+  #
+
+  # input_digests
+  #
+  # Returns the digests of the upstream outputs that feed each input of
+  # the step, as recorded by mflowgen-digest (None if not built yet)
+  #
+
+  def input_digests( s, step_name ):
+
+    digests = {}
+
+    for dst_f, ( src_build_dir, src_f ) in s.input_sources( step_name ):
+      data = s._read_metadata_yaml( src_build_dir, 'digests.yml' )
+      digests[ dst_f ] = data.get( src_f, {} ).get( 'digest' )
+
+    return digests
+
+  # input_sources
+  #
+  # Returns ( input name, ( upstream build dir, upstream output ) ) for
+  # each input of the step
+  #
+
+  def input_sources( s, step_name ):
+    sources = []
+    for edge in s.g.get_edges_i( step_name ):
+      src_step_name, src_f = edge.get_src()
+      dst_step_name, dst_f = edge.get_dst()
+      sources.append( ( dst_f, ( s.build_dirs[ src_step_name ], src_f ) ) )
+    return sorted( sources )
+
+  def _read_metadata_yaml( s, build_dir, f ):
+    try:
+      return read_yaml( s.metadata_dir + '/' + build_dir + '/' + f ) or {}
+    except Exception:
+      return {}
+
+  # dump_fingerprint
+  #
+  # Dumps the fingerprints of the step into its metadata directory
+
+  def dump_fingerprint( s, step_name, build_dir ):
+
+    step      = s.g.get_step( step_name )
+    inner_dir = s.metadata_dir + '/' + build_dir
+
+    data     = s._read_metadata_yaml( build_dir, 'fingerprint.yml' )
+    manifest = data.get( 'template' ) or {}
+    inputs   = s.input_digests( step_name )
+
+    step_fingerprint = step.fingerprint( manifest = manifest )
+
+    write_yaml_if_changed(
+      data = {
+        'fingerprint' : fingerprint_inputs( step_fingerprint, inputs ),
+        'step'        : step_fingerprint,
+        'inputs'      : inputs,
+        'sources'     : { dst_f : list( src ) for dst_f, src in
+                            s.input_sources( step_name ) },
+        'template'    : manifest,
+      },
+      path = inner_dir + '/fingerprint.yml',
+    )
+
+    # A new fingerprint file is backdated so that existing build
+    # directories are not rebuilt when they first get a fingerprint
+
+    path    = inner_dir + '/fingerprint'
+    is_new  = not os.path.exists( path )
+
+    write_if_changed( path, step_fingerprint + '\n' )
+
+    if is_new:
+      os.utime( path, ( 0, 0 ) )
+
+  # fingerprints
+  #
+  # Returns the current fingerprint of each step, including the digests
+  # of the upstream outputs as they are now
+  #
+
+  def fingerprints( s ):
+
+    if not s.order:
+      s.setup()
+
+    fingerprints = {}
+
+    for step_name in s.order:
+      step     = s.g.get_step( step_name )
+      data     = s._read_metadata_yaml( s.build_dirs[ step_name ],
+                                        'fingerprint.yml' )
+      manifest = data.get( 'template' ) or {}
+      fingerprints[ step_name ] = \
+        step.fingerprint( s.input_digests( step_name ), manifest )
+
+    return fingerprints
+
+  # invalidate_checkpoints
+  #
+  # The checkpoints of a step (see mflowgen/state/step_checkpoint.py) can
+  # only restart the run they were saved in. Once the fingerprint of the
+  # step is no longer the one the run started with, i.e., the step or the
+  # outputs that feed its inputs changed, its record is removed so that
+  # "mflowgen resume" does not restart from a stale tool checkpoint. Steps
+  # whose inputs were not built yet keep their record.
+  #
+
+  def invalidate_checkpoints( s ):
+
+    for step_name in s.order:
+
+      build_dir  = s.build_dirs[ step_name ]
+      checkpoint = StepCheckpoint( build_dir )
+
+      if not checkpoint.exists():
+        continue
+
+      fingerprint = read_fingerprint( build_dir, s.metadata_dir )
+
+      if fingerprint is not None and not checkpoint.valid( fingerprint ):
+        checkpoint.remove()
+
   #-----------------------------------------------------------------------
   # dump_graphviz
   #-----------------------------------------------------------------------
@@ -245,6 +622,33 @@ class BuildOrchestrator:
   def dump_graphviz( s ):
     s.g.plot( dot_f = s.metadata_dir + '/graph.dot' )
 
+  #-----------------------------------------------------------------------
+  # dump_steps
+  #-----------------------------------------------------------------------
+  # Dump the build directories in build order with the build directories
+  # they depend on, so that tools can walk the graph without loading it
+  # (e.g., mflowgen-status). Steps without outputs always run. The runtime
+  # key of each step finds its earlier runs in the state journal.
+  #
+
+  def dump_steps( s ):
+
+    steps = []
+
+    for step_name in s.order:
+      upstream = { s.build_dirs[ e.get_src()[0] ]
+                     for e in s.g.get_edges_i( step_name ) }
+      steps.append( {
+        'build_dir' : s.build_dirs[ step_name ],
+        'step'      : step_name,
+        'upstream'  : sorted( upstream ),
+        'phony'     : not s.g.get_step( step_name ).all_outputs_execute(),
+        'key'       : s.g.get_step( step_name ).runtime_key(),
+      } )
+
+    write_if_changed( s.metadata_dir + '/steps.json',
+                      json.dumps( steps, indent=2 ) + '\n' )
+
   #-----------------------------------------------------------------------
   # set_unique_build_ids
   #-----------------------------------------------------------------------
@@ -330,6 +734,96 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
 
     return existing_build_ids
 
+  #-----------------------------------------------------------------------
+  # set_resources
+  #-----------------------------------------------------------------------
+  # Collects the resources that each step holds while it executes. Only
+  # resources with a capacity in the graph are kept, and a step never
+  # needs more than the capacity (i.e., so that it can still run alone).
+  #
+
+  def set_resources( s ):
+
+    s.capacities = dict( s.g.get_resource_capacities() )
+
+    for step_name in s.order:
+      needs = s.g.get_step( step_name ).get_resources()
+      s.resources[ step_name ] = {
+        r : min( n, s.capacities[ r ] ) for r, n in sorted( needs.items() )
+          if r in s.capacities and n > 0
+      }
+
+  #-----------------------------------------------------------------------
+  # set_priorities
+  #-----------------------------------------------------------------------
+  # Build tools pick among the steps that are ready to run in file order
+  # (or in no particular order), so a long step can start last while short
+  # steps hold the jobs. Each step gets the length of the longest path
+  # from its start to the end of the build instead, and executors start
+  # the ready steps with the longest remaining path first.
+  #
+  # The runtime of each step is taken from its latest successful run with
+  # the same runtime key in the state journal (see Step.runtime_key), or
+  # else from the "expected_runtime" hint in its configuration. Steps
+  # without either count as one second, so that longer chains still go
+  # first. Priorities are rounded to hundredths of a second.
+  #
+
+  def set_priorities( s ):
+
+    history = {}
+
+    if os.path.exists( s.metadata_dir + '/' + StateJournal.db_name ):
+      try:
+        with StateJournal( s.metadata_dir ) as journal:
+          history = journal.history()
+      except Exception:
+        pass
+
+    for step_name in reversed( s.order ):
+
+      step    = s.g.get_step( step_name )
+      runtime = history.get( step.runtime_key() )
+
+      if runtime is None:
+        runtime = step.get_expected_runtime()
+      if runtime is None:
+        runtime = 1
+
+      downstream = [ s.priorities[ e.get_dst()[0] ]
+                       for e in s.g.get_edges_o( step_name ) ]
+
+      s.priorities[ step_name ] = \
+        round( runtime + max( downstream, default = 0 ), 2 )
+
+  #-----------------------------------------------------------------------
+  # Timing
+  #-----------------------------------------------------------------------
+
+  # lap
+  #
+  # Adds the time since "start" to the given phase and returns the current
+  # time (i.e., the start of the next phase)
+  #
+
+  def lap( s, phase, start ):
+    now = time.perf_counter()
+    s.timings[ phase ] = s.timings.get( phase, 0.0 ) + now - start
+    return now
+
+  # report_timings
+  #
+  # Prints the time spent in each phase. Metadata sub-phases are summed
+  # over all steps (i.e., across threads), so they can add up to more than
+  # the wall-clock time of the metadata phase.
+  #
+
+  def report_timings( s ):
+    print( 'Timings:' )
+    for phase, t in s.timings.items():
+      print( '- {: <30} : {:8.3f} s'.format( phase, t ) )
+    print()
+
   #-----------------------------------------------------------------------
   # Setup
   #-----------------------------------------------------------------------
@@ -340,19 +834,25 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
 
     #assert s.g.check_cycles() == None
 
+    start = time.perf_counter()
+
     # Expand parameters in the graph
 
     s.g.expand_params()
 
+    start = s.lap( 'expand params', start )
+
     # Determine build order
 
     s.order = s.g.topological_sort()
 
+    start = s.lap( 'topological sort', start )
+
     # Determine unique build IDs and build directories
 
     s.set_unique_build_ids()
-    s.build_dirs = { step_name: build_id + '-' + step_name \
-                       for step_name, build_id in s.build_ids.items() }
+    s.build_dirs = { step_name: s.build_ids[ step_name ] + '-' + step_name \
+                       for step_name in s.order }
 
     # Get step directories
 
@@ -364,39 +864,56 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
     s.g.dump_metadata_to_steps( build_dirs = s.build_dirs,
                                 build_ids  = s.build_ids  )
 
-    # Dump parameterized YAMLs for each step to the metadata directory
+    start = s.lap( 'build ids', start )
 
-    for step_name, build_dir in s.build_dirs.items():
-      s.dump_yamls( step_name, build_dir )
+    # Resources and scheduling priority of each step
 
-    # Dump commands for each step to the metadata directory
+    s.set_resources()
+    s.set_priorities()
 
-    for step_name, build_dir in s.build_dirs.items():
-      step          = s.g.get_step( step_name )
-      step_commands = step.get_commands()
-      if step_commands:
-        s.dump_commands( step_commands, step_name, build_dir )
+    # Dump the metadata for each step (parameterized YAMLs, commands, debug
+    # commands, and assertion check scripts) to the metadata directory.
+    # Steps are independent of each other, so they are dumped on a bounded
+    # thread pool.
 
-    # Dump debug commands for each step to the metadata directory
+    with ThreadPoolExecutor( max_workers = s.metadata_jobs ) as pool:
+      futures = { build_dir : pool.submit( s.dump_step_metadata,
+                                           step_name, build_dir )
+                  for step_name, build_dir in s.build_dirs.items() }
 
-    for step_name, build_dir in s.build_dirs.items():
-      step           = s.g.get_step( step_name )
-      debug_commands = step.get_debug_commands()
-      if debug_commands:
-        s.dump_debug_commands( debug_commands, step_name, build_dir )
+    for build_dir, future in futures.items():
+      files, timings = future.result()
+      s.metadata_files[ build_dir ] = files
+      for k, v in timings.items():
+        k = 'metadata (' + k + ')'
+        s.timings[ k ] = s.timings.get( k, 0.0 ) + v
+
+    start = s.lap( 'metadata', start )
+
+    # Remove stale metadata from previous runs
+
+    s.prune_metadata()
 
-    # Dump assertion check scripts for each step to the metadata directory
+    start = s.lap( 'prune metadata', start )
 
-    for step_name, build_dir in s.build_dirs.items():
-      inner_dir = s.metadata_dir + '/' + build_dir
-      if not os.path.exists( inner_dir ):
-        os.mkdir( inner_dir )
-      dump_assertion_check_scripts( step_name, inner_dir )
+    # Remove the checkpoints of steps that changed since they ran
+
+    s.invalidate_checkpoints()
+
+    start = s.lap( 'checkpoints', start )
 
     # Dump graphviz dot file to the metadata directory
 
     s.dump_graphviz()
 
+    start = s.lap( 'graphviz', start )
+
+    # Dump the build directories and their dependencies
+
+    s.dump_steps()
+
+    start = s.lap( 'steps', start )
+
   #-----------------------------------------------------------------------
   # build
   #-----------------------------------------------------------------------
@@ -496,9 +1013,12 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
 
     s.setup()
 
+    start = time.perf_counter()
+
     # Pass useful data to the backend writer
 
-    s.w.save( s.order, s.build_dirs, s.step_dirs )
+    s.w.save( s.order, s.build_dirs, s.step_dirs, s.resources,
+                                                  s.capacities )
 
     # Backend writer prologue
 
@@ -532,11 +1052,13 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
 
       s.w.gen_step_directory_pre()
 
-      # Make the directory dependent on all source files
+      # Make the directory dependent on the fingerprint of the step, which
+      # changes with the source files and the configuration of the step
+      # (see dump_fingerprint)
 
       step_template_dir = s.step_dirs[ step_name ]
-      deps              = []
-      #deps              = get_files_in_dir( step_template_dir )
+      deps              = [ s.metadata_dir + '/' + build_dir +
+                              '/fingerprint' ]
 
       # Remove any broken symlinks from the dependency list
 
@@ -558,7 +1080,8 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
       # - Remove the {dst}
       # - Copy the {src} to the {dst}
       # - This rule depends on {deps}
-      # - {sandbox} True (copies src dir), False (symlinks src contents)
+      # - {sandbox} True (copies src dir), False (symlinks src contents),
+      #   or 'hardlink' / 'overlay-symlink' (see mflowgen-sandbox)
       #
 
       rule = {
@@ -577,7 +1100,7 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
         for o in backend_outputs[src_step_name]['alias']:
           extra_deps.add( o )
 
-      extra_deps = list( extra_deps )
+      extra_deps = sorted( extra_deps )
 
       # Use the backend writer to generate the rule, and then grab any
       # backend dependencies
@@ -709,18 +1232,39 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
         'cd ..',
       ])
 
+      # Restore the results of the step from the build cache if possible,
+      # and otherwise save them after running the step (see
+      # mflowgen/cache/build_cache.py). Steps without outputs always run.
+      # Hits are recorded in the state journal with the step name and
+      # runtime key, since mflowgen-run does not run.
+
+      if step.get_cache() and step.get_commands() and not phony:
+        cache    = get_top_dir() + '/mflowgen/scripts/mflowgen-cache'
+        commands = \
+          '{{ {cache} restore -s {step} -k {key} {d} || {{ {commands} &&' \
+          ' {cache} save {d}; }}; }}'.format(
+            cache    = cache,
+            step     = shlex.quote( step_name ),
+            key      = shlex.quote( step.runtime_key() ),
+            d        = build_dir,
+            commands = commands )
+
       # Rule
       #
       # - Run the {command}
       # - Generate the {outputs}
       # - This rule depends on {deps}
+      # - Hold the {resources} while running
+      # - Start before ready rules with a lower {priority}
       #
 
       rule = {
-        'outputs' : outputs,
-        'command' : commands,
-        'deps'    : [],
-        'phony'   : phony,
+        'outputs'   : outputs,
+        'command'   : commands,
+        'deps'      : [],
+        'phony'     : phony,
+        'resources' : s.resources[ step_name ],
+        'priority'  : s.priorities[ step_name ],
       }
 
       # Pull in any backend dependencies
@@ -732,7 +1276,7 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
       for o in backend_outputs[step_name]['collect-inputs']:
         extra_deps.add( o )
 
-      extra_deps = list( extra_deps )
+      extra_deps = sorted( extra_deps )
 
       # Use the backend writer to generate the rule, and then grab any
       # backend dependencies
@@ -889,7 +1433,7 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
       for o in backend_outputs[step_name]['collect-outputs']:
         extra_deps.add( o )
 
-      extra_deps = list( extra_deps )
+      extra_deps = sorted( extra_deps )
 
       # Use the backend writer to generate the rule, and then grab any
       # backend dependencies
@@ -930,7 +1474,7 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
       for o in backend_outputs[step_name]['post-conditions']:
         extra_deps.add( o )
 
-      extra_deps = list( extra_deps )
+      extra_deps = sorted( extra_deps )
 
       # Metadata for customized backends
 
@@ -1048,6 +1592,8 @@ N. For a completely clean build, run the "clean-all" target.\n''' )
 
     s.w.gen_epilogue()
 
+    s.lap( 'build file', start )
+
   #-----------------------------------------------------------------------
   # Backend API
   #-----------------------------------------------------------------------
@@ -0,0 +1,417 @@
+#=========================================================================
+# executor.py
+#=========================================================================
+# Executes the rules saved by the local backend (see LocalBackend)
+#
+# This is a small make-like executor. A rule is rebuilt if:
+#
+# - It is phony
+# - Its target does not exist
+# - Any of its dependencies is phony (or, for dry runs, would be rebuilt)
+# - Any of its dependencies is newer than its target
+#
+# Like make, the timestamps are checked after the dependencies are made,
+# so a rule that leaves the old timestamp of its target (e.g., the digest
+# stamps of outputs whose contents did not change, which are the targets
+# of rules without actions) does not rebuild the rules that depend on it.
+# For dry runs, rules without actions count as rebuilt if any of their
+# dependencies would be rebuilt. Order-only dependencies are made first
+# but never cause a rebuild.
+#
+# Rules are started in dependency order and run concurrently with up to
+# "jobs" rules in flight. A rule that holds resources (e.g., cores or
+# licenses) is only started once the running rules leave enough of each
+# resource, so "jobs" can be set high without oversubscribing them. Among
+# the rules that are ready, the rules on the longest remaining path (i.e.,
+# with the highest priority, see BuildOrchestrator.set_priorities) start
+# first, and rules that are only needed by such rules inherit their
+# priority. Ties go in the order that make would visit the rules. Each
+# shell command runs as its own bash process (the same "bash -euo
+# pipefail" shell as the generated Makefile), so the threads of the pool
+# only wait on the child processes. Symlinks and stamps are handled
+# natively without starting a shell.
+#
+# Date   : October 18, 2026
+#
+
+import heapq
+import json
+import os
+import subprocess
+import sys
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class Executor:
+
+  def __init__( s, build_file, jobs=1, dry_run=False ):
+    s.build_file = build_file
+    s.jobs       = max( jobs, 1 )
+    s.dry_run    = dry_run
+    s.shell      = [ '/usr/bin/env', 'bash', '-euo', 'pipefail', '-c' ]
+
+  #-----------------------------------------------------------------------
+  # Rules
+  #-----------------------------------------------------------------------
+
+  # load
+  #
+  # Reads the rules from the build file. Rules for pre-built steps (i.e.,
+  # the build directory has a ".prebuilt" file) are ignored so that the
+  # step always looks done.
+  #
+
+  def load( s ):
+
+    with open( s.build_file ) as fd:
+      data = json.load( fd )
+
+    s.default    = data[ 'default' ]
+    s.capacities = data.get( 'capacities', {} )
+    s.rules      = {}
+
+    for rule in data[ 'rules' ]:
+      prebuilt = rule[ 'prebuilt' ]
+      if prebuilt and os.path.exists( prebuilt + '/.prebuilt' ):
+        continue
+      s.rules[ rule[ 'target' ] ] = rule
+
+  # all_deps
+  #
+  # Normal and order-only dependencies of a rule
+  #
+
+  def all_deps( s, rule ):
+    return rule[ 'deps' ] + rule.get( 'order_deps', [] )
+
+  # closure
+  #
+  # Returns the rules needed to make the given targets in depth-first
+  # post-order (i.e., the order that make would visit them in with -j1)
+  #
+
+  def closure( s, targets ):
+
+    order   = []
+    visited = set()
+
+    for target in targets:
+      if target in visited:
+        continue
+      visited.add( target )
+      stack = [ ( target, iter( s.all_deps( s.rules[ target ] ) ) ) ]
+      while stack:
+        t, deps = stack[-1]
+        for d in deps:
+          if d in s.rules and d not in visited:
+            visited.add( d )
+            stack.append( ( d, iter( s.all_deps( s.rules[ d ] ) ) ) )
+            break
+        else:
+          stack.pop()
+          order.append( t )
+
+    return order
+
+  #-----------------------------------------------------------------------
+  # Actions
+  #-----------------------------------------------------------------------
+
+  # describe
+  #
+  # Shell equivalent of an action (for printing)
+  #
+
+  def describe( s, action ):
+    if action[0] == 'shell':
+      return action[1].lstrip( '@+' )
+    if action[0] == 'touch':
+      return 'touch ' + action[1]
+    if action[0] == 'symlink':
+      _, dst_dir, dst, src, stamp = action
+      return 'mkdir -p {d} && cd {d} && ln -sf {src} {dst} && ' \
+             'touch {stamp}'.format( d=dst_dir, src=src, dst=dst,
+                                     stamp=stamp )
+
+  # touch
+
+  def touch( s, path ):
+    with open( path, 'a' ):
+      os.utime( path, None )
+
+  # symlink
+  #
+  # Same as "cd dst_dir && ln -sf src dst && touch stamp", except that a
+  # pre-existing link at dst is always replaced
+  #
+
+  def symlink( s, dst_dir, dst, src, stamp ):
+    os.makedirs( dst_dir, exist_ok=True )
+    path = dst_dir + '/' + dst
+    if os.path.isdir( path ) and not os.path.islink( path ):
+      path = path + '/' + os.path.basename( src )
+      src  = '../' + src if not src.startswith( '/' ) else src
+    if os.path.lexists( path ):
+      os.remove( path )
+    os.symlink( src, path )
+    s.touch( dst_dir + '/' + stamp )
+
+  # run_rule
+  #
+  # Runs all actions of a rule in order and returns the exit status of
+  # the first failing action (or zero)
+  #
+
+  def run_rule( s, rule ):
+    for action in rule[ 'actions' ]:
+      if action[0] == 'shell':
+        command = action[1]
+        if not command.startswith( '@' ):
+          print( s.describe( action ), flush=True )
+        status = subprocess.call( s.shell + [ command.lstrip( '@+' ) ] )
+        if status != 0:
+          return status
+      else:
+        print( s.describe( action ), flush=True )
+        try:
+          if action[0] == 'touch' : s.touch( action[1] )
+          else                    : s.symlink( *action[1:] )
+        except OSError as e:
+          print( e, file=sys.stderr, flush=True )
+          return 1
+    return 0
+
+  # dry_run_rule
+  #
+  # Prints the actions of a rule for a dry run. Like make, shell commands
+  # that start with "+" still run (with the "n" flag in MAKEFLAGS), and if
+  # that is all the rule does, the rule is run for real. Returns whether
+  # the rule was run.
+  #
+
+  def dry_run_rule( s, rule ):
+
+    for action in rule[ 'actions' ]:
+      print( s.describe( action ) )
+
+    if not all( a[0] == 'shell' and a[1].lstrip( '@' ).startswith( '+' )
+                for a in rule[ 'actions' ] ):
+      return False
+
+    env = dict( os.environ, MAKEFLAGS='n' )
+
+    for action in rule[ 'actions' ]:
+      subprocess.call( s.shell + [ action[1].lstrip( '@+' ) ], env=env )
+
+    return True
+
+  # mtime
+  #
+  # Modification time of a file (None if it does not exist)
+  #
+
+  def mtime( s, path ):
+    try:
+      return os.stat( path ).st_mtime_ns
+    except OSError:
+      return None
+
+  # is_stale
+  #
+  # Checks whether a rule must run given the set of rebuilt targets (i.e.,
+  # phony targets that ran and, for dry runs, targets that would be made)
+  #
+
+  def is_stale( s, rule, rebuilt ):
+
+    if rule[ 'phony' ]:
+      return True
+
+    target_mtime = s.mtime( rule[ 'target' ] )
+
+    if target_mtime is None:
+      return True
+
+    for d in rule[ 'deps' ]:
+      if d in rebuilt:
+        return True
+      dep_mtime = s.mtime( d )
+      if dep_mtime is None or dep_mtime > target_mtime:
+        return True
+
+    return False
+
+  # acquire
+  #
+  # Takes the resources of a rule from the free resources if there are
+  # enough of all of them. A rule never needs more than the capacity, so
+  # it can always start once nothing else is running.
+  #
+
+  def acquire( s, rule, free ):
+
+    needs = { r: min( n, s.capacities[r] ) \
+                for r, n in rule.get( 'resources', {} ).items() if r in free }
+
+    if any( free[r] < n for r, n in needs.items() ):
+      return False
+
+    for r, n in needs.items():
+      free[r] -= n
+
+    return True
+
+  # release
+
+  def release( s, rule, free ):
+    for r, n in rule.get( 'resources', {} ).items():
+      if r in free:
+        free[r] += min( n, s.capacities[r] )
+
+  #-----------------------------------------------------------------------
+  # priorities
+  #-----------------------------------------------------------------------
+  # Returns the key of each rule in the ready queue (lowest first). Rules
+  # get the highest priority of the rules that depend on them, which come
+  # after them in the order.
+  #
+
+  def priorities( s, order ):
+
+    highest = {}
+
+    for t in reversed( order ):
+      highest[ t ] = max( highest.get( t, 0 ),
+                          s.rules[ t ].get( 'priority', 0 ) )
+      for d in s.all_deps( s.rules[ t ] ):
+        if d in s.rules:
+          highest[ d ] = max( highest.get( d, 0 ), highest[ t ] )
+
+    return { t: ( -highest[ t ], i ) for i, t in enumerate( order ) }
+
+  #-----------------------------------------------------------------------
+  # build
+  #-----------------------------------------------------------------------
+  # Makes the given targets (or the default targets). Returns True if the
+  # build succeeded.
+  #
+
+  def build( s, targets=None ):
+
+    s.load()
+
+    targets = targets or s.default
+
+    # Targets without rules must already exist
+
+    for t in targets:
+      if t not in s.rules and not os.path.exists( t ):
+        s.error( "No rule to make target '{}'".format( t ) )
+        return False
+
+    order    = s.closure( [ t for t in targets if t in s.rules ] )
+    priority = s.priorities( order )
+
+    # Dependencies without rules must already exist
+
+    for t in order:
+      for d in s.all_deps( s.rules[ t ] ):
+        if d not in s.rules and not os.path.exists( d ):
+          s.error( "No rule to make target '{}', needed by '{}'".format(
+                     d, t ) )
+          return False
+
+    # Count the pending dependencies of each rule
+
+    pending    = {}
+    dependents = { t: [] for t in order }
+
+    for t in order:
+      deps = { d for d in s.all_deps( s.rules[ t ] ) if d in s.rules }
+      pending[ t ] = len( deps )
+      for d in deps:
+        dependents[ d ].append( t )
+
+    ready   = [ ( priority[ t ], t ) for t in order if not pending[ t ] ]
+    rebuilt = set()
+    running = {}
+    failed  = False
+    worked  = False
+    free    = dict( s.capacities )
+
+    heapq.heapify( ready )
+
+    def finish( t ):
+      for u in dependents[ t ]:
+        pending[ u ] -= 1
+        if not pending[ u ]:
+          heapq.heappush( ready, ( priority[ u ], u ) )
+
+    with ThreadPoolExecutor( max_workers=s.jobs ) as pool:
+
+      while ready or running:
+
+        # Start as many ready rules as possible (rules that are waiting for
+        # resources go back to the ready queue afterwards)
+
+        blocked = []
+
+        while ready and not failed and len( running ) < s.jobs:
+          _, t = heapq.heappop( ready )
+          rule = s.rules[ t ]
+          if not s.is_stale( rule, rebuilt ):
+            finish( t )
+            continue
+          if rule[ 'actions' ] and not s.dry_run and \
+              not s.acquire( rule, free ):
+            blocked.append( ( priority[ t ], t ) )
+            continue
+          if not rule[ 'actions' ]:
+            if rule[ 'phony' ] or s.dry_run and \
+                any( d in rebuilt for d in rule[ 'deps' ] ):
+              rebuilt.add( t )
+            finish( t )
+            continue
+          worked = True
+          if s.dry_run:
+            if not s.dry_run_rule( rule ) or rule[ 'phony' ]:
+              rebuilt.add( t )
+            finish( t )
+            continue
+          running[ pool.submit( s.run_rule, rule ) ] = t
+
+        for item in blocked:
+          heapq.heappush( ready, item )
+
+        if not running:
+          break
+
+        # Wait for any running rule to finish
+
+        done, _ = wait( running, return_when=FIRST_COMPLETED )
+
+        for future in done:
+          t      = running.pop( future )
+          status = future.result()
+          s.release( s.rules[ t ], free )
+          if status:
+            s.error( "[{}] Error {}".format( t, status ) )
+            failed = True
+          else:
+            if s.rules[ t ][ 'phony' ]:
+              rebuilt.add( t )
+            finish( t )
+
+    if failed:
+      return False
+
+    if not worked:
+      print( "mflowgen build: Nothing to be done for '{}'.".format(
+               ' '.join( targets ) ) )
+
+    return True
+
+  # error
+
+  def error( s, msg ):
+    print( 'mflowgen build: *** ' + msg, file=sys.stderr, flush=True )
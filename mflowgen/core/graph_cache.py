@@ -0,0 +1,262 @@
+#=========================================================================
+# graph_cache.py
+#=========================================================================
+# Cache of the compiled graph in the hidden metadata directory
+#
+# Running "mflowgen run --update" used to import the construct script,
+# rebuild the graph, re-read every step configuration, and regenerate the
+# build files even when nothing had changed. After each run we now record
+# a fingerprint of every input that went into the generated build files:
+#
+# - The construct script
+# - The configure.yml of every step in the graph
+# - The sizes and timestamps of the files in every step template, which
+#   go into the step fingerprints (see BuildOrchestrator.dump_fingerprint)
+# - The ADK that was resolved by Graph.set_adk()
+# - The contents of the MFLOWGEN_PATH environment variable
+# - The mflowgen version, the backend, and the build directory
+#
+# When all of these still match, the existing build files are up to date
+# and the update is done without importing the construct module. When
+# something does not match, we say which input changed and rebuild as
+# usual. A pickled copy of the graph (taken before the build files were
+# generated) is also kept so that deleted build files can be regenerated
+# without re-running the construct script.
+#
+# Note that only these inputs are tracked. Python modules imported by the
+# construct script are not, so run without --update after editing them.
+#
+# Date   : October 18, 2026
+#
+
+import hashlib
+import os
+import pickle
+import re
+
+from mflowgen         import __version__
+from mflowgen.utils   import read_yaml, write_yaml_if_changed
+from mflowgen.utils   import dir_signature
+
+class GraphCache:
+
+  def __init__( s, metadata_dir='.mflowgen' ):
+    s.metadata_dir = metadata_dir
+    s.key_path     = metadata_dir + '/graph-cache.yml'
+    s.graph_path   = metadata_dir + '/graph.pickle'
+
+  #-----------------------------------------------------------------------
+  # helpers
+  #-----------------------------------------------------------------------
+
+  # digest
+  #
+  # Hash of the contents of a file (None if the file cannot be read)
+  #
+
+  def digest( s, path ):
+    try:
+      with open( path, 'rb' ) as fd:
+        return hashlib.sha1( fd.read() ).hexdigest()
+    except OSError:
+      return None
+
+  # env_inputs
+  #
+  # Inputs that come from the environment rather than from files
+  #
+
+  def env_inputs( s, backend ):
+    return {
+      'version'       : __version__,
+      'backend'       : backend,
+      'build_dir'     : os.getcwd(),
+      'mflowgen_path' : os.environ.get( 'MFLOWGEN_PATH', '' ),
+    }
+
+  #-----------------------------------------------------------------------
+  # Fingerprints
+  #-----------------------------------------------------------------------
+
+  # fingerprint
+  #
+  # Fingerprint all inputs of a freshly constructed graph
+  #
+
+  def fingerprint( s, construct_path, g, backend ):
+
+    construct_path = os.path.abspath( construct_path )
+
+    # Find the ADK (if the graph has one)
+
+    try:
+      adk_step = g.get_adk_step()
+      adk_path = os.path.abspath( adk_step.get_dir() ) + '/configure.yml'
+    except AttributeError:
+      adk_step = None
+      adk_path = None
+
+    # Every step configuration except for the ADK, which is reported
+    # separately
+
+    configs = {}
+
+    for step_name in g.all_steps():
+      step = g.get_step( step_name )
+      if step is adk_step:
+        continue
+      path = os.path.abspath( step.get_dir() ) + '/configure.yml'
+      if path not in configs:
+        configs[ path ] = s.digest( path )
+
+    # Every step template (including the ADK)
+
+    templates = {}
+
+    for step_name in g.all_steps():
+      path = os.path.abspath( g.get_step( step_name ).get_dir() )
+      if path not in templates:
+        templates[ path ] = dir_signature( path )
+
+    data = s.env_inputs( backend )
+
+    data[ 'construct' ] = { construct_path : s.digest( construct_path ) }
+    data[ 'configs'   ] = configs
+    data[ 'adk'       ] = { adk_path : s.digest( adk_path ) } \
+                            if adk_path else {}
+    data[ 'templates' ] = templates
+
+    return data
+
+  # refingerprint
+  #
+  # Recompute a fingerprint from the file paths recorded in a previous
+  # fingerprint. This does not need the graph.
+  #
+
+  def refingerprint( s, old, backend ):
+    data = s.env_inputs( backend )
+    for k in [ 'construct', 'configs', 'adk' ]:
+      data[ k ] = { path : s.digest( path ) for path in old[ k ] }
+    data[ 'templates' ] = { path : dir_signature( path )
+                              for path in old.get( 'templates', {} ) }
+    return data
+
+  # diff
+  #
+  # Returns a list of human-readable reasons why two fingerprints differ
+  #
+
+  def diff( s, old, new ):
+
+    reasons = []
+
+    labels = [
+      ( 'version',       'mflowgen version changed'  ),
+      ( 'backend',       'backend changed'           ),
+      ( 'build_dir',     'build directory moved'     ),
+      ( 'mflowgen_path', 'MFLOWGEN_PATH changed'     ),
+    ]
+
+    for k, label in labels:
+      if old.get( k ) != new.get( k ):
+        reasons.append( '{} ("{}" -> "{}")'.format(
+                          label, old.get( k ), new.get( k ) ) )
+
+    labels = [
+      ( 'construct', 'construct script changed'   ),
+      ( 'adk',       'ADK changed'                ),
+      ( 'configs',   'step configuration changed' ),
+      ( 'templates', 'step template changed'      ),
+    ]
+
+    for k, label in labels:
+      if k not in old:
+        reasons.append( 'no cached fingerprint of the {}'.format( k ) )
+        continue
+      for path, h in sorted( new[ k ].items() ):
+        if old[ k ].get( path ) != h:
+          reasons.append( '{}: {}'.format( label, path ) )
+
+    return reasons
+
+  #-----------------------------------------------------------------------
+  # Load and save
+  #-----------------------------------------------------------------------
+
+  # load
+  #
+  # Returns the cached data (i.e., fingerprint and build IDs), or None if
+  # there is no cached graph
+  #
+
+  def load( s ):
+    try:
+      cached = read_yaml( s.key_path )
+      cached[ 'fingerprint' ], cached[ 'build_ids' ]
+    except Exception:
+      return None
+    return cached
+
+  # check
+  #
+  # Checks whether the cached graph is still valid for the given backend.
+  # Returns a list of reasons why it is not (i.e., empty if it is valid).
+  #
+
+  def check( s, cached, backend ):
+
+    if not cached:
+      return [ 'no cached graph' ]
+
+    old     = cached[ 'fingerprint' ]
+    reasons = s.diff( old, s.refingerprint( old, backend ) )
+
+    # Metadata that tools read without loading the graph (builds from
+    # older versions of mflowgen may not have it yet)
+
+    if not os.path.exists( s.metadata_dir + '/steps.json' ):
+      reasons.append( 'no list of steps in the metadata directory' )
+
+    # Existing build directories claim their build IDs first (see
+    # BuildOrchestrator.set_unique_build_ids), so the cached build files
+    # are only valid if the existing build directories still agree
+
+    build_ids = cached[ 'build_ids' ]
+
+    for dir_name in os.listdir( '.' ):
+      m = re.match( r'(\d+)-(.*)', dir_name )
+      if m and m.group(2) in build_ids and os.path.isdir( dir_name ):
+        if build_ids[ m.group(2) ] != m.group(1):
+          reasons.append( 'build directory numbering changed: '
+                          + dir_name )
+
+    return reasons
+
+  # save
+  #
+  # Saves the fingerprint and the build IDs after generating build files.
+  # The pickled graph should have been taken before generating the build
+  # files (i.e., before the parameters were expanded).
+  #
+
+  def save( s, fingerprint, build_ids, graph_pickle=None ):
+    if graph_pickle is not None:
+      with open( s.graph_path, 'wb' ) as fd:
+        fd.write( graph_pickle )
+    write_yaml_if_changed( data = { 'fingerprint' : fingerprint,
+                                    'build_ids'   : build_ids },
+                           path = s.key_path )
+
+  # load_graph
+  #
+  # Returns the cached graph, or None if there is no usable cached graph
+  #
+
+  def load_graph( s ):
+    try:
+      with open( s.graph_path, 'rb' ) as fd:
+        return pickle.load( fd )
+    except Exception:
+      return None
+
@@ -9,13 +9,16 @@
 
 import importlib
 import os
+import pickle
 import sys
 import yaml
 
 from mflowgen.core.build_orchestrator import BuildOrchestrator
+from mflowgen.core.graph_cache        import GraphCache
 from mflowgen.backends                import MakeBackend, NinjaBackend
+from mflowgen.backends                import LocalBackend
 from mflowgen.utils                   import bold
-from mflowgen.utils                   import read_yaml, write_yaml
+from mflowgen.utils                   import read_yaml, write_yaml_if_changed
 
 class RunHandler:
 
@@ -98,7 +101,7 @@ class RunHandler:
     except Exception:
       data = {}
     data['construct'] = construct_path
-    write_yaml( data = data, path = yaml_path )
+    write_yaml_if_changed( data = data, path = yaml_path )
 
   #-----------------------------------------------------------------------
   # launch
@@ -106,7 +109,8 @@ class RunHandler:
   # Dispatch function for commands
   #
 
-  def launch( s, help_, design, update=False, backend='make' ):
+  def launch( s, help_, design, update=False, backend='make',
+                                             verbose=False ):
 
     # Check that this design directory exists
 
@@ -115,7 +119,7 @@ class RunHandler:
                                'unless using --update or --demo' )
       sys.exit( 1 )
 
-    s.launch_run( design, update, backend )
+    s.launch_run( design, update, backend, verbose )
 
   #-----------------------------------------------------------------------
   # launch_run
@@ -124,7 +128,7 @@ class RunHandler:
   # graph description.
   #
 
-  def launch_run( s, design, update, backend ):
+  def launch_run( s, design, update, backend, verbose=False ):
 
     # Find the construct script (and check for --update) and save the path
     # to the construct script for future use of --update
@@ -132,6 +136,79 @@ class RunHandler:
     construct_path = s.find_construct_path( design, update )
     s.save_construct_path( construct_path )
 
+    # Select the backend build system
+
+    if backend == 'make':
+      backend_cls = MakeBackend
+      build_file  = 'Makefile'
+    elif backend == 'ninja':
+      backend_cls = NinjaBackend
+      build_file  = 'build.ninja'
+    elif backend == 'local':
+      backend_cls = LocalBackend
+      build_file  = LocalBackend.build_file
+
+    # For --update, check the compiled graph cache first. If none of the
+    # inputs changed since the last run, then the build files are already
+    # up to date and we do not need to import the construct script.
+
+    cache = GraphCache()
+    g     = None
+
+    if update:
+      cached  = cache.load()
+      reasons = cache.check( cached, backend )
+      if not reasons:
+        if os.path.exists( build_file ):
+          print( 'Graph is unchanged since the last run,',
+                 'build files are up to date' )
+          print()
+          s.print_targets( backend )
+          return
+        g           = cache.load_graph()
+        fingerprint = cached[ 'fingerprint' ]
+      else:
+        print( 'Reconstructing graph:' )
+        for reason in reasons:
+          print( '-', reason )
+        print()
+
+    # Construct the graph
+
+    if g is None:
+      g           = s.construct_graph( construct_path )
+      fingerprint = cache.fingerprint( construct_path, g, backend )
+
+    # Keep a copy of the graph before the build files are generated (the
+    # parameters are expanded in place)
+
+    try:
+      graph_pickle = pickle.dumps( g )
+    except Exception: # e.g., steps or params that cannot be pickled
+      graph_pickle = None
+
+    # Generate the build files (e.g., Makefile) for the selected backend
+    # build system
+
+    b = BuildOrchestrator( g, backend_cls )
+    b.build()
+
+    if verbose:
+      b.report_timings()
+
+    cache.save( fingerprint, b.build_ids, graph_pickle )
+
+    # Done
+
+    s.print_targets( backend )
+
+  # construct_graph
+  #
+  # Import the construct script and construct the graph
+  #
+
+  def construct_graph( s, construct_path ):
+
     # Import the graph for this design
 
     c_dirname  = os.path.dirname( construct_path )
@@ -159,20 +236,14 @@ class RunHandler:
 
     # Construct the graph
 
-    g = construct.construct()
+    return construct.construct()
 
-    # Generate the build files (e.g., Makefile) for the selected backend
-    # build system
-
-    if backend == 'make':
-      backend_cls = MakeBackend
-    elif backend == 'ninja':
-      backend_cls = NinjaBackend
+  # print_targets
 
-    b = BuildOrchestrator( g, backend_cls )
-    b.build()
+  def print_targets( s, backend ):
 
-    # Done
+    if backend == 'local':
+      backend = 'mflowgen build'
 
     list_target   = backend + " list"
     status_target = backend + " status"
@@ -181,4 +252,3 @@ class RunHandler:
                              + status_target + "\"" )
     print()
 
-
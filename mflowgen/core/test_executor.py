@@ -0,0 +1,126 @@
+import os
+
+from mflowgen.backends.local_syntax import Writer, local_execute
+from mflowgen.backends.local_syntax import local_symlink, local_alias
+from mflowgen.core.executor         import Executor
+
+def write_rules( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  os.makedirs( '0-a/outputs' )
+  os.makedirs( '1-b' )
+  w = Writer()
+  local_execute( w, [ '0-a/.execstamp', '0-a/outputs/.execstamp.x' ],
+                 'echo a >> log && echo x > 0-a/outputs/x',
+                 prebuilt = '0-a' )
+  local_symlink( w, '1-b/inputs/x', '0-a/outputs/x',
+                 deps = [ '0-a/outputs/.execstamp.x' ],
+                 ignore_src_dep = True )
+  local_execute( w, [ '1-b/.execstamp' ], 'echo b >> log',
+                 deps = [ '1-b/inputs/.stamp.x' ] )
+  local_alias( w, '1', [ '1-b/.execstamp' ] )
+  w.set_default( [ '1' ] )
+  with open( 'build.local.json', 'w' ) as fd:
+    fd.write( w.dumps() )
+
+def log():
+  with open( 'log' ) as fd:
+    return fd.read().split()
+
+def test_executor_build( tmp_path, monkeypatch ):
+  write_rules( tmp_path, monkeypatch )
+  assert Executor( 'build.local.json', jobs=2 ).build()
+  assert log() == [ 'a', 'b' ]
+  assert os.readlink( '1-b/inputs/x' ) == '../../0-a/outputs/x'
+  # Nothing to do on a second build
+  assert Executor( 'build.local.json' ).build()
+  assert log() == [ 'a', 'b' ]
+  # Only downstream rules are rebuilt
+  os.utime( '1-b/inputs/.stamp.x', ( 0, 2**33 ) )
+  assert Executor( 'build.local.json' ).build()
+  assert log() == [ 'a', 'b', 'b' ]
+
+def test_executor_prebuilt( tmp_path, monkeypatch ):
+  write_rules( tmp_path, monkeypatch )
+  for f in [ '.prebuilt', '.execstamp', 'outputs/x',
+             'outputs/.execstamp.x' ]:
+    open( '0-a/' + f, 'w' ).close()
+  assert Executor( 'build.local.json' ).build()
+  assert log() == [ 'b' ]
+
+def test_executor_dry_run( tmp_path, monkeypatch, capsys ):
+  write_rules( tmp_path, monkeypatch )
+  assert Executor( 'build.local.json', dry_run=True ).build()
+  assert not os.path.exists( 'log' )
+  assert 'touch 1-b/.execstamp' in capsys.readouterr().out
+
+def test_executor_failure( tmp_path, monkeypatch ):
+  write_rules( tmp_path, monkeypatch )
+  e = Executor( 'build.local.json' )
+  e.shell = [ 'bash', '-c', 'exit 3' ]
+  assert not e.build()
+  assert not os.path.exists( '1-b/.execstamp' )
+
+def test_executor_resources( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  w = Writer()
+  for n in range( 4 ):
+    local_execute( w, [ 'x' + str( n ) ],
+                   'echo start >> log && sleep 0.2 && echo end >> log',
+                   resources = { 'license.tool': 2 } )
+  w.set_default( [ 'x' + str( n ) for n in range( 4 ) ] )
+  w.set_capacities( { 'license.tool': 3 } )
+  with open( 'build.local.json', 'w' ) as fd:
+    fd.write( w.dumps() )
+  assert Executor( 'build.local.json', jobs=4 ).build()
+  # Only one rule holds the license at a time
+  assert log() == [ 'start', 'end' ] * 4
+
+def test_executor_early_cutoff( tmp_path, monkeypatch, capsys ):
+  monkeypatch.chdir( tmp_path )
+  os.makedirs( '0-a/outputs' )
+  w = Writer()
+  local_execute( w, [ '0-a/.execstamp' ], 'echo a >> log' )
+  # Output stamp that is always touched and digest stamp that keeps its
+  # old timestamp (i.e., output is unchanged, see mflowgen-digest)
+  w.rule( '0-a/outputs/.stamp.x', [ '0-a/.execstamp' ],
+          [ [ 'shell', 'echo x >> log && touch 0-a/outputs/.stamp.x &&'
+                       ' touch -d @1000 0-a/outputs/.digest.x' ] ] )
+  w.rule( '0-a/outputs/.digest.x', [ '0-a/outputs/.stamp.x' ] )
+  w.rule( '1-b/.stamp', [ '0-a/outputs/.digest.x' ],
+          [ [ 'shell', 'echo b >> log' ], [ 'touch', '1-b/.stamp' ] ],
+          order_deps = [ '0-a/.execstamp' ] )
+  w.set_default( [ '1-b/.stamp' ] )
+  os.makedirs( '1-b' )
+  with open( 'build.local.json', 'w' ) as fd:
+    fd.write( w.dumps() )
+  assert Executor( 'build.local.json' ).build()
+  assert log() == [ 'a', 'x', 'b' ]
+  # Rerunning the upstream rule stops at the unchanged digest stamp
+  os.remove( '0-a/.execstamp' )
+  assert Executor( 'build.local.json' ).build()
+  assert log() == [ 'a', 'x', 'b', 'a', 'x' ]
+  # Nothing to do afterwards, also for dry runs
+  assert Executor( 'build.local.json' ).build()
+  assert log() == [ 'a', 'x', 'b', 'a', 'x' ]
+  capsys.readouterr()
+  assert Executor( 'build.local.json', dry_run=True ).build()
+  assert 'echo' not in capsys.readouterr().out
+  # Dry runs cannot know whether the output will change
+  os.remove( '0-a/.execstamp' )
+  assert Executor( 'build.local.json', dry_run=True ).build()
+  assert 'echo b' in capsys.readouterr().out
+
+def test_executor_priority( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  w = Writer()
+  local_execute( w, [ 'x0' ], 'echo x0 >> log' )
+  local_execute( w, [ 'x1' ], 'echo x1 >> log', priority = 1 )
+  # x2 only inherits the priority of the rule that depends on it
+  local_execute( w, [ 'x2' ], 'echo x2 >> log' )
+  local_execute( w, [ 'x3' ], 'echo x3 >> log', deps = [ 'x2' ],
+                 priority = 5 )
+  w.set_default( [ 'x0', 'x1', 'x3' ] )
+  with open( 'build.local.json', 'w' ) as fd:
+    fd.write( w.dumps() )
+  assert Executor( 'build.local.json', jobs=1 ).build()
+  assert log() == [ 'x2', 'x3', 'x1', 'x0' ]
@@ -0,0 +1,55 @@
+import os
+
+from mflowgen.components import Graph, Step
+from mflowgen.core       import GraphCache
+from mflowgen.utils      import write_yaml
+
+def make_graph( tmp_path ):
+  for name in [ 'a', 'b' ]:
+    ( tmp_path / name ).mkdir()
+    write_yaml( data = { 'name': name, 'outputs': [ 'x' ] },
+                path = str( tmp_path / name / 'configure.yml' ) )
+  ( tmp_path / 'construct.py' ).write_text( '# construct\n' )
+  g = Graph()
+  g.add_step( Step( str( tmp_path / 'a' ) ) )
+  g.add_step( Step( str( tmp_path / 'b' ) ) )
+  return g
+
+def save_cache( tmp_path, monkeypatch ):
+  ( tmp_path / 'build' ).mkdir()
+  ( tmp_path / 'build' / '.mflowgen' ).mkdir()
+  monkeypatch.chdir( tmp_path / 'build' )
+  monkeypatch.delenv( 'MFLOWGEN_PATH', raising=False )
+  g = make_graph( tmp_path )
+  cache = GraphCache()
+  fingerprint = cache.fingerprint( str( tmp_path / 'construct.py' ), g,
+                                   'make' )
+  cache.save( fingerprint, { 'a': '0', 'b': '1' } )
+  ( tmp_path / 'build' / '.mflowgen' / 'steps.json' ).write_text( '[]\n' )
+  return cache
+
+def test_graph_cache_hit( tmp_path, monkeypatch ):
+  cache = save_cache( tmp_path, monkeypatch )
+  os.mkdir( '1-b' )
+  assert cache.check( cache.load(), 'make' ) == []
+
+def test_graph_cache_reports_changes( tmp_path, monkeypatch ):
+  cache = save_cache( tmp_path, monkeypatch )
+  ( tmp_path / 'b' / 'configure.yml' ).write_text( 'name: b\n' )
+  monkeypatch.setenv( 'MFLOWGEN_PATH', '/some/adks' )
+  os.mkdir( '3-a' )
+  reasons = cache.check( cache.load(), 'ninja' )
+  assert reasons == [
+    'backend changed ("make" -> "ninja")',
+    'MFLOWGEN_PATH changed ("" -> "/some/adks")',
+    'step configuration changed: ' + str( tmp_path / 'b' / 'configure.yml' ),
+    'step template changed: ' + str( tmp_path / 'b' ),
+    'build directory numbering changed: 3-a',
+  ]
+
+def test_graph_cache_missing( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  cache = GraphCache()
+  assert cache.check( cache.load(), 'make' ) == [ 'no cached graph' ]
+  assert cache.load_graph() is None
+
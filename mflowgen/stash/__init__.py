@@ -1,2 +1,4 @@
+from mflowgen.stash.blob_store    import BlobStore
+from mflowgen.stash.file_transfer import FileTransfer
+from mflowgen.stash.stash_catalog import StashCatalog
 from mflowgen.stash.stash_handler import StashHandler
-
@@ -0,0 +1,564 @@
+#=========================================================================
+# blob_store.py
+#=========================================================================
+# Content-addressed storage of the files in a stash
+#
+# Pushing the same step from several sweep points (or the same large GDS
+# or checkpoint from several steps) used to store a full copy each time.
+# The stash now keeps the content of each file once, as a blob keyed by
+# its sha256 digest, and each stashed step is a manifest that lists its
+# files by blob:
+#
+#     <stash>/blobs/3e/3e5ab4...
+#     <stash>/2020-0315-synopsys-dc-synthesis-3e5ab4/
+#                            .mflowgen.stash.manifest.json
+#                            .mflowgen.stash.node.yml
+#
+# The manifest maps each relative path to its blob, size, mode, and mtime,
+# and also lists the directories (so empty ones come back too):
+#
+#     { "files": { "outputs/design.v": { "blob"  : "3e5ab4...",
+#                                        "size"  : 1024,
+#                                        "mode"  : 420,
+#                                        "mtime" : 1584300000.0 } },
+#       "dirs" : [ "outputs" ] }
+#
+# Pushes skip the blobs that are already in the stash. Blobs are read-only
+# and written to a temporary file that is moved into place, so concurrent
+# pushes of the same content are safe. Pulls materialize each file with a
+# copy-on-write clone ("reflink") where the file system supports it, or
+# else with a hardlink to the blob (read-only, like the build cache), or
+# else with a copy (e.g., across file systems). Both run on the thread
+# pool of the transfer engine (see file_transfer.py).
+#
+# With "push --compress", new blobs are stored compressed (gzip, xz, or
+# zstd) next to where the plain blob would be (e.g., "blobs/3e/3e5ab4...gz",
+# see compression.py). They are still keyed by the digest of the plain
+# content, so they are shared with plain pushes of the same content, and
+# the manifest still lists every file, so pulls can pick out a subset of
+# the files (e.g., only the outputs) without reading the others. Pulls
+# decompress these blobs, since they cannot be cloned or linked.
+#
+# Blobs that no manifest refers to anymore are removed when steps are
+# dropped (see collect). Pushes hold a shared lock on the blob directory
+# and collection holds an exclusive one, so a push never refers to a blob
+# that is being removed.
+#
+# Date   : October 18, 2026
+#
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mflowgen.stash.compression   import codec_for_ext, decompress_file
+from mflowgen.stash.file_transfer import FileTransfer, copy_file
+
+#-------------------------------------------------------------------------
+# BlobStore
+#-------------------------------------------------------------------------
+
+class BlobStore:
+
+  manifest_name = '.mflowgen.stash.manifest.json'
+
+  # Mode of the blobs (files with this mode without write bits can be
+  # hardlinked to them)
+
+  blob_mode = 0o444
+
+  # ioctl to clone a file on Linux (btrfs, xfs, ...)
+
+  FICLONE = 0x40049409
+
+  chunk_size = 1 << 20
+
+  # Extensions of compressed blobs (including those of codecs that are not
+  # installed here, so that their blobs are still found and collected)
+
+  compressed_exts = [ '.gz', '.xz', '.zst' ]
+
+  def __init__( s, path ):
+    s.path        = path
+    s.blobs_dir   = path + '/blobs'
+    s.can_reflink = True
+
+  def blob_path( s, digest ):
+    return s.blobs_dir + '/' + digest[:2] + '/' + digest
+
+  def has( s, digest ):
+    return s.find( digest ) is not None
+
+  # variants
+  #
+  # Returns the paths of the plain and compressed blobs with the given
+  # digest (usually only one of them)
+  #
+
+  def variants( s, digest ):
+    path = s.blob_path( digest )
+    return [ path + ext for ext in [ '' ] + s.compressed_exts
+                          if os.path.exists( path + ext ) ]
+
+  # find
+  #
+  # Returns the path of the blob with the given digest (preferring the
+  # plain one), or None
+  #
+
+  def find( s, digest ):
+    paths = s.variants( digest )
+    return paths[0] if paths else None
+
+  #-----------------------------------------------------------------------
+  # Locking
+  #-----------------------------------------------------------------------
+
+  def lock( s, shared=False ):
+    os.makedirs( s.blobs_dir, exist_ok=True )
+    fd = os.open( s.blobs_dir, os.O_RDONLY )
+    fcntl.flock( fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX )
+    return fd
+
+  def unlock( s, fd ):
+    os.close( fd )
+
+  #-----------------------------------------------------------------------
+  # Blobs
+  #-----------------------------------------------------------------------
+
+  # digest
+  #
+  # Returns the sha256 digest of a file and its size. Calls
+  # progress( nbytes ) after each chunk if given. Compressed blobs are
+  # read with the open function of their codec.
+  #
+
+  def digest( s, path, progress=None, open_=None ):
+    h    = hashlib.sha256()
+    size = 0
+    with ( open_( path ) if open_ else open( path, 'rb' ) ) as fd:
+      for chunk in iter( lambda: fd.read( s.chunk_size ), b'' ):
+        h.update( chunk )
+        size += len( chunk )
+        if progress: progress( len( chunk ) )
+    return h.hexdigest(), size
+
+  # put
+  #
+  # Adds the content of a file to the store, compressed if a compressor
+  # is given (see compression.py). Returns its digest, its size, and the
+  # bytes written to a new blob (zero if the blob was already there). If
+  # the file changed while it was hashed and copied, the blob is keyed by
+  # what was copied.
+  #
+
+  def put( s, path, progress=None, compressor=None ):
+
+    st           = os.stat( path )
+    digest, size = s.digest( path, progress )
+
+    if s.has( digest ):
+      return digest, size, 0
+
+    ext = compressor.codec.ext if compressor else ''
+    tmp = s.path + '/tmp/{}.{}.{}{}'.format( digest, os.getpid(),
+                                             threading.get_ident(), ext )
+    os.makedirs( os.path.dirname( tmp ), exist_ok=True )
+
+    try:
+      if compressor:
+        stored = compressor.compress_file( path, tmp )
+      else:
+        stored = copy_file( path, tmp )
+      after = os.stat( path )
+      if ( after.st_size, after.st_mtime_ns ) != \
+         ( st.st_size,    st.st_mtime_ns    ):
+        digest, size = s.digest( tmp, open_ = compressor and
+                                              compressor.codec.open )
+      os.utime( tmp, ns = ( after.st_atime_ns, after.st_mtime_ns ) )
+      os.chmod( tmp, s.blob_mode )
+      blob = s.blob_path( digest ) + ext
+      os.makedirs( os.path.dirname( blob ), exist_ok=True )
+      os.rename( tmp, blob )
+    except BaseException:
+      s.remove( tmp )
+      raise
+
+    return digest, size, stored
+
+  # materialize
+  #
+  # Creates the file at dst from a blob with the given mode and mtime, as:
+  #
+  # - auto : a reflink, or else a (read-only) hardlink, or else a copy
+  # - link : a symlink to the blob (read-only)
+  # - copy : a private writable copy (a reflink, or else a copy)
+  #
+  # Compressed blobs are always decompressed into dst. Stamps and empty
+  # files are never linked (see shareable), and files are only hardlinked
+  # if the blob has their mtime. Returns how: "reflink", "hardlink",
+  # "symlink", "copy", or "decompress". Copies call progress( nbytes )
+  # after each chunk if given.
+  #
+
+  def materialize( s, digest, dst, mode, mtime=None, progress=None,
+                         how='auto' ):
+
+    src = s.find( digest )
+
+    if not src:
+      raise FileNotFoundError( errno.ENOENT, 'Missing blob',
+                               s.blob_path( digest ) )
+
+    ext = os.path.splitext( src )[1]
+
+    if how == 'copy':
+      mode = mode | stat.S_IWUSR
+
+    if ext in s.compressed_exts:
+      decompress_file( codec_for_ext( ext ), src, dst, progress )
+      how = 'decompress'
+    elif how == 'link' and s.shareable( src, dst ):
+      os.symlink( src, dst )
+      return 'symlink'
+    elif s.reflink( src, dst ):
+      how = 'reflink'
+    elif how == 'auto' and mode & 0o777 & ~0o222 == s.blob_mode and \
+         s.shareable( src, dst, mtime ) and s.hardlink( src, dst ):
+      return 'hardlink'
+    else:
+      copy_file( src, dst, progress )
+      how = 'copy'
+
+    os.chmod( dst, mode & 0o7777 )
+
+    if mtime is not None:
+      os.utime( dst, ( mtime, mtime ) )
+
+    return how
+
+  # reflink
+  #
+  # Clones src into dst. Stops trying after the first failure that means
+  # the file system (or platform) does not support it.
+  #
+
+  def reflink( s, src, dst ):
+
+    if not s.can_reflink:
+      return False
+
+    try:
+      with open( src, 'rb' ) as fi, open( dst, 'wb' ) as fo:
+        fcntl.ioctl( fo.fileno(), s.FICLONE, fi.fileno() )
+      return True
+    except OSError as e:
+      s.remove( dst )
+      if e.errno in [ errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL,
+                      errno.EXDEV, errno.ENOSYS, errno.EBADF ]:
+        s.can_reflink = False
+      return False
+
+  # shareable
+  #
+  # Returns whether dst can share the inode of its blob (with a link).
+  # Stamps and empty files cannot: the build touches stamps, and all empty
+  # files share one blob, so touching one would change the mtime of every
+  # other stamp (and pull) that links to it. Hardlinks also need the blob
+  # to have the mtime of the file, since they cannot have their own.
+  #
+
+  def shareable( s, src, dst, mtime=None ):
+    st = os.stat( src )
+    if st.st_size == 0 or 'stamp' in os.path.basename( dst ):
+      return False
+    return mtime is None or st.st_mtime == mtime
+
+  # hardlink
+  #
+  # Hardlinks a blob. Blobs owned by another user are not linked (like in
+  # the build cache, since the build could not update their timestamps).
+  #
+
+  def hardlink( s, src, dst ):
+    if os.stat( src ).st_uid != os.getuid():
+      return False
+    try:
+      os.link( src, dst )
+      return True
+    except OSError:
+      return False
+
+  # remove
+  #
+  # Removes a file or directory (the files may be read-only)
+  #
+
+  def remove( s, path ):
+    if os.path.isdir( path ) and not os.path.islink( path ):
+      shutil.rmtree( path )
+    elif os.path.lexists( path ):
+      os.remove( path )
+
+  #-----------------------------------------------------------------------
+  # Manifests
+  #-----------------------------------------------------------------------
+
+  # read_manifest
+  #
+  # Returns the manifest of a stashed step, or None for steps stashed as
+  # full copies (before the blob store)
+  #
+
+  def read_manifest( s, entry_dir ):
+    try:
+      with open( entry_dir + '/' + s.manifest_name ) as fd:
+        return json.load( fd )
+    except FileNotFoundError:
+      return None
+
+  def write_manifest( s, entry_dir, manifest ):
+    tmp = entry_dir + '/' + s.manifest_name + '.tmp'
+    with open( tmp, 'w' ) as fd:
+      json.dump( manifest, fd, sort_keys=True )
+    os.replace( tmp, entry_dir + '/' + s.manifest_name )
+
+  # push
+  #
+  # Stores the given files ( relative path, path, size ) and directories
+  # (from FileTransfer.walk) as the manifest of the stashed step in
+  # entry_dir, compressing new blobs if a compressor is given. Returns the
+  # manifest, the number of bytes of content in new blobs, the number of
+  # bytes written for them (less if they are compressed), and the summary
+  # of the transfer.
+  #
+
+  def push( s, entry_dir, files, dirs, transfer=None, compressor=None ):
+
+    transfer = transfer or FileTransfer( quiet=True )
+
+    def put( item, progress ):
+      rel, path, size = item
+      st = os.stat( path )
+      digest, size, stored = s.put( path,
+                                    lambda n: progress.update( nbytes = n ),
+                                    compressor )
+      return rel, stored, {
+        'blob'  : digest,
+        'size'  : size,
+        'mode'  : stat.S_IMODE( st.st_mode ),
+        'mtime' : st.st_mtime,
+      }
+
+    manifest     = { 'files': {}, 'dirs': sorted( dirs ) }
+    new_bytes    = 0
+    stored_bytes = 0
+
+    fd = s.lock( shared=True )
+
+    try:
+      results, summary = transfer.run( 'Pushed', put, files,
+                                       [ f[2] for f in files ] )
+      for rel, stored, f in results:
+        manifest[ 'files' ][ rel ] = f
+        if stored:
+          new_bytes    += f[ 'size' ]
+          stored_bytes += stored
+      os.makedirs( entry_dir, exist_ok=True )
+      s.write_manifest( entry_dir, manifest )
+    finally:
+      s.unlock( fd )
+
+    return manifest, new_bytes, stored_bytes, summary
+
+  # pull
+  #
+  # Materializes the files of a manifest in dst (see materialize for how),
+  # or only those under the given directory (e.g., "outputs"). Returns how
+  # many files were materialized each way and the summary of the transfer.
+  #
+
+  def pull( s, manifest, dst, transfer=None, how='auto', only=None ):
+
+    transfer = transfer or FileTransfer( quiet=True )
+
+    def selected( rel ):
+      return only is None or rel == only or rel.startswith( only + '/' )
+
+    os.makedirs( dst, exist_ok=True )
+
+    for rel in manifest[ 'dirs' ]:
+      if selected( rel ):
+        os.makedirs( dst + '/' + rel, exist_ok=True )
+
+    def materialize( item, progress ):
+      rel, f = item
+      path   = dst + '/' + rel
+      os.makedirs( os.path.dirname( path ), exist_ok=True )
+      result = s.materialize( f[ 'blob' ], path, f[ 'mode' ],
+                              f.get( 'mtime' ),
+                              lambda n: progress.update( nbytes = n ), how )
+      if result not in [ 'copy', 'decompress' ]:
+        progress.update( nbytes = f[ 'size' ] )
+      return result
+
+    items = [ ( rel, f ) for rel, f in sorted( manifest[ 'files' ].items() )
+                if selected( rel ) ]
+
+    results, summary = transfer.run( 'Pulled', materialize, items,
+                                     [ f[ 'size' ] for rel, f in items ] )
+
+    counts = { 'reflink': 0, 'hardlink': 0, 'symlink': 0, 'copy': 0,
+               'decompress': 0 }
+
+    for result in results:
+      counts[ result ] += 1
+
+    return counts, summary
+
+  # detach
+  #
+  # Replaces the files of a manifest in dst that are symlinks to blobs,
+  # hardlinks, or read-only with private writable copies. Returns the
+  # number of files that were replaced and the summary of the transfer.
+  #
+
+  def detach( s, manifest, dst, transfer=None ):
+
+    transfer = transfer or FileTransfer( quiet=True )
+
+    def linked( path ):
+      try:
+        st = os.lstat( path )
+      except FileNotFoundError:
+        return False # removed since it was pulled
+      return stat.S_ISLNK( st.st_mode ) or st.st_nlink > 1 or \
+             not st.st_mode & stat.S_IWUSR
+
+    items = [ ( rel, f ) for rel, f in sorted( manifest[ 'files' ].items() )
+                if linked( dst + '/' + rel ) ]
+
+    def detach( item, progress ):
+      rel, f = item
+      path   = dst + '/' + rel
+      tmp    = path + '.mflowgen-stash-tmp'
+      s.remove( tmp )
+      result = s.materialize( f[ 'blob' ], tmp, f[ 'mode' ], f.get( 'mtime' ),
+                              lambda n: progress.update( nbytes = n ),
+                              'copy' )
+      if result not in [ 'copy', 'decompress' ]:
+        progress.update( nbytes = f[ 'size' ] )
+      os.replace( tmp, path )
+
+    results, summary = transfer.run( 'Materialized', detach, items,
+                                     [ f[ 'size' ] for rel, f in items ] )
+
+    return len( results ), summary
+
+  #-----------------------------------------------------------------------
+  # Sizes and collection
+  #-----------------------------------------------------------------------
+
+  # blobs
+  #
+  # Returns { digest : size } for all blobs in the store (the size on disk,
+  # with all variants of a blob)
+  #
+
+  def blobs( s ):
+
+    blobs = {}
+
+    if not os.path.isdir( s.blobs_dir ):
+      return blobs
+
+    for prefix in os.scandir( s.blobs_dir ):
+      if not prefix.is_dir():
+        continue
+      for blob in os.scandir( prefix.path ):
+        digest, ext = os.path.splitext( blob.name )
+        if ext not in s.compressed_exts:
+          digest = blob.name
+        blobs[ digest ] = blobs.get( digest, 0 ) + blob.stat().st_size
+
+    return blobs
+
+  # sizes
+  #
+  # Returns { name : ( logical size, unique size ) } for the given
+  # manifests { name : manifest }. The logical size is the sum of the
+  # files, and the unique size is the bytes in the blobs that no other
+  # manifest refers to (i.e., what dropping the step would free), on disk
+  # if the sizes of the blobs (from blobs) are given.
+  #
+
+  def sizes( s, manifests, blobs=None ):
+
+    refs = {}
+
+    for m in manifests.values():
+      for digest in { f[ 'blob' ] for f in m[ 'files' ].values() }:
+        refs[ digest ] = refs.get( digest, 0 ) + 1
+
+    sizes = {}
+
+    for name, m in manifests.items():
+      unique = { f[ 'blob' ]: f[ 'size' ] for f in m[ 'files' ].values()
+                   if refs[ f[ 'blob' ] ] == 1 }
+      if blobs is not None:
+        unique = { d: blobs.get( d, 0 ) for d in unique }
+      sizes[ name ] = (
+        sum( f[ 'size' ] for f in m[ 'files' ].values() ),
+        sum( unique.values() ),
+      )
+
+    return sizes
+
+  # manifests
+  #
+  # Returns { entry directory name : manifest } for all stashed steps
+  #
+
+  def manifests( s ):
+    manifests = {}
+    for entry in os.scandir( s.path ):
+      if entry.is_dir() and entry.name not in [ 'blobs', 'tmp' ]:
+        m = s.read_manifest( entry.path )
+        if m is not None:
+          manifests[ entry.name ] = m
+    return manifests
+
+  # collect
+  #
+  # Removes the blobs that no stashed step refers to (on the given number
+  # of threads). Returns the number of blobs and bytes that were removed.
+  #
+
+  def collect( s, jobs=1 ):
+
+    def remove( digest ):
+      for path in s.variants( digest ):
+        s.remove( path )
+
+    fd = s.lock()
+
+    try:
+      live = set()
+      for m in s.manifests().values():
+        live.update( f[ 'blob' ] for f in m[ 'files' ].values() )
+      dead = { digest: size for digest, size in s.blobs().items()
+                 if digest not in live }
+      with ThreadPoolExecutor( max_workers = jobs ) as pool:
+        list( pool.map( remove, dead ) )
+    finally:
+      s.unlock( fd )
+
+    return len( dead ), sum( dead.values() )
@@ -0,0 +1,178 @@
+#=========================================================================
+# compression.py
+#=========================================================================
+# Compressed blobs for "mflowgen stash push --compress"
+#
+# Logs, reports, netlists, and DEF compress very well, so stashes can
+# keep their blobs compressed (see blob_store.py). A compressed blob is
+# a standard gzip, xz, or zstd file next to where the plain blob would be
+# (e.g., "blobs/3e/3e5ab4....gz"), so it can also be read with zcat, xzcat,
+# or zstdcat. It is still keyed by the digest of the plain content, so
+# compressed and plain pushes of the same content share the blob.
+#
+# Files are compressed in independent chunks (gzip members, xz streams, or
+# zstd frames) on a thread pool, since all three formats allow several of
+# them one after the other in the same file. The compressors release the
+# interpreter lock, so pushes of large files scale with the number of
+# processors. The chunks of each file are written in order as they
+# complete, with a bounded number of chunks in flight across all files,
+# so memory use does not grow with the size or the number of files.
+#
+# The zstd format needs the "zstandard" package and is only offered when
+# it is installed.
+#
+# Date   : October 18, 2026
+#
+
+import collections
+import gzip
+import lzma
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+#-------------------------------------------------------------------------
+# Codecs
+#-------------------------------------------------------------------------
+
+class Codec:
+
+  def __init__( s, name, ext, compress, open_ ):
+    s.name     = name
+    s.ext      = ext
+    s.compress = compress # bytes -> one independent chunk
+    s.open     = open_    # path -> file object with the plain content
+
+def zstd_compress( data ):
+  return zstandard.ZstdCompressor( level=3 ).compress( data )
+
+def zstd_open( path ):
+  return zstandard.ZstdDecompressor().stream_reader(
+           open( path, 'rb' ), read_across_frames=True, closefd=True )
+
+codecs = collections.OrderedDict()
+
+codecs[ 'gzip' ] = Codec( 'gzip', '.gz',
+                          lambda data: gzip.compress( data, 6 ),
+                          lambda path: gzip.open( path, 'rb' ) )
+
+codecs[ 'lzma' ] = Codec( 'lzma', '.xz',
+                          lambda data: lzma.compress( data, preset=6 ),
+                          lambda path: lzma.open( path, 'rb' ) )
+
+if zstandard:
+  codecs[ 'zstd' ] = Codec( 'zstd', '.zst', zstd_compress, zstd_open )
+
+# get_codec
+#
+# Returns the codec with the given name ("auto" is zstd if it is
+# installed, or else gzip)
+#
+
+def get_codec( name ):
+  if name == 'auto':
+    name = 'zstd' if 'zstd' in codecs else 'gzip'
+  assert name in codecs, \
+    'Compression -- Unknown format "{}" (choose from: {})'.format(
+      name, ', '.join( codecs ) )
+  return codecs[ name ]
+
+# codec_for_ext
+#
+# Returns the codec of a compressed blob with the given extension
+#
+
+def codec_for_ext( ext ):
+  for codec in codecs.values():
+    if codec.ext == ext:
+      return codec
+  assert ext != '.zst', \
+    'Compression -- Reading zstd blobs needs the "zstandard" package'
+  assert False, \
+    'Compression -- Unknown extension "{}"'.format( ext )
+
+#-------------------------------------------------------------------------
+# Compressor
+#-------------------------------------------------------------------------
+# Compresses files in chunks on a shared thread pool
+#
+
+class Compressor:
+
+  chunk_size = 4 << 20
+
+  def __init__( s, codec, jobs=None ):
+    s.codec = codec
+    s.jobs  = jobs or os.cpu_count() or 1
+    s.pool  = ThreadPoolExecutor( max_workers = s.jobs )
+    s.slots = threading.BoundedSemaphore( 2 * s.jobs ) # chunks in flight
+
+  def close( s ):
+    s.pool.shutdown()
+
+  # compress_file
+  #
+  # Compresses src into dst and returns the size of dst. Calls
+  # progress( nbytes ) after each chunk if given.
+  #
+
+  def compress_file( s, src, dst, progress=None ):
+
+    size    = 0
+    pending = collections.deque()
+
+    def write( future, n ):
+      nonlocal size
+      try:
+        data = future.result()
+      finally:
+        s.slots.release()
+      fo.write( data )
+      size += len( data )
+      if progress: progress( n )
+
+    # Wait for a free slot, writing out the chunks of this file in the
+    # meantime (so that files never wait on each other while they hold
+    # slots)
+
+    def acquire():
+      while not s.slots.acquire( blocking=False ):
+        if not pending:
+          s.slots.acquire()
+          return
+        write( *pending.popleft() )
+
+    with open( src, 'rb' ) as fi, open( dst, 'wb' ) as fo:
+      try:
+        for chunk in iter( lambda: fi.read( s.chunk_size ), b'' ):
+          acquire()
+          pending.append( ( s.pool.submit( s.codec.compress, chunk ),
+                            len( chunk ) ) )
+        while pending:
+          write( *pending.popleft() )
+        if not size: # empty files are still valid compressed files
+          size = fo.write( s.codec.compress( b'' ) )
+      finally:
+        for future, n in pending: # after an error
+          future.cancel() or future.exception()
+          s.slots.release()
+
+    return size
+
+# decompress_file
+#
+# Decompresses src (a blob compressed with the codec) into dst. Calls
+# progress( nbytes ) after each chunk if given.
+#
+
+def decompress_file( codec, src, dst, progress=None ):
+  with codec.open( src ) as fi, open( dst, 'wb' ) as fo:
+    for chunk in iter( lambda: fi.read( 1 << 20 ), b'' ):
+      fo.write( chunk )
+      if progress: progress( len( chunk ) )
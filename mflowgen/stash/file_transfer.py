@@ -0,0 +1,261 @@
+#=========================================================================
+# file_transfer.py
+#=========================================================================
+# Parallel file transfers for stash push and pull
+#
+# Stashes usually live on shared network file systems, where copying one
+# file at a time (like shutil.copytree) is bound by the latency of each
+# file operation rather than by bandwidth. The transfer engine:
+#
+# - Walks the tree with os.scandir (following symlinks and skipping
+#   dangling ones, like the stash always did)
+# - Runs the per-file work (hashing, copying, linking) on a thread pool,
+#   largest files first so that the few huge files (e.g., GDS or
+#   checkpoints) do not start last
+# - Copies file content in chunks with os.copy_file_range, which lets the
+#   kernel (or an NFS server) copy without going through user space, or
+#   else with os.sendfile, or else with plain reads and writes
+# - Shows the progress and throughput while it runs (on terminals) and
+#   reports the throughput at the end
+#
+# The number of threads is set with "-j" (default 8), since the work is
+# bound by I/O and not by the number of processors.
+#
+# Date   : October 18, 2026
+#
+
+import errno
+import os
+import shutil
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mflowgen.cache.build_cache import format_size
+
+#-------------------------------------------------------------------------
+# copy_file
+#-------------------------------------------------------------------------
+# Copies the content of src into dst in chunks and returns the number of
+# bytes copied. Calls progress( nbytes ) after each chunk if given.
+#
+
+chunk_size = 64 << 20
+
+# Kernel copy functions that failed in a way that means that they are not
+# supported (e.g., by the platform or across file systems)
+
+unsupported = set()
+
+unsupported_errnos = [ errno.ENOSYS, errno.EXDEV, errno.EINVAL,
+                       errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF ]
+
+def copy_range( fi, fo, size, progress=None ):
+
+  offset = 0
+
+  # copy_file_range (Python 3.8+ on Linux) with explicit offsets
+
+  if hasattr( os, 'copy_file_range' ) and \
+     'copy_file_range' not in unsupported:
+    try:
+      while offset < size:
+        n = os.copy_file_range( fi, fo, min( chunk_size, size - offset ),
+                                offset, offset )
+        if n == 0:
+          break
+        offset += n
+        if progress: progress( n )
+      return offset
+    except OSError as e:
+      if e.errno not in unsupported_errnos or offset:
+        raise
+      unsupported.add( 'copy_file_range' )
+
+  # sendfile writes at the current position of the output file
+
+  if hasattr( os, 'sendfile' ) and 'sendfile' not in unsupported:
+    try:
+      while offset < size:
+        n = os.sendfile( fo, fi, offset, min( chunk_size, size - offset ) )
+        if n == 0:
+          break
+        offset += n
+        if progress: progress( n )
+      return offset
+    except OSError as e:
+      if e.errno not in unsupported_errnos or offset:
+        raise
+      unsupported.add( 'sendfile' )
+
+  return offset
+
+def copy_file( src, dst, progress=None ):
+
+  with open( src, 'rb' ) as fi, open( dst, 'wb' ) as fo:
+
+    size   = os.fstat( fi.fileno() ).st_size
+    offset = copy_range( fi.fileno(), fo.fileno(), size, progress )
+
+    # Whatever the kernel did not copy (or everything)
+
+    fi.seek( offset )
+    fo.seek( offset )
+
+    while True:
+      chunk = fi.read( 1 << 20 )
+      if not chunk:
+        break
+      fo.write( chunk )
+      offset += len( chunk )
+      if progress: progress( len( chunk ) )
+
+  return offset
+
+#-------------------------------------------------------------------------
+# Progress
+#-------------------------------------------------------------------------
+# Progress of a transfer. Threads report the bytes and files they are
+# done with, and the progress line is redrawn at most every interval
+# seconds when the output is a terminal.
+#
+
+class Progress:
+
+  def __init__( s, label, total_bytes, total_files, stream=None,
+                   interval=0.5, live=None ):
+    s.label       = label
+    s.total_bytes = total_bytes
+    s.total_files = total_files
+    s.stream      = stream or sys.stdout
+    s.interval    = interval
+    s.live        = s.stream.isatty() if live is None else live
+    s.nbytes      = 0
+    s.nfiles      = 0
+    s.start       = time.time()
+    s.last        = 0
+    s.lock        = threading.Lock()
+
+  def update( s, nbytes=0, nfiles=0 ):
+    with s.lock:
+      s.nbytes += nbytes
+      s.nfiles += nfiles
+      now = time.time()
+      if s.live and now - s.last >= s.interval:
+        s.last = now
+        s.draw( now )
+
+  def rate( s, now=None ):
+    elapsed = ( now or time.time() ) - s.start
+    return s.nbytes / elapsed if elapsed > 0 else 0
+
+  def draw( s, now ):
+    percent = 100 * s.nbytes / s.total_bytes if s.total_bytes else 100
+    s.stream.write( '\r{}: {} / {} ({:.0f}%), {} / {} files, {}/s  '.format(
+      s.label, format_size( s.nbytes ), format_size( s.total_bytes ),
+      percent, s.nfiles, s.total_files, format_size( s.rate( now ) ) ) )
+    s.stream.flush()
+
+  # done
+  #
+  # Clears the progress line and returns a summary of the transfer
+  #
+
+  def done( s ):
+    now = time.time()
+    if s.live and s.last:
+      s.stream.write( '\r' + ' ' * 79 + '\r' )
+      s.stream.flush()
+    return '{} {} files ({}) in {:.1f} s ({}/s)'.format(
+      s.label, s.nfiles, format_size( s.nbytes ), now - s.start,
+      format_size( s.rate( now ) ) )
+
+#-------------------------------------------------------------------------
+# FileTransfer
+#-------------------------------------------------------------------------
+
+class FileTransfer:
+
+  def __init__( s, jobs=None, quiet=False ):
+    s.jobs  = jobs or 8
+    s.quiet = quiet
+
+  # walk
+  #
+  # Returns the files ( relative path, path, size ) and directories
+  # (relative paths) under src, like shutil.copytree would copy them with
+  # the given ignore function: all symlinks are followed, and dangling
+  # symlinks are skipped.
+  #
+
+  def walk( s, src, ignore=None ):
+
+    files = []
+    dirs  = []
+
+    def visit( path, rel ):
+      with os.scandir( path ) as it:
+        entries = sorted( it, key=lambda e: e.name )
+      ignored = set( ignore( path, [ e.name for e in entries ] )
+                       if ignore else [] )
+      for e in entries:
+        if e.name in ignored:
+          continue
+        if e.is_dir():
+          dirs.append( rel + e.name )
+          visit( e.path, rel + e.name + '/' )
+        elif e.is_file(): # skips dangling symlinks
+          files.append( ( rel + e.name, e.path, e.stat().st_size ) )
+
+    visit( src, '' )
+
+    return files, dirs
+
+  # run
+  #
+  # Calls f( item, progress ) for each item on the thread pool, largest
+  # items first, with the progress of the transfer. Each call reports its
+  # own bytes, and the files are counted here. Returns the results in the
+  # order of the items and the summary of the transfer.
+  #
+
+  def run( s, label, f, items, sizes ):
+
+    progress = Progress( label, sum( sizes ), len( items ),
+                         live = False if s.quiet else None )
+
+    def work( i ):
+      result = f( items[i], progress )
+      progress.update( nfiles = 1 )
+      return result
+
+    order = sorted( range( len( items ) ), key=lambda i: -sizes[i] )
+
+    with ThreadPoolExecutor( max_workers = s.jobs ) as pool:
+      futures = { i: pool.submit( work, i ) for i in order }
+      results = [ futures[i].result() for i in range( len( items ) ) ]
+
+    return results, progress.done()
+
+  # copy_tree
+  #
+  # Copies the files and directories (from walk) into dst, preserving
+  # their modes and timestamps. Returns the summary of the transfer.
+  #
+
+  def copy_tree( s, files, dirs, dst, label='Copied' ):
+
+    os.makedirs( dst, exist_ok=True )
+
+    for rel in dirs:
+      os.makedirs( dst + '/' + rel, exist_ok=True )
+
+    def copy( item, progress ):
+      rel, path, size = item
+      copy_file( path, dst + '/' + rel,
+                 lambda n: progress.update( nbytes = n ) )
+      shutil.copystat( path, dst + '/' + rel )
+
+    return s.run( label, copy, files, [ f[2] for f in files ] )[1]
@@ -0,0 +1,157 @@
+#=========================================================================
+# retention_policy.py
+#=========================================================================
+# Retention rules for "mflowgen stash gc"
+#
+# Stashes only grow unless steps are dropped by hand, one at a time. The
+# retention policy picks the stashed steps to drop with these rules:
+#
+# - keep_last : keep only the newest N pushes of each step
+# - max_age   : drop the steps that were neither pushed nor pulled in the
+#               last N days
+# - max_size  : then drop the least recently used steps (by their last
+#               pull, or else their push) until the stash fits in the quota
+#
+# The size quota is on the physical size of the stash, so the policy
+# follows which blobs each step refers to (see blob_store.py): a blob is
+# only reclaimed once no step that is kept refers to it. Steps stashed as
+# full copies (before the blob store) take their whole size. Dropping a
+# step whose content other steps share reclaims nothing, so once the
+# stash fits, the steps that were dropped for the quota are kept again
+# (most recently used first) as long as it still fits.
+#
+# Date   : October 18, 2026
+#
+
+import time
+
+from datetime import datetime
+
+#-------------------------------------------------------------------------
+# RetentionPolicy
+#-------------------------------------------------------------------------
+
+class RetentionPolicy:
+
+  def __init__( s, keep_last=None, max_age=None, max_size=None ):
+    s.keep_last = keep_last
+    s.max_age   = max_age
+    s.max_size  = max_size
+
+    assert keep_last is None or keep_last >= 0, \
+      'RetentionPolicy -- Keep at least zero pushes of each step'
+    assert max_age is None or max_age >= 0, \
+      'RetentionPolicy -- The maximum age must be at least zero days'
+
+  def empty( s ):
+    return s.keep_last is None and s.max_age is None and \
+           s.max_size is None
+
+  # last_used
+  #
+  # Returns when a stashed step was last pushed or pulled (seconds since
+  # epoch)
+  #
+
+  def last_used( s, entry ):
+    try:
+      pushed = datetime.strptime( str( entry[ 'date' ] ),
+                                  '%Y-%m%d' ).timestamp()
+    except ValueError:
+      pushed = 0
+    return max( pushed, entry.get( 'pulled' ) or 0 )
+
+  # referenced_blobs
+  #
+  # Returns the digests of the blobs that a manifest refers to
+  #
+
+  def referenced_blobs( s, manifest ):
+    return { f[ 'blob' ] for f in manifest[ 'files' ].values() }
+
+  # select
+  #
+  # Picks the stashed steps to drop, given:
+  #
+  # - entries   : the metadata of the stashed steps (most recent first,
+  #               like StashCatalog.query) with the time of their last
+  #               pull in "pulled" (or None)
+  # - manifests : { entry directory : manifest } of all manifests in the
+  #               stash (including those of pushes in progress)
+  # - blobs     : { digest : size on disk } of all blobs
+  # - copies    : { entry directory : size } of steps stashed as full
+  #               copies
+  #
+  # Returns the steps to drop as ( entry, rule ) in the order they were
+  # picked, the bytes that dropping them reclaims, and the size of the
+  # stash before.
+  #
+
+  def select( s, entries, manifests, blobs, copies, now=None ):
+
+    now = time.time() if now is None else now
+
+    # Number of manifests that refer to each blob
+
+    refs = {}
+
+    for m in manifests.values():
+      for digest in s.referenced_blobs( m ):
+        refs[ digest ] = refs.get( digest, 0 ) + 1
+
+    total = sum( n for digest, n in blobs.items() if digest in refs ) + \
+            sum( copies.values() )
+
+    size    = total
+    dropped = []
+
+    # Adds ( delta = 1 ) or removes ( delta = -1 ) the references of a
+    # stashed step and returns how the size of the stash changed
+
+    def refer( entry, delta ):
+      d = entry[ 'dir' ]
+      n = delta * copies.get( d, 0 )
+      m = manifests.get( d, { 'files': {} } )
+      for digest in s.referenced_blobs( m ):
+        if refs[ digest ] == ( 0 if delta > 0 else 1 ):
+          n += delta * blobs.get( digest, 0 )
+        refs[ digest ] += delta
+      return n
+
+    def drop( entry, rule ):
+      nonlocal size
+      dropped.append( ( entry, rule ) )
+      size += refer( entry, -1 )
+
+    kept = []
+    seen = {}
+
+    for entry in entries:
+      step = entry[ 'step' ]
+      seen[ step ] = seen.get( step, 0 ) + 1
+      if s.keep_last is not None and seen[ step ] > s.keep_last:
+        drop( entry, 'keep-last' )
+      elif s.max_age is not None and \
+           now - s.last_used( entry ) > s.max_age * 86400:
+        drop( entry, 'max-age' )
+      else:
+        kept.append( entry )
+
+    # Least recently used first (older pushes first on ties)
+
+    if s.max_size is not None:
+      for entry in sorted( reversed( kept ), key=s.last_used ):
+        if size <= s.max_size:
+          break
+        drop( entry, 'max-size' )
+      for entry, rule in reversed( dropped[:] ):
+        if rule != 'max-size':
+          break
+        n = refer( entry, 1 )
+        if size + n <= s.max_size:
+          size += n
+          dropped.remove( ( entry, rule ) )
+        else:
+          refer( entry, -1 )
+
+    return dropped, total - size, total
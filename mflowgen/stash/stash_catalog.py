@@ -0,0 +1,318 @@
+#=========================================================================
+# stash_catalog.py
+#=========================================================================
+# Catalog of the steps in a stash
+#
+# The stash used to list its steps in ".mflowgen.stash.yml", which every
+# stash command read in full and every push or drop rewrote in full, so
+# two people pushing at the same time could drop each other's entries.
+# The catalog is a single SQLite database in the stash directory instead:
+#
+#     <stash>/.mflowgen.stash.db
+#
+# with one row per stashed step:
+#
+#     id           -- order of the pushes
+#     hash         -- hash stamp of the stashed step (e.g., "3e5ab4")
+#     dir          -- directory of the stashed step in the stash
+#     step         -- name of the step
+#     author       -- user who pushed it
+#     date         -- date of the push (e.g., "2020-0315")
+#     msg          -- push message
+#     size         -- size of the files of the stashed step (bytes)
+#     stashed_from -- where the step was pushed from (JSON)
+#     pulled       -- when the step was last pulled (seconds since epoch)
+#
+# and indexes on the hash, step, author, and date, so that lookups and
+# filtered, paginated listings stay fast with many entries. Every update
+# is a transaction, and SQLite locks the database file while it writes.
+# The database uses the default rollback journal instead of write-ahead
+# logging since stashes are shared across hosts on network file systems,
+# where write-ahead logging does not work.
+#
+# The entries of ".mflowgen.stash.yml" are imported once when the catalog
+# is created. The YAML file is left in place but no longer updated.
+#
+# Date   : October 18, 2026
+#
+
+import json
+import sqlite3
+import time
+
+from mflowgen.utils import read_yaml
+
+#-------------------------------------------------------------------------
+# StashCatalog
+#-------------------------------------------------------------------------
+
+class StashCatalog:
+
+  db_name   = '.mflowgen.stash.db'
+  yaml_name = '.mflowgen.stash.yml'
+
+  # Columns of the entries table (in order, without the id)
+
+  columns = [
+    'hash',
+    'dir',
+    'step',
+    'author',
+    'date',
+    'msg',
+    'size',
+    'stashed_from',
+  ]
+
+  schema = '''
+    CREATE TABLE IF NOT EXISTS entries (
+      id           INTEGER PRIMARY KEY AUTOINCREMENT,
+      hash         TEXT    NOT NULL UNIQUE,
+      dir          TEXT    NOT NULL,
+      step         TEXT,
+      author       TEXT,
+      date         TEXT,
+      msg          TEXT,
+      size         INTEGER,
+      stashed_from TEXT,
+      pulled       REAL
+    );
+    CREATE INDEX IF NOT EXISTS entries_step   ON entries ( step,   id );
+    CREATE INDEX IF NOT EXISTS entries_author ON entries ( author, id );
+    CREATE INDEX IF NOT EXISTS entries_date   ON entries ( date,   id );
+    CREATE TABLE IF NOT EXISTS meta (
+      key   TEXT PRIMARY KEY,
+      value TEXT
+    );
+  '''
+
+  def __init__( s, stash_dir, timeout=60 ):
+
+    s.stash_dir = stash_dir
+    s.path      = stash_dir + '/' + s.db_name
+
+    # Autocommit, with explicit transactions for multiple statements
+
+    s.db = sqlite3.connect( s.path, timeout=timeout,
+                            isolation_level=None )
+
+    s.db.executescript( s.schema )
+
+    # Catalogs from before the pulls were recorded
+
+    existing = [ row[1] for row in
+                   s.db.execute( 'PRAGMA table_info( entries )' ) ]
+
+    if 'pulled' not in existing:
+      try:
+        s.db.execute( 'ALTER TABLE entries ADD COLUMN pulled REAL' )
+      except sqlite3.OperationalError:
+        pass # added by another process in the meantime
+
+    s.migrate()
+
+  def close( s ):
+    s.db.close()
+
+  def __enter__( s ):
+    return s
+
+  def __exit__( s, *args ):
+    s.close()
+
+  #-----------------------------------------------------------------------
+  # Migration
+  #-----------------------------------------------------------------------
+
+  # migrate
+  #
+  # Imports the entries of the YAML list once (in a transaction, so that
+  # only the first of several concurrent stash commands does it)
+  #
+
+  def migrate( s ):
+
+    done = s.db.execute(
+      "SELECT value FROM meta WHERE key = 'migrated'" ).fetchone()
+
+    if done:
+      return
+
+    s.db.execute( 'BEGIN IMMEDIATE' )
+
+    try:
+      done = s.db.execute(
+        "SELECT value FROM meta WHERE key = 'migrated'" ).fetchone()
+      if not done:
+        try:
+          entries = read_yaml( s.stash_dir + '/' + s.yaml_name ) or []
+        except FileNotFoundError:
+          entries = []
+        for x in entries:
+          s.db.execute( s.insert_sql(), s.to_row( x ) )
+        s.db.execute( "INSERT INTO meta ( key, value )"
+                      " VALUES ( 'migrated', ? )", ( str( len( entries ) ), ) )
+      s.db.execute( 'COMMIT' )
+    except BaseException:
+      s.db.execute( 'ROLLBACK' )
+      raise
+
+  #-----------------------------------------------------------------------
+  # Rows
+  #-----------------------------------------------------------------------
+
+  def insert_sql( s ):
+    return 'INSERT OR IGNORE INTO entries ( {} ) VALUES ( {} )'.format(
+             ', '.join( s.columns ), ', '.join( [ '?' ] * len( s.columns ) ) )
+
+  # to_row
+  #
+  # Converts the metadata of a stashed step (as in the YAML list) into a
+  # row of the entries table
+  #
+
+  def to_row( s, data ):
+    return (
+      str( data[ 'hash' ] ),
+      data[ 'dir' ],
+      data.get( 'step' ),
+      data.get( 'author' ),
+      str( data.get( 'date' ) ),
+      data.get( 'msg' ),
+      data.get( 'size' ),
+      json.dumps( data[ 'stashed-from' ] ) \
+        if 'stashed-from' in data else None,
+    )
+
+  # to_data
+  #
+  # Converts a row back into the metadata of a stashed step
+  #
+
+  def to_data( s, row ):
+    data = dict( zip( s.columns, row ) )
+    stashed_from = data.pop( 'stashed_from' )
+    if stashed_from is not None:
+      data[ 'stashed-from' ] = json.loads( stashed_from )
+    if data[ 'size' ] is None:
+      del data[ 'size' ]
+    return data
+
+  #-----------------------------------------------------------------------
+  # Entries
+  #-----------------------------------------------------------------------
+
+  def has( s, hash_ ):
+    return s.db.execute( 'SELECT 1 FROM entries WHERE hash = ?',
+                         ( hash_, ) ).fetchone() is not None
+
+  # get
+  #
+  # Returns the metadata of the stashed step with the given hash, or None
+  #
+
+  def get( s, hash_ ):
+    row = s.db.execute(
+      'SELECT {} FROM entries WHERE hash = ?'.format( ', '.join( s.columns ) ),
+      ( hash_, ) ).fetchone()
+    return s.to_data( row ) if row else None
+
+  # add
+  #
+  # Adds a stashed step. Returns False if the hash is already taken.
+  #
+
+  def add( s, data ):
+    cursor = s.db.execute( s.insert_sql(), s.to_row( data ) )
+    return cursor.rowcount == 1
+
+  # remove
+  #
+  # Removes the stashed step with the given hash. Returns False if there
+  # was none.
+  #
+
+  def remove( s, hash_ ):
+    cursor = s.db.execute( 'DELETE FROM entries WHERE hash = ?', ( hash_, ) )
+    return cursor.rowcount == 1
+
+  # touch
+  #
+  # Records that the stashed step with the given hash was pulled now (or at
+  # the given time)
+  #
+
+  def touch( s, hash_, when=None ):
+    s.db.execute( 'UPDATE entries SET pulled = ? WHERE hash = ?',
+                  ( time.time() if when is None else when, hash_ ) )
+
+  #-----------------------------------------------------------------------
+  # Queries
+  #-----------------------------------------------------------------------
+
+  # where
+  #
+  # Returns the WHERE clause and its parameters for the filters. Dates
+  # are compared as strings, which works for the "2020-0315" format.
+  #
+
+  def where( s, step=None, author=None, since=None, until=None ):
+    clauses = []
+    params  = []
+    if step   is not None:
+      clauses.append( 'step = ?' )
+      params.append( step )
+    if author is not None:
+      clauses.append( 'author = ?' )
+      params.append( author )
+    if since  is not None:
+      clauses.append( 'date >= ?' )
+      params.append( since )
+    if until  is not None:
+      clauses.append( 'date <= ?' )
+      params.append( until )
+    sql = ' WHERE ' + ' AND '.join( clauses ) if clauses else ''
+    return sql, params
+
+  # count
+  #
+  # Returns the number of stashed steps that match the filters
+  #
+
+  def count( s, **filters ):
+    sql, params = s.where( **filters )
+    return s.db.execute( 'SELECT COUNT(*) FROM entries' + sql,
+                         params ).fetchone()[0]
+
+  # query
+  #
+  # Returns the metadata of the stashed steps that match the filters, most
+  # recently pushed first, skipping the first "offset" of them and
+  # returning at most "limit" (or all)
+  #
+
+  def query( s, limit=None, offset=0, **filters ):
+    sql, params = s.where( **filters )
+    rows = s.db.execute(
+      'SELECT {} FROM entries{} ORDER BY id DESC LIMIT ? OFFSET ?'.format(
+        ', '.join( s.columns ), sql ),
+      params + [ -1 if limit is None else limit, offset ] )
+    return [ s.to_data( row ) for row in rows ]
+
+  # dirs
+  #
+  # Returns the directories of all stashed steps
+  #
+
+  def dirs( s ):
+    return [ row[0] for row in s.db.execute( 'SELECT dir FROM entries' ) ]
+
+  # last_pulled
+  #
+  # Returns { hash : time of the last pull } for the stashed steps that
+  # were pulled
+  #
+
+  def last_pulled( s ):
+    return dict( s.db.execute( 'SELECT hash, pulled FROM entries'
+                               ' WHERE pulled IS NOT NULL' ) )
@@ -10,27 +10,44 @@
 import os
 import re
 import shutil
+import sqlite3
 import subprocess
 import sys
+import time
 import yaml
 
-from datetime       import datetime
+from concurrent.futures              import ThreadPoolExecutor
+from datetime                        import datetime
 
-from mflowgen.utils import bold, yellow
-from mflowgen.utils import read_yaml, write_yaml
+from mflowgen.cache.build_cache      import format_size, parse_size
+from mflowgen.stash.blob_store       import BlobStore
+from mflowgen.stash.compression      import Compressor, get_codec
+from mflowgen.stash.file_transfer    import FileTransfer
+from mflowgen.stash.retention_policy import RetentionPolicy
+from mflowgen.stash.stash_catalog    import StashCatalog
+from mflowgen.utils                  import bold, yellow
+from mflowgen.utils                  import read_yaml, write_yaml
 
 #-------------------------------------------------------------------------
 # Stash Management
 #-------------------------------------------------------------------------
 # Stashes are directories with (1) pre-built steps and (2) a stash
-# metadata YAML. The stashed steps are both date-stamped and hash-stamped
-# to prevent name conflicts:
+# catalog. The stashed steps are both date-stamped and hash-stamped to
+# prevent name conflicts:
 #
 #     % ls -1
 #     2020-0315-synopsys-dc-synthesis-3e5ab4
 #     2020-0314-synopsys-dc-synthesis-1eaab4
 #
-# The stash metadata YAML has an entry per stashed item:
+# The stash catalog is a database with an entry per stashed item (see
+# stash_catalog.py):
+#
+#     hash    dir                                      author  date  ...
+#     4d7fdb  2020-0315-synopsys-dc-synthesis-4d7fdb  ctorng  2020-0315
+#     2e78ac  2020-0314-synopsys-dc-synthesis-2e78ac  ctorng  2020-0314
+#
+# Stashes from before the catalog listed their entries in a stash
+# metadata YAML, which is imported into the catalog the first time:
 #
 #     - author: ctorng
 #       date: 2020-0315
@@ -39,12 +56,11 @@ from mflowgen.utils import read_yaml, write_yaml
 #       msg: foo
 #       step: synopsys-dc-synthesis
 #
-#     - author: ctorng
-#       date: 2020-0314
-#       dir: 2020-0314-synopsys-dc-synthesis-2e78ac
-#       hash: 2e78ac
-#       msg: bar
-#       step: synopsys-dc-synthesis
+# The content of the stashed files is kept once in a content-addressed
+# blob store in the stash directory, and each stashed step directory only
+# holds a manifest of its files (see blob_store.py). Steps stashed before
+# the blob store are full copies, which can still be pulled and dropped.
+# Pushes can keep their new content compressed (see compression.py).
 #
 # The stash can live anywhere in the file system, so in order to link a
 # build directory to a particular stash, we store the path locally in a
@@ -67,6 +83,7 @@ class StashHandler:
       'pull',
       'pop',
       'drop',
+      'gc',
       'help',
     ]
 
@@ -80,15 +97,14 @@ class StashHandler:
     except Exception:
       s.link_path = ''
 
-    # Read YAML: Grab metadata about the linked stash (e.g., stash hashes,
-    # authors, messages)
+    # Catalog of the linked stash (e.g., stash hashes, authors, messages),
+    # opened once the stash is verified
 
-    s.stash_yaml_path = s.link_path + '/.mflowgen.stash.yml'
+    s.catalog = None
 
-    try:
-      s.stash = read_yaml( s.stash_yaml_path )
-    except FileNotFoundError:
-      s.stash = []
+    # Transfer engine for push and pull
+
+    s.transfer = FileTransfer()
 
   #-----------------------------------------------------------------------
   # helpers
@@ -97,7 +113,7 @@ class StashHandler:
   # gen_unique_hash
   #
   # Generate a unique six-character hexadecimal hash that is not currently
-  # in use across all steps in the currently linked stash.
+  # in use across all steps in the currently linked stash (if any).
   #
   # - E.g., "3e5ab4"
   #
@@ -110,8 +126,7 @@ class StashHandler:
       return hash_
 
     def stash_has_hash( hash_ ):
-      match = [ hash_ == data[ 'hash' ] for data in s.stash ]
-      return any( match )
+      return s.catalog is not None and s.catalog.has( hash_ )
 
     # Loop until we get a unique hash
 
@@ -122,19 +137,36 @@ class StashHandler:
 
     return hashstamp
 
+  # disk_usage
+  #
+  # Returns the size of the files in a directory (for steps stashed as
+  # full copies)
+  #
+
+  def disk_usage( s, path ):
+    n = 0
+    for root, dirs, names in os.walk( path ):
+      for name in names:
+        try:
+          n += os.lstat( os.path.join( root, name ) ).st_size
+        except OSError:
+          pass
+    return n
+
   #-----------------------------------------------------------------------
   # verify and check
   #-----------------------------------------------------------------------
 
   # verify_stash
   #
-  # Make sure the stash directory exists
+  # Make sure the stash directory exists and open its catalog
   #
 
   def verify_stash( s ):
     try:
       assert os.path.exists( s.link_path )
-    except AssertionError:
+      s.catalog = StashCatalog( s.link_path )
+    except ( AssertionError, sqlite3.Error ):
       # Stash not found... print a useful message with directions
       stash_msg = s.link_path if s.link_path else '(no stash is linked)'
       print()
@@ -149,22 +181,21 @@ class StashHandler:
       print()
       sys.exit( 1 )
 
-  # get_hash_index_in_stash
+  # get_stash_entry
   #
-  # Given a hash, returns the index of the matching stashed item in the
-  # stash metadata list. This method errors out if the hash is not found.
+  # Given a hash, returns the metadata of the matching stashed item in the
+  # stash catalog. This method errors out if the hash is not found.
   #
 
-  def get_hash_index_in_stash( s, hash_ ):
-    is_target = [ hash_ == data[ 'hash' ] for data in s.stash ]
+  def get_stash_entry( s, hash_ ):
+    data = s.catalog.get( hash_ )
     try:
-      assert any( is_target )
+      assert data is not None
     except AssertionError:
       print( bold( 'Error:' ), 'Stash does not contain hash',
                                   '"{}"'.format( hash_ ) )
       sys.exit( 1 )
-    ind  = is_target.index( True )
-    return ind
+    return data
 
   #-----------------------------------------------------------------------
   # stash_path
@@ -180,25 +211,21 @@ class StashHandler:
       path = s.link_path_yaml,
     )
 
-  #-----------------------------------------------------------------------
-  # update_stash
-  #-----------------------------------------------------------------------
-  # Update the metadata in the linked stash directory
-  #
-
-  def update_stash( s ):
-    write_yaml(
-      data = s.stash,
-      path = s.stash_yaml_path,
-    )
-
   #-----------------------------------------------------------------------
   # launch
   #-----------------------------------------------------------------------
   # Dispatch function for commands
   #
 
-  def launch( s, args, help_, path, step, msg, hash_, all_, verbose ):
+  def launch( s, args, help_, path, step, msg, hash_, all_, verbose,
+                    name=None, author=None, since=None, until=None,
+                    page=None, limit=None, jobs=None, link=False,
+                    materialize=False, compress=None, outputs_only=False,
+                    keep_last=None, max_age=None, size=None,
+                    dry_run=False ):
+
+    if jobs:
+      s.transfer = FileTransfer( jobs )
 
     if help_ and not args:
       s.launch_help()
@@ -222,11 +249,17 @@ class StashHandler:
 
     if   command == 'init' : s.launch_init( help_, path )
     elif command == 'link' : s.launch_link( help_, path )
-    elif command == 'list' : s.launch_list( help_, verbose, all_ )
-    elif command == 'push' : s.launch_push( help_, step, msg, all_ )
-    elif command == 'pull' : s.launch_pull( help_, hash_ )
+    elif command == 'list' : s.launch_list( help_, verbose, all_, name,
+                                            author, since, until, page,
+                                            limit )
+    elif command == 'push' : s.launch_push( help_, step, msg, all_,
+                                            compress )
+    elif command == 'pull' : s.launch_pull( help_, hash_, step, link,
+                                            materialize, outputs_only )
     elif command == 'pop'  : s.launch_pop ( help_, hash_ )
     elif command == 'drop' : s.launch_drop( help_, hash_ )
+    elif command == 'gc'   : s.launch_gc  ( help_, keep_last, max_age,
+                                            size, dry_run )
     else                   : s.launch_help()
 
   #-----------------------------------------------------------------------
@@ -324,21 +357,36 @@ class StashHandler:
   #-----------------------------------------------------------------------
   # Internally, this command does the following:
   #
-  # - Reads the metadata YAML in the stash directory to list the stash
+  # - Queries the catalog in the stash directory to list the stash
   #
 
-  def launch_list( s, help_, verbose, all_ ):
+  def launch_list( s, help_, verbose, all_, name=None, author=None,
+                         since=None, until=None, page=None, limit=None ):
 
     # Help message
 
     def print_help():
       print()
       print( bold( 'Usage:' ), 'mflowgen stash list [--verbose] [--all]' )
+      print( '                          [--name <step>] [--author <user>]' )
+      print( '                          [--since <date>] [--until <date>]' )
+      print( '                          [--page <int>] [--limit <int>]'    )
+      print()
+      print( bold( 'Example:' ), 'mflowgen stash list',
+                                  '--name synopsys-dc-synthesis',
+                                  '--since 2020-03-01'                   )
       print()
-      print( 'Lists all pre-built steps stored in the mflowgen stash'    )
-      print( 'that the current build graph is linked to. The --verbose'  )
-      print( 'flag prints metadata about where each stashed step was'    )
-      print( 'stashed from. Use --all to print all steps in the stash.'  )
+      print( 'Lists the pre-built steps stored in the mflowgen stash'    )
+      print( 'that the current build graph is linked to, most recent'    )
+      print( 'first. The list can be filtered by step name, author, and' )
+      print( 'date (e.g., 2020-0315 or 2020-03-15), and is printed in'   )
+      print( 'pages of --limit steps (default 10). Use --all to print'   )
+      print( 'all steps that match. The --verbose flag prints metadata'  )
+      print( 'about where each stashed step was stashed from and its'    )
+      print( 'size, i.e., the size of its files and the size of the'     )
+      print( 'content that no other stashed step shares (what dropping'  )
+      print( 'it frees), as well as the logical and physical size of'    )
+      print( 'the whole stash.'                                          )
       print()
 
     if help_:
@@ -349,6 +397,28 @@ class StashHandler:
 
     s.verify_stash()
 
+    # Query the catalog
+
+    try:
+      filters = {
+        'step'   : name,
+        'author' : author,
+        'since'  : s.parse_date( since ) if since else None,
+        'until'  : s.parse_date( until ) if until else None,
+      }
+      page  = page or 1
+      limit = limit or 10
+      assert page > 0 and limit > 0, \
+        'StashHandler -- Pages and limits start at 1'
+    except AssertionError as e:
+      print( bold( 'Error:' ), e )
+      sys.exit( 1 )
+
+    n_match  = s.catalog.count( **filters )
+    offset   = 0 if all_ else ( page - 1 ) * limit
+    to_print = s.catalog.query( limit = None if all_ else limit,
+                                offset = offset, **filters )
+
     # Print the list
 
     print()
@@ -360,13 +430,27 @@ class StashHandler:
     stashed_from_template_str = \
       '     > {k:30} : {v}'
 
+    # Sizes of the stashed steps and of the stash (steps stashed as full
+    # copies take their whole size)
+
+    if verbose:
+      store    = BlobStore( s.get_stash_path() )
+      blobs    = store.blobs()
+      sizes    = store.sizes( store.manifests(), blobs )
+      physical = sum( blobs.values() )
+      for d in s.catalog.dirs():
+        if d not in sizes:
+          n = s.disk_usage( s.get_stash_path() + '/' + d )
+          sizes[ d ] = ( n, n )
+          physical += n
+
     print()
-    if not s.stash:
-      print( ' - ( the stash is empty )' )
+    if not n_match:
+      if any( v is not None for v in filters.values() ):
+        print( ' - ( no stashed steps match )' )
+      else:
+        print( ' - ( the stash is empty )' )
     else:
-      s.stash.reverse()  # print in reverse chronological order
-      n_print = 10       # print first N items
-      to_print = s.stash[:n_print] if not all_ else s.stash
       for x in to_print:
         print( template_str.format(
           hash_  = yellow( x[ 'hash' ] ),
@@ -378,14 +462,42 @@ class StashHandler:
         if verbose and 'stashed-from' in x.keys(): # stashed from
           for k, v in x['stashed-from'].items():
             print( stashed_from_template_str.format(k=k,v=v) )
+        if verbose and x[ 'dir' ] in sizes:        # sizes
+          logical, unique = sizes[ x[ 'dir' ] ]
+          print( stashed_from_template_str.format( k = 'size',
+                   v = format_size( logical ) ) )
+          print( stashed_from_template_str.format( k = 'unique-size',
+                   v = format_size( unique ) ) )
+        if verbose:
           print()
-      if not all_ and len(s.stash) > n_print:
-        n_extra = len(s.stash) - n_print
-        print( ' - (...) see', n_extra, 'more with --all' )
+      n_extra = n_match - offset - len( to_print )
+      if n_extra > 0:
+        print( ' - (...) see', n_extra, 'more with --page', page + 1,
+               'or --all' )
     print()
     print( bold( 'Stash:' ), s.get_stash_path() )
+    if verbose:
+      print( bold( 'Size :' ), '{} logical, {} physical'.format(
+               format_size( sum( x[0] for x in sizes.values() ) ),
+               format_size( physical ) ) )
     print()
 
+  # parse_date
+  #
+  # Converts dates like "2020-03-15" into the date stamps of the stash
+  # (e.g., "2020-0315")
+  #
+
+  def parse_date( s, date ):
+    for fmt in [ '%Y-%m%d', '%Y-%m-%d' ]:
+      try:
+        return datetime.strftime( datetime.strptime( date, fmt ), '%Y-%m%d' )
+      except ValueError:
+        pass
+    assert False, \
+      'StashHandler -- Bad date "{}" (e.g., 2020-0315 or 2020-03-15)'.format(
+        date )
+
   #-----------------------------------------------------------------------
   # launch_push
   #-----------------------------------------------------------------------
@@ -393,10 +505,10 @@ class StashHandler:
   #
   # - Copies the target step build directory to the stash
   #     - if "all_" is True, then stash the entire step, not just outputs
-  # - Updates the metadata YAML in the stash directory
+  # - Adds the stashed step to the catalog in the stash directory
   #
 
-  def launch_push( s, help_, step, msg, all_ ):
+  def launch_push( s, help_, step, msg, all_, compress=None ):
 
     try:
       author = os.environ[ 'USER' ]
@@ -410,27 +522,43 @@ class StashHandler:
       print( bold( 'Usage:' ), 'mflowgen stash push',
                                   '--step/-s <int> --message/-m "<str>"',
                                   '[--all]'                              )
+      print( '                           [--compress [<format>]] [-j <int>]' )
       print()
       print( bold( 'Example:' ), 'mflowgen stash push',
                                     '--step 5 -m "foo bar"'              )
+      print( '         mflowgen stash push --step 5 -m "foo" --compress' )
       print()
       print( 'Pushes a built step to the mflowgen stash. The given step' )
       print( 'is copied to the stash, preserving all permissions and'    )
-      print( 'following all symlinks. By default, only the outputs of a' )
-      print( 'step are stashed, but the entire step can be stashed with' )
-      print( '--all. The stashed copy is given a hash stamp and is'      )
+      print( 'following all symlinks. Files with the same content are'   )
+      print( 'only stored once in the stash, so content that is already' )
+      print( 'there is not copied again. By default, only the outputs of' )
+      print( 'a step are stashed, but the entire step can be stashed'    )
+      print( 'with --all. The stashed copy is given a hash stamp and is' )
       print( 'marked as authored by $USER (' + author + '). An optional' )
-      print( 'message can also be attached to each push.'                )
+      print( 'message can also be attached to each push. Files are'      )
+      print( 'transferred on -j threads (default 8).'                    )
+      print()
+      print( 'With --compress, new content is stored compressed with'    )
+      print( 'the given format (gzip, lzma, or zstd if the zstandard'    )
+      print( 'package is installed; default: zstd if installed, or else' )
+      print( 'gzip), in chunks on all processors. Pulls decompress it.'  )
       print()
 
     if help_ or step==None or not msg:
       print_help()
       return
 
-    # Sanity-check the stash
+    # Sanity-check the stash and the compression format
 
     s.verify_stash()
 
+    try:
+      codec = get_codec( compress ) if compress else None
+    except AssertionError as e:
+      print( bold( 'Error:' ), e )
+      sys.exit( 1 )
+
     # Get step to push
     #
     # Check the current directory and search for a dirname matching the
@@ -456,10 +584,19 @@ class StashHandler:
 
     today       = datetime.today()
     datestamp   = datetime.strftime( today, '%Y-%m%d' )
-    hashstamp   = s.gen_unique_hash()
     step_name   = '-'.join( push_target.split('-')[1:] )
 
-    dst_dirname = '-'.join( [ datestamp, step_name, hashstamp ] )
+    # Reserve the name by creating its directory, so that concurrent pushes
+    # never stash into the same directory
+
+    while True:
+      hashstamp   = s.gen_unique_hash()
+      dst_dirname = '-'.join( [ datestamp, step_name, hashstamp ] )
+      try:
+        os.makedirs( s.get_stash_path() + '/' + dst_dirname )
+        break
+      except FileExistsError:
+        pass
 
     # Try to get some information to help describe "where this step came
     # from"
@@ -522,53 +659,43 @@ class StashHandler:
       ignore = [ _ for _ in files if _ not in keep ]
       return ignore
 
-    # Now copy src to dst
+    # Now store the files of src in the blob store of the stash, with a
+    # manifest in dst (all symlinks are followed, dangling symlinks are
+    # skipped, and all but the outputs are ignored unless "--all" was
+    # given). Dangling symlinks can happen in a few situations:
+    #
+    #  1. In inputs, if users cleaned earlier dependent steps. In this
+    #  situation, we are just doing our best to copy what is available.
     #
-    # - symlinks                 = False  # Follow all symlinks
-    # - ignore_dangling_symlinks = False  # Stop with error if we cannot
-    #                                     #  follow a link to something
-    #                                     #  we need
-    # - ignore                   = (func) # Ignore all but the outputs
-    #                                     #  unless "--all" was given
+    #  2. Some symlink to somewhere we do not have permission to view.
+    #  It would be nice to raise an exception in this case, but that is
+    #  hard to differentiate.
     #
 
     remote_path = s.get_stash_path() + '/' + dst_dirname
 
+    store      = BlobStore( s.get_stash_path() )
+    compressor = Compressor( codec ) if codec else None
+    start      = time.time()
+
     try:
-      shutil.copytree( src      = push_target,
-                       dst      = remote_path,
-                       symlinks = False,
-                       ignore   = None if all_ else f_ignore,
-                       ignore_dangling_symlinks = False )
-    except shutil.Error:
-      # According to online discussion, ignore_dangling_symlinks does not
-      # apply recursively within sub-directories (a bug):
-      #
-      # - https://bugs.python.org/issue38523
-      #
-      # But according to more online discussion, copytree finishes copying
-      # everything else before raising the exception.
-      #
-      # - https://bugs.python.org/issue6547
-      #
-      # So if we just pass here, we will have everything except dangling
-      # symlinks, which is fine for our use case. Dangling symlinks can
-      # happen in a few situations:
-      #
-      #  1. In inputs, if users cleaned earlier dependent steps. In this
-      #  situation, we are just doing our best to copy what is available.
-      #
-      #  2. Some symlink to somewhere we do not have permission to view.
-      #  It would be nice to raise an exception in this case, but that is
-      #  hard to differentiate.
-      #
-      pass
+      files, dirs = s.transfer.walk( push_target,
+                                     None if all_ else f_ignore )
+      manifest, new_bytes, stored_bytes, summary = \
+        store.push( remote_path, files, dirs, s.transfer, compressor )
     except Exception as e:
       print( bold( 'Error:' ), 'Failed to complete stash push' )
       shutil.rmtree( path = remote_path, ignore_errors = True ) # clean up
       raise
+    finally:
+      if compressor:
+        compressor.close()
+
+    seconds = time.time() - start
 
-    # Update the metadata in the stash
+    size = sum( f[ 'size' ] for f in manifest[ 'files' ].values() )
+
+    # Metadata of the stashed step
 
     push_metadata = {
       'date'         : datestamp,
@@ -577,18 +704,16 @@ class StashHandler:
       'author'       : author,
       'step'         : step_name,
       'msg'          : msg,
+      'size'         : size,
       'stashed-from' : stashed_from,
     }
 
-    s.stash.append( push_metadata )
-    s.update_stash()
-
     # Try adding the metadata to the stashed step itself, so that when the
     # step gets pulled somewhere, we have all of its metadata to know
     # where it came from
 
     try:
-      data = push_metadata
+      data = dict( push_metadata )
       data.update( { 'stash-dir': s.link_path } ) # add stash dir
       write_yaml(
         data = data,
@@ -597,12 +722,36 @@ class StashHandler:
     except Exception as e:
       pass
 
+    # Add the stashed step to the catalog, which makes it visible to other
+    # stash commands
+
+    if not s.catalog.add( push_metadata ):
+      print( bold( 'Error:' ), 'Stash already contains hash',
+                                  '"{}"'.format( hashstamp ) )
+      shutil.rmtree( path = remote_path, ignore_errors = True ) # clean up
+      sys.exit( 1 )
+
     print(
-      'Stashed step {step} "{step_name}" as author "{author}"'.format(
+      'Stashed step {step} "{step_name}" as author "{author}"'
+      ' ({new} new of {size})'.format(
       step      = step,
       step_name = step_name,
       author    = author,
+      new       = format_size( new_bytes ),
+      size      = format_size( size ),
     ) )
+    print( summary )
+    if codec and stored_bytes:
+      print( 'Compressed {new} of new content to {stored} ({ratio:.1f}x)'
+             ' with {codec} in {t:.1f} s'.format(
+        new    = format_size( new_bytes ),
+        stored = format_size( stored_bytes ),
+        ratio  = new_bytes / stored_bytes,
+        codec  = codec.name,
+        t      = seconds,
+      ) )
+    elif codec:
+      print( 'Compressed nothing (no new content)' )
 
   #-----------------------------------------------------------------------
   # launch_pull
@@ -612,41 +761,69 @@ class StashHandler:
   # - Copies the stashed step to the current directory
   #
 
-  def launch_pull( s, help_, hash_ ):
+  def launch_pull( s, help_, hash_, step=None, link=False,
+                         materialize=False, outputs_only=False ):
 
     # Help message
 
     def print_help():
       print()
-      print( bold( 'Usage:' ), 'mflowgen stash pull --hash <hash>'       )
+      print( bold( 'Usage:' ), 'mflowgen stash pull --hash <hash>',
+                                  '[--link|--materialize]'               )
+      print( '                                          [--outputs-only]'
+             ' [-j <int>]'                                               )
+      print( '       mflowgen stash pull --step/-s <int> --materialize'  )
       print()
       print( bold( 'Example:' ), 'mflowgen stash pull --hash 3e5ab4'     )
+      print( '         mflowgen stash pull --hash 3e5ab4 --link'         )
+      print( '         mflowgen stash pull --step 4 --materialize'       )
       print()
       print( 'Pulls a pre-built step from the stash matching the given'  )
       print( 'hash. This command copies the pre-built step from the'     )
-      print( 'stash using archive mode (preserves all permissions). The' )
-      print( 'new step replaces the same step in the existing graph.'    )
+      print( 'stash (preserving all permissions), with copy-on-write'    )
+      print( 'clones where the file system supports them, or else with'  )
+      print( 'read-only hardlinks into the stash when it is on the same' )
+      print( 'file system. The new step replaces the same step in the'   )
+      print( 'existing graph.'                                           )
       print( 'For example if the existing graph marks'                   )
       print( '"synopsys-dc-synthesis" as step 4 and a pre-built'         )
       print( '"synopsys-dc-synthesis" is pulled from the stash, the'     )
       print( 'existing build directory is removed and the pre-built'     )
       print( 'version replaces it as step 4. The status of the'          )
       print( 'pre-built step is forced to be up to date until the step'  )
-      print( 'is cleaned.'                                               )
+      print( 'is cleaned. Files are transferred on -j threads (default' )
+      print( '8).'                                                       )
+      print()
+      print( 'With --link, nothing is copied: the files of the step are' )
+      print( 'symlinks to the read-only content in the stash, so the'    )
+      print( 'outputs resolve straight to the stash. Dropping the step'  )
+      print( 'from the stash breaks these links. With --materialize, the' )
+      print( 'files are private writable copies instead. A step that'    )
+      print( 'was already pulled (e.g., with --link) is turned into'     )
+      print( 'private writable copies with --step and --materialize.'    )
+      print( 'With --outputs-only, only the outputs of the stashed step' )
+      print( 'are pulled (the logs and reports are skipped).'            )
       print()
 
-    if help_ or not hash_:
+    if help_ or not ( hash_ or materialize and step is not None ):
       print_help()
       return
 
+    if link and materialize:
+      print( bold( 'Error:' ), 'Pull with either --link or --materialize' )
+      sys.exit( 1 )
+
     # Sanity-check the stash
 
     s.verify_stash()
 
+    if not hash_:
+      s.launch_materialize( step )
+      return
+
     # Get the step metadata
 
-    ind  = s.get_hash_index_in_stash( hash_ )
-    data = s.stash[ ind ]
+    data = s.get_stash_entry( hash_ )
     step = data[ 'step' ]
 
     # Get the build directory for the matching configured step
@@ -676,35 +853,164 @@ class StashHandler:
 
     shutil.rmtree( path = build_dir, ignore_errors = True )
 
-    # Now copy from the stash
-    #
-    # - symlinks                 = False # Follow all symlinks
-    # - ignore_dangling_symlinks = False # Stop with error if we cannot
-    #                                    #  follow a link to something
-    #                                    #  we need
-    #
+    # Now materialize the files of the stashed step from the blob store
+    # (steps stashed as full copies are copied, following all symlinks)
 
     remote_path = s.get_stash_path() + '/' + data[ 'dir' ]
 
+    store    = BlobStore( s.get_stash_path() )
+    manifest = store.read_manifest( remote_path )
+
+    how = 'link' if link else 'copy' if materialize else 'auto'
+
+    only = 'outputs' if outputs_only else None
+
+    def f_ignore( path, files ): # only the outputs of full copies
+      if only and path == remote_path:
+        return [ _ for _ in files if _ != only ]
+      return []
+
+    linked = link
+
     try:
-      shutil.copytree( src      = remote_path,
-                       dst      = build_dir,
-                       symlinks = False,
-                       ignore_dangling_symlinks = False )
+      if manifest is not None:
+        counts, summary = store.pull( manifest, build_dir, s.transfer,
+                                      how, only )
+        linked = counts[ 'symlink' ] > 0 # compressed content is copied
+        node = remote_path + '/.mflowgen.stash.node.yml'
+        if os.path.exists( node ):
+          shutil.copy2( node, build_dir )
+      elif link:
+        summary = s.link_tree( remote_path, build_dir, only )
+      else:
+        files, dirs = s.transfer.walk( remote_path, f_ignore )
+        summary = s.transfer.copy_tree( files, dirs, build_dir, 'Pulled' )
     except Exception as e:
       print( bold( 'Error:' ), 'Failed to complete stash pull' )
       raise
 
+    # Record where the step came from (e.g., for --materialize) if the
+    # stashed step did not
+
+    node = build_dir + '/.mflowgen.stash.node.yml'
+
+    if not os.path.exists( node ):
+      write_yaml( data = dict( data, **{ 'stash-dir': s.link_path } ),
+                  path = node )
+
+    # Record the pull (for the retention policy of "stash gc")
+
+    s.catalog.touch( hash_ )
+
     # Mark the new step as pre-built with a ".prebuilt" flag
 
     with open( build_dir + '/.prebuilt', 'w' ) as fd: # touch
       pass
 
     print(
-      'Pulled step "{step}" from stash into "{dir_}"'.format(
+      'Pulled step "{step}" from stash into "{dir_}"{how}'.format(
       step = step,
       dir_ = build_dir,
+      how  = ' (linked to the stash)' if linked else
+             ' (outputs only)'        if only else '',
+    ) )
+    print( summary )
+
+  # link_tree
+  #
+  # Links the build directory to a step stashed as a full copy (before the
+  # blob store) with a symlink for each of its top-level files and
+  # directories (or only the given one). Returns a summary.
+  #
+
+  def link_tree( s, remote_path, build_dir, only=None ):
+    os.makedirs( build_dir )
+    names = [ _ for _ in sorted( os.listdir( remote_path ) )
+                if _ != '.mflowgen.stash.node.yml' and
+                   ( only is None or _ == only ) ]
+    for name in names:
+      os.symlink( remote_path + '/' + name, build_dir + '/' + name )
+    return 'Linked {} files and directories'.format( len( names ) )
+
+  #-----------------------------------------------------------------------
+  # launch_materialize
+  #-----------------------------------------------------------------------
+  # Internally, this command does the following:
+  #
+  # - Finds the stashed step that the given step was pulled from
+  # - Replaces the files of the step that are links into the stash (or
+  #   read-only) with private writable copies
+  #
+
+  def launch_materialize( s, step ):
+
+    # Get the build directory and the stashed step it was pulled from
+
+    targets = [ _ for _ in os.listdir( '.' )
+                  if _.startswith( str(step)+'-' ) ]
+
+    try:
+      build_dir = targets[0]
+      node      = read_yaml( build_dir + '/.mflowgen.stash.node.yml' )
+      hash_     = node[ 'hash' ]
+    except IndexError:
+      print( bold( 'Error:' ), 'No build directory found for step',
+                                  '{}'.format( step ) )
+      sys.exit( 1 )
+    except Exception:
+      print( bold( 'Error:' ), 'Step {} was not pulled'.format( step ),
+                                  'from a stash' )
+      sys.exit( 1 )
+
+    data        = s.get_stash_entry( hash_ )
+    remote_path = s.get_stash_path() + '/' + data[ 'dir' ]
+
+    store    = BlobStore( s.get_stash_path() )
+    manifest = store.read_manifest( remote_path )
+
+    try:
+      if manifest is not None:
+        n, summary = store.detach( manifest, build_dir, s.transfer )
+      else:
+        n, summary = s.detach_tree( remote_path, build_dir )
+    except Exception as e:
+      print( bold( 'Error:' ), 'Failed to complete stash pull' )
+      raise
+
+    print(
+      'Materialized step "{step}" in "{dir_}" ({n} files copied)'.format(
+      step = data[ 'step' ],
+      dir_ = build_dir,
+      n    = n,
     ) )
+    print( summary )
+
+  # detach_tree
+  #
+  # Replaces the top-level symlinks of a build directory into a step
+  # stashed as a full copy (see link_tree) with private copies. Returns
+  # the number of files copied and a summary.
+  #
+
+  def detach_tree( s, remote_path, build_dir ):
+    n = 0
+    for name in sorted( os.listdir( build_dir ) ):
+      path = build_dir + '/' + name
+      src  = remote_path + '/' + name
+      if not os.path.islink( path ) or os.readlink( path ) != src:
+        continue
+      os.remove( path )
+      if os.path.isdir( src ):
+        files, dirs = s.transfer.walk( src )
+        dst         = path
+      else:
+        files, dirs = [ ( name, src, os.stat( src ).st_size ) ], []
+        dst         = build_dir
+      s.transfer.copy_tree( files, dirs, dst )
+      for rel, _, _ in files:
+        os.chmod( dst + '/' + rel, os.stat( dst + '/' + rel ).st_mode | 0o200 )
+      n += len( files )
+    return n, 'Materialized {} files'.format( n )
 
   #-----------------------------------------------------------------------
   # launch_pop
@@ -739,7 +1045,7 @@ class StashHandler:
   # Internally, this command does the following:
   #
   # - Deletes a stashed step from the stash directory
-  # - Updates the metadata YAML in the stash directory
+  # - Removes the stashed step from the catalog in the stash directory
   #
 
   def launch_drop( s, help_, hash_ ):
@@ -765,8 +1071,15 @@ class StashHandler:
 
     # Get the step metadata
 
-    ind  = s.get_hash_index_in_stash( hash_ )
-    data = s.stash[ ind ]
+    data = s.get_stash_entry( hash_ )
+
+    # Remove the target from the catalog first, so that other stash
+    # commands never see it half deleted
+
+    if not s.catalog.remove( hash_ ):
+      print( bold( 'Error:' ), 'Stash does not contain hash',
+                                  '"{}"'.format( hash_ ) )
+      sys.exit( 1 )
 
     # Now delete the target from the stash
 
@@ -778,10 +1091,9 @@ class StashHandler:
       print( bold( 'Error:' ), 'Failed to complete stash drop' )
       raise
 
-    # Update the metadata in the stash
+    # Remove the blobs that no other stashed step refers to
 
-    del( s.stash[ ind ] )
-    s.update_stash()
+    BlobStore( s.get_stash_path() ).collect()
 
     print(
       'Dropped step "{step_name}" with hash "{hash_}"'.format(
@@ -789,6 +1101,129 @@ class StashHandler:
       hash_     = hash_,
     ) )
 
+  #-----------------------------------------------------------------------
+  # launch_gc
+  #-----------------------------------------------------------------------
+  # Internally, this command does the following:
+  #
+  # - Picks the stashed steps to drop with the retention policy (see
+  #   retention_policy.py)
+  # - Removes them from the catalog first, so that other stash commands
+  #   never see them half deleted
+  # - Deletes their directories and then the blobs that no other stashed
+  #   step refers to, on -j threads. Pushes that are in progress hold a
+  #   lock on the blobs, so their blobs are never collected.
+  #
+
+  def launch_gc( s, help_, keep_last, max_age, size, dry_run ):
+
+    # Help message
+
+    def print_help():
+      print()
+      print( bold( 'Usage:' ), 'mflowgen stash gc [--keep-last <int>]'
+                               ' [--max-age <days>]'                    )
+      print( '                         [--size <size>] [--dry-run/-n]'
+             ' [-j <int>]'                                              )
+      print()
+      print( bold( 'Example:' ), 'mflowgen stash gc --keep-last 3'
+                                 ' --size 500G --dry-run'               )
+      print()
+      print( 'Drops stashed steps from the stash with retention rules:'  )
+      print()
+      print( '  --keep-last : Keep only the newest pushes of each step'  )
+      print( '  --max-age   : Drop the steps that were neither pushed'   )
+      print( '                nor pulled in the given number of days'    )
+      print( '  --size      : Then drop the least recently pulled (or'   )
+      print( '                pushed) steps until the stash fits in the' )
+      print( '                given size (e.g., 500G)'                   )
+      print()
+      print( 'Content that a kept step shares is never removed. With'    )
+      print( '--dry-run, the steps are only listed along with the space' )
+      print( 'that dropping them would reclaim. Others can keep pushing' )
+      print( 'to the stash while it is collected.'                       )
+      print()
+
+    try:
+      policy = RetentionPolicy( keep_last, max_age,
+                                None if size is None else parse_size( size ) )
+    except AssertionError as e:
+      print( bold( 'Error:' ), e )
+      sys.exit( 1 )
+
+    if help_ or policy.empty():
+      print_help()
+      return
+
+    # Sanity-check the stash
+
+    s.verify_stash()
+
+    # Pick the steps to drop
+
+    store     = BlobStore( s.get_stash_path() )
+    pulled    = s.catalog.last_pulled()
+    entries   = [ dict( x, pulled = pulled.get( x[ 'hash' ] ) )
+                    for x in s.catalog.query() ]
+    manifests = store.manifests()
+    copies    = { d: s.disk_usage( s.get_stash_path() + '/' + d )
+                    for d in s.catalog.dirs() if d not in manifests }
+
+    dropped, reclaimed, total = policy.select( entries, manifests,
+                                               store.blobs(), copies )
+
+    print()
+    print( bold( 'Stash GC' ) + ( ' (dry run)' if dry_run else '' ) )
+    print()
+
+    template_str = \
+      ' - {hash_} [ {date} ] {author} {step} -- {msg} ({rule})'
+
+    for x, rule in dropped:
+      print( template_str.format(
+        hash_  = yellow( x[ 'hash' ] ),
+        date   = x[ 'date'   ],
+        author = x[ 'author' ],
+        step   = x[ 'step'   ],
+        msg    = x[ 'msg'    ],
+        rule   = rule,
+      ) )
+
+    if not dropped:
+      print( ' - ( nothing to drop )' )
+
+    print()
+
+    if dry_run:
+      print( bold( 'Stash:' ), 'Would drop {} steps and reclaim {}'
+             ' (of {})'.format( len( dropped ), format_size( reclaimed ),
+                                format_size( total ) ) )
+      print()
+      return
+
+    # Remove the steps from the catalog first (skipping those that were
+    # dropped by someone else in the meantime)
+
+    dirs = [ x[ 'dir' ] for x, rule in dropped
+               if s.catalog.remove( x[ 'hash' ] ) ]
+
+    def remove( d ):
+      shutil.rmtree( s.get_stash_path() + '/' + d, ignore_errors = True )
+      return copies.get( d, 0 )
+
+    try:
+      with ThreadPoolExecutor( max_workers = s.transfer.jobs ) as pool:
+        freed = sum( pool.map( remove, dirs ) )
+      n, blob_bytes = store.collect( s.transfer.jobs )
+    except Exception as e:
+      print( bold( 'Error:' ), 'Failed to complete stash gc' )
+      raise
+
+    print( bold( 'Stash:' ), 'Dropped {} steps and reclaimed {}'
+           ' ({} blobs)'.format( len( dirs ),
+                                 format_size( freed + blob_bytes ), n ) )
+    print()
+
   #-----------------------------------------------------------------------
   # launch_help
   #-----------------------------------------------------------------------
@@ -805,6 +1240,7 @@ class StashHandler:
     print( bold( ' - push :' ), 'Push a built step to the stash'                    )
     print( bold( ' - pull :' ), 'Pull a built step from the stash'                  )
     print( bold( ' - drop :' ), 'Remove a built step from the stash'                )
+    print( bold( ' - gc   :' ), 'Drop steps with retention rules and size quotas'   )
     print()
     print( 'Run any command with -h to see more details'                 )
     print()
@@ -0,0 +1,89 @@
+import os
+
+from mflowgen.stash import BlobStore, FileTransfer
+from mflowgen.stash.compression import Compressor, get_codec
+
+def make_step( d, text ):
+  os.makedirs( d + '/outputs' )
+  os.makedirs( d + '/reports' )
+  with open( d + '/outputs/design.gds', 'w' ) as fd:
+    fd.write( 'gds' * 1000 )
+  with open( d + '/outputs/design.v', 'w' ) as fd:
+    fd.write( text )
+  os.symlink( 'missing', d + '/outputs/dangling' )
+
+def test_blob_store( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  make_step( '1-a', 'module a;\n' )
+  make_step( '2-a', 'module b;\n' )
+  store = BlobStore( str( tmp_path / 'stash' ) )
+  walk  = FileTransfer().walk
+  # Shared content is stored once
+  m1, new1, _, _ = store.push( 'stash/x', *walk( '1-a' ) )
+  m2, new2, _, _ = store.push( 'stash/y', *walk( '2-a' ) )
+  assert sorted( m1[ 'files' ] ) == [ 'outputs/design.gds',
+                                      'outputs/design.v' ]
+  assert ( new1, new2 ) == ( 3010, 10 )
+  assert len( store.blobs() ) == 3
+  assert store.sizes( store.manifests() ) == { 'x': ( 3010, 10 ),
+                                               'y': ( 3010, 10 ) }
+  # Pull
+  counts, _ = store.pull( store.read_manifest( 'stash/y' ), 'pulled' )
+  assert sum( counts.values() ) == 2
+  assert open( 'pulled/outputs/design.v' ).read() == 'module b;\n'
+  assert os.path.isdir( 'pulled/reports' )
+  # Linked pulls resolve to the blobs until they are materialized
+  store.pull( store.read_manifest( 'stash/x' ), 'linked', how='link' )
+  assert os.path.realpath( 'linked/outputs/design.v' ) == \
+         os.path.realpath( store.blob_path( m1[ 'files' ][
+                             'outputs/design.v' ][ 'blob' ] ) )
+  assert store.detach( store.read_manifest( 'stash/x' ), 'linked' )[0] == 2
+  assert not os.path.islink( 'linked/outputs/design.v' )
+  assert os.access( 'linked/outputs/design.v', os.W_OK )
+  # Blobs that nothing refers to are collected
+  os.remove( 'stash/x/' + store.manifest_name )
+  assert store.collect() == ( 1, 10 )
+  assert len( store.blobs() ) == 2
+
+def test_blob_store_compressed( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  make_step( '1-a', 'module a;\n' )
+  store      = BlobStore( str( tmp_path / 'stash' ) )
+  compressor = Compressor( get_codec( 'gzip' ), jobs=2 )
+  m, new, stored, _ = store.push( 'stash/x', *FileTransfer().walk( '.' ),
+                                  compressor=compressor )
+  compressor.close()
+  assert new == 3010 and stored < new
+  assert all( p.endswith( '.gz' ) for p in
+                store.variants( m[ 'files' ][ '1-a/outputs/design.gds' ][
+                                  'blob' ] ) )
+  # Only the outputs are pulled, and compressed blobs are decompressed
+  counts, _ = store.pull( m, 'pulled', only='1-a/outputs' )
+  assert counts[ 'decompress' ] == 2
+  assert os.listdir( 'pulled' ) == [ '1-a' ]
+  assert open( 'pulled/1-a/outputs/design.gds' ).read() == 'gds' * 1000
+  os.remove( 'stash/x/' + store.manifest_name )
+  assert store.collect()[0] == 2
+
+def test_blob_store_stamps( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  make_step( '1-a', 'module a;\n' )
+  for i, name in enumerate( [ '.stamp', '.execstamp',
+                              'outputs/.stamp.design.v',
+                              'mflowgen-run.log' ] ):
+    open( '1-a/' + name, 'w' ).close()
+    os.utime( '1-a/' + name, ( 1000 + i, 1000 + i ) )
+  store = BlobStore( str( tmp_path / 'stash' ) )
+  m = store.push( 'stash/x', *FileTransfer().walk( '1-a' ) )[0]
+  store.pull( m, 'p1' )
+  store.pull( m, 'p2' )
+  # Stamps and empty files are private files with the mtimes of the push
+  inodes = set()
+  for name in [ '.stamp', '.execstamp', 'outputs/.stamp.design.v',
+                'mflowgen-run.log' ]:
+    for d in [ 'p1', 'p2' ]:
+      st = os.stat( d + '/' + name )
+      assert st.st_nlink == 1
+      assert st.st_mtime == m[ 'files' ][ name ][ 'mtime' ]
+      inodes.add( st.st_ino )
+  assert len( inodes ) == 8
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from mflowgen.stash.compression import Compressor, codecs, decompress_file
+from mflowgen.stash.compression import get_codec
+
+@pytest.mark.parametrize( 'name', list( codecs ) )
+def test_compression( tmp_path, name ):
+  data = os.urandom( 1000 ).hex().encode() * 50
+  src  = str( tmp_path / 'src' )
+  with open( src, 'wb' ) as fd:
+    fd.write( data )
+  compressor = Compressor( get_codec( name ), jobs=2 )
+  compressor.chunk_size = 4096 # many independent chunks
+  size = compressor.compress_file( src, src + '.z' )
+  compressor.close()
+  assert size == os.path.getsize( src + '.z' ) < len( data )
+  decompress_file( codecs[ name ], src + '.z', src + '.out' )
+  assert open( src + '.out', 'rb' ).read() == data
+
+def test_compression_unknown():
+  with pytest.raises( AssertionError ):
+    get_codec( 'bogus' )
@@ -0,0 +1,28 @@
+import os
+
+from mflowgen.stash import FileTransfer
+from mflowgen.stash import file_transfer
+
+def test_file_transfer( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  monkeypatch.setattr( file_transfer, 'chunk_size', 1000 )
+  os.makedirs( 'src/outputs' )
+  os.makedirs( 'elsewhere' )
+  with open( 'elsewhere/big.gds', 'wb' ) as fd:
+    fd.write( os.urandom( 4500 ) )
+  os.chmod( 'elsewhere/big.gds', 0o640 )
+  os.symlink( '../../elsewhere/big.gds', 'src/outputs/big.gds' )
+  os.symlink( '../../elsewhere', 'src/outputs/linked' )
+  os.symlink( 'missing', 'src/outputs/dangling' )
+  transfer = FileTransfer( jobs=2, quiet=True )
+  # Symlinks are followed and dangling symlinks are skipped
+  files, dirs = transfer.walk( 'src' )
+  assert [ f[0] for f in files ] == [ 'outputs/big.gds',
+                                      'outputs/linked/big.gds' ]
+  assert dirs == [ 'outputs', 'outputs/linked' ]
+  # Copies in chunks
+  summary = transfer.copy_tree( files, dirs, 'dst' )
+  assert summary.startswith( 'Copied 2 files (8.8K)' )
+  for rel, path, size in files:
+    assert open( 'dst/' + rel, 'rb' ).read() == open( path, 'rb' ).read()
+    assert os.stat( 'dst/' + rel ).st_mode & 0o777 == 0o640
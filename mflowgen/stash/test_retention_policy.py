@@ -0,0 +1,36 @@
+from mflowgen.stash.retention_policy import RetentionPolicy
+
+def entry( hash_, step, date, pulled=None ):
+  return { 'hash': hash_, 'dir': hash_, 'step': step, 'date': date,
+           'pulled': pulled }
+
+def manifest( *blobs ):
+  return { 'files': { b: { 'blob': b, 'size': 1 } for b in blobs } }
+
+def test_retention_policy():
+  # Most recent first, and "c" shares the content of "b"
+  entries   = [ entry( 'd', 'syn', '2020-0104' ),
+                entry( 'c', 'pnr', '2020-0103' ),
+                entry( 'b', 'pnr', '2020-0102' ),
+                entry( 'a', 'syn', '2020-0101', pulled=2e9 ) ]
+  manifests = { 'a': manifest( 'x' ), 'b': manifest( 'y' ),
+                'c': manifest( 'y', 'z' ), 'd': manifest( 'w' ) }
+  blobs     = { 'w': 100, 'x': 200, 'y': 300, 'z': 400 }
+  copies    = {}
+  now       = 2e9 + 86400
+  def select( **rules ):
+    dropped, reclaimed, total = RetentionPolicy( **rules ).select(
+      entries, manifests, blobs, copies, now )
+    assert total == 1000
+    return [ ( x[ 'hash' ], rule ) for x, rule in dropped ], reclaimed
+  assert select( keep_last=1 ) == ( [ ( 'b', 'keep-last' ),
+                                      ( 'a', 'keep-last' ) ], 200 )
+  # "a" was pulled recently
+  assert select( max_age=30 ) == ( [ ( 'd', 'max-age' ),
+                                     ( 'c', 'max-age' ),
+                                     ( 'b', 'max-age' ) ], 800 )
+  # Least recently used first
+  assert select( max_size=500 ) == ( [ ( 'b', 'max-size' ),
+                                       ( 'c', 'max-size' ) ], 700 )
+  # ... but "b" is kept again since dropping it reclaims nothing here
+  assert select( max_size=800 ) == ( [ ( 'c', 'max-size' ) ], 400 )
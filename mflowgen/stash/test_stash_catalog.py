@@ -0,0 +1,29 @@
+from mflowgen.stash import StashCatalog
+from mflowgen.utils import write_yaml
+
+def entry( i, step='dc', author='ctorng', date='2020-0315' ):
+  return { 'hash': '{:06x}'.format( i ), 'dir': 'd{}'.format( i ),
+           'step': step, 'author': author, 'date': date, 'msg': str( i ) }
+
+def test_stash_catalog( tmp_path ):
+  write_yaml( [ entry( 1 ), entry( 2, step='pnr' ) ],
+              str( tmp_path / '.mflowgen.stash.yml' ) )
+  with StashCatalog( str( tmp_path ) ) as catalog:
+    # Migrated once from the YAML list
+    assert [ x[ 'hash' ] for x in catalog.query() ] == [ '000002',
+                                                         '000001' ]
+    assert catalog.add( entry( 3, author='other', date='2020-0401' ) )
+    assert not catalog.add( entry( 3 ) )
+  with StashCatalog( str( tmp_path ) ) as catalog:
+    assert catalog.count() == 3
+    assert catalog.get( '000002' )[ 'step' ] == 'pnr'
+    assert catalog.count( step='dc' ) == 2
+    assert catalog.count( author='other' ) == 1
+    assert catalog.count( since='2020-0316' ) == 1
+    assert [ x[ 'hash' ] for x in catalog.query( limit=1, offset=1 ) ] \
+             == [ '000002' ]
+    assert catalog.remove( '000001' )
+    assert not catalog.has( '000001' )
+    # Pulls are recorded for the retention policy
+    catalog.touch( '000002', when=100.0 )
+    assert catalog.last_pulled() == { '000002': 100.0 }
@@ -0,0 +1,8 @@
+from mflowgen.state.state_journal import StateJournal
+from mflowgen.state.build_status  import BuildStatus
+from mflowgen.state.step_profile  import StepProfiler
+from mflowgen.state.build_trace   import BuildTrace
+from mflowgen.state.trace_handler import TraceHandler
+from mflowgen.state.runtimes_handler import RuntimesHandler
+from mflowgen.state.step_checkpoint import StepCheckpoint
+from mflowgen.state.resume_handler import ResumeHandler
@@ -0,0 +1,271 @@
+#=========================================================================
+# build_status.py
+#=========================================================================
+# Status of each step in a build, without asking the build tool
+#
+# The status used to come from a dry run of the build tool over the whole
+# graph (e.g., "make -n"), which gets slow for large graphs and competes
+# with running builds for the build files. Instead, the status of each
+# step is decided here from the same files that the build tool looks at:
+#
+# - .mflowgen/<build-dir>/fingerprint  -- Changes with the template and
+#                                         the configuration of the step
+# - <build-dir>/.stamp                 -- Build directory was created
+# - <build-dir>/.execstamp              -- Step was executed
+# - <build-dir>/outputs/.digest.*      -- Output changed (mflowgen-digest)
+# - <build-dir>/.postconditions.stamp  -- Step finished
+# - <build-dir>/.prebuilt              -- Step is pre-built
+#
+# together with the latest run of each step in the state journal (see
+# state_journal.py), and the build order and dependencies that the build
+# orchestrator dumps to ".mflowgen/steps.json". The files are checked on a
+# thread pool, since most of the time goes into waiting for stat calls on
+# network file systems.
+#
+# Each step is in one of these states:
+#
+# - done     -- Up to date
+# - stale    -- Will run with the next build
+# - running  -- Running now (according to the state journal)
+# - failed   -- The latest run failed or was interrupted
+# - prebuilt -- Pre-built, never runs
+#
+# Steps downstream of a step that is not up to date are stale too, since
+# they may run after it (unless its outputs do not change). Steps that are
+# up to date because their latest run was a hit in the build cache say so
+# in their reason.
+#
+# Date   : October 18, 2026
+#
+
+import json
+import os
+import socket
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mflowgen.state.state_journal import StateJournal
+
+#-------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------
+
+# mtime
+#
+# Returns the timestamp of a file in nanoseconds, or None if it does not
+# exist
+#
+
+def mtime( path ):
+  try:
+    return os.stat( path ).st_mtime_ns
+  except OSError:
+    return None
+
+# is_alive
+#
+# Checks whether a process on this host is still running
+#
+
+def is_alive( pid ):
+  try:
+    os.kill( pid, 0 )
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    return True
+  return True
+
+#-------------------------------------------------------------------------
+# BuildStatus
+#-------------------------------------------------------------------------
+
+class BuildStatus:
+
+  statuses = [ 'done', 'stale', 'running', 'failed', 'prebuilt' ]
+
+  def __init__( s, metadata_dir='.mflowgen', jobs=16 ):
+
+    s.metadata_dir = metadata_dir
+    s.jobs         = jobs
+
+    # The build directories are next to the metadata directory
+
+    s.build_root = os.path.dirname( os.path.abspath( metadata_dir ) )
+
+    try:
+      with open( metadata_dir + '/steps.json' ) as fd:
+        s.steps = json.load( fd )
+    except OSError:
+      assert False, \
+        'BuildStatus -- No list of steps in "{}" (regenerate the build' \
+        ' files with "mflowgen run --update")'.format( metadata_dir )
+
+  #-----------------------------------------------------------------------
+  # Inputs to the status
+  #-----------------------------------------------------------------------
+
+  # probe
+  #
+  # Returns the timestamps of the stamps of a build directory
+  #
+
+  def probe( s, build_dir ):
+
+    d = s.build_root + '/' + build_dir
+
+    # Digest stamps of the outputs (only the latest matters)
+
+    try:
+      outputs = [ mtime( d + '/outputs/' + f )
+                    for f in os.listdir( d + '/outputs' )
+                    if f.startswith( '.digest.' ) ]
+    except OSError:
+      outputs = []
+
+    outputs = [ t for t in outputs if t is not None ]
+
+    return {
+      'fingerprint' : mtime( s.metadata_dir + '/' + build_dir +
+                               '/fingerprint' ),
+      'directory'   : mtime( d + '/.stamp' ),
+      'execute'     : mtime( d + '/.execstamp' ),
+      'outputs'     : max( outputs ) if outputs else None,
+      'postcond'    : mtime( d + '/.postconditions.stamp' ),
+      'prebuilt'    : os.path.exists( d + '/.prebuilt' ),
+    }
+
+  # last_runs
+  #
+  # Returns the latest run of each build directory from the state journal
+  #
+
+  def last_runs( s ):
+    if not os.path.exists( s.metadata_dir + '/' + StateJournal.db_name ):
+      return {}
+    with StateJournal( s.metadata_dir ) as journal:
+      return journal.last_runs()
+
+  #-----------------------------------------------------------------------
+  # Status
+  #-----------------------------------------------------------------------
+
+  # stale_reason
+  #
+  # Returns why the step will run with the next build, or None
+  #
+
+  def stale_reason( s, step, stamps, status ):
+
+    t = stamps[ step[ 'build_dir' ] ]
+
+    for d in step[ 'upstream' ]:
+      if status[ d ] not in [ 'done', 'prebuilt' ]:
+        return 'upstream step {} is {}'.format( d, status[ d ] )
+
+    if t[ 'directory' ] is None:
+      return 'not built yet'
+    if t[ 'fingerprint' ] and t[ 'fingerprint' ] > t[ 'directory' ]:
+      return 'fingerprint changed'
+
+    for d in step[ 'upstream' ]:
+      upstream = stamps[ d ][ 'outputs' ]
+      if upstream and upstream > t[ 'directory' ]:
+        return 'inputs from {} changed'.format( d )
+
+    if step[ 'phony' ]:
+      return 'no outputs (always runs)'
+    if t[ 'execute' ] is None or t[ 'execute' ] < t[ 'directory' ]:
+      return 'not executed yet'
+    if t[ 'postcond' ] is None or t[ 'postcond' ] < t[ 'execute' ] or \
+        ( t[ 'outputs' ] and t[ 'outputs' ] > t[ 'postcond' ] ):
+      return 'post-conditions not checked yet'
+
+    return None
+
+  # status
+  #
+  # Returns a list with the status of each step in build order:
+  #
+  #     {
+  #       'build_dir' : '4-dc',
+  #       'step'      : 'synopsys-dc-synthesis',
+  #       'status'    : 'stale',
+  #       'reason'    : 'inputs from 3-rtl changed',
+  #       'run'       : { ... latest run in the state journal ... },
+  #     }
+  #
+
+  def status( s ):
+
+    build_dirs = [ step[ 'build_dir' ] for step in s.steps ]
+
+    # Probe the build directories in chunks, since handing each one to the
+    # thread pool separately costs more than the stat calls themselves
+
+    chunks = [ build_dirs[ i : i + 64 ]
+                 for i in range( 0, len( build_dirs ), 64 ) ]
+
+    def probe_chunk( chunk ):
+      return [ s.probe( d ) for d in chunk ]
+
+    stamps = {}
+
+    with ThreadPoolExecutor( max_workers = s.jobs ) as pool:
+      for chunk, result in zip( chunks, pool.map( probe_chunk, chunks ) ):
+        stamps.update( zip( chunk, result ) )
+
+    runs = s.last_runs()
+    host = socket.gethostname()
+
+    status = {}
+    result = []
+
+    for step in s.steps:
+
+      build_dir = step[ 'build_dir' ]
+      t         = stamps[ build_dir ]
+      run       = runs.get( build_dir )
+      reason    = None
+
+      # Finished runs are older than the stamps they left behind (e.g.,
+      # steps restored from the build cache do not run at all)
+
+      if run and run[ 'end' ] is not None and t[ 'postcond' ] and \
+          t[ 'postcond' ] >= run[ 'end' ] * 1e9:
+        finished = True
+      else:
+        finished = False
+
+      if t[ 'prebuilt' ]:
+        state = 'prebuilt'
+
+      elif run and run[ 'end' ] is None:
+        if run[ 'host' ] != host or is_alive( run[ 'pid' ] ):
+          state  = 'running'
+          reason = 'on {} (pid {})'.format( run[ 'host' ], run[ 'pid' ] )
+        else:
+          state  = 'failed'
+          reason = 'interrupted'
+
+      elif run and run[ 'status' ] != 0 and not finished:
+        state  = 'failed'
+        reason = 'exit status {}'.format( run[ 'status' ] )
+
+      else:
+        reason = s.stale_reason( step, stamps, status )
+        state  = 'stale' if reason else 'done'
+        if state == 'done' and run and run[ 'cached' ]:
+          reason = 'restored from the build cache'
+
+      status[ build_dir ] = state
+
+      result.append( {
+        'build_dir' : build_dir,
+        'step'      : step[ 'step' ],
+        'status'    : state,
+        'reason'    : reason,
+        'run'       : run,
+      } )
+
+    return result
@@ -0,0 +1,339 @@
+#=========================================================================
+# build_trace.py
+#=========================================================================
+# Trace of a build for trace viewers
+#
+# The state journal has the start and end of every run of every step (see
+# state_journal.py), which is enough to see how well a parallel build used
+# its job slots. This turns the runs of the latest build into the Chrome
+# trace-event format, which opens in chrome://tracing and in Perfetto
+# (https://ui.perfetto.dev):
+#
+# - One track per job slot, with a span for each step. Runs are packed
+#   into the lowest free slot, so the number of tracks is the largest
+#   number of steps that ran at the same time. Slots beyond the number of
+#   jobs (if given) are marked as oversubscribed.
+# - Spans for each command inside the steps that were profiled (see
+#   step_profile.py). Steps restored from the build cache show up as
+#   short spans marked as cached.
+# - A track with the critical path of the build, i.e., the chain of
+#   dependencies that ended last
+# - Counters with the number of steps running and the CPU cores they kept
+#   busy (on average over each step), where idle gaps show up as dips
+#
+# The latest build is the latest group of runs without an idle gap longer
+# than a minute between them.
+#
+# Date   : October 18, 2026
+#
+
+import json
+import os
+import time
+
+from mflowgen.state.state_journal import StateJournal
+
+#-------------------------------------------------------------------------
+# BuildTrace
+#-------------------------------------------------------------------------
+
+class BuildTrace:
+
+  # Runs more than this many seconds apart belong to different builds
+
+  gap = 60.0
+
+  # Process id of the build in the trace
+
+  pid = 1
+
+  def __init__( s, metadata_dir='.mflowgen', jobs=None ):
+
+    s.metadata_dir = metadata_dir
+    s.jobs         = jobs
+
+    # The build directories are next to the metadata directory
+
+    s.build_root = os.path.dirname( os.path.abspath( metadata_dir ) )
+
+    # Dependencies (optional, only needed for the critical path)
+
+    try:
+      with open( metadata_dir + '/steps.json' ) as fd:
+        steps = json.load( fd )
+    except ( OSError, ValueError ):
+      steps = []
+
+    s.upstream = { step[ 'build_dir' ] : step[ 'upstream' ]
+                     for step in steps }
+
+  #-----------------------------------------------------------------------
+  # Runs
+  #-----------------------------------------------------------------------
+
+  # runs
+  #
+  # Returns the runs in the state journal sorted by start time, with
+  # unfinished runs ending now. Only the runs of the latest build are
+  # returned unless all_ is set.
+  #
+
+  def runs( s, all_=False ):
+
+    assert os.path.exists( s.metadata_dir + '/' + StateJournal.db_name ), \
+      'BuildTrace -- No state journal in "{}" (run a build first)'.format(
+        s.metadata_dir )
+
+    with StateJournal( s.metadata_dir ) as journal:
+      runs = journal.runs()
+
+    now = time.time()
+
+    for r in runs:
+      r[ 'running' ] = r[ 'end' ] is None
+      if r[ 'running' ]:
+        r[ 'end' ] = max( now, r[ 'start' ] )
+
+    runs.sort( key = lambda r: r[ 'start' ] )
+
+    if all_:
+      return runs
+
+    return s.latest_build( runs )
+
+  # latest_build
+  #
+  # Returns the runs after the last idle gap
+  #
+
+  def latest_build( s, runs ):
+    first = 0
+    end   = None
+    for i, r in enumerate( runs ):
+      if end is not None and r[ 'start' ] > end + s.gap:
+        first = i
+      end = r[ 'end' ] if end is None else max( end, r[ 'end' ] )
+    return runs[ first: ]
+
+  # assign_slots
+  #
+  # Packs the runs into job slots (numbered from one) and returns the
+  # number of slots
+  #
+
+  def assign_slots( s, runs ):
+    slot_ends = []
+    for r in runs:
+      for i, end in enumerate( slot_ends ):
+        if end <= r[ 'start' ]:
+          break
+      else:
+        i = len( slot_ends )
+        slot_ends.append( None )
+      slot_ends[ i ] = r[ 'end' ]
+      r[ 'slot' ] = i + 1
+    return len( slot_ends )
+
+  # critical_path
+  #
+  # Returns the chain of runs that ended last, from the first to the last.
+  # Going backwards from the run that ended last, the next run is the run
+  # of an upstream step that ended last before it started.
+  #
+
+  def critical_path( s, runs ):
+
+    # Latest run of each build directory
+
+    latest = {}
+    for r in runs:
+      latest[ r[ 'build_dir' ] ] = r
+
+    if not latest:
+      return []
+
+    run  = max( latest.values(), key = lambda r: r[ 'end' ] )
+    path = [ run ]
+
+    while True:
+      upstream = [ latest[ d ]
+                     for d in s.upstream.get( run[ 'build_dir' ], [] )
+                     if d in latest and latest[ d ][ 'end' ] <= run[ 'start' ]
+                     and latest[ d ] not in path ]
+      if not upstream:
+        break
+      run = max( upstream, key = lambda r: r[ 'end' ] )
+      path.append( run )
+
+    return path[::-1]
+
+  # read_profile
+  #
+  # Returns the per-command profile of a run, if the step was profiled
+  # during this run
+  #
+
+  def read_profile( s, run ):
+    path = s.build_root + '/' + run[ 'build_dir' ] + '/profile.json'
+    try:
+      with open( path ) as fd:
+        profile = json.load( fd )
+    except ( OSError, ValueError ):
+      return None
+    if abs( profile.get( 'start', 0 ) - run[ 'start' ] ) > 1.0:
+      return None
+    return profile
+
+  #-----------------------------------------------------------------------
+  # Trace events
+  #-----------------------------------------------------------------------
+
+  # events
+  #
+  # Returns the trace events for a list of runs
+  #
+
+  def events( s, runs ):
+
+    if not runs:
+      return []
+
+    t0       = min( r[ 'start' ] for r in runs )
+    us       = lambda t: round( ( t - t0 ) * 1e6 )
+    slots    = s.assign_slots( runs )
+    critical = s.critical_path( runs )
+
+    events = []
+
+    # Names of the process and tracks (the critical path goes first)
+
+    def meta( name, tid, args ):
+      e = { 'ph': 'M', 'name': name, 'pid': s.pid, 'args': args }
+      if tid is not None:
+        e[ 'tid' ] = tid
+      events.append( e )
+
+    meta( 'process_name', None, { 'name': 'mflowgen build' } )
+    meta( 'thread_name', 0, { 'name': 'critical path' } )
+    meta( 'thread_sort_index', 0, { 'sort_index': 0 } )
+
+    for i in range( 1, slots + 1 ):
+      name = 'slot {}'.format( i )
+      if s.jobs and i > s.jobs:
+        name += ' (over -j {})'.format( s.jobs )
+      meta( 'thread_name', i, { 'name': name } )
+      meta( 'thread_sort_index', i, { 'sort_index': i } )
+
+    # Steps
+
+    for r in runs:
+
+      wall = r[ 'end' ] - r[ 'start' ]
+      cpu  = ( r[ 'cpu_user' ] or 0 ) + ( r[ 'cpu_sys' ] or 0 )
+
+      r[ 'cores' ] = cpu / wall if wall > 0 else 0
+
+      args = {
+        'build_dir'  : r[ 'build_dir' ],
+        'status'     : 'running' if r[ 'running' ] else r[ 'status' ],
+        'host'       : r[ 'host' ],
+        'pid'        : r[ 'pid' ],
+        'cpu_user'   : r[ 'cpu_user' ],
+        'cpu_sys'    : r[ 'cpu_sys' ],
+        'max_rss_kb' : r[ 'max_rss_kb' ],
+        'cores'      : round( r[ 'cores' ], 2 ),
+        'critical'   : r in critical,
+        'cached'     : bool( r[ 'cached' ] ),
+      }
+
+      e = {
+        'ph'   : 'X',
+        'name' : r[ 'step' ] or r[ 'build_dir' ],
+        'cat'  : 'step',
+        'pid'  : s.pid,
+        'tid'  : r[ 'slot' ],
+        'ts'   : us( r[ 'start' ] ),
+        'dur'  : us( r[ 'end' ] ) - us( r[ 'start' ] ),
+        'args' : args,
+      }
+
+      if not r[ 'running' ] and r[ 'status' ] != 0:
+        e[ 'cname' ] = 'terrible'
+      elif r in critical:
+        e[ 'cname' ] = 'yellow'
+      elif r[ 'cached' ]:
+        e[ 'cname' ] = 'good'
+
+      events.append( e )
+
+      if r in critical:
+        events.append( dict( e, tid = 0, cat = 'critical' ) )
+
+      # Commands of profiled steps
+
+      profile = s.read_profile( r )
+
+      for c in ( profile or {} ).get( 'commands', [] ):
+        command = c[ 'command' ] or ''
+        name    = command.split( '\n' )[0]
+        events.append( {
+          'ph'   : 'X',
+          'name' : name if len( name ) <= 60 else name[:57] + '...',
+          'cat'  : 'command',
+          'pid'  : s.pid,
+          'tid'  : r[ 'slot' ],
+          'ts'   : us( c[ 'start' ] ),
+          'dur'  : us( c[ 'end' ] ) - us( c[ 'start' ] ),
+          'args' : { k: v for k, v in c.items()
+                       if k not in [ 'start', 'end' ] },
+        } )
+
+    # Counters (ends go before starts at the same time)
+
+    changes = sorted( [ ( r[ 'start' ], 1, r ) for r in runs ] +
+                      [ ( r[ 'end' ], -1, r ) for r in runs ],
+                      key = lambda c: ( c[0], c[1] ) )
+
+    running = 0
+    cores   = 0.0
+
+    for t, d, r in changes:
+      running += d
+      cores   += d * r[ 'cores' ]
+      for name, args in [ ( 'steps running', { 'steps': running } ),
+                          ( 'cores busy',
+                            { 'cores': round( max( cores, 0 ), 2 ) } ) ]:
+        events.append( { 'ph': 'C', 'name': name, 'pid': s.pid,
+                         'ts': us( t ), 'args': args } )
+
+    return events
+
+  # write
+  #
+  # Writes the trace of the latest build (or of all runs) to a file and
+  # returns a summary
+  #
+
+  def write( s, path, all_=False ):
+
+    runs   = s.runs( all_ )
+    events = s.events( runs )
+
+    with open( path, 'w' ) as fd:
+      json.dump( { 'traceEvents': events, 'displayTimeUnit': 'ms' }, fd )
+      fd.write( '\n' )
+
+    if not runs:
+      return { 'steps': 0, 'slots': 0, 'wall': 0, 'busy': 0,
+               'critical': [] }
+
+    wall = max( r[ 'end' ] for r in runs ) - \
+           min( r[ 'start' ] for r in runs )
+
+    return {
+      'steps'    : len( runs ),
+      'slots'    : max( r[ 'slot' ] for r in runs ),
+      'wall'     : wall,
+      'busy'     : sum( r[ 'end' ] - r[ 'start' ] for r in runs ),
+      'critical' : s.critical_path( runs ),
+    }
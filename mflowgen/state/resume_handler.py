@@ -0,0 +1,198 @@
+#=========================================================================
+# resume_handler.py
+#=========================================================================
+# Handler for "mflowgen resume"
+#
+# Restarts a step that failed from its last tool checkpoint instead of
+# from scratch (see step_checkpoint.py). The mflowgen-run of the step is
+# regenerated from the one in the metadata directory to run only the
+# entries of its "order" parameter after the checkpoint, and then run in
+# the build directory like the build system would. When it succeeds, the
+# step is marked as executed so that the next build goes on with the
+# steps after it.
+#
+# Date   : October 18, 2026
+#
+
+import os
+import subprocess
+import sys
+
+from mflowgen.state.build_status    import BuildStatus
+from mflowgen.state.step_checkpoint import StepCheckpoint
+from mflowgen.utils                 import bold, read_yaml, read_fingerprint
+
+class ResumeHandler:
+
+  def __init__( s, metadata_dir='.mflowgen' ):
+    s.metadata_dir = metadata_dir
+
+  # launch
+  #
+  # Resumes the given step (by build id, build directory, or name)
+  #
+
+  def launch( s, args, help_, dry_run ):
+
+    if help_ or not args or args[0] == 'help':
+      s.launch_help()
+      return
+
+    if len( args ) > 1:
+      print( 'resume: Unrecognized commands (see "mflowgen resume help")' )
+      sys.exit( 1 )
+
+    try:
+      build_dir = s.find_build_dir( args[0] )
+      n, checkpoint, script, order = s.regenerate( build_dir )
+    except AssertionError as e:
+      print()
+      print( bold( 'Error:' ), e )
+      print()
+      sys.exit( 1 )
+
+    print()
+    if checkpoint:
+      print( bold( 'Resume:' ), '{} from {} (after {})'.format(
+               build_dir, checkpoint, order[n-1] ) )
+    else:
+      print( bold( 'Resume:' ), '{} from the start (no checkpoint was'
+                                ' saved)'.format( build_dir ) )
+    print()
+    print( '  Skip :', ', '.join( order[:n] ) or '-' )
+    print( '  Run  :', ', '.join( order[n:] ) or '-' )
+    print()
+
+    if dry_run:
+      print( script, end='' )
+      return
+
+    StepCheckpoint( build_dir ).cut( n )
+
+    path = build_dir + '/mflowgen-run'
+    with open( path, 'w' ) as fd:
+      fd.write( script )
+    os.chmod( path, 0o755 )
+
+    sys.exit( s.run( build_dir ) )
+
+  # find_build_dir
+  #
+  # Returns the build directory of a step given by build id (e.g., "4"),
+  # build directory, or step name
+  #
+
+  def find_build_dir( s, name ):
+
+    status = BuildStatus( s.metadata_dir )
+
+    for step in status.status():
+      d = step[ 'build_dir' ]
+      if name in [ d, step[ 'step' ], d.split( '-' )[0] ]:
+        assert step[ 'status' ] != 'running', \
+          'ResumeHandler -- Step "{}" is still running'.format( d )
+        return d
+
+    assert False, \
+      'ResumeHandler -- No step "{}" in this build'.format( name )
+
+  # regenerate
+  #
+  # Returns the resume point, the tool checkpoint, and the regenerated
+  # mflowgen-run of the step, along with the order of its subscripts
+  #
+
+  def regenerate( s, build_dir ):
+
+    inner_dir  = s.metadata_dir + '/' + build_dir
+    checkpoint = StepCheckpoint( build_dir )
+
+    try:
+      with open( inner_dir + '/mflowgen-run' ) as fd:
+        script = fd.read()
+      config = read_yaml( inner_dir + '/configure.yml' ) or {}
+    except OSError:
+      assert False, \
+        'ResumeHandler -- No commands for "{}" (regenerate the build' \
+        ' files with "mflowgen run --update")'.format( build_dir )
+
+    assert StepCheckpoint.reset_command in script, \
+      'ResumeHandler -- Step "{}" does not record checkpoints (turn on' \
+      ' "checkpoint" in its configuration)'.format( build_dir )
+
+    assert checkpoint.exists(), \
+      'ResumeHandler -- Step "{}" has no checkpoints (it did not run with' \
+      ' checkpoints turned on)'.format( build_dir )
+
+    # The step or its inputs changed since the run that saved them
+
+    if not checkpoint.valid( read_fingerprint( build_dir,
+                                               s.metadata_dir ) ):
+      checkpoint.remove()
+      assert False, \
+        'ResumeHandler -- Step "{}" changed since its checkpoints were' \
+        ' saved, so they were removed (rerun the step)'.format( build_dir )
+
+    order = config.get( 'parameters', {} ).get( 'order', [] )
+    if type( order ) is not list:
+      order = order.split( ',' )
+
+    return checkpoint.resume( script, order ) + ( order, )
+
+  # run
+  #
+  # Runs the regenerated script like the build system (appending to the
+  # log) and returns its exit status
+  #
+
+  def run( s, build_dir ):
+
+    status = subprocess.call(
+      [ 'bash', '-c',
+        'set -o pipefail; ./mflowgen-run 2>&1 | tee -a mflowgen-run.log' ],
+      cwd = build_dir )
+
+    print()
+
+    if status != 0:
+      print( bold( 'Error:' ), 'Step "{}" failed again (exit status {}),'
+             ' see {}/mflowgen-run.log'.format( build_dir, status,
+                                                build_dir ) )
+      print()
+      return status
+
+    # Mark the step as executed, like the build system does
+
+    outputs = build_dir + '/outputs'
+
+    for f in os.listdir( outputs ) if os.path.isdir( outputs ) else []:
+      if os.path.exists( outputs + '/' + f ):
+        os.utime( outputs + '/' + f )
+
+    with open( build_dir + '/.execstamp', 'a' ):
+      os.utime( build_dir + '/.execstamp' )
+
+    print( bold( 'Done:' ), 'Resumed "{}". Run the build again to go on'
+           ' with the steps after it.'.format( build_dir ) )
+    print()
+
+    return 0
+
+  #-----------------------------------------------------------------------
+  # launch_help
+  #-----------------------------------------------------------------------
+
+  def launch_help( s ):
+    print()
+    print( bold( 'Usage:' ), 'mflowgen resume <step> [--dry-run]' )
+    print()
+    print( 'Restarts a step that failed from the last tool checkpoint that' )
+    print( 'it saved, instead of from scratch. The step is given by build'  )
+    print( 'id (e.g., 4), build directory, or name, and must have'          )
+    print( 'checkpoints turned on ("checkpoint" in its configuration).'     )
+    print( 'Its mflowgen-run is regenerated to run only the entries of its' )
+    print( '"order" parameter after the checkpoint, and then run.'          )
+    print()
+    print( '  -n --dry-run : Show the regenerated mflowgen-run without'      )
+    print( '                 running it'                                    )
+    print()
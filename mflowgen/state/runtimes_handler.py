@@ -0,0 +1,235 @@
+#=========================================================================
+# runtimes_handler.py
+#=========================================================================
+# Handler for "mflowgen runtimes"
+#
+# The sum of the step runtimes (e.g., from mflowgen-runtimes) says little
+# about how long a parallel build takes. This estimates the runtime of
+# each step from its earlier runs with the same name and parameters in the
+# state journal (see Step.runtime_key) and reports:
+#
+# - The critical path, i.e., the longest chain of dependencies weighted
+#   by runtime, and the slack of every other step (how much longer it can
+#   take without delaying the build). Speeding up the critical path is
+#   what shortens the build.
+# - An estimate of the remaining time of a build in progress, i.e., the
+#   critical path through the steps that still have to run, counting the
+#   running steps from how long they already ran
+#
+# Both assume that there are enough jobs to run every step as soon as its
+# inputs are ready.
+#
+# Date   : October 18, 2026
+#
+
+import datetime as dt
+import sys
+import time
+
+from mflowgen.state.build_status  import BuildStatus
+from mflowgen.state.state_journal import StateJournal
+from mflowgen.utils               import bold, critical_path
+
+#-------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------
+
+# format_runtime
+#
+# Formats seconds like mflowgen-runtimes (e.g., "3 min 16 sec")
+#
+
+def format_runtime( seconds ):
+  h = int( ( seconds / 60 ) / 60 )
+  m = int( ( seconds / 60 ) % 60 )
+  s = int(   seconds % 60        )
+  text  = str( h ) + ' hr '  if h > 0 else ''
+  text += str( m ) + ' min ' if h > 0 or m > 0 else ''
+  return text + str( s ) + ' sec'
+
+#-------------------------------------------------------------------------
+# RuntimesHandler
+#-------------------------------------------------------------------------
+
+class RuntimesHandler:
+
+  def __init__( s, metadata_dir='.mflowgen' ):
+    s.metadata_dir = metadata_dir
+
+  # launch
+  #
+  # Shows the critical path and the estimated remaining time (both unless
+  # one of them is asked for)
+  #
+
+  def launch( s, args, help_, critical_path, eta ):
+
+    if help_ or args and args[0] == 'help':
+      s.launch_help()
+      return
+
+    if args:
+      print( 'runtimes: Unrecognized commands'
+             ' (see "mflowgen runtimes help")' )
+      sys.exit( 1 )
+
+    if not critical_path and not eta:
+      critical_path = eta = True
+
+    try:
+      s.status = BuildStatus( s.metadata_dir )
+    except AssertionError as e:
+      print( bold( 'Error:' ), e )
+      sys.exit( 1 )
+
+    s.steps   = s.status.steps
+    s.order   = [ step[ 'build_dir' ] for step in s.steps ]
+    s.preds   = { step[ 'build_dir' ]: step[ 'upstream' ]
+                    for step in s.steps }
+    s.weights = s.expected_runtimes()
+
+    if critical_path : s.launch_critical_path()
+    if eta           : s.launch_eta()
+
+  # expected_runtimes
+  #
+  # Returns { build_dir : seconds } from the latest successful run of each
+  # step with the same runtime key
+  #
+
+  def expected_runtimes( s ):
+
+    history  = {}
+    runtimes = {}
+
+    try:
+      with StateJournal( s.metadata_dir ) as journal:
+        history  = journal.history()
+        runtimes = journal.runtimes()
+    except Exception:
+      pass
+
+    weights = {}
+
+    for step in s.steps:
+      d = step[ 'build_dir' ]
+      if 'key' in step:
+        weights[ d ] = history.get( step[ 'key' ] )
+      else:
+        weights[ d ] = runtimes.get( d ) # older builds without keys
+
+    return weights
+
+  #-----------------------------------------------------------------------
+  # launch_critical_path
+  #-----------------------------------------------------------------------
+
+  def launch_critical_path( s ):
+
+    result   = critical_path( s.order, s.preds, s.weights )
+    critical = set( result[ 'path' ] )
+    missing  = [ d for d in s.order if s.weights[ d ] is None ]
+
+    template = '{mark} {step: <35} -- {runtime: >20} {slack: >24}'
+
+    print( '-'*80 )
+    print( 'Critical Path (from earlier runs)' )
+    print( '-'*80 )
+
+    for d in s.order:
+      w = s.weights[ d ]
+      print( template.format(
+        mark    = '*' if d in critical else ' ',
+        step    = d,
+        runtime = format_runtime( w ) if w is not None else 'no runs',
+        slack   = 'slack ' + format_runtime( result[ 'slack' ][ d ] )
+                    if d not in critical else '',
+      ).rstrip() )
+
+    print( '-'*80 )
+    print( template.format(
+      mark    = ' ',
+      step    = 'Critical path',
+      runtime = format_runtime( result[ 'length' ] ),
+      slack   = '',
+    ).rstrip() )
+    print( template.format(
+      mark    = ' ',
+      step    = 'Sum of all steps',
+      runtime = format_runtime( sum( w for w in s.weights.values() if w ) ),
+      slack   = '',
+    ).rstrip() )
+    print()
+    print( 'Critical path:', ' -> '.join( result[ 'path' ] ) )
+
+    if missing:
+      print()
+      print( 'Steps without earlier runs count as 0 sec:',
+             ', '.join( missing ) )
+
+    print()
+
+  #-----------------------------------------------------------------------
+  # launch_eta
+  #-----------------------------------------------------------------------
+
+  def launch_eta( s ):
+
+    now       = time.time()
+    remaining = {}
+    running   = []
+    waiting   = []
+
+    for x in s.status.status():
+      d = x[ 'build_dir' ]
+      w = s.weights[ d ] or 0
+      if x[ 'status' ] == 'running':
+        running.append( d )
+        remaining[ d ] = max( w - ( now - x[ 'run' ][ 'start' ] ), 0 )
+      elif x[ 'status' ] in [ 'stale', 'failed' ]:
+        waiting.append( d )
+        remaining[ d ] = w
+      else:
+        remaining[ d ] = 0
+
+    result = critical_path( s.order, s.preds, remaining )
+    path   = [ d for d in result[ 'path' ] if remaining[ d ] > 0 ]
+    eta    = dt.datetime.fromtimestamp( now + result[ 'length' ] )
+
+    template = '{name: <37} -- {value: >20}'
+
+    print( '-'*80 )
+    print( 'Estimate (from earlier runs)' )
+    print( '-'*80 )
+    print( template.format( name = 'Steps running',
+                            value = len( running ) ) )
+    print( template.format( name = 'Steps still to run',
+                            value = len( waiting ) ) )
+    print( template.format( name = 'Remaining work',
+             value = format_runtime( sum( remaining.values() ) ) ) )
+    print( template.format( name = 'Remaining time',
+             value = format_runtime( result[ 'length' ] ) ) )
+    print( template.format( name = 'Done at',
+             value = eta.strftime( '%Y-%m-%d %H:%M' ) ) )
+
+    if path:
+      print()
+      print( 'Remaining critical path:', ' -> '.join( path ) )
+
+    print()
+
+  #-----------------------------------------------------------------------
+  # launch_help
+  #-----------------------------------------------------------------------
+
+  def launch_help( s ):
+    print()
+    print( bold( 'Usage:' ), 'mflowgen runtimes [--critical-path] [--eta]' )
+    print()
+    print( 'Estimates the runtime of each step from its earlier runs with'  )
+    print( 'the same name and parameters (in .mflowgen/state.db), and'      )
+    print( 'shows the critical path of the build with the slack of each'    )
+    print( 'step (--critical-path) and the remaining time of a build in'    )
+    print( 'progress (--eta). Both assume enough jobs to run each step as'  )
+    print( 'soon as its inputs are ready.'                                  )
+    print()
@@ -0,0 +1,254 @@
+#=========================================================================
+# state_journal.py
+#=========================================================================
+# Journal of the runs of each step in a build
+#
+# The state of a build used to be spread over the stamps and timestamps
+# in each build directory (.time_start, .time_end, .stamp, .execstamp,
+# .postconditions.stamp), so every report had to walk the build
+# directories or dry-run the build tool to put it back together. Each
+# generated mflowgen-run now records its run in a single SQLite database
+# in the metadata directory (see mflowgen-journal):
+#
+#     .mflowgen/state.db
+#
+# A row is inserted when the step starts and completed when it ends, so
+# steps that are still running have no end time and no exit status:
+#
+#     id          -- run id
+#     build_dir   -- build directory of the step (e.g., "4-dc")
+#     step        -- name of the step
+#     start       -- start time (seconds since the epoch)
+#     end         -- end time (seconds since the epoch)
+#     status      -- exit status of mflowgen-run
+#     fingerprint -- fingerprint of the step including its inputs
+#     host        -- host that ran the step
+#     pid         -- process id of mflowgen-run
+#     max_rss_kb  -- peak resident set size of the largest process (KB)
+#     cpu_user    -- user CPU time of all processes (seconds)
+#     cpu_sys     -- system CPU time of all processes (seconds)
+#     key         -- runtime key of the step (its name and parameters,
+#                    see Step.runtime_key)
+#     cached      -- 1 if the step did not run because its results were
+#                    restored from the build cache (see mflowgen-cache)
+#
+# The database uses write-ahead logging so that steps running in parallel
+# do not block each other or the readers.
+#
+# Date   : October 18, 2026
+#
+
+import os
+import socket
+import sqlite3
+import time
+
+#-------------------------------------------------------------------------
+# StateJournal
+#-------------------------------------------------------------------------
+
+class StateJournal:
+
+  # Name of the database in the metadata directory
+
+  db_name = 'state.db'
+
+  # Columns of the runs table (in order)
+
+  columns = [
+    'id',
+    'build_dir',
+    'step',
+    'start',
+    'end',
+    'status',
+    'fingerprint',
+    'host',
+    'pid',
+    'max_rss_kb',
+    'cpu_user',
+    'cpu_sys',
+    'key',
+    'cached',
+  ]
+
+  schema = '''
+    CREATE TABLE IF NOT EXISTS runs (
+      id          INTEGER PRIMARY KEY AUTOINCREMENT,
+      build_dir   TEXT    NOT NULL,
+      step        TEXT,
+      start       REAL    NOT NULL,
+      end         REAL,
+      status      INTEGER,
+      fingerprint TEXT,
+      host        TEXT,
+      pid         INTEGER,
+      max_rss_kb  INTEGER,
+      cpu_user    REAL,
+      cpu_sys     REAL,
+      key         TEXT,
+      cached      INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS runs_build_dir ON runs ( build_dir, id );
+  '''
+
+  def __init__( s, metadata_dir='.mflowgen', timeout=60 ):
+
+    s.path = metadata_dir + '/' + s.db_name
+
+    # Autocommit, since each write is a single statement
+
+    s.db = sqlite3.connect( s.path, timeout=timeout,
+                            isolation_level=None )
+
+    s.db.execute( 'PRAGMA journal_mode=WAL' )
+    s.db.execute( 'PRAGMA synchronous=NORMAL' )
+    s.db.executescript( s.schema )
+
+    # Journals from before the runtime keys and cache hits were recorded
+
+    existing = [ row[1] for row in
+                   s.db.execute( 'PRAGMA table_info( runs )' ) ]
+
+    for column, kind in [ ( 'key', 'TEXT' ), ( 'cached', 'INTEGER' ) ]:
+      if column not in existing:
+        try:
+          s.db.execute( 'ALTER TABLE runs ADD COLUMN {} {}'.format(
+                          column, kind ) )
+        except sqlite3.OperationalError:
+          pass # added by another process in the meantime
+
+  def close( s ):
+    s.db.close()
+
+  def __enter__( s ):
+    return s
+
+  def __exit__( s, *args ):
+    s.close()
+
+  #-----------------------------------------------------------------------
+  # Recording
+  #-----------------------------------------------------------------------
+
+  # start
+  #
+  # Records the start of a run and returns its id
+  #
+
+  def start( s, build_dir, step=None, fingerprint=None, pid=None,
+                host=None, start=None, key=None ):
+
+    cursor = s.db.execute(
+      'INSERT INTO runs ( build_dir, step, start, fingerprint, host, pid,'
+      ' key ) VALUES ( ?, ?, ?, ?, ?, ?, ? )',
+      ( build_dir, step,
+        start if start is not None else time.time(),
+        fingerprint,
+        host  if host  is not None else socket.gethostname(),
+        pid   if pid   is not None else os.getpid(),
+        key ) )
+
+    return cursor.lastrowid
+
+  # end
+  #
+  # Records the end of a run
+  #
+
+  def end( s, run_id, status, max_rss_kb=None, cpu_user=None,
+              cpu_sys=None, end=None ):
+
+    s.db.execute(
+      'UPDATE runs SET end = ?, status = ?, max_rss_kb = ?, cpu_user = ?,'
+      ' cpu_sys = ? WHERE id = ?',
+      ( end if end is not None else time.time(),
+        status, max_rss_kb, cpu_user, cpu_sys, run_id ) )
+
+  # hit
+  #
+  # Records a run that was a hit in the build cache (i.e., the results of
+  # the step were restored instead of running the step) and returns its id
+  #
+
+  def hit( s, build_dir, step=None, fingerprint=None, key=None,
+              start=None, end=None ):
+
+    end   = end   if end   is not None else time.time()
+    start = start if start is not None else end
+
+    cursor = s.db.execute(
+      'INSERT INTO runs ( build_dir, step, start, end, status,'
+      ' fingerprint, host, pid, key, cached )'
+      ' VALUES ( ?, ?, ?, ?, 0, ?, ?, ?, ?, 1 )',
+      ( build_dir, step, start, end, fingerprint,
+        socket.gethostname(), os.getpid(), key ) )
+
+    return cursor.lastrowid
+
+  #-----------------------------------------------------------------------
+  # Queries
+  #-----------------------------------------------------------------------
+  # Runs are returned as dicts with the columns as keys, oldest first
+  #
+
+  def _query( s, where='', args=() ):
+    rows = s.db.execute(
+      'SELECT ' + ', '.join( s.columns ) + ' FROM runs ' + where, args )
+    return [ dict( zip( s.columns, row ) ) for row in rows ]
+
+  # runs
+  #
+  # Returns all runs, or all runs of one build directory
+  #
+
+  def runs( s, build_dir=None ):
+    if build_dir is None:
+      return s._query( 'ORDER BY id' )
+    return s._query( 'WHERE build_dir = ? ORDER BY id', ( build_dir, ) )
+
+  # last_runs
+  #
+  # Returns { build_dir : latest run } for all build directories
+  #
+
+  def last_runs( s ):
+    runs = s._query( 'WHERE id IN ( SELECT MAX( id ) FROM runs'
+                     ' GROUP BY build_dir ) ORDER BY id' )
+    return { r[ 'build_dir' ]: r for r in runs }
+
+  # running
+  #
+  # Returns the runs that have not ended yet. This includes runs that were
+  # killed before they could record their end.
+  #
+
+  def running( s ):
+    return [ r for r in s.last_runs().values() if r[ 'end' ] is None ]
+
+  # runtimes
+  #
+  # Returns { build_dir : seconds } from the latest finished run of each
+  # build directory that succeeded. Cache hits are left out, since they
+  # say nothing about how long the step takes to run.
+  #
+
+  def runtimes( s ):
+    runs = s._query( 'WHERE id IN ( SELECT MAX( id ) FROM runs'
+                     ' WHERE end IS NOT NULL AND status = 0'
+                     ' AND cached IS NOT 1 GROUP BY build_dir )' )
+    return { r[ 'build_dir' ]: r[ 'end' ] - r[ 'start' ] for r in runs }
+
+  # history
+  #
+  # Returns { runtime key : seconds } from the latest finished run of each
+  # runtime key that succeeded (see Step.runtime_key), leaving out cache
+  # hits like runtimes
+  #
+
+  def history( s ):
+    runs = s._query( 'WHERE id IN ( SELECT MAX( id ) FROM runs'
+                     ' WHERE end IS NOT NULL AND status = 0'
+                     ' AND cached IS NOT 1'
+                     ' AND key IS NOT NULL GROUP BY key )' )
+    return { r[ 'key' ]: r[ 'end' ] - r[ 'start' ] for r in runs }
@@ -0,0 +1,162 @@
+#=========================================================================
+# step_checkpoint.py
+#=========================================================================
+# Progress of steps that run an ordered list of subscripts
+#
+# Steps like synopsys-dc-synthesis and the Innovus steps source the
+# subscripts in their "order" parameter one after the other in a single
+# tool session, so when a late subscript fails, rerunning the step repeats
+# hours of work. Steps with checkpoints turned on (i.e., "checkpoint" in
+# the step configuration) record their progress in ".mflowgen-checkpoint"
+# in the build directory:
+#
+#     fingerprint <fingerprint of the step when the run started>
+#     done <entry>
+#     done <entry> <tool checkpoint saved after the entry>
+#
+# The generated mflowgen-run starts a new record with the fingerprint
+# (from mflowgen-journal) and tells the tool script where the record is
+# and after which entries it should save a tool checkpoint:
+#
+#     MFLOWGEN_CHECKPOINT        : path to the record
+#     MFLOWGEN_CHECKPOINT_AFTER  : entries to save a checkpoint after
+#
+# The tool script appends a line after each entry that completed.
+#
+# "mflowgen resume" regenerates mflowgen-run to restart the step from the
+# last tool checkpoint, with only the entries after it in "order" and:
+#
+#     MFLOWGEN_RESUME_CHECKPOINT : path to the tool checkpoint
+#     MFLOWGEN_RESUME_DONE       : entries that ran before it
+#
+# The tool script then restores the checkpoint (and any session setup
+# among the entries that ran, which tool checkpoints do not save) instead
+# of starting from the inputs. A record is only valid for the fingerprint
+# it was started with, so it is removed once the step or its inputs
+# change (see BuildOrchestrator.invalidate_checkpoints).
+#
+# Date   : October 18, 2026
+#
+
+import os
+import shlex
+
+class StepCheckpoint:
+
+  file_name = '.mflowgen-checkpoint'
+
+  # Line of mflowgen-run that starts a new record, which resumed scripts
+  # replace with the restart point
+
+  reset_command = \
+    'echo "fingerprint ${MFLOWGEN_FINGERPRINT:-}" > "$MFLOWGEN_CHECKPOINT"'
+
+  def __init__( s, step_dir='.' ):
+    s.step_dir = step_dir
+    s.path     = step_dir + '/' + s.file_name
+
+  def exists( s ):
+    return os.path.exists( s.path )
+
+  def remove( s ):
+    try:
+      os.remove( s.path )
+    except FileNotFoundError:
+      pass
+
+  # read
+  #
+  # Returns the fingerprint of the record and the completed entries as a
+  # list of ( entry, tool checkpoint or None )
+  #
+
+  def read( s ):
+
+    fingerprint = None
+    done        = []
+
+    with open( s.path ) as fd:
+      for line in fd:
+        fields = line.split( None, 2 )
+        if len( fields ) < 2:
+          continue
+        if fields[0] == 'fingerprint':
+          fingerprint = fields[1]
+        elif fields[0] == 'done':
+          done.append( ( fields[1],
+                         fields[2].strip() if len( fields ) > 2 else None ) )
+
+    return fingerprint, done
+
+  # valid
+  #
+  # Returns whether the record was started with this fingerprint
+  #
+
+  def valid( s, fingerprint ):
+    try:
+      return fingerprint is not None and s.read()[0] == fingerprint
+    except OSError:
+      return False
+
+  # resume_point
+  #
+  # Returns how many entries of the order do not have to run again and the
+  # tool checkpoint to restore for that, which is the last one saved while
+  # the entries completed in order (or 0 and None)
+  #
+
+  def resume_point( s, order ):
+
+    _, done = s.read()
+
+    n          = 0
+    checkpoint = None
+
+    for i, ( entry, path ) in enumerate( done ):
+      if i >= len( order ) or order[i] != entry:
+        break
+      if path and os.path.exists( os.path.join( s.step_dir, path ) ):
+        n          = i + 1
+        checkpoint = path
+
+    return n, checkpoint
+
+  # resume
+  #
+  # Returns the resume point and the script with the reset command
+  # replaced by the commands that restart from there
+  #
+
+  def resume( s, script, order ):
+
+    assert s.reset_command in script, \
+      'StepCheckpoint -- The step does not record checkpoints'
+
+    n, checkpoint = s.resume_point( order )
+
+    commands = [ 'export order=' + shlex.quote( ','.join( order[n:] ) ) ]
+
+    if checkpoint:
+      commands += [
+        'export MFLOWGEN_RESUME_CHECKPOINT=' + shlex.quote( checkpoint ),
+        'export MFLOWGEN_RESUME_DONE=' + shlex.quote( ','.join( order[:n] ) ),
+      ]
+
+    return n, checkpoint, script.replace( s.reset_command,
+                                          '\n'.join( commands ) )
+
+  # cut
+  #
+  # Cuts the record back to the first n completed entries, since the
+  # entries after them run again
+  #
+
+  def cut( s, n ):
+
+    fingerprint, done = s.read()
+
+    with open( s.path, 'w' ) as fd:
+      fd.write( 'fingerprint {}\n'.format( fingerprint ) )
+      for entry, path in done[:n]:
+        fd.write( 'done {}{}\n'.format( entry, ' ' + path if path else '' ) )
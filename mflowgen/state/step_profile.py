@@ -0,0 +1,317 @@
+#=========================================================================
+# step_profile.py
+#=========================================================================
+# Per-command profile of a step
+#
+# The state journal records the runtime and resources of a whole step
+# (see state_journal.py), which does not say where a long step spends its
+# time. Steps with profiling turned on (i.e., "profile: True" in the step
+# configuration) also get a breakdown for each entry in their commands:
+#
+# - Wall time
+# - User and system CPU time
+# - Bytes read and written (from storage and in total)
+# - Peak resident set size of the process tree
+#
+# The generated mflowgen-run marks the start of each command and the end
+# of the last one by appending a line to ".mflowgen-profile" in the build
+# directory with the time and the counters of its own shell process from
+# /proc (which include the counters of the children that it waited for):
+#
+#     <label> <time> <fields of /proc/$$/stat after the command name>
+#         <contents of /proc/$$/io on one line>
+#
+# The CPU time and I/O of each command are the differences between marks.
+# Memory is not accumulated like this, so mflowgen-journal samples the
+# resident set size of all processes of the step instead (every second by
+# default, see MFLOWGEN_PROFILE_INTERVAL). Commands shorter than the
+# sampling interval may have no memory sample.
+#
+# When the step ends, mflowgen-journal writes the profile to
+# "profile.json" in the build directory. Counters that cannot be read
+# (e.g., without /proc) are null.
+#
+# Date   : October 18, 2026
+#
+
+import json
+import os
+import threading
+import time
+
+#-------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------
+
+# Fields of /proc/<pid>/stat (counting from the state field, which is the
+# first one after the command name)
+
+stat_utime  = 11
+stat_stime  = 12
+stat_cutime = 13
+stat_cstime = 14
+stat_ppid   = 1
+stat_rss    = 21
+
+try:
+  clock_ticks = os.sysconf( 'SC_CLK_TCK' )
+  page_kb     = os.sysconf( 'SC_PAGE_SIZE' ) // 1024
+except ( AttributeError, ValueError, OSError ):
+  clock_ticks = 100
+  page_kb     = 4
+
+# parse_mark
+#
+# Parses a line of the marks file into a dict with the label, the time,
+# the CPU time of the shell and its children, and the I/O counters
+#
+
+def parse_mark( line ):
+
+  fields = line.rstrip( '\n' ).split( '\t' )
+  fields = fields + [ '' ] * ( 4 - len( fields ) )
+
+  label, t, stat, io = fields[:4]
+
+  mark = {
+    'label'       : label,
+    'time'        : float( t.replace( ',', '.' ) ),
+    'cpu_user'    : None,
+    'cpu_sys'     : None,
+    'rchar'       : None,
+    'wchar'       : None,
+    'read_bytes'  : None,
+    'write_bytes' : None,
+  }
+
+  stat = stat.split()
+
+  if len( stat ) > stat_cstime:
+    mark[ 'cpu_user' ] = ( int( stat[ stat_utime  ] ) +
+                           int( stat[ stat_cutime ] ) ) / clock_ticks
+    mark[ 'cpu_sys'  ] = ( int( stat[ stat_stime  ] ) +
+                           int( stat[ stat_cstime ] ) ) / clock_ticks
+
+  io = io.split()
+
+  for k, v in zip( io[0::2], io[1::2] ):
+    k = k.rstrip( ':' )
+    if k in mark:
+      mark[ k ] = int( v )
+
+  return mark
+
+# delta
+#
+# Difference between two counters (None if either is missing), rounded
+# to hide floating-point noise in the CPU times
+#
+
+def delta( a, b ):
+  if a is None or b is None:
+    return None
+  return round( b - a, 6 )
+
+#-------------------------------------------------------------------------
+# StepProfiler
+#-------------------------------------------------------------------------
+
+class StepProfiler:
+
+  # Files in the build directory
+
+  marks_name   = '.mflowgen-profile'
+  profile_name = 'profile.json'
+
+  def __init__( s, build_dir='.', interval=None ):
+
+    s.build_dir = build_dir
+    s.interval  = interval or \
+      float( os.environ.get( 'MFLOWGEN_PROFILE_INTERVAL', '1.0' ) )
+
+    s.samples   = []   # [ ( time, rss_kb ) ]
+    s.stopped   = threading.Event()
+    s.thread    = None
+
+    # Start from a clean slate
+
+    try:
+      os.remove( s.build_dir + '/' + s.marks_name )
+    except OSError:
+      pass
+
+  #-----------------------------------------------------------------------
+  # Memory sampling
+  #-----------------------------------------------------------------------
+
+  # tree_rss
+  #
+  # Returns the total resident set size (KB) of a process and all of its
+  # descendants, or None without /proc
+  #
+
+  def tree_rss( s, pid ):
+
+    children = {}
+    rss      = {}
+
+    try:
+      pids = [ int( p ) for p in os.listdir( '/proc' ) if p.isdigit() ]
+    except OSError:
+      return None
+
+    for p in pids:
+      try:
+        with open( '/proc/{}/stat'.format( p ) ) as fd:
+          stat = fd.read()
+      except OSError:
+        continue
+      stat = stat[ stat.rfind( ')' ) + 2 : ].split()
+      children.setdefault( int( stat[ stat_ppid ] ), [] ).append( p )
+      rss[ p ] = int( stat[ stat_rss ] ) * page_kb
+
+    if pid not in rss:
+      return None
+
+    total = 0
+    todo  = [ pid ]
+
+    while todo:
+      p = todo.pop()
+      total += rss.get( p, 0 )
+      todo  += children.get( p, [] )
+
+    return total
+
+  def run( s, pid ):
+    while not s.stopped.is_set():
+      rss = s.tree_rss( pid )
+      if rss is not None:
+        s.samples.append( ( time.time(), rss ) )
+      s.stopped.wait( s.interval )
+
+  # start
+  #
+  # Starts sampling the process tree of the step in the background
+  #
+
+  def start( s, pid ):
+    s.thread = threading.Thread( target=s.run, args=( pid, ), daemon=True )
+    s.thread.start()
+
+  def stop( s ):
+    s.stopped.set()
+    if s.thread:
+      s.thread.join()
+
+  #-----------------------------------------------------------------------
+  # Report
+  #-----------------------------------------------------------------------
+
+  def read_marks( s ):
+    marks = []
+    try:
+      with open( s.build_dir + '/' + s.marks_name ) as fd:
+        for line in fd:
+          try:
+            marks.append( parse_mark( line ) )
+          except ValueError:
+            pass
+    except OSError:
+      pass
+    return marks
+
+  # report
+  #
+  # Returns the profile of the step
+  #
+  # - commands : list of the commands of the step
+  # - run      : dict with the 'step', 'build_dir', 'start', 'end',
+  #              'status', and the total 'cpu_user', 'cpu_sys', and
+  #              'max_rss_kb' of the step
+  #
+
+  def report( s, commands, run ):
+
+    marks = s.read_marks()
+
+    # A step that fails does not mark the end of its last command, which
+    # then ends with the step (the totals cover the shell and all of its
+    # children too)
+
+    if not marks or marks[-1][ 'label' ] != 'end':
+      marks.append( {
+        'label'       : 'end',
+        'time'        : run[ 'end' ],
+        'cpu_user'    : run.get( 'cpu_user' ),
+        'cpu_sys'     : run.get( 'cpu_sys' ),
+        'rchar'       : None,
+        'wchar'       : None,
+        'read_bytes'  : None,
+        'write_bytes' : None,
+      } )
+
+    result = []
+
+    for a, b in zip( marks, marks[1:] ):
+
+      if a[ 'label' ] == 'end':
+        break
+
+      # Entries that continue a command are not marked separately
+
+      index = int( a[ 'label' ] )
+      until = len( commands ) if b[ 'label' ] == 'end' else int( b[ 'label' ] )
+      rss   = [ r for t, r in s.samples if a[ 'time' ] <= t <= b[ 'time' ] ]
+
+      result.append( {
+        'index'       : index,
+        'command'     : '\n'.join( commands[ index : until ] ) or None,
+        'start'       : a[ 'time' ],
+        'end'         : b[ 'time' ],
+        'wall'        : b[ 'time' ] - a[ 'time' ],
+        'cpu_user'    : delta( a[ 'cpu_user' ], b[ 'cpu_user' ] ),
+        'cpu_sys'     : delta( a[ 'cpu_sys' ], b[ 'cpu_sys' ] ),
+        'max_rss_kb'  : max( rss ) if rss else None,
+        'read_bytes'  : delta( a[ 'read_bytes' ], b[ 'read_bytes' ] ),
+        'write_bytes' : delta( a[ 'write_bytes' ], b[ 'write_bytes' ] ),
+        'rchar'       : delta( a[ 'rchar' ], b[ 'rchar' ] ),
+        'wchar'       : delta( a[ 'wchar' ], b[ 'wchar' ] ),
+      } )
+
+    # The peak memory of the step is that of its largest single process
+    # (from the operating system, not sampled)
+
+    return {
+      'step'       : run.get( 'step' ),
+      'build_dir'  : run.get( 'build_dir' ),
+      'start'      : run[ 'start' ],
+      'end'        : run[ 'end' ],
+      'wall'       : run[ 'end' ] - run[ 'start' ],
+      'status'     : run[ 'status' ],
+      'cpu_user'   : run.get( 'cpu_user' ),
+      'cpu_sys'    : run.get( 'cpu_sys' ),
+      'max_rss_kb' : run.get( 'max_rss_kb' ),
+      'interval'   : s.interval,
+      'commands'   : result,
+    }
+
+  # write
+  #
+  # Writes the profile to the build directory and cleans up the marks
+  #
+
+  def write( s, commands, run ):
+
+    data = s.report( commands, run )
+
+    with open( s.build_dir + '/' + s.profile_name, 'w' ) as fd:
+      json.dump( data, fd, indent=2 )
+      fd.write( '\n' )
+
+    try:
+      os.remove( s.build_dir + '/' + s.marks_name )
+    except OSError:
+      pass
+
+    return data
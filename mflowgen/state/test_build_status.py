@@ -0,0 +1,59 @@
+import json
+import os
+
+from mflowgen.state import BuildStatus, StateJournal
+
+def make_build( tmp_path ):
+  steps = [
+    { 'build_dir': '0-a', 'step': 'a', 'upstream': [],      'phony': False },
+    { 'build_dir': '1-b', 'step': 'b', 'upstream': [ '0-a' ],
+      'phony': False },
+    { 'build_dir': '2-c', 'step': 'c', 'upstream': [ '1-b' ],
+      'phony': False },
+  ]
+  os.makedirs( '.mflowgen' )
+  with open( '.mflowgen/steps.json', 'w' ) as fd:
+    json.dump( steps, fd )
+  # Stamps of a finished build, in the order that the build tool writes
+  t = 1000
+  for step in steps:
+    d = step[ 'build_dir' ]
+    os.makedirs( '.mflowgen/' + d )
+    os.makedirs( d + '/outputs' )
+    for f in [ '.mflowgen/' + d + '/fingerprint', d + '/.stamp',
+               d + '/.execstamp', d + '/outputs/.digest.x',
+               d + '/.postconditions.stamp' ]:
+      open( f, 'w' ).close()
+      os.utime( f, ( t, t ) )
+      t += 1
+  return t
+
+def status( tmp_path ):
+  return { x[ 'build_dir' ]: x[ 'status' ]
+           for x in BuildStatus( '.mflowgen' ).status() }
+
+def test_build_status( tmp_path, monkeypatch ):
+  monkeypatch.chdir( tmp_path )
+  t = make_build( tmp_path )
+  assert status( tmp_path ) == \
+    { '0-a': 'done', '1-b': 'done', '2-c': 'done' }
+  # Fingerprint changed
+  os.utime( '.mflowgen/1-b/fingerprint', ( t, t ) )
+  assert status( tmp_path ) == \
+    { '0-a': 'done', '1-b': 'stale', '2-c': 'stale' }
+  # Running and failed runs in the journal
+  with StateJournal( '.mflowgen' ) as journal:
+    run_id = journal.start( '1-b', 'b', start=t )
+    assert status( tmp_path )[ '1-b' ] == 'running'
+    journal.end( run_id, 1, end=t + 1 )
+    assert status( tmp_path )[ '1-b' ] == 'failed'
+  # Restored from the build cache
+  with StateJournal( '.mflowgen' ) as journal:
+    journal.hit( '0-a', 'a', start=t, end=t )
+  steps = BuildStatus( '.mflowgen' ).status()
+  assert steps[0][ 'status' ] == 'done'
+  assert steps[0][ 'reason' ] == 'restored from the build cache'
+  # Pre-built
+  open( '1-b/.prebuilt', 'w' ).close()
+  assert status( tmp_path ) == \
+    { '0-a': 'done', '1-b': 'prebuilt', '2-c': 'done' }
@@ -0,0 +1,50 @@
+import json
+import os
+
+from mflowgen.state import BuildTrace, StateJournal
+
+def test_build_trace( tmp_path ):
+  metadata_dir = str( tmp_path / '.mflowgen' )
+  os.makedirs( metadata_dir )
+  steps = [
+    { 'build_dir': '0-a', 'step': 'a', 'upstream': [],      'phony': False },
+    { 'build_dir': '1-b', 'step': 'b', 'upstream': [ '0-a' ],
+      'phony': False },
+    { 'build_dir': '2-c', 'step': 'c', 'upstream': [ '0-a' ],
+      'phony': False },
+    { 'build_dir': '3-d', 'step': 'd', 'upstream': [ '1-b', '2-c' ],
+      'phony': False },
+  ]
+  with open( metadata_dir + '/steps.json', 'w' ) as fd:
+    json.dump( steps, fd )
+  with StateJournal( metadata_dir ) as journal:
+    # An older build
+    r = journal.start( '0-a', 'a', start=0.0 )
+    journal.end( r, 0, end=1.0 )
+    # The latest build (b and c in parallel, c is slower)
+    for d, start, end in [ ( '0-a', 1000, 1001 ), ( '1-b', 1001, 1003 ),
+                           ( '2-c', 1001, 1005 ), ( '3-d', 1005, 1006 ) ]:
+      r = journal.start( d, d[2:], start=start )
+      journal.end( r, 0, cpu_user=end - start, cpu_sys=0.0, end=end )
+  trace   = BuildTrace( metadata_dir, jobs=1 )
+  path    = str( tmp_path / 'trace.json' )
+  summary = trace.write( path )
+  assert summary[ 'steps' ] == 4 and summary[ 'slots' ] == 2
+  assert summary[ 'wall' ] == 6.0 and summary[ 'busy' ] == 8.0
+  assert [ r[ 'build_dir' ] for r in summary[ 'critical' ] ] == \
+         [ '0-a', '2-c', '3-d' ]
+  with open( path ) as fd:
+    events = json.load( fd )[ 'traceEvents' ]
+  spans = { ( e[ 'tid' ], e[ 'name' ] ): e for e in events
+            if e[ 'ph' ] == 'X' }
+  assert sorted( spans ) == [ ( 0, 'a' ), ( 0, 'c' ), ( 0, 'd' ),
+                              ( 1, 'a' ), ( 1, 'b' ), ( 1, 'd' ),
+                              ( 2, 'c' ) ]
+  assert spans[ ( 2, 'c' ) ][ 'ts' ] == 1000000
+  assert spans[ ( 2, 'c' ) ][ 'dur' ] == 4000000
+  names = [ e[ 'args' ][ 'name' ] for e in events
+            if e[ 'name' ] == 'thread_name' ]
+  assert names == [ 'critical path', 'slot 1', 'slot 2 (over -j 1)' ]
+  running = [ e[ 'args' ][ 'steps' ] for e in events
+              if e[ 'name' ] == 'steps running' ]
+  assert max( running ) == 2 and running[-1] == 0
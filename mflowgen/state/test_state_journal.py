@@ -0,0 +1,35 @@
+from mflowgen.state import StateJournal
+
+def test_state_journal( tmp_path ):
+  with StateJournal( str( tmp_path ) ) as journal:
+    a = journal.start( '0-a', 'a', fingerprint='123', start=1.0, key='k' )
+    b = journal.start( '1-b', 'b', start=2.0 )
+    assert [ r[ 'build_dir' ] for r in journal.running() ] == \
+           [ '0-a', '1-b' ]
+    journal.end( a, 0, max_rss_kb=1024, cpu_user=0.5, cpu_sys=0.1,
+                 end=4.5 )
+    journal.end( b, 1, end=3.0 )
+    assert journal.running() == []
+    assert journal.runtimes() == { '0-a': 3.5 }
+    assert journal.history() == { 'k': 3.5 }
+    # Reruns
+    journal.start( '0-a', 'a', start=5.0 )
+    assert len( journal.runs( '0-a' ) ) == 2
+    assert journal.last_runs()[ '0-a' ][ 'end' ] is None
+    assert journal.runtimes() == { '0-a': 3.5 }
+  # The journal persists
+  with StateJournal( str( tmp_path ) ) as journal:
+    assert journal.runs()[0][ 'fingerprint' ] == '123'
+
+def test_state_journal_cache_hits( tmp_path ):
+  with StateJournal( str( tmp_path ) ) as journal:
+    a = journal.start( '0-a', 'a', start=1.0, key='k' )
+    journal.end( a, 0, end=4.0 )
+    journal.hit( '0-a', 'a', key='k', start=10.0, end=10.5 )
+    last = journal.last_runs()[ '0-a' ]
+    assert last[ 'cached' ] == 1 and last[ 'status' ] == 0
+    assert last[ 'start' ] == 10.0 and last[ 'end' ] == 10.5
+    assert journal.running() == []
+    # Hits do not count as runtimes
+    assert journal.runtimes() == { '0-a': 3.0 }
+    assert journal.history() == { 'k': 3.0 }
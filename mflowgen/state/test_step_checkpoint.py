@@ -0,0 +1,31 @@
+import os
+
+from mflowgen.state import StepCheckpoint
+
+def test_step_checkpoint( tmp_path ):
+  checkpoint = StepCheckpoint( str( tmp_path ) )
+  os.makedirs( str( tmp_path / 'checkpoints' ) )
+  ( tmp_path / 'checkpoints' / 'b' ).write_text( '' )
+  with open( checkpoint.path, 'w' ) as fd:
+    fd.write( 'fingerprint abc\n' )
+    fd.write( 'done a.tcl\n' )
+    fd.write( 'done b.tcl checkpoints/b\n' )
+    fd.write( 'done c.tcl checkpoints/missing\n' )
+    fd.write( 'done d.tcl\n' )
+  assert checkpoint.valid( 'abc' ) and not checkpoint.valid( 'xyz' )
+  order = [ 'a.tcl', 'b.tcl', 'c.tcl', 'd.tcl', 'e.tcl' ]
+  # Restarts after the last checkpoint that still exists
+  assert checkpoint.resume_point( order ) == ( 2, 'checkpoints/b' )
+  # Entries that no longer match the order are not skipped
+  assert checkpoint.resume_point( [ 'a.tcl', 'x.tcl' ] ) == ( 0, None )
+  script = 'export order=a\n' + StepCheckpoint.reset_command + '\n'
+  n, path, resumed = checkpoint.resume( script, order )
+  assert StepCheckpoint.reset_command not in resumed
+  assert 'export order=c.tcl,d.tcl,e.tcl\n' in resumed
+  assert 'export MFLOWGEN_RESUME_CHECKPOINT=checkpoints/b\n' in resumed
+  assert 'export MFLOWGEN_RESUME_DONE=a.tcl,b.tcl\n' in resumed
+  checkpoint.cut( n )
+  assert checkpoint.read() == \
+         ( 'abc', [ ( 'a.tcl', None ), ( 'b.tcl', 'checkpoints/b' ) ] )
+  checkpoint.remove()
+  assert not checkpoint.exists() and not checkpoint.valid( 'abc' )
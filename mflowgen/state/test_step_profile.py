@@ -0,0 +1,30 @@
+from mflowgen.state import StepProfiler
+from mflowgen.state.step_profile import clock_ticks
+
+def stat( utime, stime ):
+  fields = [ 'S' ] + [ '0' ] * 40
+  fields[ 11 ] = str( utime * clock_ticks )
+  fields[ 12 ] = str( stime * clock_ticks )
+  return ' '.join( fields )
+
+def test_step_profile( tmp_path ):
+  profiler = StepProfiler( str( tmp_path ) )
+  with open( str( tmp_path / profiler.marks_name ), 'w' ) as fd:
+    fd.write( '0\t10.0\t{}\twrite_bytes: 0 rchar: 5\n'.format( stat(1,0) ) )
+    fd.write( '1\t12,5\t{}\twrite_bytes: 4096\n'.format( stat(3,0) ) )
+    fd.write( '2\t13.0\t{}\t\n'.format( stat(3,2) ) )
+  profiler.samples = [ ( 11.0, 100 ), ( 12.0, 300 ), ( 14.0, 50 ) ]
+  # The last command failed without marking its end
+  run = { 'start': 9.0, 'end': 15.0, 'status': 1, 'cpu_user': 4.0 }
+  data = profiler.write( [ 'a', 'b', 'c \\', '  d' ], run )
+  assert not ( tmp_path / profiler.marks_name ).exists()
+  assert ( tmp_path / profiler.profile_name ).exists()
+  a, b, c = data[ 'commands' ]
+  assert [ a[ 'wall' ], b[ 'wall' ], c[ 'wall' ] ] == [ 2.5, 0.5, 2.0 ]
+  assert [ a[ 'cpu_user' ], b[ 'cpu_user' ], c[ 'cpu_user' ] ] == \
+         [ 2.0, 0.0, 1.0 ]
+  assert b[ 'cpu_sys' ] == 2.0 and c[ 'cpu_sys' ] is None
+  assert a[ 'write_bytes' ] == 4096 and a[ 'rchar' ] is None
+  assert [ a[ 'max_rss_kb' ], b[ 'max_rss_kb' ], c[ 'max_rss_kb' ] ] == \
+         [ 300, None, 50 ]
+  assert c[ 'command' ] == 'c \\\n  d'
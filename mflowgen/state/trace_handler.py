@@ -0,0 +1,85 @@
+#=========================================================================
+# trace_handler.py
+#=========================================================================
+# Handler for "mflowgen trace"
+#
+# Date   : October 18, 2026
+#
+
+import os
+import sys
+
+from mflowgen.state.build_trace import BuildTrace
+from mflowgen.utils             import bold
+
+class TraceHandler:
+
+  # launch
+  #
+  # Writes the trace of the latest build in the current build directory
+  #
+
+  def launch( s, args, help_, path, jobs, all_ ):
+
+    if help_ or args and args[0] == 'help':
+      s.launch_help()
+      return
+
+    if args:
+      print( 'trace: Unrecognized commands (see "mflowgen trace help")' )
+      sys.exit( 1 )
+
+    path = path or 'trace.json'
+
+    if not os.path.isdir( '.mflowgen' ):
+      print()
+      print( bold( 'Error:' ), 'No build here (run "mflowgen trace" in'
+                               ' the build directory)' )
+      print()
+      sys.exit( 1 )
+
+    try:
+      trace   = BuildTrace( metadata_dir = '.mflowgen', jobs = jobs )
+      summary = trace.write( path, all_ = all_ )
+    except AssertionError as e:
+      print( bold( 'Error:' ), e )
+      sys.exit( 1 )
+
+    # Summary (busy is the sum of the step runtimes, so busy / wall is the
+    # average number of steps that were running)
+
+    wall = summary[ 'wall' ]
+
+    print()
+    print( bold( 'Trace:' ), path )
+    print()
+    print( '  Steps         :', summary[ 'steps' ] )
+    print( '  Wall time     : {:.1f} s'.format( wall ) )
+    print( '  Job slots     :', summary[ 'slots' ] )
+    print( '  Average jobs  : {:.2f}'.format(
+             summary[ 'busy' ] / wall if wall > 0 else 0 ) )
+    print( '  Critical path :', ' -> '.join(
+             r[ 'build_dir' ] for r in summary[ 'critical' ] ) )
+    print()
+    print( 'Open the trace in chrome://tracing or https://ui.perfetto.dev' )
+    print()
+
+  #-----------------------------------------------------------------------
+  # launch_help
+  #-----------------------------------------------------------------------
+
+  def launch_help( s ):
+    print()
+    print( bold( 'Usage:' ), 'mflowgen trace [--path <file>] [-j <jobs>]'
+                             ' [--all]' )
+    print()
+    print( 'Writes a trace of the latest build (from the state journal in' )
+    print( '.mflowgen/state.db) in the Chrome trace-event format, with one' )
+    print( 'track per job slot and a span for each step and for each'      )
+    print( 'command of profiled steps. The trace goes to trace.json unless' )
+    print( 'given a --path.'                                               )
+    print()
+    print( '  -j --jobs : Mark the job slots beyond this number of jobs'    )
+    print( '     --all  : Include every run in the journal, not only the'  )
+    print( '              latest build'                                    )
+    print()
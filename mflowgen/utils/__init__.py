@@ -1,4 +1,8 @@
 from mflowgen.utils.helpers import get_top_dir, get_files_in_dir
 from mflowgen.utils.helpers import bold, yellow, red, green
 from mflowgen.utils.helpers import read_yaml, write_yaml
+from mflowgen.utils.helpers import write_if_changed, write_yaml_if_changed
 
+from mflowgen.utils.helpers import file_digest, dir_digest, dir_signature
+from mflowgen.utils.helpers import fingerprint_inputs, read_fingerprint
+from mflowgen.utils.helpers import critical_path
@@ -5,7 +5,10 @@
 # Date   : June 2, 2019
 #
 
+import hashlib
+import json
 import os
+import shutil
 import yaml
 
 #-------------------------------------------------------------------------
@@ -63,6 +66,260 @@ def stamp( p, stamp='.stamp.' ):
   if p_dirname : return p_dirname + '/' + p_stamp
   else         : return p_stamp
 
+# is_output_stamp
+#
+# Checks whether a path is the digest stamp of a step output (e.g.,
+# "4-dc/outputs/.digest.design.v"). The backends only touch these stamps
+# when the contents of the output change (see mflowgen-digest).
+#
+# - p : path to check
+#
+
+def is_output_stamp( p ):
+  return os.path.basename( os.path.dirname( p ) ) == 'outputs' and \
+         os.path.basename( p ).startswith( '.digest.' )
+
+# write_if_changed
+#
+# Writes the text to a file only if it differs from what is already on
+# disk, so that unchanged files keep their timestamps. The text is first
+# written to a temporary file in the same directory and then renamed over
+# the old file, so readers never see a partially written file.
+#
+# - path : path to the file
+# - text : the new contents of the file
+#
+# Returns True if the file was written
+#
+
+def write_if_changed( path, text ):
+  try:
+    with open( path ) as f:
+      if f.read() == text:
+        return False
+  except ( OSError, UnicodeDecodeError ):
+    pass
+  p_dirname  = os.path.dirname( path )
+  p_basename = os.path.basename( path )
+  tmp        = os.path.join( p_dirname,
+                 '.{}.tmp{}'.format( p_basename, os.getpid() ) )
+  with open( tmp, 'w' ) as f:
+    f.write( text )
+  if os.path.exists( path ):
+    shutil.copymode( path, tmp )
+  os.replace( tmp, path )
+  return True
+
+#-------------------------------------------------------------------------
+# Digests
+#-------------------------------------------------------------------------
+
+# walk_files
+#
+# Returns ( relative path, path ) for all files in a directory tree in a
+# stable order (following symlinks)
+#
+# - p : path to a directory
+#
+
+def walk_files( p ):
+  file_list = []
+  for root, subfolders, files in os.walk( p, followlinks=True ):
+    subfolders.sort()
+    for f in sorted( files ):
+      path = os.path.join( root, f )
+      file_list.append( ( os.path.relpath( path, p ), path ) )
+  return file_list
+
+# file_digest
+#
+# Returns the hash of the contents of a file
+#
+# - path : path to a file
+#
+
+def file_digest( path ):
+  h = hashlib.sha1()
+  with open( path, 'rb' ) as f:
+    for chunk in iter( lambda: f.read( 1 << 20 ), b'' ):
+      h.update( chunk )
+  return h.hexdigest()
+
+# dir_digest
+#
+# Returns the hash of the relative paths and contents of all files in a
+# directory tree. Files are only read if they are not in the manifest
+# from an earlier call with the same size and timestamp, so recomputing
+# the digest is cheap. The manifest is updated in place.
+#
+# - p        : path to a directory
+# - manifest : dict { relative path : [ size, mtime_ns, digest ] }
+#
+
+def dir_digest( p, manifest=None ):
+
+  if manifest is None:
+    manifest = {}
+
+  h    = hashlib.sha1()
+  seen = set()
+
+  for rel, path in walk_files( p ):
+    try:
+      st = os.stat( path )
+    except OSError: # broken symlink
+      continue
+    entry = manifest.get( rel )
+    if not entry or entry[:2] != [ st.st_size, st.st_mtime_ns ]:
+      entry = [ st.st_size, st.st_mtime_ns, file_digest( path ) ]
+      manifest[ rel ] = entry
+    seen.add( rel )
+    h.update( '{} {}\n'.format( rel, entry[2] ).encode() )
+
+  for rel in set( manifest ) - seen:
+    del manifest[ rel ]
+
+  return h.hexdigest()
+
+# dir_signature
+#
+# Returns a hash of the relative paths, sizes, and timestamps of all files
+# in a directory tree. This is much cheaper than dir_digest but changes
+# whenever a file is touched.
+#
+# - p : path to a directory
+#
+
+def dir_signature( p ):
+  h = hashlib.sha1()
+  for rel, path in walk_files( p ):
+    try:
+      st = os.stat( path )
+    except OSError: # broken symlink
+      continue
+    h.update( '{} {} {}\n'.format( rel, st.st_size,
+                                   st.st_mtime_ns ).encode() )
+  return h.hexdigest()
+
+# fingerprint_inputs
+#
+# Combines the fingerprint of a step with the digests of its inputs (see
+# Step.fingerprint)
+#
+# - fingerprint   : fingerprint of the step without its inputs
+# - input_digests : dict { input name : digest of the upstream output }
+#
+
+def fingerprint_inputs( fingerprint, input_digests ):
+  h = hashlib.sha1()
+  h.update( fingerprint.encode() )
+  h.update( json.dumps( input_digests, sort_keys=True ).encode() )
+  return h.hexdigest()
+
+# read_fingerprint
+#
+# Returns the fingerprint of the step in a build directory including the
+# current digests of its inputs, or None if an input was never stamped by
+# mflowgen-digest (e.g., the outputs of pre-built steps). This reads the
+# metadata written by BuildOrchestrator.dump_fingerprint and the digests
+# of the upstream outputs, so it reflects upstream rebuilds that happened
+# after the build files were generated.
+#
+# - build_dir    : build directory of the step (e.g., "4-dc")
+# - metadata_dir : path to the metadata directory
+#
+
+def read_fingerprint( build_dir, metadata_dir='.mflowgen' ):
+
+  try:
+    data = read_yaml( metadata_dir + '/' + build_dir + '/fingerprint.yml' )
+    step_fingerprint = data[ 'step' ]
+    sources          = data.get( 'sources' ) or {}
+  except Exception:
+    return None
+
+  digests = {}
+  inputs  = {}
+
+  for dst_f, ( src_build_dir, src_f ) in sources.items():
+    if src_build_dir not in digests:
+      try:
+        path = metadata_dir + '/' + src_build_dir + '/digests.yml'
+        digests[ src_build_dir ] = read_yaml( path ) or {}
+      except Exception:
+        digests[ src_build_dir ] = {}
+    d = digests[ src_build_dir ].get( src_f, {} ).get( 'digest' )
+    if d is None:
+      return None
+    inputs[ dst_f ] = d
+
+  return fingerprint_inputs( step_fingerprint, inputs )
+
+#-------------------------------------------------------------------------
+# Graph analysis
+#-------------------------------------------------------------------------
+
+# critical_path
+#
+# Finds the longest path through a DAG with weighted nodes. Each node
+# starts as soon as all of its predecessors finished (i.e., with unlimited
+# parallelism). Returns a dict with:
+#
+# - length : finish time of the last node (i.e., the length of the path)
+# - path   : nodes on the longest path from the first to the last
+# - start  : earliest start time of each node
+# - slack  : how much each node can be delayed without delaying the end
+#
+# - order   : list of nodes in topological order
+# - preds   : dict { node : iterable of predecessor nodes }
+# - weights : dict { node : weight } (nodes without weights weigh 0)
+#
+
+def critical_path( order, preds, weights ):
+
+  weight = lambda n: weights.get( n ) or 0
+
+  # Earliest finish time (forwards)
+
+  finish = {}
+  start  = {}
+
+  for n in order:
+    start[ n ]  = max( [ finish[ p ] for p in preds.get( n, () ) ],
+                       default = 0 )
+    finish[ n ] = start[ n ] + weight( n )
+
+  length = max( finish.values(), default = 0 )
+
+  # Latest finish time that does not delay the end (backwards)
+
+  latest = { n : length for n in order }
+
+  for n in reversed( order ):
+    for p in preds.get( n, () ):
+      latest[ p ] = min( latest[ p ], latest[ n ] - weight( n ) )
+
+  slack = { n : latest[ n ] - finish[ n ] for n in order }
+
+  # Walk back from the node that finishes last through the predecessors
+  # that finish last
+
+  path = []
+
+  if order:
+    n = max( order, key = lambda n: finish[ n ] )
+    while n is not None:
+      path.append( n )
+      p = [ x for x in preds.get( n, () ) if finish[ x ] == start[ n ] ]
+      n = max( p, key = lambda x: finish[ x ] ) if p else None
+
+  return {
+    'length' : length,
+    'path'   : path[::-1],
+    'start'  : start,
+    'slack'  : slack,
+  }
+
 #-------------------------------------------------------------------------
 # YAML helper functions
 #-------------------------------------------------------------------------
@@ -90,6 +347,23 @@ def write_yaml( data, path ):
   with open( path, 'w' ) as f:
     yaml.dump( data, f, default_flow_style=False )
 
+# write_yaml_if_changed
+#
+# Same as write_yaml, but leaves the file untouched if the dumped data is
+# the same as what is already on disk. This is used for the bulk of the
+# generated YAMLs, so it uses the (much faster) libyaml emitter if PyYAML
+# was built with it.
+#
+
+try:
+  YamlDumper = yaml.CDumper
+except AttributeError:
+  YamlDumper = yaml.Dumper
+
+def write_yaml_if_changed( data, path ):
+  return write_if_changed( path, yaml.dump( data, Dumper=YamlDumper,
+                                            default_flow_style=False ) )
+
 #-------------------------------------------------------------------------
 # Colors
 #-------------------------------------------------------------------------
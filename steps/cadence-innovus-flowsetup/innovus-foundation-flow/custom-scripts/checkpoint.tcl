@@ -0,0 +1,38 @@
+#=========================================================================
+# checkpoint.tcl
+#=========================================================================
+# Records the progress of a step for "mflowgen resume"
+#
+# With checkpoints turned on for the step ("checkpoint" in its
+# configure.yml), mflowgen-run sets:
+#
+# - MFLOWGEN_CHECKPOINT       : file that records the finished subscripts
+# - MFLOWGEN_CHECKPOINT_AFTER : subscripts to save a checkpoint after
+#
+# START.tcl calls mflowgen_checkpoint_done after each subscript in the
+# order, which first saves an Innovus checkpoint if the step asked for one
+# after this subscript. Without checkpoints, it does nothing.
+#
+# Date   : October 18, 2026
+
+proc mflowgen_checkpoint_done { tcl } {
+
+  if {![ info exists ::env(MFLOWGEN_CHECKPOINT) ]} { return }
+
+  set line "done $tcl"
+
+  if {[ lsearch -exact [ split $::env(MFLOWGEN_CHECKPOINT_AFTER) "," ] \
+                       $tcl ] >= 0 } {
+    set path checkpoints/after-[ file rootname $tcl ]/save.enc
+    uplevel #0 [ list set innovus_checkpoint_path $path ]
+    uplevel #0 {
+      source innovus-foundation-flow/custom-scripts/save-design.tcl
+      unset innovus_checkpoint_path
+    }
+    append line " $path"
+  }
+
+  set fd [ open $::env(MFLOWGEN_CHECKPOINT) a ]
+  puts $fd $line
+  close $fd
+}
@@ -9,7 +9,12 @@
 # Author : Christopher Torng
 # Date   : March 26, 2018 and January 13, 2020
 
-set innovus_checkpoint_path checkpoints/design.checkpoint/save.enc
+# The checkpoint goes to checkpoints/design.checkpoint unless another path
+# was given (e.g., by checkpoint.tcl)
+
+if {![ info exists innovus_checkpoint_path ]} {
+  set innovus_checkpoint_path checkpoints/design.checkpoint/save.enc
+}
 
 #-------------------------------------------------------------------------
 # 1. Options for saving a portable design
@@ -27,10 +27,15 @@
 #-------------------------------------------------------------------------
 # Setup
 #-------------------------------------------------------------------------
-# Restore from checkpoint and set up variables
+# Restore from checkpoint and set up variables (or restore from the
+# checkpoint of an earlier run, see "mflowgen resume")
 
 #source innovus-foundation-flow/custom-scripts/restore-design.tcl
+if {[ info exists ::env(MFLOWGEN_RESUME_CHECKPOINT) ]} {
+  source $::env(MFLOWGEN_RESUME_CHECKPOINT)
+}
 source innovus-foundation-flow/custom-scripts/setup-session.tcl
+source innovus-foundation-flow/custom-scripts/checkpoint.tcl
 
 #-------------------------------------------------------------------------
 # Execute
@@ -56,6 +61,8 @@ foreach tcl $order {
     echo "Warn: Did not find $tcl"
     exit 1
   }
+  # Record the progress for "mflowgen resume"
+  mflowgen_checkpoint_done $tcl
 }
 
 #-------------------------------------------------------------------------
@@ -27,6 +27,16 @@
 
 set order [split $::env(order) ","]
 
+# Record the progress for "mflowgen resume", and restore from the
+# checkpoint of an earlier run when resuming (then the order only has the
+# scripts after the checkpoint)
+
+source checkpoint.tcl
+
+if {[ info exists ::env(MFLOWGEN_RESUME_CHECKPOINT) ]} {
+  mflowgen_checkpoint_restore
+}
+
 # Run the scripts in order (inputs take priority)
 
 foreach tcl $order {
@@ -47,6 +57,7 @@ foreach tcl $order {
     echo "Warn: Did not find $tcl"
     exit 1
   }
+  mflowgen_checkpoint_done $tcl
 }
 
 exit
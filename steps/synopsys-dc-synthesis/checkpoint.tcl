@@ -0,0 +1,63 @@
+#=========================================================================
+# checkpoint.tcl
+#=========================================================================
+# Records the progress of the step for "mflowgen resume" and restores
+# from the checkpoint of an earlier run
+#
+# With checkpoints turned on for the step ("checkpoint" in its
+# configure.yml), mflowgen-run sets:
+#
+# - MFLOWGEN_CHECKPOINT       : file that records the finished subscripts
+# - MFLOWGEN_CHECKPOINT_AFTER : subscripts to save a checkpoint after
+#
+# START.tcl calls mflowgen_checkpoint_done after each subscript in the
+# order, which first saves the design as a ddc if the step asked for a
+# checkpoint after this subscript (e.g., after compile.tcl). Without
+# checkpoints, it does nothing.
+#
+# Date   : October 18, 2026
+
+proc mflowgen_checkpoint_done { tcl } {
+
+  if {![ info exists ::env(MFLOWGEN_CHECKPOINT) ]} { return }
+
+  set line "done $tcl"
+
+  if {[ lsearch -exact [ split $::env(MFLOWGEN_CHECKPOINT_AFTER) "," ] \
+                       $tcl ] >= 0 } {
+    set path checkpoints/after-[ file rootname $tcl ].ddc
+    file mkdir checkpoints
+    uplevel #0 [ list write_file -hierarchy -format ddc -output $path ]
+    append line " $path"
+  }
+
+  set fd [ open $::env(MFLOWGEN_CHECKPOINT) a ]
+  puts $fd $line
+  close $fd
+}
+
+# mflowgen_checkpoint_restore
+#
+# Restores the design from MFLOWGEN_RESUME_CHECKPOINT. The session setup
+# is not saved in a ddc, so the setup subscripts that ran before the
+# checkpoint are sourced again first.
+
+proc mflowgen_checkpoint_restore {} {
+
+  set setup { designer-interface.tcl setup-session.tcl }
+
+  foreach tcl [ split $::env(MFLOWGEN_RESUME_DONE) "," ] {
+    if {[ lsearch -exact $setup $tcl ] < 0} { continue }
+    if {[ file exists inputs/$tcl ]} {
+      uplevel #0 [ list source -echo -verbose inputs/$tcl ]
+    } else {
+      uplevel #0 [ list source -echo -verbose scripts/$tcl ]
+    }
+  }
+
+  uplevel #0 {
+    read_ddc $::env(MFLOWGEN_RESUME_CHECKPOINT)
+    current_design $dc_design_name
+    link
+  }
+}
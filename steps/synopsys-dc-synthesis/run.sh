@@ -14,11 +14,14 @@ set -x
 
 dc_exec='dc_shell-xg-t -64bit'
 
-# Build directories
+# Build directories (kept when resuming from a checkpoint, see
+# "mflowgen resume")
 
-rm -rf ./logs
-rm -rf ./reports
-rm -rf ./results
+if [[ -z "${MFLOWGEN_RESUME_CHECKPOINT:-}" ]]; then
+  rm -rf ./logs
+  rm -rf ./reports
+  rm -rf ./results
+fi
 
 mkdir -p logs
 mkdir -p reports